@@ -1,12 +1,19 @@
 """
 主應用程式入口 - 模組化結構
 """
-from flask import Flask, render_template, request, session
+from flask import Flask, Response, g, render_template, request, session
+import hashlib
+import hmac
 import logging
 import os
+import time
 from datetime import timedelta
 from config import Config
-from services.firestore_service import FirestoreService
+from auth import require_admin_login_api
+from services.database_adapter import DatabaseAdapter
+from services import db_instrumentation
+from services.metrics import metrics, flush_on_exit
+from services.line_service import line_dispatcher
 from routes.auth import auth_bp
 from routes.member import member_bp
 from routes.admin import admin_bp
@@ -44,14 +51,17 @@ import os
 if os.environ.get('FLASK_ENV') == 'testing':
     app.testing = True
 
-# 初始化資料庫服務
-try:
-    FirestoreService.init()
-    logger.info("Firebase Firestore initialized successfully")
-    logger.info("Application initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize application: {e}")
-    raise
+# 資料庫服務（依 DATABASE_BACKEND 選擇 Firestore 或 SQLite）在第一次使用時才初始化，
+# 啟動時不等待憑證解析與連線建立；gunicorn 於 post_fork 在背景預先初始化（gunicorn.conf.py）
+logger.info(f"Application initialized (database backend: {Config.DATABASE_BACKEND}, lazy init)")
+
+# 啟動 LINE 推播背景派送（測試模式維持同步送出）
+if Config.LINE_DISPATCH_ASYNC and not app.testing:
+    line_dispatcher.start()
+
+# 多進程監控指標：進程結束時寫入最後的數值
+if Config.METRICS_ENABLED:
+    flush_on_exit(Config.METRICS_MULTIPROC_DIR)
 
 # 註冊藍圖
 app.register_blueprint(auth_bp)
@@ -261,6 +271,55 @@ def update_product_stock(product_id):
         return {"code": 1, "message": "更新庫存失敗"}, 500
 
 
+@app.route('/api/admin/product/<product_id>/stock-shards', methods=['POST'])
+@require_admin_login_api
+def set_product_stock_shards(product_id):
+    """設定商品庫存分片數（搶購商品分散下單寫入；0 表示不分片）"""
+    try:
+        from services.database_adapter import DatabaseAdapter
+        data = request.get_json()
+        
+        if not data or 'shards' not in data:
+            return {"code": 1, "message": "缺少必要欄位"}, 400
+        
+        success, result = DatabaseAdapter.set_stock_shards(product_id, data['shards'])
+        
+        if success:
+            return {"code": 0, "message": "庫存分片已更新", "data": result}
+        else:
+            return {"code": 1, "message": result}, 400
+    except Exception as e:
+        logger.error(f"Error setting stock shards {product_id}: {e}")
+        return {"code": 1, "message": "設定庫存分片失敗"}, 500
+
+
+@app.route('/api/admin/products/stock/bulk', methods=['POST'])
+@require_admin_login_api
+def update_products_stock():
+    """批次更新多個商品庫存（全部成功或全部不變）"""
+    try:
+        from services.database_adapter import DatabaseAdapter
+        data = request.get_json()
+        
+        if not data or not isinstance(data.get('changes'), list) or not data['changes'] or not data.get('reason'):
+            return {"code": 1, "message": "缺少必要欄位"}, 400
+        
+        operator = session.get('admin_name', '系統')
+        success, result = DatabaseAdapter.update_products_stock(
+            changes=data['changes'],
+            reason=data['reason'],
+            operator=operator
+        )
+        
+        if success:
+            return {"code": 0, "message": "庫存已更新", "data": result}
+        else:
+            return {"code": 1, "message": result}, 400
+    except Exception as e:
+        logger.error(f"Error bulk updating product stock: {e}")
+        return {"code": 1, "message": "批次更新庫存失敗"}, 500
+
+
 @app.route('/api/admin/stock-logs', methods=['GET'])
 def get_stock_logs():
     """取得庫存日誌"""
@@ -314,6 +373,39 @@ def enforce_https():
         return redirect(url, code=301)
 
 
+@app.before_request
+def start_db_usage():
+    """開始統計本次請求的資料庫讀寫"""
+    if Config.DB_INSTRUMENTATION_ENABLED:
+        db_instrumentation.begin_request()
+
+
+@app.after_request
+def report_db_usage(response):
+    """以 Server-Timing 標頭回報資料庫用量，並記錄慢請求
+
+    串流回應（CSV 匯出）的標頭只包含開始串流前的用量，日誌於串流結束後記錄完整用量。
+    """
+    if not Config.DB_INSTRUMENTATION_ENABLED or db_instrumentation.current_usage() is None:
+        return response
+
+    def log_usage():
+        usage = db_instrumentation.end_request()
+        if usage:
+            db_instrumentation.log_request(
+                usage, request_info['method'], request_info['path'], request_info['endpoint'],
+                response.status_code, Config.DB_SLOW_REQUEST_MS, Config.DB_USAGE_LOG_ALL
+            )
+
+    request_info = {'method': request.method, 'path': request.path, 'endpoint': request.endpoint}
+    response.headers['Server-Timing'] = db_instrumentation.server_timing(db_instrumentation.current_usage().to_dict())
+    if response.is_streamed:
+        response.call_on_close(log_usage)
+    else:
+        log_usage()
+    return response
+
+
 @app.after_request
 def set_security_headers(response):
     """設置安全頭"""
@@ -424,6 +516,40 @@ def get_discounts():
         return {"code": 1, "message": str(e)}, 500
 
 
+@app.route('/api/admin/discounts/applicable', methods=['POST'])
+@require_admin_login_api
+def get_applicable_discounts():
+    """批次查詢多個商品適用的折扣（商品、所屬分類與會員等級）
+
+    Request: {"productIds": ["p1", "p2"], "memberLevel": "gold"}
+    Response data: {"p1": [...], "p2": [...]}
+    """
+    try:
+        from services.database_adapter import DatabaseAdapter
+        data = request.get_json() or {}
+        product_ids = data.get('productIds')
+        if not isinstance(product_ids, list) or not product_ids:
+            return {"code": 1, "message": "productIds 必須為非空陣列"}, 400
+
+        success, products = DatabaseAdapter.get_all_products()
+        if not success:
+            return {"code": 1, "message": products}, 500
+        categories = {p.get('productId'): p.get('categoryId') for p in products}
+
+        success, result = DatabaseAdapter.get_applicable_discounts_batch(
+            [(product_id, categories.get(product_id)) for product_id in product_ids],
+            member_level=data.get('memberLevel')
+        )
+        return {
+            "code": 0 if success else 1,
+            "data": result if success else None,
+            "message": "成功" if success else result
+        }
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        return {"code": 1, "message": str(e)}, 500
+
+
 @app.route('/api/admin/discount/add', methods=['POST'])
 def add_discount():
     """新增折扣"""
@@ -492,20 +618,62 @@ def delete_discount(discount_id):
 
 # ===== 庫存警告 API =====
 
+STOCK_ALERTS_PAGE_DEFAULT_LIMIT = 50
+STOCK_ALERTS_PAGE_MAX_LIMIT = 200
+
+
 @app.route('/api/admin/stock-alerts', methods=['GET'])
 def get_stock_alerts():
-    """取得庫存警告"""
+    """取得庫存警告（依建立時間新到舊）
+
+    Query: status (預設 active，空字串表示全部)、type、limit、startAfter；
+    帶 limit / startAfter 時 data 為 {"alerts": [...], "nextCursor": "...", "hasMore": true}。
+
+    回應帶 ETag（警告清單版本 + 查詢參數），後台輪詢時帶 If-None-Match，
+    清單沒有變更則直接回傳 304，不執行查詢。
+    """
     try:
         from services.database_adapter import DatabaseAdapter
-        status = request.args.get('status', 'active')
+        status = request.args.get('status', 'active') or None
         alert_type = request.args.get('type')
-        
-        success, data = DatabaseAdapter.get_stock_alerts(status=status, alert_type=alert_type)
-        return {
+        start_after = request.args.get('startAfter') or None
+        paged = 'limit' in request.args or start_after is not None
+
+        limit = None
+        if paged:
+            try:
+                limit = int(request.args.get('limit') or STOCK_ALERTS_PAGE_DEFAULT_LIMIT)
+            except ValueError:
+                return {"code": 1, "message": "limit 必須為整數"}, 400
+            if limit <= 0:
+                return {"code": 1, "message": "limit 必須大於 0"}, 400
+            limit = min(limit, STOCK_ALERTS_PAGE_MAX_LIMIT)
+
+        etag = None
+        version_ok, version = DatabaseAdapter.get_stock_alerts_version()
+        if version_ok:
+            query_key = f"{status}|{alert_type or ''}|{limit or ''}|{start_after or ''}"
+            etag = f"stock-alerts-{version}-{hashlib.sha1(query_key.encode()).hexdigest()[:12]}"
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'private, no-cache'
+                return response
+
+        if paged:
+            success, data = DatabaseAdapter.get_stock_alerts_page(status=status, alert_type=alert_type,
+                                                                  limit=limit, start_after=start_after)
+        else:
+            success, data = DatabaseAdapter.get_stock_alerts(status=status, alert_type=alert_type)
+        response = app.make_response({
             "code": 0 if success else 1,
             "data": data,
             "message": "成功" if success else data
-        }
+        })
+        if success and etag:
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+        return response
     except Exception as e:
         logger.error(f"Error: {e}")
         return {"code": 1, "message": str(e)}, 500
@@ -529,6 +697,81 @@ def acknowledge_stock_alert(alert_id):
         return {"code": 1, "message": str(e)}, 500
 
 
+# ===== 健康檢查 =====
+
+@app.route('/healthz')
+def healthz():
+    """存活檢查：不存取資料庫，進程可回應即通過"""
+    return {"status": "ok"}
+
+
+@app.route('/readyz')
+def readyz():
+    """就緒檢查：回報資料庫狀態，尚未初始化時在背景開始初始化並回傳 503"""
+    state = DatabaseAdapter.readiness()
+    if state['status'] == 'ready':
+        return {"status": "ready", "database": state}
+    if state['status'] != 'initializing':
+        DatabaseAdapter.warm_up()
+    return {"status": "not_ready", "database": state}, 503
+
+
+# ===== 監控指標 =====
+
+@app.before_request
+def start_request_metrics():
+    """記錄請求開始時間與處理中請求數"""
+    if Config.METRICS_ENABLED:
+        g.metrics_started = time.perf_counter()
+        metrics.inc('http_requests_in_flight', 1)
+
+
+@app.after_request
+def record_request_metrics(response):
+    """依藍圖與路由記錄延遲直方圖與狀態碼（串流回應只計入開始串流前的時間）"""
+    started = g.get('metrics_started')
+    if started is not None:
+        labels = {
+            'blueprint': request.blueprint or 'app',
+            'endpoint': request.endpoint or 'unmatched',
+            'method': request.method
+        }
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - started, **labels)
+        metrics.inc('http_requests_total', status=response.status_code, **labels)
+    return response
+
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    """減少處理中請求數，並定期寫入多進程目錄"""
+    if g.pop('metrics_started', None) is not None:
+        metrics.inc('http_requests_in_flight', -1)
+        metrics.maybe_flush(Config.METRICS_MULTIPROC_DIR, Config.METRICS_FLUSH_INTERVAL)
+
+
+def _metrics_authorized():
+    """已登入的管理員，或帶有 Authorization: Bearer <METRICS_TOKEN> 的抓取端"""
+    if session.get('logged_in'):
+        return True
+    auth_header = request.headers.get('Authorization', '')
+    if Config.METRICS_TOKEN and auth_header.startswith('Bearer '):
+        return hmac.compare_digest(auth_header[len('Bearer '):], Config.METRICS_TOKEN)
+    return False
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus 監控指標（多個 worker 時合併 METRICS_MULTIPROC_DIR 內所有進程的數值）"""
+    if not Config.METRICS_ENABLED:
+        return {"error": "頁面不存在", "code": 404}, 404
+    if not _metrics_authorized():
+        return {"error": "Unauthorized", "msg": "請先登入"}, 401
+    return Response(
+        metrics.render(Config.METRICS_MULTIPROC_DIR),
+        mimetype='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
 # ===== 錯誤處理 =====
 
 @app.errorhandler(400)
@@ -572,8 +815,6 @@ def admin_tool_clear_all_data():
                 "msg": "未授權：需要有效的管理員密鑰"
             }, 401
         
-        from services.firestore_service import FirestoreService
-        
         collections_to_clear = [
             'orders',
             'members',
@@ -587,27 +828,16 @@ def admin_tool_clear_all_data():
             'appointmentSlots',
         ]
         
-        db = FirestoreService._db
         total_deleted = 0
         cleared_collections = {}
         
         for collection_name in collections_to_clear:
-            try:
-                docs = db.collection(collection_name).stream()
-                doc_list = list(docs)
-                
-                if doc_list:
-                    batch = db.batch()
-                    for doc in doc_list:
-                        batch.delete(doc.reference)
-                    batch.commit()
-                    total_deleted += len(doc_list)
-                    cleared_collections[collection_name] = len(doc_list)
-                else:
-                    cleared_collections[collection_name] = 0
-                    
-            except Exception as e:
-                cleared_collections[collection_name] = f"error: {str(e)[:50]}"
+            success, result = DatabaseAdapter.clear_collection(collection_name)
+            if success:
+                total_deleted += result
+                cleared_collections[collection_name] = result
+            else:
+                cleared_collections[collection_name] = f"error: {str(result)[:50]}"
         
         logger.info(f"Admin cleared all data: {total_deleted} records deleted")
         
@@ -0,0 +1,122 @@
+"""
+壓力測試：訂單編號產生器並行碰撞檢查
+
+模擬多個 gunicorn worker（進程）× 每個 worker 多個執行緒同時建立訂單，
+檢查所有訂單編號是否唯一、長度是否符合綠界限制，並與舊的
+「ORD + 時間戳後 8 位」方式比較。
+
+使用方法：
+  python benchmarks/bench_order_ids.py --workers 4 --threads 8 --orders 2000
+
+worker 編號以 OrderIdService.configure() 固定指定（等同各進程已取得不同的
+Firestore 租約），不需要連線 Firestore。
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _legacy_order_id():
+    timestamp_str = str(int(time.time()))
+    return "ORD" + timestamp_str[-8:]
+
+
+def _run_worker(worker_id, threads, orders_per_thread, legacy, rate, results):
+    from services.order_id_service import OrderIdService
+    OrderIdService.configure(worker_id)
+    generate = _legacy_order_id if legacy else OrderIdService.next_order_id
+
+    ids = []
+    lock = threading.Lock()
+    interval = threads / rate if rate else 0
+
+    def run():
+        local = []
+        next_at = time.perf_counter()
+        for _ in range(orders_per_thread):
+            if interval:
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                next_at += interval
+            local.append(generate())
+        with lock:
+            ids.extend(local)
+
+    pool = [threading.Thread(target=run) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    results.put(ids)
+
+
+def run_benchmark(workers, threads, orders_per_thread, legacy=False, rate=0):
+    """執行壓力測試並回傳統計結果
+
+    rate: 每個 worker 每秒的目標訂單數（0 = 不限速）
+    """
+    results = multiprocessing.Queue()
+    start = time.perf_counter()
+    processes = [
+        multiprocessing.Process(
+            target=_run_worker,
+            args=(worker_id, threads, orders_per_thread, legacy, rate, results)
+        )
+        for worker_id in range(workers)
+    ]
+    for p in processes:
+        p.start()
+    all_ids = []
+    for _ in processes:
+        all_ids.extend(results.get())
+    for p in processes:
+        p.join()
+    elapsed = time.perf_counter() - start
+
+    total = len(all_ids)
+    unique = len(set(all_ids))
+    return {
+        'mode': 'legacy' if legacy else 'allocator',
+        'workers': workers,
+        'threads': threads,
+        'orders': total,
+        'collisions': total - unique,
+        'max_length': max(len(i) for i in all_ids) if all_ids else 0,
+        'elapsed_seconds': round(elapsed, 3),
+        'orders_per_second': round(total / elapsed, 1) if elapsed else 0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="訂單編號並行碰撞測試")
+    parser.add_argument('--workers', type=int, default=4, help="模擬的 gunicorn worker（進程）數")
+    parser.add_argument('--threads', type=int, default=8, help="每個 worker 的執行緒數")
+    parser.add_argument('--orders', type=int, default=2000, help="每個執行緒建立的訂單數")
+    parser.add_argument('--rate', type=float, default=0, help="每個 worker 每秒的目標訂單數（0 = 不限速）")
+    parser.add_argument('--legacy', action='store_true', help="同時測試舊的時間戳編號方式")
+    args = parser.parse_args()
+
+    reports = [run_benchmark(args.workers, args.threads, args.orders, rate=args.rate)]
+    if args.legacy:
+        reports.append(run_benchmark(args.workers, args.threads, min(args.orders, 50), legacy=True, rate=args.rate))
+
+    for report in reports:
+        print(
+            f"[{report['mode']}] {report['orders']} orders, "
+            f"{report['orders_per_second']}/s, collisions={report['collisions']}, "
+            f"max length={report['max_length']}"
+        )
+
+    allocator = reports[0]
+    if allocator['collisions'] or allocator['max_length'] > 17:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
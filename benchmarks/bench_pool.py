@@ -0,0 +1,161 @@
+"""
+壓力測試：Firestore 連線池的 channel 數與吞吐量
+
+以 50 個並行客戶端混合呼叫後台（訂單分頁、訂單明細、商品、出貨報表）與前台
+（會員訂單紀錄、下單）路由，比較不同 channel 數下的延遲與吞吐量。
+
+記憶體內替身（預設）以 --max-concurrent-rpcs 模擬單一 gRPC channel 的串流上限、
+--rpc-latency-ms 模擬每次 RPC 的網路往返時間，channel 數不足時 RPC 會排隊等待；
+emulator 模式以 FirestoreClientPool.create 建立真正的 gRPC channel。
+
+使用方法：
+  python benchmarks/bench_pool.py --channels 1,2,4 --concurrency 50
+  python benchmarks/bench_pool.py --max-concurrent-rpcs 10 --rpc-latency-ms 20
+
+  # 使用 Firestore emulator（firebase emulators:start --only firestore）
+  FIRESTORE_EMULATOR_HOST=127.0.0.1:8080 python benchmarks/bench_pool.py --backend emulator
+
+預設停用進程內讀取快取，讓每個請求都實際呼叫資料庫。
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+from benchmarks.bench_routes import SCENARIOS, Scenario, _run_scenario, load_app, save_results, _git_sha  # noqa: E402
+from benchmarks.fake_firestore import FakeFirestoreClient  # noqa: E402
+from benchmarks.seed import seed  # noqa: E402
+from config import Config  # noqa: E402
+from services.database_adapter import DatabaseCache  # noqa: E402
+from services.firestore_service import FirestoreClientPool, FirestoreService  # noqa: E402
+from services.order_id_service import OrderIdService  # noqa: E402
+
+# 混合情境的組成：後台與前台請求
+MIXED_SCENARIOS = ('admin_orders_page', 'admin_order_detail', 'products', 'delivery_report',
+                   'member_history', 'member_history', 'create_order')
+
+
+def mixed_scenario():
+    """每個請求隨機挑選一個後台或前台情境（客戶端皆帶後台登入，前台路由不受影響）"""
+    by_name = {s.name: s for s in SCENARIOS}
+    choices = [by_name[name] for name in MIXED_SCENARIOS]
+
+    def request(ctx, rng):
+        return choices[rng.randrange(len(choices))].request(ctx, rng)
+
+    return Scenario('mixed', request, admin=True, writes=True)
+
+
+def create_pool(backend, base, channels, max_concurrent_rpcs):
+    """建立指定 channel 數的連線池"""
+    if backend == 'memory':
+        views = [base.channel(max_concurrent_rpcs) for _ in range(channels)]
+        return FirestoreClientPool(views, limiters=views)
+    from google.auth.credentials import AnonymousCredentials
+    project = Config.FIREBASE_PROJECT_ID or 'demo-bench'
+    return FirestoreClientPool.create(project, AnonymousCredentials(), channels=channels,
+                                      max_concurrent_rpcs=max_concurrent_rpcs)
+
+
+def run_benchmark(backend='memory', channels=(1, 2, 4), max_concurrent_rpcs=10, members=1000, orders=10000,
+                  requests=500, concurrency=50, warmup=1, cache=False, rpc_latency_ms=20.0, seed_value=42,
+                  log=print):
+    """依序以不同 channel 數執行混合情境，回傳結果 dict"""
+    if backend == 'memory':
+        base = FakeFirestoreClient()
+        stats = base.stats
+    else:
+        if not os.environ.get('FIRESTORE_EMULATOR_HOST'):
+            raise RuntimeError("emulator 模式需設定 FIRESTORE_EMULATOR_HOST")
+        base = create_pool(backend, None, 1, max_concurrent_rpcs)
+        stats = None
+
+    started = time.perf_counter()
+    ctx = seed(base, members=members, orders=orders, seed_value=seed_value)
+    log(f"Seeded {ctx['written']} documents in {time.perf_counter() - started:.1f}s")
+    if backend == 'memory':
+        # 建立資料不計延遲，之後的每次 RPC 才模擬網路往返
+        base.rpc_latency = rpc_latency_ms / 1000.0
+
+    app = load_app()
+    scenario = mixed_scenario()
+    saved = (FirestoreService._db, Config.LINE_CHANNEL_ACCESS_TOKEN, Config.DB_CACHE_ENABLED)
+    results = {}
+    try:
+        Config.LINE_CHANNEL_ACCESS_TOKEN = None  # 不發送 LINE 推播
+        Config.DB_CACHE_ENABLED = cache
+        OrderIdService.configure(0)
+        for count in channels:
+            pool = create_pool(backend, base, count, max_concurrent_rpcs)
+            FirestoreService._db = pool
+            DatabaseCache.clear()
+            result = _run_scenario(app, scenario, ctx, stats, requests, concurrency, warmup,
+                                   random.Random(seed_value).randrange(1 << 16))
+            results[f"channels_{count}"] = result
+            log(f"{count} channel(s)  p50 {result['latencyMs']['p50']:>9.2f}ms  "
+                f"p95 {result['latencyMs']['p95']:>9.2f}ms  p99 {result['latencyMs']['p99']:>9.2f}ms  "
+                f"{result['throughputRps']:>8.1f} req/s  errors {result['errors']}")
+            if backend != 'memory':
+                pool.close()
+    finally:
+        FirestoreService._db, Config.LINE_CHANNEL_ACCESS_TOKEN, Config.DB_CACHE_ENABLED = saved
+        DatabaseCache.clear()
+        OrderIdService._reset()
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'git': _git_sha(),
+            'backend': backend,
+            'python': sys.version.split()[0],
+            'rpcLatencyMs': rpc_latency_ms,
+            'maxConcurrentRpcs': max_concurrent_rpcs,
+            'cache': cache,
+            'requestsPerScenario': requests,
+            'concurrency': concurrency,
+            'seed': seed_value,
+            'dataset': ctx['counts']
+        },
+        'scenarios': results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Firestore 連線池壓力測試')
+    parser.add_argument('--backend', choices=['memory', 'emulator'], default='memory')
+    parser.add_argument('--channels', default='1,2,4', help='以逗號分隔的 channel 數')
+    parser.add_argument('--max-concurrent-rpcs', type=int, default=10, help='每個 channel 同時進行的 RPC 上限')
+    parser.add_argument('--members', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=500, help='每種 channel 數的請求數')
+    parser.add_argument('--concurrency', type=int, default=50, help='並行客戶端數')
+    parser.add_argument('--warmup', type=int, default=1, help='每個客戶端的暖身請求數')
+    parser.add_argument('--cache', action='store_true', help='啟用進程內讀取快取')
+    parser.add_argument('--rpc-latency-ms', type=float, default=20.0, help='記憶體後端每次 RPC 的模擬延遲')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='結果 JSON 路徑')
+    args = parser.parse_args()
+
+    result = run_benchmark(
+        backend=args.backend,
+        channels=[int(n) for n in args.channels.split(',') if n],
+        max_concurrent_rpcs=args.max_concurrent_rpcs,
+        members=args.members,
+        orders=args.orders,
+        requests=args.requests,
+        concurrency=args.concurrency,
+        warmup=args.warmup,
+        cache=args.cache,
+        rpc_latency_ms=args.rpc_latency_ms,
+        seed_value=args.seed
+    )
+    print(f"Results saved to {save_results(result, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,362 @@
+"""
+壓力測試：API 路由延遲、吞吐量與 Firestore 讀取數
+
+以合成資料填入記憶體內 Firestore 替身（預設）、SQLite 後端或本機 Firestore emulator，
+再以多個並行客戶端呼叫 Flask 路由，回報各情境的 p50/p95/p99 延遲、吞吐量、
+錯誤數與每個請求的文件讀取數 / RPC 次數，結果存成 JSON 供不同 commit 比較。
+
+使用方法：
+  python benchmarks/bench_routes.py --orders 10000 --members 1000 --concurrency 8
+  python benchmarks/bench_routes.py --orders 100000 --scenarios member_history,delivery_report
+  python benchmarks/bench_routes.py --compare benchmarks/results/<舊結果>.json
+
+  # 使用 SQLite 後端（DATABASE_BACKEND=sqlite，記憶體資料庫）
+  python benchmarks/bench_routes.py --backend sqlite
+
+  # 使用 Firestore emulator（firebase emulators:start --only firestore）
+  FIRESTORE_EMULATOR_HOST=127.0.0.1:8080 python benchmarks/bench_routes.py --backend emulator
+
+讀取數 / RPC 次數由記憶體內替身統計（查詢無結果計 1 次讀取，與 Firestore 計費相同），
+SQLite 後端的讀取數為回傳的資料列數、RPC 次數為 SQL 敘述數，emulator 模式只回報延遲與吞吐量。
+--rpc-latency-ms 可模擬每次 RPC 的網路往返時間。
+"""
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from unittest.mock import patch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+from benchmarks.fake_firestore import FakeFirestoreClient  # noqa: E402
+from benchmarks.seed import seed  # noqa: E402
+from config import Config  # noqa: E402
+from services.database_adapter import DatabaseCache  # noqa: E402
+from services.firestore_service import FirestoreService  # noqa: E402
+from services.sqlite_service import SQLiteService  # noqa: E402
+from services.order_id_service import OrderIdService  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+
+class Scenario:
+    """壓力測試情境：request(ctx, rng) 回傳 (method, path, json_body)"""
+
+    def __init__(self, name, request, admin=True, writes=False):
+        self.name = name
+        self.request = request
+        self.admin = admin
+        self.writes = writes
+
+
+def _pick(rng, items):
+    return items[rng.randrange(len(items))]
+
+
+SCENARIOS = [
+    Scenario('admin_orders_all', lambda ctx, rng: ('GET', '/api/admin/orders', None)),
+    Scenario('admin_orders_page', lambda ctx, rng: ('GET', '/api/admin/orders?limit=50', None)),
+    Scenario('admin_order_detail',
+             lambda ctx, rng: ('GET', f"/api/admin/order/{_pick(rng, ctx['orderIds'])}", None)),
+    Scenario('admin_members', lambda ctx, rng: ('GET', '/api/admin/members', None)),
+    Scenario('delivery_report',
+             lambda ctx, rng: ('GET', '/api/admin/reports/delivery-records?delivery_date='
+                               f"{_pick(rng, ctx['deliveryDates'][:10])}", None)),
+    Scenario('dashboard_stats', lambda ctx, rng: ('GET', '/api/admin/stats', None)),
+    Scenario('products', lambda ctx, rng: ('GET', '/api/admin/products', None)),
+    Scenario('stock_logs', lambda ctx, rng: ('GET', '/api/admin/stock-logs', None)),
+    Scenario('member_history',
+             lambda ctx, rng: ('POST', '/api/history', {'userId': _pick(rng, ctx['memberIds']), 'limit': 20}),
+             admin=False),
+    Scenario('orders_export', lambda ctx, rng: ('GET', '/api/admin/orders/export', None)),
+    Scenario('add_delivery',
+             lambda ctx, rng: ('POST', '/api/admin/order/add_delivery', {
+                 'orderId': _pick(rng, ctx['orderIds']),
+                 'userId': '',
+                 'qty': 1,
+                 'address': '壓力測試',
+                 'delivery_date': datetime.now().strftime('%Y-%m-%d'),
+                 'totalOrdered': 1
+             }), writes=True),
+    Scenario('create_order',
+             lambda ctx, rng: ('POST', '/api/order', {
+                 'userId': _pick(rng, ctx['memberIds']),
+                 'productId': _pick(rng, ctx['productIds']),
+                 'itemName': '雞蛋禮盒',
+                 'qty': 1,
+                 'paymentMethod': 'transfer'
+             }), admin=False, writes=True),
+]
+
+
+def percentile(sorted_values, pct):
+    """最近排名法百分位數"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _git_sha():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return 'unknown'
+
+
+def create_backend(backend, rpc_latency_ms=0.0):
+    """建立資料庫後端，回傳 (db, stats)；emulator 模式沒有讀取統計"""
+    if backend == 'memory':
+        db = FakeFirestoreClient(rpc_latency=rpc_latency_ms / 1000.0)
+        return db, db.stats
+    if backend == 'sqlite':
+        SQLiteService.init(':memory:')
+        return SQLiteService, SQLiteService.stats
+    if not os.environ.get('FIRESTORE_EMULATOR_HOST'):
+        raise RuntimeError("emulator 模式需設定 FIRESTORE_EMULATOR_HOST")
+    from google.auth.credentials import AnonymousCredentials
+    from google.cloud import firestore
+    project = Config.FIREBASE_PROJECT_ID or 'demo-bench'
+    return firestore.Client(project=project, credentials=AnonymousCredentials()), None
+
+
+def load_app():
+    """載入 Flask app（不連線正式 Firebase）"""
+    with patch.object(FirestoreService, 'init'):
+        from app import app
+    return app
+
+
+def _run_scenario(app, scenario, ctx, stats, requests, concurrency, warmup, seed_value):
+    latencies = []
+    reads = []
+    rpcs = []
+    errors = {}
+    lock = threading.Lock()
+    per_client = [requests // concurrency + (1 if i < requests % concurrency else 0)
+                  for i in range(concurrency)]
+    barrier = threading.Barrier(concurrency + 1)
+
+    def client_loop(index, count):
+        rng = random.Random(seed_value * 1000 + index)
+        client = app.test_client()
+        if scenario.admin:
+            with client.session_transaction() as sess:
+                sess['logged_in'] = True
+                sess['user_name'] = 'bench'
+
+        def call():
+            method, path, body = scenario.request(ctx, rng)
+            if stats is not None:
+                stats.begin_request()
+            started = time.perf_counter()
+            response = client.open(path, method=method, json=body)
+            response.get_data()
+            elapsed = time.perf_counter() - started
+            usage = stats.end_request() if stats is not None else None
+            response.close()
+            return response.status_code, elapsed, usage
+
+        for _ in range(warmup):
+            call()
+        barrier.wait()
+
+        local_latencies, local_reads, local_rpcs, local_errors = [], [], [], {}
+        for _ in range(count):
+            status, elapsed, usage = call()
+            local_latencies.append(elapsed)
+            if usage is not None:
+                local_reads.append(usage['reads'])
+                local_rpcs.append(usage['rpcs'])
+            if status >= 400:
+                local_errors[status] = local_errors.get(status, 0) + 1
+        with lock:
+            latencies.extend(local_latencies)
+            reads.extend(local_reads)
+            rpcs.extend(local_rpcs)
+            for status, n in local_errors.items():
+                errors[status] = errors.get(status, 0) + n
+
+    threads = [threading.Thread(target=client_loop, args=(i, n)) for i, n in enumerate(per_client)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+    ms = [v * 1000 for v in latencies]
+    result = {
+        'requests': len(latencies),
+        'concurrency': concurrency,
+        'errors': sum(errors.values()),
+        'errorStatuses': {str(k): v for k, v in sorted(errors.items())},
+        'durationSec': round(duration, 4),
+        'throughputRps': round(len(latencies) / duration, 2) if duration else 0.0,
+        'latencyMs': {
+            'p50': round(percentile(ms, 50), 3),
+            'p95': round(percentile(ms, 95), 3),
+            'p99': round(percentile(ms, 99), 3),
+            'mean': round(sum(ms) / len(ms), 3) if ms else 0.0,
+            'max': round(ms[-1], 3) if ms else 0.0
+        }
+    }
+    if reads:
+        result['readsPerRequest'] = round(sum(reads) / len(reads), 2)
+        result['maxReadsPerRequest'] = max(reads)
+        result['rpcsPerRequest'] = round(sum(rpcs) / len(rpcs), 2)
+    return result
+
+
+def run_benchmark(backend='memory', members=1000, orders=10000, products=20, stock_logs=2000,
+                  days=180, requests=200, concurrency=8, warmup=2, scenarios=None,
+                  cache=True, rpc_latency_ms=0.0, seed_value=42, log=print):
+    """建立資料、執行各情境並回傳結果 dict"""
+    db, stats = create_backend(backend, rpc_latency_ms)
+
+    started = time.perf_counter()
+    ctx = seed(db, members=members, orders=orders, products=products,
+               stock_logs=stock_logs, days=days, seed_value=seed_value)
+    log(f"Seeded {ctx['written']} documents in {time.perf_counter() - started:.1f}s")
+
+    selected = [s for s in SCENARIOS if not scenarios or s.name in scenarios]
+    unknown = set(scenarios or []) - {s.name for s in SCENARIOS}
+    if unknown:
+        raise ValueError(f"未知的情境：{', '.join(sorted(unknown))}")
+
+    app = load_app()
+    saved = (FirestoreService._db, Config.DATABASE_BACKEND, Config.LINE_CHANNEL_ACCESS_TOKEN, Config.DB_CACHE_ENABLED)
+    try:
+        if backend == 'sqlite':
+            Config.DATABASE_BACKEND = 'sqlite'
+        else:
+            FirestoreService._db = db
+        Config.LINE_CHANNEL_ACCESS_TOKEN = None  # 不發送 LINE 推播
+        Config.DB_CACHE_ENABLED = cache
+        DatabaseCache.clear()
+        OrderIdService.configure(0)
+
+        results = {}
+        # 唯讀情境先執行，寫入情境最後執行，避免改變讀取情境的資料量
+        for scenario in sorted(selected, key=lambda s: s.writes):
+            result = _run_scenario(app, scenario, ctx, stats, requests, concurrency, warmup, seed_value)
+            results[scenario.name] = result
+            log(f"{scenario.name:<20} p50 {result['latencyMs']['p50']:>9.2f}ms  "
+                f"p95 {result['latencyMs']['p95']:>9.2f}ms  p99 {result['latencyMs']['p99']:>9.2f}ms  "
+                f"{result['throughputRps']:>8.1f} req/s  "
+                f"reads {result.get('readsPerRequest', '-'):>8}  errors {result['errors']}")
+    finally:
+        FirestoreService._db, Config.DATABASE_BACKEND, Config.LINE_CHANNEL_ACCESS_TOKEN, Config.DB_CACHE_ENABLED = saved
+        DatabaseCache.clear()
+        OrderIdService._reset()
+
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git': _git_sha(),
+            'backend': backend,
+            'python': sys.version.split()[0],
+            'rpcLatencyMs': rpc_latency_ms,
+            'cache': cache,
+            'requestsPerScenario': requests,
+            'concurrency': concurrency,
+            'seed': seed_value,
+            'dataset': ctx['counts']
+        },
+        'scenarios': results
+    }
+
+
+def save_results(result, output=None):
+    """儲存結果 JSON，預設為 benchmarks/results/<時間>-<commit>.json"""
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{result['meta']['git']}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return output
+
+
+def compare_results(baseline, current):
+    """比較兩次結果，回傳每個情境的變化（負值代表變快 / 讀取變少）"""
+    rows = []
+    for name, now in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        row = {'scenario': name}
+        for key in ('p50', 'p95', 'p99'):
+            old, new = before['latencyMs'][key], now['latencyMs'][key]
+            row[key] = round((new - old) / old * 100, 1) if old else None
+        if 'readsPerRequest' in before and 'readsPerRequest' in now:
+            row['reads'] = round(now['readsPerRequest'] - before['readsPerRequest'], 2)
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='API 路由壓力測試')
+    parser.add_argument('--backend', choices=['memory', 'sqlite', 'emulator'], default='memory')
+    parser.add_argument('--members', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=10000)
+    parser.add_argument('--products', type=int, default=20)
+    parser.add_argument('--stock-logs', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=180, help='訂單建立時間分布天數')
+    parser.add_argument('--requests', type=int, default=200, help='每個情境的請求數')
+    parser.add_argument('--concurrency', type=int, default=8, help='並行客戶端數')
+    parser.add_argument('--warmup', type=int, default=2, help='每個客戶端的暖身請求數')
+    parser.add_argument('--scenarios', default='', help='以逗號分隔的情境名稱（預設全部）')
+    parser.add_argument('--no-cache', action='store_true', help='停用進程內讀取快取')
+    parser.add_argument('--rpc-latency-ms', type=float, default=0.0, help='記憶體後端每次 RPC 的模擬延遲')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='結果 JSON 路徑')
+    parser.add_argument('--compare', help='與先前的結果 JSON 比較')
+    parser.add_argument('--list', action='store_true', help='列出所有情境')
+    args = parser.parse_args()
+
+    if args.list:
+        for scenario in SCENARIOS:
+            print(scenario.name)
+        return
+
+    result = run_benchmark(
+        backend=args.backend,
+        members=args.members,
+        orders=args.orders,
+        products=args.products,
+        stock_logs=args.stock_logs,
+        days=args.days,
+        requests=args.requests,
+        concurrency=args.concurrency,
+        warmup=args.warmup,
+        scenarios=[s for s in args.scenarios.split(',') if s] or None,
+        cache=not args.no_cache,
+        rpc_latency_ms=args.rpc_latency_ms,
+        seed_value=args.seed
+    )
+    print(f"Results saved to {save_results(result, args.output)}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {baseline['meta'].get('git')} ({baseline['meta'].get('timestamp')}):")
+        for row in compare_results(baseline, result):
+            reads = f"  reads {row['reads']:+}" if 'reads' in row else ''
+            print(f"{row['scenario']:<20} p50 {row['p50']:+}%  p95 {row['p95']:+}%  p99 {row['p99']:+}%{reads}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,600 @@
+"""
+記憶體內的 Firestore 替身（壓力測試用）
+
+實作 FirestoreService 用到的 Client API 子集，行為盡量與 Firestore 一致：
+- 文件讀寫：get / set(merge) / create / update / delete、collection.add
+- 查詢：where（==、!=、<、<=、>、>=、in、not-in、array_contains）、order_by、
+  limit、start_after、select；篩選或排序欄位不存在的文件會被排除
+- 批次寫入（最多 500 筆）、交易（可搭配 firestore.transactional）、get_all
+- Increment、ArrayUnion、ArrayRemove、SERVER_TIMESTAMP、DELETE_FIELD
+
+並依 Firestore 計費方式統計文件讀取數（查詢無結果計 1 次）與 RPC 次數，
+可設定每次 RPC 的模擬延遲，讓結果接近實際的網路往返成本。
+
+max_concurrent_rpcs 模擬單一 gRPC channel 的 HTTP/2 串流上限（超過時 RPC 排隊等待），
+channel() 建立共用同一份資料的另一條模擬 channel，可放進 FirestoreClientPool。
+"""
+import copy
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from google.api_core.exceptions import AlreadyExists, InvalidArgument, NotFound
+from google.cloud.firestore_v1 import transforms
+
+BATCH_WRITE_LIMIT = 500
+
+
+class FakeStats:
+    """讀取數 / RPC 次數統計，另以 thread-local 記錄目前請求的用量"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reads = 0
+        self.writes = 0
+        self.rpcs = 0
+
+    def begin_request(self):
+        self._local.reads = 0
+        self._local.writes = 0
+        self._local.rpcs = 0
+
+    def end_request(self):
+        return {
+            'reads': getattr(self._local, 'reads', 0),
+            'writes': getattr(self._local, 'writes', 0),
+            'rpcs': getattr(self._local, 'rpcs', 0)
+        }
+
+    def record(self, reads=0, writes=0):
+        with self._lock:
+            self.reads += reads
+            self.writes += writes
+            self.rpcs += 1
+        self._local.reads = getattr(self._local, 'reads', 0) + reads
+        self._local.writes = getattr(self._local, 'writes', 0) + writes
+        self._local.rpcs = getattr(self._local, 'rpcs', 0) + 1
+
+
+# ===== 值比較（Firestore 型別排序：null < bool < number < timestamp < string < bytes < array < map） =====
+
+def _type_rank(value):
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, datetime):
+        return 3
+    if isinstance(value, str):
+        return 4
+    if isinstance(value, bytes):
+        return 5
+    if isinstance(value, (list, tuple)):
+        return 8
+    if isinstance(value, dict):
+        return 9
+    return 10
+
+
+def _normalize(value):
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def sort_key(value):
+    """排序用的鍵：先比型別順序，再比值"""
+    rank = _type_rank(value)
+    if rank == 0:
+        return rank, 0
+    if rank in (8, 9, 10):
+        return rank, repr(value)
+    return rank, _normalize(value)
+
+
+def compare_values(a, b):
+    ka, kb = sort_key(a), sort_key(b)
+    if ka == kb:
+        return 0
+    return -1 if ka < kb else 1
+
+
+_MISSING = object()
+
+
+def _get_field(data, path):
+    value = data
+    for part in path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _set_field(data, path, value):
+    parts = path.split('.')
+    target = data
+    for part in parts[:-1]:
+        target = target.setdefault(part, {})
+    target[parts[-1]] = value
+
+
+def _delete_field(data, path):
+    parts = path.split('.')
+    target = data
+    for part in parts[:-1]:
+        target = target.get(part)
+        if not isinstance(target, dict):
+            return
+    target.pop(parts[-1], None)
+
+
+def _apply_value(data, path, value):
+    """寫入單一欄位，處理 transforms 與 sentinel"""
+    if value is transforms.DELETE_FIELD:
+        _delete_field(data, path)
+        return
+    if value is transforms.SERVER_TIMESTAMP:
+        _set_field(data, path, datetime.now(timezone.utc))
+        return
+    current = _get_field(data, path)
+    if isinstance(value, transforms.Increment):
+        base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0
+        _set_field(data, path, base + value.value)
+        return
+    if isinstance(value, transforms.ArrayUnion):
+        items = list(current) if isinstance(current, list) else []
+        for item in value.values:
+            if item not in items:
+                items.append(copy.deepcopy(item))
+        _set_field(data, path, items)
+        return
+    if isinstance(value, transforms.ArrayRemove):
+        items = list(current) if isinstance(current, list) else []
+        _set_field(data, path, [i for i in items if i not in value.values])
+        return
+    if isinstance(value, dict):
+        nested = {}
+        for key, item in value.items():
+            _apply_value(nested, key, item)
+        _set_field(data, path, nested)
+        return
+    _set_field(data, path, copy.deepcopy(value))
+
+
+def _project(data, field_paths):
+    """只保留指定欄位（select 投影）"""
+    projected = {}
+    for field_path in field_paths:
+        value = _get_field(data, field_path)
+        if value is not _MISSING:
+            _set_field(projected, field_path, value)
+    return projected
+
+
+def _merge(data, updates, prefix=''):
+    for key, value in updates.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict) and isinstance(_get_field(data, path), dict):
+            _merge(data, value, f"{path}.")
+        else:
+            _apply_value(data, path, value)
+
+
+# ===== 文件 =====
+
+class FakeSnapshot:
+
+    def __init__(self, reference, data):
+        self.reference = reference
+        self._data = data
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        value = _get_field(self._data or {}, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+
+class FakeDocumentReference:
+
+    def __init__(self, client, collection, doc_id):
+        self._client = client
+        self._collection = collection
+        self.id = doc_id
+
+    @property
+    def path(self):
+        return f"{self._collection}/{self.id}"
+
+    def __eq__(self, other):
+        return isinstance(other, FakeDocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def get(self, field_paths=None, transaction=None, **kwargs):
+        self._client._rpc(reads=1)
+        return FakeSnapshot(self, self._client._read(self._collection, self.id))
+
+    def set(self, document_data, merge=False):
+        self._client._commit([('set', self, document_data, merge)])
+
+    def create(self, document_data):
+        self._client._commit([('create', self, document_data, False)])
+
+    def update(self, field_updates, **kwargs):
+        self._client._commit([('update', self, field_updates, False)])
+
+    def delete(self, **kwargs):
+        self._client._commit([('delete', self, None, False)])
+
+    def collection(self, name):
+        return FakeCollection(self._client, f"{self.path}/{name}")
+
+
+# ===== 查詢 =====
+
+class FakeQuery:
+
+    def __init__(self, client, collection, filters=(), orders=(), limit=None, cursor=None, projection=None):
+        self._client = client
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._cursor = cursor
+        self._projection = projection
+
+    def _copy(self, **changes):
+        params = {
+            'filters': self._filters, 'orders': self._orders,
+            'limit': self._limit, 'cursor': self._cursor, 'projection': self._projection
+        }
+        params.update(changes)
+        return FakeQuery(self._client, self._collection, **params)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction='ASCENDING'):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(cursor=document_fields_or_snapshot)
+
+    def select(self, field_paths):
+        return self._copy(projection=tuple(field_paths))
+
+    @staticmethod
+    def _matches(doc_id, data, field_path, op, value):
+        actual = doc_id if field_path == '__name__' else _get_field(data, field_path)
+        if actual is _MISSING:
+            return False
+        if op == '==':
+            return compare_values(actual, value) == 0
+        if op == '!=':
+            return actual is not None and compare_values(actual, value) != 0
+        if op == 'in':
+            return any(compare_values(actual, v) == 0 for v in value)
+        if op == 'not-in':
+            return actual is not None and all(compare_values(actual, v) != 0 for v in value)
+        if op == 'array_contains':
+            return isinstance(actual, list) and value in actual
+        if op == 'array_contains_any':
+            return isinstance(actual, list) and any(v in actual for v in value)
+        if _type_rank(actual) != _type_rank(value):
+            return False
+        result = compare_values(actual, value)
+        return {'<': result < 0, '<=': result <= 0, '>': result > 0, '>=': result >= 0}[op]
+
+    def _effective_orders(self):
+        orders = list(self._orders)
+        # Firestore 對不等式篩選欄位隱含排序（接在明確排序之後，方向同最後一個排序）
+        last_direction = orders[-1][1] if orders else 'ASCENDING'
+        for field_path, op, _ in self._filters:
+            if op in ('<', '<=', '>', '>=', '!=', 'not-in') and all(f != field_path for f, _ in orders):
+                orders.append((field_path, last_direction))
+        if not any(f == '__name__' for f, _ in orders):
+            orders.append(('__name__', last_direction))
+        return orders
+
+    @staticmethod
+    def _sort_value(doc_id, data, field_path):
+        return doc_id if field_path == '__name__' else _get_field(data, field_path)
+
+    def _cursor_values(self, orders):
+        cursor = self._cursor
+        if isinstance(cursor, FakeSnapshot):
+            data = cursor.to_dict() or {}
+            return [self._sort_value(cursor.id, data, f) for f, _ in orders]
+        values = []
+        for field_path, _ in orders:
+            if field_path not in cursor:
+                break
+            values.append(cursor[field_path])
+        return values
+
+    def _after_cursor(self, orders, cursor_values, doc_id, data):
+        for (field_path, direction), cursor_value in zip(orders, cursor_values):
+            result = compare_values(self._sort_value(doc_id, data, field_path), cursor_value)
+            if result:
+                return (result > 0) if direction != 'DESCENDING' else (result < 0)
+        return False
+
+    def _run(self):
+        orders = self._effective_orders()
+        docs = []
+        for doc_id, data in self._client._scan(self._collection):
+            if not all(self._matches(doc_id, data, f, op, v) for f, op, v in self._filters):
+                continue
+            if any(f != '__name__' and _get_field(data, f) is _MISSING for f, _ in orders):
+                continue
+            docs.append((doc_id, data))
+        # 由最後一個排序欄位開始做穩定排序，等同多欄位排序
+        for field_path, direction in reversed(orders):
+            docs.sort(key=lambda d: sort_key(self._sort_value(d[0], d[1], field_path)),
+                      reverse=direction == 'DESCENDING')
+        if self._cursor is not None:
+            cursor_values = self._cursor_values(orders)
+            docs = [d for d in docs if self._after_cursor(orders, cursor_values, d[0], d[1])]
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        # 查詢即使沒有結果也計 1 次讀取
+        self._client._rpc(reads=max(len(docs), 1))
+        if self._projection is not None:
+            docs = [(doc_id, _project(data, self._projection)) for doc_id, data in docs]
+        return [
+            FakeSnapshot(FakeDocumentReference(self._client, self._collection, doc_id), data)
+            for doc_id, data in docs
+        ]
+
+    def stream(self, transaction=None, **kwargs):
+        return iter(self._run())
+
+    def get(self, transaction=None, **kwargs):
+        return self._run()
+
+
+class FakeCollection(FakeQuery):
+
+    def __init__(self, client, name):
+        super().__init__(client, name)
+        self.id = name.rsplit('/', 1)[-1]
+
+    def document(self, document_id=None):
+        return FakeDocumentReference(self._client, self._collection, document_id or uuid.uuid4().hex[:20])
+
+    def add(self, document_data, document_id=None):
+        ref = self.document(document_id)
+        ref.create(document_data)
+        return datetime.now(timezone.utc), ref
+
+    def list_documents(self):
+        return [self.document(doc_id) for doc_id, _ in self._client._scan(self._collection)]
+
+
+# ===== 批次與交易 =====
+
+class FakeWriteBatch:
+
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, reference, document_data, merge=False):
+        self._ops.append(('set', reference, document_data, merge))
+
+    def create(self, reference, document_data):
+        self._ops.append(('create', reference, document_data, False))
+
+    def update(self, reference, field_updates, **kwargs):
+        self._ops.append(('update', reference, field_updates, False))
+
+    def delete(self, reference, **kwargs):
+        self._ops.append(('delete', reference, None, False))
+
+    def commit(self, **kwargs):
+        ops, self._ops = self._ops, []
+        return self._client._commit(ops)
+
+
+class FakeTransaction(FakeWriteBatch):
+    """與 firestore.transactional 相容的交易；交易之間以鎖序列化"""
+
+    _read_only = False
+    _max_attempts = 5
+
+    def __init__(self, client):
+        super().__init__(client)
+        self._id = None
+        self._held = False
+
+    @property
+    def in_progress(self):
+        return self._id is not None
+
+    @property
+    def id(self):
+        return self._id
+
+    def _clean_up(self):
+        self._ops = []
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._client._tx_lock.acquire()
+        self._held = True
+        self._id = uuid.uuid4().bytes
+
+    def _release(self):
+        if self._held:
+            self._held = False
+            self._client._tx_lock.release()
+
+    def _commit(self):
+        try:
+            return self.commit()
+        finally:
+            self._clean_up()
+            self._release()
+
+    def _rollback(self):
+        self._clean_up()
+        self._release()
+
+    def get(self, ref_or_query, **kwargs):
+        if isinstance(ref_or_query, FakeDocumentReference):
+            return iter([ref_or_query.get()])
+        return ref_or_query.stream()
+
+    def get_all(self, references, **kwargs):
+        return self._client.get_all(references)
+
+
+# ===== Client =====
+
+class FakeFirestoreClient:
+    """記憶體內 Firestore Client"""
+
+    def __init__(self, rpc_latency=0.0, max_concurrent_rpcs=None):
+        self._data = {}
+        self._lock = threading.RLock()
+        self._tx_lock = threading.RLock()
+        self.rpc_latency = rpc_latency
+        self.stats = FakeStats()
+        self._set_channel_limit(max_concurrent_rpcs)
+
+    def _set_channel_limit(self, max_concurrent_rpcs):
+        self.max_concurrent = max_concurrent_rpcs
+        self._channel_slots = threading.BoundedSemaphore(max_concurrent_rpcs) if max_concurrent_rpcs else None
+        self._in_flight_lock = threading.Lock()
+        self.in_flight = 0
+
+    def channel(self, max_concurrent_rpcs=None):
+        """另一條模擬 channel：共用資料、鎖與統計，各自的串流上限"""
+        view = copy.copy(self)
+        view._set_channel_limit(max_concurrent_rpcs or self.max_concurrent)
+        return view
+
+    def _rpc(self, reads=0, writes=0):
+        self.stats.record(reads=reads, writes=writes)
+        if self._channel_slots is None:
+            if self.rpc_latency:
+                time.sleep(self.rpc_latency)
+            return
+        # RPC 進行期間佔用 channel 的一個串流
+        with self._channel_slots:
+            with self._in_flight_lock:
+                self.in_flight += 1
+            try:
+                if self.rpc_latency:
+                    time.sleep(self.rpc_latency)
+            finally:
+                with self._in_flight_lock:
+                    self.in_flight -= 1
+
+    # 已提交的文件不會被原地修改（寫入時整份替換），讀取可直接共用，
+    # 由 FakeSnapshot.to_dict() 回傳副本
+
+    def _read(self, collection, doc_id):
+        with self._lock:
+            return self._data.get(collection, {}).get(doc_id)
+
+    def _scan(self, collection):
+        with self._lock:
+            return list(self._data.get(collection, {}).items())
+
+    def _commit(self, ops):
+        if len(ops) > BATCH_WRITE_LIMIT:
+            raise InvalidArgument(f"maximum {BATCH_WRITE_LIMIT} writes allowed per request")
+        with self._lock:
+            # 先在副本上套用，全部成功才寫回（原子性）
+            staged = {}
+            for op, ref, data, merge in ops:
+                key = (ref._collection, ref.id)
+                current = staged[key] if key in staged else copy.deepcopy(
+                    self._data.get(ref._collection, {}).get(ref.id)
+                )
+                if op == 'create':
+                    if current is not None:
+                        raise AlreadyExists(f"Document already exists: {ref.path}")
+                    current = {}
+                    _merge(current, data)
+                elif op == 'set':
+                    if current is None or not merge:
+                        current = {}
+                    _merge(current, data)
+                elif op == 'update':
+                    if current is None:
+                        raise NotFound(f"No document to update: {ref.path}")
+                    for field_path, value in data.items():
+                        _apply_value(current, field_path, value)
+                elif op == 'delete':
+                    current = None
+                staged[key] = current
+            for (collection, doc_id), data in staged.items():
+                docs = self._data.setdefault(collection, {})
+                if data is None:
+                    docs.pop(doc_id, None)
+                else:
+                    docs[doc_id] = data
+        self._rpc(writes=len(ops))
+        return []
+
+    def load(self, collection, doc_id, data):
+        """直接寫入資料（建立測試資料用，不計入統計）"""
+        with self._lock:
+            self._data.setdefault(collection, {})[doc_id] = copy.deepcopy(data)
+
+    def count(self, collection):
+        with self._lock:
+            return len(self._data.get(collection, {}))
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def document(self, path):
+        collection, doc_id = path.rsplit('/', 1)
+        return FakeDocumentReference(self, collection, doc_id)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def transaction(self, **kwargs):
+        return FakeTransaction(self)
+
+    def get_all(self, references, field_paths=None, transaction=None, **kwargs):
+        references = list(references)
+        self._rpc(reads=len(references))
+        snapshots = []
+        for ref in references:
+            data = self._read(ref._collection, ref.id)
+            if data is not None and field_paths is not None:
+                data = _project(data, field_paths)
+            snapshots.append(FakeSnapshot(ref, data))
+        return iter(snapshots)
+
+    def collections(self):
+        with self._lock:
+            return [FakeCollection(self, name) for name in self._data if '/' not in name]
@@ -0,0 +1,249 @@
+"""
+壓力測試資料產生器
+
+以固定亂數種子產生可重現的會員、商品、分類、訂單（含出貨紀錄與出貨日索引）、
+庫存異動與審計紀錄，欄位格式與 FirestoreService 寫入的文件一致。
+
+可寫入記憶體內 Firestore 替身（benchmarks/fake_firestore.py）或
+Firestore emulator（以 500 筆為一批寫入）。
+"""
+import random
+from datetime import datetime, timedelta
+
+import pytz
+
+from config import Config
+
+TW_TZ = pytz.timezone(Config.TIMEZONE)
+
+# Firestore 單一批次寫入上限
+BATCH_LIMIT = 500
+
+ORDER_STATUSES = ['處理中', '處理中', '部分配送', '已完成', '已完成', '已刪除']
+PAYMENT_STATUSES = ['未付款', '已付款', '已付款', '待付款']
+ADDRESSES = ['新竹市東區光復路', '新竹縣竹北市自強路', '台北市大安區復興南路', '桃園市中壢區中大路']
+
+
+class _Writer:
+    """依後端選擇直接載入或分批寫入"""
+
+    def __init__(self, db):
+        self._db = db
+        self._batch = None
+        self._pending = 0
+        self.written = 0
+
+    def set(self, collection, doc_id, data):
+        self.written += 1
+        if hasattr(self._db, 'load'):
+            self._db.load(collection, doc_id, data)
+            return
+        if self._batch is None:
+            self._batch = self._db.batch()
+        self._batch.set(self._db.collection(collection).document(doc_id), data)
+        self._pending += 1
+        if self._pending >= BATCH_LIMIT:
+            self.flush()
+
+    def flush(self):
+        if self._batch is not None and self._pending:
+            self._batch.commit()
+        self._batch = None
+        self._pending = 0
+
+
+def seed(db, members=1000, orders=10000, products=20, stock_logs=2000, days=180, seed_value=42):
+    """產生壓力測試資料
+
+    Args:
+        db: Firestore Client（或記憶體內替身）
+        members: 會員數
+        orders: 訂單數（平均分配給會員，建立時間分散在最近 days 天）
+        products: 商品數
+        stock_logs: 庫存異動紀錄數
+        days: 訂單建立時間的分布天數
+        seed_value: 亂數種子
+
+    Returns:
+        dict: 各集合筆數，以及壓力測試情境使用的樣本（會員、訂單、出貨日）
+    """
+    rng = random.Random(seed_value)
+    writer = _Writer(db)
+    now = datetime.now(TW_TZ).replace(microsecond=0)
+    start = now - timedelta(days=days)
+
+    # ===== 分類與商品 =====
+    category_ids = [f"cat_bench_{i:02d}" for i in range(max(1, products // 5))]
+    for i, category_id in enumerate(category_ids):
+        writer.set('categories', category_id, {
+            'name': f"分類 {i + 1}",
+            'description': '',
+            'color': '',
+            'icon': '',
+            'status': 'active',
+            'createdAt': start,
+            'updatedAt': start
+        })
+
+    product_list = []
+    for i in range(products):
+        product_id = f"prod_bench_{i:04d}"
+        product = {
+            'productId': product_id,
+            'name': f"雞蛋禮盒 {i + 1}",
+            'description': '',
+            'unit': '盒',
+            'price': float(rng.choice([150, 180, 240, 300, 360])),
+            'cost': 100.0,
+            'stock': rng.randint(0, 500),
+            'minStockAlert': 10,
+            'maxStockAlert': 1000,
+            'categoryId': category_ids[i % len(category_ids)],
+            'supplierId': '',
+            'image': '',
+            'actualQuantity': rng.choice([1, 1, 10, 30]),
+            'status': 'active',
+            'createdAt': start,
+            'updatedAt': start
+        }
+        product_list.append(product)
+        writer.set('products', product_id, product)
+
+    # ===== 會員 =====
+    member_ids = []
+    for i in range(members):
+        user_id = f"U{rng.getrandbits(128):032x}"
+        member_ids.append(user_id)
+        created_at = start + timedelta(seconds=rng.randrange(days * 86400))
+        writer.set('members', user_id, {
+            'userId': user_id,
+            'name': f"會員{i:05d}",
+            'phone': f"09{i:08d}",
+            'address': rng.choice(ADDRESSES),
+            'birthDate': '',
+            'address2': '',
+            'status': 'active',
+            'createdAt': created_at,
+            'updatedAt': created_at
+        })
+
+    # ===== 訂單、出貨紀錄與出貨日索引 =====
+    order_ids = []
+    delivery_dates = {}
+    deliveries = 0
+    for i in range(orders):
+        created_at = start + timedelta(seconds=int(i * days * 86400 / max(orders, 1)))
+        order_id = f"ORD{int(created_at.timestamp()) - 1704038400:09d}99{i % 1000:03d}"
+        user_id = member_ids[rng.randrange(len(member_ids))] if member_ids else ''
+        product = rng.choice(product_list)
+        order_qty = rng.randint(1, 5)
+        expected_total = product['actualQuantity'] * order_qty
+        status = rng.choice(ORDER_STATUSES)
+
+        # 已完成：全數出貨；部分配送：出貨 1 ~ 應出貨數 - 1，分成 1 ~ 3 筆紀錄
+        if status == '已完成':
+            delivered = expected_total
+        elif status == '部分配送' and expected_total > 1:
+            delivered = rng.randint(1, expected_total - 1)
+        else:
+            delivered = 0
+            if status == '部分配送':
+                status = '處理中'
+
+        logs = []
+        remaining = delivered
+        count = min(rng.randint(1, 3), delivered)
+        for n in range(count):
+            qty = remaining if n == count - 1 else rng.randint(1, remaining - (count - n - 1))
+            remaining -= qty
+            stamp = created_at + timedelta(days=rng.randint(1, 14))
+            logs.append({
+                'logId': f"{order_id}-{n}",
+                'stamp': stamp.strftime('%Y-%m-%d %H:%M:%S'),
+                'delivery_date': stamp.strftime('%Y-%m-%d'),
+                'qty': qty,
+                'address': rng.choice(ADDRESSES)
+            })
+
+        order_ids.append(order_id)
+        writer.set('orders', order_id, {
+            'orderId': order_id,
+            'userId': user_id,
+            'productId': product['productId'],
+            'items': f"{product['name']} x{order_qty}",
+            'amount': int(product['price'] * order_qty),
+            'status': status,
+            'paymentStatus': rng.choice(PAYMENT_STATUSES),
+            'paymentMethod': rng.choice(['transfer', 'ecpay']),
+            'actualQuantity': product['actualQuantity'],
+            'orderQty': order_qty,
+            'expectedTotal': expected_total,
+            'totalDelivered': delivered,
+            'date': created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'deliveryLogs': logs,
+            'createdAt': created_at,
+            'updatedAt': created_at
+        })
+        for log in logs:
+            deliveries += 1
+            delivery_dates[log['delivery_date']] = delivery_dates.get(log['delivery_date'], 0) + 1
+            writer.set('deliveries', log['logId'], {
+                'logId': log['logId'],
+                'orderId': order_id,
+                'userId': user_id,
+                'delivery_date': log['delivery_date'],
+                'qty': log['qty'],
+                'address': log['address'],
+                'updatedAt': created_at
+            })
+
+    # ===== 庫存異動與審計紀錄 =====
+    for i in range(stock_logs):
+        product = rng.choice(product_list)
+        quantity = rng.randint(1, 50)
+        old_stock = rng.randint(0, 500)
+        outgoing = rng.random() < 0.6
+        timestamp = start + timedelta(seconds=rng.randrange(days * 86400))
+        writer.set('stockLogs', f"stocklog_bench_{i:07d}", {
+            'productId': product['productId'],
+            'productName': product['name'],
+            'type': 'out' if outgoing else 'in',
+            'quantity': quantity,
+            'oldStock': old_stock,
+            'newStock': old_stock - quantity if outgoing else old_stock + quantity,
+            'reason': '出貨' if outgoing else '進貨',
+            'operator': 'admin',
+            'timestamp': timestamp.isoformat()
+        })
+
+    audited = order_ids[::max(1, len(order_ids) // 100)] if order_ids else []
+    for i, order_id in enumerate(audited):
+        writer.set('auditLogs', f"audit_bench_{i:05d}", {
+            'timestamp': now.isoformat(),
+            'orderId': order_id,
+            'operation': 'correct_delivery',
+            'adminName': 'admin',
+            'beforeValue': {'qty': 2},
+            'afterValue': {'qty': 1},
+            'reason': '數量修正'
+        })
+
+    writer.flush()
+
+    busiest = sorted(delivery_dates.items(), key=lambda item: (-item[1], item[0]))
+    return {
+        'counts': {
+            'members': members,
+            'products': products,
+            'categories': len(category_ids),
+            'orders': orders,
+            'deliveries': deliveries,
+            'stockLogs': stock_logs,
+            'auditLogs': len(audited)
+        },
+        'written': writer.written,
+        'memberIds': member_ids,
+        'orderIds': order_ids,
+        'productIds': [p['productId'] for p in product_list],
+        'deliveryDates': [date for date, _ in busiest]
+    }
@@ -42,6 +42,17 @@ class Config:
     
     # LINE Bot 配置
     LINE_CHANNEL_ACCESS_TOKEN = os.getenv('LINE_CHANNEL_ACCESS_TOKEN')
+    # LINE API 位址，可指向本機 stub（tests/line_stub.py）進行測試
+    LINE_API_HOST = os.getenv('LINE_API_HOST', 'https://api.line.me')
+    
+    # LINE 推播背景派送 (請求只寫入 outbox 並排入佇列，由工作執行緒送出)
+    LINE_DISPATCH_ASYNC = os.getenv('LINE_DISPATCH_ASYNC', 'true').lower() == 'true'
+    LINE_DISPATCH_WORKERS = int(os.getenv('LINE_DISPATCH_WORKERS', 2))
+    LINE_DISPATCH_QUEUE_SIZE = int(os.getenv('LINE_DISPATCH_QUEUE_SIZE', 1000))
+    LINE_DISPATCH_MAX_ATTEMPTS = int(os.getenv('LINE_DISPATCH_MAX_ATTEMPTS', 5))
+    LINE_DISPATCH_BACKOFF = float(os.getenv('LINE_DISPATCH_BACKOFF', 1.0))  # 秒，每次重試加倍
+    # outbox 租約 (秒)：updatedAt 超過此時間未更新的 pending 訊息才由重新啟動的進程補送，需大於重試間隔
+    LINE_OUTBOX_LEASE_SECONDS = int(os.getenv('LINE_OUTBOX_LEASE_SECONDS', 300))
     
     # ECPay 配置 - 從 .env 檔案讀取 (不要在程式碼中硬編碼)
     ECPAY_MERCHANT_ID = os.getenv('ECPAY_MERCHANT_ID')
@@ -49,9 +60,47 @@ class Config:
     ECPAY_HASH_IV = os.getenv('ECPAY_HASH_IV')
     ECPAY_ACTION_URL = 'https://payment.ecpay.com.tw/Cashier/AioCheckOut/V5'
     
+    # 訂單編號 worker 編號：未設定時由 Firestore 租約自動分配（0-99）
+    ORDER_ID_WORKER_ID = os.getenv('ORDER_ID_WORKER_ID')
+    ORDER_ID_LEASE_SECONDS = int(os.getenv('ORDER_ID_LEASE_SECONDS', 600))
+    
     # 應用程式基礎 URL
     APP_BASE_URL = os.getenv('APP_BASE_URL', None)
     
+    # 資料庫後端：firestore（預設）或 sqlite（本機開發、壓力測試、單機部署，不需 Firebase 憑證）
+    DATABASE_BACKEND = os.getenv('DATABASE_BACKEND', 'firestore').lower()
+    SQLITE_PATH = os.getenv('SQLITE_PATH', 'data.sqlite3')
+    
+    # Firestore 連線池：gRPC channel 數、每個 channel 的並行 RPC 上限、deadline 與重試
+    FIRESTORE_CHANNELS = int(os.getenv('FIRESTORE_CHANNELS', 2))
+    FIRESTORE_MAX_CONCURRENT_RPCS = int(os.getenv('FIRESTORE_MAX_CONCURRENT_RPCS', 100))  # HTTP/2 單一連線的串流上限
+    FIRESTORE_RPC_TIMEOUT = float(os.getenv('FIRESTORE_RPC_TIMEOUT', 10))  # 秒，單次 RPC
+    FIRESTORE_STREAM_TIMEOUT = float(os.getenv('FIRESTORE_STREAM_TIMEOUT', 120))  # 秒，查詢與批次讀取串流
+    FIRESTORE_RETRY_DEADLINE = float(os.getenv('FIRESTORE_RETRY_DEADLINE', 30))  # 秒，含重試的總時間
+    FIRESTORE_KEEPALIVE_MS = int(os.getenv('FIRESTORE_KEEPALIVE_MS', 30000))
+    
+    # 資料庫讀取快取 (進程內，各 worker 各自一份；單位：秒)
+    DB_CACHE_ENABLED = os.getenv('DB_CACHE_ENABLED', 'true').lower() == 'true'
+    DB_CACHE_TTL = {
+        'products': int(os.getenv('DB_CACHE_TTL_PRODUCTS', 60)),
+        'categories': int(os.getenv('DB_CACHE_TTL_CATEGORIES', 300)),
+        'discounts': int(os.getenv('DB_CACHE_TTL_DISCOUNTS', 60)),
+        'stockAlerts': int(os.getenv('DB_CACHE_TTL_STOCK_ALERTS', 15)),  # 警告清單版本（ETag）
+    }
+    DB_CACHE_MAX_DOCUMENTS = int(os.getenv('DB_CACHE_MAX_DOCUMENTS', 512))
+    
+    # 資料庫用量統計：每個請求回傳 Server-Timing 標頭（讀寫數、RPC 次數、耗時）
+    DB_INSTRUMENTATION_ENABLED = os.getenv('DB_INSTRUMENTATION_ENABLED', 'true').lower() == 'true'
+    DB_SLOW_REQUEST_MS = float(os.getenv('DB_SLOW_REQUEST_MS', 1000))  # 超過此毫秒數以 WARNING 記錄
+    DB_USAGE_LOG_ALL = os.getenv('DB_USAGE_LOG_ALL', 'false').lower() == 'true'  # 每個請求都寫入用量日誌
+    
+    # 監控指標 (/metrics，Prometheus 文字格式)
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # 抓取端以 Authorization: Bearer <token> 存取；未設定時只允許已登入的管理員
+    # 多個 gunicorn worker 共用的目錄，各進程定期寫入自己的數值，/metrics 合併輸出
+    METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR') or os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 1.0))  # 秒
+    
     # 日誌配置
     LOG_FILE = 'ecpay_callback.log'
     LOG_FORMAT = '%(asctime)s %(levelname)s: %(message)s'
@@ -64,7 +113,7 @@ class ProductConfig:
         "土雞蛋1盤": 250
     }
     
-    # 土雞蛋 1 盤的分級定價
+    # 土雞蛋 1 盤的分級定價 (最低數量, 最高數量, 單價)；商品文件未設定 bulkPricing 時依商品名稱套用
     BULK_PRICING = {
         "土雞蛋1盤": [
             (1, 9, 250),      # 1-9盤: $250
@@ -75,11 +124,6 @@ class ProductConfig:
     
     @staticmethod
     def get_unit_price(item_name, qty):
-        """獲取單位價格，考慮批量折扣"""
-        if item_name not in ProductConfig.BULK_PRICING:
-            return ProductConfig.PRODUCTS.get(item_name)
-        
-        for min_qty, max_qty, price in ProductConfig.BULK_PRICING[item_name]:
-            if min_qty <= qty <= max_qty:
-                return price
-        return ProductConfig.PRODUCTS.get(item_name, 0)
+        """獲取單位價格，考慮批量折扣（由計價引擎查詢編譯後的級距）"""
+        from services.pricing_service import config_unit_price
+        return config_unit_price(item_name, qty)
@@ -0,0 +1,21 @@
+"""
+gunicorn 設定（Procfile：gunicorn app:app 會自動載入本檔）
+
+- 資料庫連線在 worker fork 之後才建立（gRPC 連線不能跨 fork 共用），
+  post_fork 在背景預先初始化，worker 不必等待即可開始服務頁面
+- 啟動時清空多進程監控指標目錄（METRICS_MULTIPROC_DIR），避免累加上次執行的數值
+"""
+import os
+import shutil
+
+
+def on_starting(server):
+    directory = os.getenv('METRICS_MULTIPROC_DIR') or os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def post_fork(server, worker):
+    from services.database_adapter import DatabaseAdapter
+    DatabaseAdapter.warm_up()
@@ -0,0 +1,102 @@
+"""
+遷移腳本：為舊訂單回填 totalDelivered 和 expectedTotal 計數欄位
+
+使用方法：
+  python migrate_delivery_counters.py
+
+此腳本會：
+1. 遍歷所有訂單
+2. 對於缺少 totalDelivered 或 expectedTotal 的訂單，依 deliveryLogs 與訂購數量計算
+3. 以批次寫入（每批最多 500 筆）回填欄位
+
+回填後，出貨紀錄與訂單查詢直接使用這兩個欄位，不再逐筆加總 deliveryLogs。
+"""
+
+import firebase_admin
+from firebase_admin import credentials, firestore
+from config import Config
+from services import order_rules
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Firestore 單一批次寫入上限
+BATCH_LIMIT = 500
+
+# 初始化 Firebase
+if not firebase_admin._apps:
+    creds_dict = {
+        "type": "service_account",
+        "project_id": Config.FIREBASE_PROJECT_ID,
+        "private_key": Config.FIREBASE_PRIVATE_KEY.replace('\\n', '\n') if Config.FIREBASE_PRIVATE_KEY else None,
+        "client_email": Config.FIREBASE_CLIENT_EMAIL,
+        "client_id": Config.FIREBASE_CLIENT_ID,
+        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+        "token_uri": "https://oauth2.googleapis.com/token",
+        "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs"
+    }
+    cred = credentials.Certificate(creds_dict)
+    firebase_admin.initialize_app(cred)
+
+db = firestore.client()
+
+
+def migrate_delivery_counters():
+    """回填所有訂單的出貨計數欄位"""
+    orders_ref = db.collection('orders')
+
+    total_orders = 0
+    updated_orders = 0
+    skipped_orders = 0
+
+    batch = db.batch()
+    pending = 0
+
+    for order_doc in orders_ref.stream():
+        total_orders += 1
+        order = order_doc.to_dict()
+        order_id = order.get('orderId', order_doc.id)
+
+        if order.get('totalDelivered') is not None and order.get('expectedTotal') is not None:
+            skipped_orders += 1
+            continue
+
+        # 忽略既有（可能不完整的）欄位，一律從原始資料重新計算
+        source = {k: v for k, v in order.items() if k not in ('totalDelivered', 'expectedTotal')}
+        expected_total = order_rules.expected_total(source)
+        total_delivered = order_rules.total_delivered(source)
+
+        batch.update(order_doc.reference, {
+            'expectedTotal': expected_total,
+            'totalDelivered': total_delivered
+        })
+        pending += 1
+        updated_orders += 1
+        logger.info(f"[UPDATE] {order_id} - expectedTotal={expected_total}, totalDelivered={total_delivered}")
+
+        if pending >= BATCH_LIMIT:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        batch.commit()
+
+    logger.info(f"\n" + "="*50)
+    logger.info(f"遷移完成！")
+    logger.info(f"總訂單數：{total_orders}")
+    logger.info(f"已更新：{updated_orders}")
+    logger.info(f"已跳過：{skipped_orders}")
+    logger.info(f"="*50)
+
+
+if __name__ == '__main__':
+    print("開始回填訂單出貨計數欄位...")
+    print("此操作將為所有缺少 totalDelivered / expectedTotal 的訂單計算並寫入這兩個欄位。")
+    confirm = input("確認繼續嗎？(y/n): ")
+
+    if confirm.lower() == 'y':
+        migrate_delivery_counters()
+    else:
+        print("已取消")
@@ -0,0 +1,106 @@
+"""
+遷移腳本：由既有訂單的 deliveryLogs 建立 deliveries 出貨日索引
+
+使用方法：
+  python migrate_delivery_index.py
+
+此腳本會：
+1. 遍歷所有訂單的出貨紀錄
+2. 為沒有 logId 的舊紀錄補上固定的 logId（訂單編號-索引）並寫回訂單
+3. 為每筆出貨紀錄建立 deliveries/{logId} 文件（已存在則覆寫）
+
+出貨單報表（/api/admin/reports/delivery-records）只查詢 deliveries 集合，
+部署新版本後需執行一次此腳本，舊的出貨紀錄才會出現在報表中。
+"""
+
+import firebase_admin
+from firebase_admin import credentials, firestore
+from config import Config
+from services import order_rules
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Firestore 單一批次寫入上限
+BATCH_LIMIT = 500
+
+# 初始化 Firebase
+if not firebase_admin._apps:
+    creds_dict = {
+        "type": "service_account",
+        "project_id": Config.FIREBASE_PROJECT_ID,
+        "private_key": Config.FIREBASE_PRIVATE_KEY.replace('\\n', '\n') if Config.FIREBASE_PRIVATE_KEY else None,
+        "client_email": Config.FIREBASE_CLIENT_EMAIL,
+        "client_id": Config.FIREBASE_CLIENT_ID,
+        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+        "token_uri": "https://oauth2.googleapis.com/token",
+        "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs"
+    }
+    cred = credentials.Certificate(creds_dict)
+    firebase_admin.initialize_app(cred)
+
+db = firestore.client()
+
+
+def migrate_delivery_index():
+    """為所有出貨紀錄建立出貨日索引"""
+    total_orders = 0
+    indexed_logs = 0
+    updated_orders = 0
+
+    batch = db.batch()
+    pending = 0
+
+    def queue(write):
+        nonlocal batch, pending
+        write(batch)
+        pending += 1
+        if pending >= BATCH_LIMIT:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    for order_doc in db.collection('orders').stream():
+        total_orders += 1
+        order = order_doc.to_dict()
+        order_id = order.get('orderId', order_doc.id)
+        delivery_logs = order.get('deliveryLogs', [])
+        if not delivery_logs:
+            continue
+
+        logs_changed = False
+        for index, log in enumerate(delivery_logs):
+            if not log.get('logId'):
+                log['logId'] = f"{order_id}-{index}"
+                logs_changed = True
+
+            entry = order_rules.delivery_index_entry(order_id, order.get('userId', ''), log)
+            queue(lambda b, ref=db.collection('deliveries').document(log['logId']), data=entry: b.set(ref, data))
+            indexed_logs += 1
+
+        if logs_changed:
+            queue(lambda b, ref=order_doc.reference, logs=delivery_logs: b.update(ref, {'deliveryLogs': logs}))
+            updated_orders += 1
+            logger.info(f"[UPDATE] {order_id} - 補上 logId")
+
+    if pending:
+        batch.commit()
+
+    logger.info(f"\n" + "="*50)
+    logger.info(f"遷移完成！")
+    logger.info(f"總訂單數：{total_orders}")
+    logger.info(f"已建立索引的出貨紀錄：{indexed_logs}")
+    logger.info(f"補上 logId 的訂單：{updated_orders}")
+    logger.info(f"="*50)
+
+
+if __name__ == '__main__':
+    print("開始建立出貨日索引...")
+    print("此操作將為所有出貨紀錄建立 deliveries 文件，並為舊紀錄補上 logId。")
+    confirm = input("確認繼續嗎？(y/n): ")
+
+    if confirm.lower() == 'y':
+        migrate_delivery_index()
+    else:
+        print("已取消")
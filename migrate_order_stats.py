@@ -0,0 +1,47 @@
+"""
+遷移腳本：由既有訂單建立儀表板統計計數 (orderStats)
+
+使用方法：
+  python migrate_order_stats.py
+
+此腳本會：
+1. 依文件 ID 分頁讀取所有訂單
+2. 計算各狀態訂單數、未付款金額、每日 / 每月營收、應出貨與已出貨盤數
+   （已取消 / 刪除的訂單只計入狀態數量）
+3. 將結果寫入 orderStats/shard_00，並清空其他分片
+
+之後新增訂單、更新狀態 / 付款狀態、新增或修正出貨時會同步累加計數，
+/api/admin/stats 直接讀取計數分片。執行期間的訂單異動可能不會被計入，請在離峰時段執行。
+"""
+
+import logging
+
+from services.firestore_service import FirestoreService
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def migrate_order_stats():
+    """重新計算訂單統計計數"""
+    FirestoreService.init()
+    success, result = FirestoreService.rebuild_order_stats()
+    if not success:
+        logger.error(f"重建統計失敗：{result}")
+        return
+
+    logger.info(f"\n" + "="*50)
+    logger.info(f"遷移完成！")
+    logger.info(f"總訂單數：{result}")
+    logger.info(f"="*50)
+
+
+if __name__ == '__main__':
+    print("開始建立訂單統計計數...")
+    print("此操作將讀取所有訂單並覆寫 orderStats 集合。")
+    confirm = input("確認繼續嗎？(y/n): ")
+
+    if confirm.lower() == 'y':
+        migrate_order_stats()
+    else:
+        print("已取消")
@@ -4,8 +4,10 @@
 from flask import Blueprint, request, jsonify, session
 from auth import require_admin_login_api
 from services.database_adapter import DatabaseAdapter
-from services.firestore_service import FirestoreService
 from services.line_service import LINEService
+from services.order_id_service import OrderIdService
+from services import order_rules
+from services.pricing_service import PriceQuote, PricingError, PRICE_PREVIEW_MAX_QTY
 from datetime import datetime, timedelta
 import pytz
 import logging
@@ -17,18 +19,81 @@ logger = logging.getLogger(__name__)
 admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
 
 
+ORDERS_PAGE_DEFAULT_LIMIT = 50
+ORDERS_PAGE_MAX_LIMIT = 500
+ORDERS_PAGE_PARAMS = ('limit', 'startAfter', 'status', 'paymentStatus', 'dateFrom', 'dateTo')
+
+
 @admin_bp.route('/orders', methods=['GET'])
 @require_admin_login_api
 def get_all_orders():
-    """取得所有訂單 (含會員資訊)"""
+    """取得訂單 (含會員資訊)
+
+    未帶任何分頁參數時回傳全部訂單陣列（舊版行為）。
+
+    Query Parameters (分頁模式):
+        limit: 每頁筆數 (預設 50，上限 500)
+        startAfter: 上一頁回傳的 nextCursor
+        status: 訂單狀態
+        paymentStatus: 付款狀態
+        dateFrom / dateTo: YYYY-MM-DD 建立日期區間（含）
+
+    Response (分頁模式):
+        {"status": "success", "orders": [...], "nextCursor": "...", "hasMore": true}
+    """
     try:
-        orders = DatabaseAdapter.get_all_orders_with_members()
-        return jsonify(orders)
+        if not any(param in request.args for param in ORDERS_PAGE_PARAMS):
+            orders = DatabaseAdapter.get_all_orders_with_members()
+            return jsonify(orders)
+
+        try:
+            limit = int(request.args.get('limit', ORDERS_PAGE_DEFAULT_LIMIT))
+        except ValueError:
+            return jsonify({"status": "error", "msg": "limit 必須為整數"}), 400
+        if limit <= 0:
+            return jsonify({"status": "error", "msg": "limit 必須大於 0"}), 400
+        limit = min(limit, ORDERS_PAGE_MAX_LIMIT)
+
+        date_from = request.args.get('dateFrom') or None
+        date_to = request.args.get('dateTo') or None
+        for value in (date_from, date_to):
+            if value:
+                try:
+                    datetime.strptime(value, '%Y-%m-%d')
+                except ValueError:
+                    return jsonify({"status": "error", "msg": "日期格式錯誤，應為 YYYY-MM-DD"}), 400
+
+        success, result = DatabaseAdapter.get_orders_page(
+            limit=limit,
+            start_after=request.args.get('startAfter') or None,
+            status=request.args.get('status') or None,
+            payment_status=request.args.get('paymentStatus') or None,
+            date_from=date_from,
+            date_to=date_to
+        )
+        if not success:
+            return jsonify({"status": "error", "msg": result}), 400
+
+        return jsonify({"status": "success", **result})
     except Exception as e:
         logger.error(f"Error in get_all_orders: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+@admin_bp.route('/order/<order_id>', methods=['GET'])
+@require_admin_login_api
+def get_order(order_id):
+    """取得單一訂單 (含會員資訊)"""
+    try:
+        success, result = DatabaseAdapter.get_order_with_member(order_id)
+        if success:
+            return jsonify({"status": "success", "order": result})
+        return jsonify({"status": "error", "msg": result}), 404
+    except Exception as e:
+        logger.error(f"Error in get_order: {e}")
+        return jsonify({"status": "error", "msg": str(e)}), 500
+
+
 @admin_bp.route('/order/update_status', methods=['POST'])
 @require_admin_login_api
 def update_order_status():
@@ -45,7 +110,7 @@ def update_order_status():
                 "msg": "缺少必要參數"
             }), 400
         
-        success = DatabaseAdapter.update_order_status(order_id, new_status)
+        success, result = DatabaseAdapter.update_order_status(order_id, new_status)
         
         if success:
             # 發送 LINE 通知
@@ -53,11 +118,11 @@ def update_order_status():
                 LINEService.send_status_update(user_id, order_id, new_status)
             
             return jsonify({"status": "success"})
-        else:
-            return jsonify({
-                "status": "error",
-                "msg": "訂單不存在"
-            }), 404
+        # 訂單不存在回 404；庫存不足無法恢復等不允許的變更回 400 並附上原因
+        return jsonify({
+            "status": "error",
+            "msg": result
+        }), 404 if result == DatabaseAdapter.ORDER_NOT_FOUND_MSG else 400
     except Exception as e:
         logger.error(f"Error in update_order_status: {e}")
         return jsonify({
@@ -81,15 +146,15 @@ def update_payment_status():
                 "msg": "缺少必要參數"
             }), 400
         
-        success = DatabaseAdapter.update_order_payment_status(order_id, payment_status)
+        success, result = DatabaseAdapter.update_order_payment_status(order_id, payment_status)
         
         if success:
             return jsonify({"status": "success"})
-        else:
-            return jsonify({
-                "status": "error",
-                "msg": "訂單不存在"
-            }), 404
+        # 訂單不存在回 404；已取消 / 刪除的訂單不可標記為已付款，回 400 並附上原因
+        return jsonify({
+            "status": "error",
+            "msg": result
+        }), 404 if result == DatabaseAdapter.ORDER_NOT_FOUND_MSG else 400
     except Exception as e:
         logger.error(f"Error in update_payment_status: {e}")
         return jsonify({
@@ -142,6 +207,94 @@ def add_delivery_log():
             "msg": str(e)
         }), 500
 
+@admin_bp.route('/order/bulk_delivery', methods=['POST'])
+@require_admin_login_api
+def add_delivery_logs_bulk():
+    """批次新增出貨紀錄（出貨日整批登錄）
+    
+    Request Body:
+        {
+            "deliveries": [
+                {"orderId": "ORD...", "qty": 5, "address": "新竹市...", "delivery_date": "2026-03-18"},
+                ...
+            ]
+        }
+    
+    Response:
+        {
+            "status": "success",
+            "succeeded": 2,
+            "failed": 1,
+            "results": [
+                {"orderId": "ORD...", "success": true, "status": "部分配送", "total_delivered": 5, "total_ordered": 10},
+                {"orderId": "ORD...", "success": false, "msg": "訂單不存在"},
+                ...
+            ]
+        }
+    """
+    try:
+        data = request.json or {}
+        deliveries = data.get('deliveries')
+        
+        if not isinstance(deliveries, list) or not deliveries:
+            return jsonify({
+                "status": "error",
+                "msg": "必須提供出貨清單 (deliveries)"
+            }), 400
+        
+        # 逐筆驗證，無效的項目直接回報錯誤，不影響其他項目
+        results = [None] * len(deliveries)
+        valid_indexes = []
+        valid_items = []
+        for index, item in enumerate(deliveries):
+            order_id = item.get('orderId') if isinstance(item, dict) else None
+            try:
+                qty = int(item.get('qty', 0)) if order_id else 0
+            except (TypeError, ValueError):
+                qty = 0
+            if not order_id or qty <= 0:
+                results[index] = {"orderId": order_id or '', "success": False, "msg": "無效的參數"}
+                continue
+            valid_indexes.append(index)
+            valid_items.append({
+                'orderId': order_id,
+                'qty': qty,
+                'address': item.get('address', ''),
+                'delivery_date': item.get('delivery_date', '')
+            })
+        
+        if valid_items:
+            success, bulk_results = DatabaseAdapter.add_delivery_logs(valid_items)
+            if not success:
+                return jsonify({
+                    "status": "error",
+                    "msg": bulk_results
+                }), 400
+            for index, result in zip(valid_indexes, bulk_results):
+                results[index] = result
+        
+        # 發送 LINE 出貨通知（派送器啟動時只排入佇列，不等待 LINE API）
+        for result in results:
+            if result['success']:
+                LINEService.send_delivery_notification(
+                    result.pop('userId'), result['orderId'], result['delivery_date'],
+                    result.pop('qty'), result['total_ordered'] - result['total_delivered']
+                )
+        
+        succeeded = sum(1 for r in results if r['success'])
+        return jsonify({
+            "status": "success",
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "results": results
+        })
+    except Exception as e:
+        logger.error(f"Error in add_delivery_logs_bulk: {e}")
+        return jsonify({
+            "status": "error",
+            "msg": str(e)
+        }), 500
+
 @admin_bp.route('/order/correct_delivery', methods=['POST'])
 @require_admin_login_api
 def correct_delivery_log():
@@ -279,41 +432,33 @@ def create_order_for_member():
                 "msg": "該商品已下架"
             }), 400
         
-        # 計算總金額
-        unit_price = product.get('price', 0)
-        total_amount = int(unit_price * qty)
-        
-        # 生成訂單編號
-        timestamp_str = str(int(datetime.now(pytz.timezone('Asia/Taipei')).timestamp()))
-        order_id = "ORD" + timestamp_str[-8:]
+        # 計算總金額：商品售價、分級定價與適用折扣
+        line_item = PriceQuote.from_products({product_id: product}).line_item(product_id, qty)
+        total_amount = line_item['amount']
         
         # 組合商品字串
         item_str = f"{item_name} x{qty}"
         if remarks:
             item_str += f" ({remarks})"
         
-        # 取得實際數量
-        actual_quantity = product.get('actualQuantity', 1)
-        
-        # 新增訂單：強制使用銀行轉帳/貨到付款，付款狀態為未付款
-        success = DatabaseAdapter.add_order(
-            order_id=order_id,
+        # 新增訂單並預留庫存：強制使用銀行轉帳/貨到付款，付款狀態為未付款；
+        # 訂單編號（17 字元，跨 worker 不重複）重複時換號重試
+        success, result, order_id = OrderIdService.place_order(
             user_id=user_id,
-            product_id=product_id,
             item_str=item_str,
             amount=total_amount,
             status="已確認",  # 商家建立的訂單直接設為已確認
             payment_status="未付款",  # 一律未付款
             payment_method="transfer",  # 一律銀行轉帳（涵蓋貨到付款）
-            actual_quantity=actual_quantity,
-            order_qty=qty
+            line_items=[{**line_item, "name": product.get('name') or item_name}],
+            operator=session.get('user_name', '店家')
         )
         
         if not success:
             return jsonify({
                 "status": "error",
-                "msg": "訂單建立失敗"
-            }), 500
+                "msg": result
+            }), 400
         
         # 發送 LINE 通知 - 通知會員訂單已建立
         admin_name = session.get('user_name', '店家')
@@ -426,33 +571,13 @@ def get_delivery_records_report():
                 "msg": "日期格式錯誤，應為 YYYY-MM-DD"
             }), 400
         
-        # 取得所有訂單
-        orders = DatabaseAdapter.get_all_orders_with_members()
-        
-        # 篩選符合出貨日期的出貨紀錄
-        delivery_records = []
-        for order in orders:
-            if not order.get('deliveryLogs'):
-                continue
-            
-            for delivery_log in order['deliveryLogs']:
-                # 檢查該出貨紀錄的日期是否符合
-                log_delivery_date = delivery_log.get('delivery_date', '')
-                if log_delivery_date == delivery_date:
-                    # 取得客戶資訊
-                    customer = order.get('customer', {})
-                    
-                    # 計算實際出貨數量（使用修正後的數量或原始數量）
-                    actual_qty = delivery_log.get('corrected_qty') or delivery_log.get('qty', 0)
-                    
-                    record = {
-                        "orderId": order.get('orderId', ''),
-                        "delivery_qty": actual_qty,
-                        "delivery_address": delivery_log.get('address', ''),
-                        "customer_name": customer.get('name', ''),
-                        "customer_phone": customer.get('phone', '')
-                    }
-                    delivery_records.append(record)
+        # 由出貨日索引查詢當日出貨紀錄
+        success, delivery_records = DatabaseAdapter.get_delivery_records_by_date(delivery_date)
+        if not success:
+            return jsonify({
+                "status": "error",
+                "msg": delivery_records
+            }), 500
         
         return jsonify({
             "status": "success",
@@ -468,6 +593,126 @@ def get_delivery_records_report():
         }), 500
 
 
+STATS_MAX_DAYS = 366
+STATS_MAX_MONTHS = 36
+
+
+@admin_bp.route('/stats', methods=['GET'])
+@require_admin_login_api
+def get_dashboard_stats():
+    """儀表板統計：由統計計數取得，不需下載全部訂單
+
+    Query Parameters:
+        days: 每日營收的天數 (預設 30，上限 366)
+        months: 每月營收的月數 (預設 12，上限 36)
+
+    Response:
+        {
+            "status": "success",
+            "stats": {
+                "totalOrders": 120,
+                "ordersByStatus": {"處理中": 30, "已完成": 85, ...},
+                "unpaidOrders": 12,
+                "unpaidAmount": 6400,
+                "revenue": 98000,
+                "revenueByDay": {"2026-03-01": 1200, ...},
+                "revenueByMonth": {"2026-03": 35000, ...},
+                "expectedTrays": 900,
+                "deliveredTrays": 760,
+                "outstandingTrays": 140
+            }
+        }
+    """
+    try:
+        try:
+            days = int(request.args.get('days', 30))
+            months = int(request.args.get('months', 12))
+        except ValueError:
+            return jsonify({"status": "error", "msg": "days / months 必須為整數"}), 400
+        if days <= 0 or months <= 0:
+            return jsonify({"status": "error", "msg": "days / months 必須大於 0"}), 400
+
+        success, result = DatabaseAdapter.get_order_stats(min(days, STATS_MAX_DAYS), min(months, STATS_MAX_MONTHS))
+        if not success:
+            return jsonify({"status": "error", "msg": result}), 500
+        return jsonify({"status": "success", "stats": result})
+    except Exception as e:
+        logger.error(f"Error in get_dashboard_stats: {e}")
+        return jsonify({
+            "status": "error",
+            "msg": str(e)
+        }), 500
+
+
+# ===== 計價 API =====
+
+@admin_bp.route('/pricing/quote', methods=['POST'])
+@require_admin_login_api
+def quote_prices():
+    """批次報價：售價、分級定價與適用折扣
+
+    Request:
+        {"lines": [{"productId": "p1", "qty": 12}, ...], "memberLevel": "gold"}
+
+    Response:
+        {"status": "success", "quotes": [{"productId", "qty", "tierPrice", "unitPrice",
+         "discountId", "discountAmount", "amount", ...}], "totalAmount": 2880}
+    """
+    try:
+        data = request.json or {}
+        lines = data.get('lines')
+        if not isinstance(lines, list) or not lines:
+            return jsonify({"status": "error", "msg": "lines 必須為非空陣列"}), 400
+        try:
+            lines = [(line['productId'], int(line['qty'])) for line in lines]
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"status": "error", "msg": "每筆需包含 productId 與整數 qty"}), 400
+
+        quote = PriceQuote.load([product_id for product_id, _ in lines], member_level=data.get('memberLevel'))
+        try:
+            quotes, total_amount = quote.quote_many(lines)
+        except PricingError as e:
+            return jsonify({"status": "error", "msg": str(e)}), 400
+        return jsonify({"status": "success", "quotes": quotes, "totalAmount": total_amount})
+    except Exception as e:
+        logger.error(f"Error in quote_prices: {e}")
+        return jsonify({
+            "status": "error",
+            "msg": str(e)
+        }), 500
+
+
+@admin_bp.route('/product/<product_id>/price-preview', methods=['GET'])
+@require_admin_login_api
+def price_preview(product_id):
+    """價格預覽：數量 1..maxQty（預設與上限 1000）的單價與總金額
+
+    Query Parameters:
+        maxQty: 預覽的最大數量
+        memberLevel: 會員等級（套用會員等級折扣）
+    """
+    try:
+        try:
+            max_qty = int(request.args.get('maxQty') or PRICE_PREVIEW_MAX_QTY)
+        except ValueError:
+            return jsonify({"status": "error", "msg": "maxQty 必須為整數"}), 400
+        if max_qty <= 0:
+            return jsonify({"status": "error", "msg": "maxQty 必須大於 0"}), 400
+
+        quote = PriceQuote.load([product_id], member_level=request.args.get('memberLevel') or None)
+        try:
+            rows = quote.preview(product_id, min(max_qty, PRICE_PREVIEW_MAX_QTY))
+        except PricingError as e:
+            return jsonify({"status": "error", "msg": str(e)}), 404
+        return jsonify({"status": "success", "productId": product_id, "prices": rows})
+    except Exception as e:
+        logger.error(f"Error in price_preview: {e}")
+        return jsonify({
+            "status": "error",
+            "msg": str(e)
+        }), 500
+
+
 # ===== 會員管理 API =====
 
 @admin_bp.route('/members', methods=['GET'])
@@ -507,16 +752,17 @@ def create_member():
         if not name or not phone or not address:
             return jsonify({"status": "error", "msg": "姓名、手機、地址為必填"}), 400
 
-        existing = DatabaseAdapter.get_all_members()
-        if any(m.get('phone') == phone for m in existing):
-            return jsonify({"status": "error", "msg": f"手機 {phone} 已有會員資料"}), 400
-
+        # 手機重複檢查與新增在同一交易中完成
         user_id = f"ADMIN_{int(time.time())}_{secrets.token_hex(2).upper()}"
-        success = DatabaseAdapter.add_member(user_id, name, phone, address, birth_date or None, address2 or None)
+        success, error = DatabaseAdapter.add_member_with_unique_phone(
+            user_id, name, phone, address, birth_date or None, address2 or None
+        )
 
         if success:
             logger.info(f"Admin created member: {user_id} ({name})")
             return jsonify({"status": "success", "msg": "會員新增成功", "userId": user_id})
+        if error is None:
+            return jsonify({"status": "error", "msg": f"手機 {phone} 已有會員資料"}), 400
         return jsonify({"status": "error", "msg": "新增失敗，請稍後再試"}), 500
     except Exception as e:
         logger.error(f"Error in create_member: {e}")
@@ -582,50 +828,117 @@ def update_member_status():
         }), 500
 
 
+MEMBER_EXPORT_FIELDS = [
+    'userId', 'name', 'phone', 'address', 'address2',
+    'birthDate', 'status', 'createdAt', 'updatedAt'
+]
+
+ORDER_EXPORT_FIELDS = [
+    'orderId', 'date', 'userId', 'customerName', 'customerPhone',
+    'items', 'amount', 'status', 'paymentStatus', 'paymentMethod',
+    'expectedTotal', 'totalDelivered',
+    'logId', 'deliveryDate', 'deliveryQty', 'deliveryAddress', 'isCorrected'
+]
+
+# 串流匯出時累積到此大小才送出一段，避免每列一個 chunk
+CSV_STREAM_CHUNK_SIZE = 16 * 1024
+
+
+def _stream_csv(fieldnames, rows, label):
+    """逐列產生 CSV 內容；標題列立即送出，之後每累積一段送出一次"""
+    import csv
+    from io import StringIO
+    
+    buffer = StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+    writer.writeheader()
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate(0)
+    
+    try:
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() >= CSV_STREAM_CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+    except Exception as e:
+        # 回應已開始傳送，無法再改狀態碼，只能記錄並中止
+        logger.error(f"Error streaming {label} export: {e}")
+    
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _csv_response(generator, filename):
+    from flask import Response, stream_with_context
+    
+    response = Response(stream_with_context(generator), mimetype='text/csv')
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    response.headers["Content-Type"] = "text/csv; charset=utf-8-sig"
+    return response
+
+
+def _member_export_rows():
+    for member in DatabaseAdapter.iter_members():
+        yield {
+            'userId': member.get('userId', ''),
+            'name': member.get('name', ''),
+            'phone': member.get('phone', ''),
+            'address': member.get('address', ''),
+            'address2': member.get('address2', ''),
+            'birthDate': member.get('birthDate', ''),
+            'status': member.get('status', '啟用'),
+            'createdAt': member.get('createdAt', ''),
+            'updatedAt': member.get('updatedAt', '')
+        }
+
+
+def _order_export_rows():
+    """每筆出貨紀錄一列；尚無出貨紀錄的訂單輸出一列空白出貨欄位"""
+    for order in DatabaseAdapter.iter_orders_with_members():
+        customer = order.get('customer', {})
+        base = {
+            'orderId': order.get('orderId', ''),
+            'date': order.get('date', ''),
+            'userId': order.get('userId', ''),
+            'customerName': customer.get('name', ''),
+            'customerPhone': customer.get('phone', ''),
+            'items': order.get('items', ''),
+            'amount': order.get('amount', ''),
+            'status': order.get('status', ''),
+            'paymentStatus': order.get('paymentStatus', ''),
+            'paymentMethod': order.get('paymentMethod', ''),
+            'expectedTotal': order_rules.expected_total(order),
+            'totalDelivered': order_rules.total_delivered(order)
+        }
+        logs = order.get('deliveryLogs') or [{}]
+        for log in logs:
+            row = dict(base)
+            if log:
+                row.update({
+                    'logId': log.get('logId', ''),
+                    'deliveryDate': log.get('delivery_date', ''),
+                    'deliveryQty': order_rules.delivered_qty(log),
+                    'deliveryAddress': log.get('address', ''),
+                    'isCorrected': 'Y' if log.get('is_corrected') else ''
+                })
+            yield row
+
+
 @admin_bp.route('/members/export', methods=['GET'])
 @require_admin_login_api
 def export_members():
-    """導出會員資料為 CSV"""
-    try:
-        import csv
-        from io import StringIO
-        from flask import make_response
-        
-        members = DatabaseAdapter.get_all_members()
-        
-        # 建立 CSV 緩衝區
-        output = StringIO()
-        writer = csv.DictWriter(output, fieldnames=[
-            'userId', 'name', 'phone', 'address', 'address2', 
-            'birthDate', 'status', 'createdAt', 'updatedAt'
-        ])
-        
-        writer.writeheader()
-        for member in members:
-            writer.writerow({
-                'userId': member.get('userId', ''),
-                'name': member.get('name', ''),
-                'phone': member.get('phone', ''),
-                'address': member.get('address', ''),
-                'address2': member.get('address2', ''),
-                'birthDate': member.get('birthDate', ''),
-                'status': member.get('status', '啟用'),
-                'createdAt': member.get('createdAt', ''),
-                'updatedAt': member.get('updatedAt', '')
-            })
-        
-        # 建立回應
-        response = make_response(output.getvalue())
-        response.headers["Content-Disposition"] = "attachment; filename=members.csv"
-        response.headers["Content-Type"] = "text/csv; charset=utf-8-sig"
-        
-        return response
-    except Exception as e:
-        logger.error(f"Error in export_members: {e}")
-        return jsonify({
-            "status": "error",
-            "msg": str(e)
-        }), 500
+    """導出會員資料為 CSV（串流輸出，依會員 ID 排序）"""
+    return _csv_response(_stream_csv(MEMBER_EXPORT_FIELDS, _member_export_rows(), 'members'), 'members.csv')
+
+
+@admin_bp.route('/orders/export', methods=['GET'])
+@require_admin_login_api
+def export_orders():
+    """導出訂單與出貨紀錄為 CSV（串流輸出，每筆出貨紀錄一列）"""
+    return _csv_response(_stream_csv(ORDER_EXPORT_FIELDS, _order_export_rows(), 'orders'), 'orders.csv')
 
 
 # ===== 會員 ID 驗證工具 =====
@@ -657,13 +970,14 @@ def generate_verification_token():
         # 生成驗證令牌（隨機 32 位字符串）
         token = secrets.token_urlsafe(32)
 
-        # 儲存令牌至 Firestore（有效期 24 小時），確保跨裝置有效
+        # 儲存令牌至資料庫（有效期 24 小時），確保跨裝置有效
         expiry = datetime.now(TW_TZ) + timedelta(hours=24)
-        FirestoreService._db.collection('verificationTokens').document(token).set({
-            'userId': user_id,
-            'createdAt': datetime.now(TW_TZ),
-            'expiresAt': expiry
-        })
+        success, result = DatabaseAdapter.add_verification_token(token, user_id, expiry)
+        if not success:
+            return jsonify({
+                "status": "error",
+                "msg": result
+            }), 500
 
         logger.info(f"Verification token generated for user: {user_id}")
         
@@ -754,6 +1068,23 @@ def update_user_id():
         }), 500
 
 
+@admin_bp.route('/cache/stats', methods=['GET'])
+@require_admin_login_api
+def get_cache_stats():
+    """查看資料庫讀取快取命中統計（目前 worker）"""
+    try:
+        return jsonify({
+            "status": "success",
+            "stats": DatabaseAdapter.get_cache_stats()
+        })
+    except Exception as e:
+        logger.error(f"Error in get_cache_stats: {e}")
+        return jsonify({
+            "status": "error",
+            "msg": str(e)
+        }), 500
+
+
 @admin_bp.route('/webhook_logs', methods=['GET'])
 @require_admin_login_api
 def get_webhook_logs():
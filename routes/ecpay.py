@@ -4,15 +4,26 @@
 from flask import Blueprint, request
 from services.database_adapter import DatabaseAdapter
 from services.line_service import LINEService
+from services.metrics import metrics
 from ecpay_sdk import ECPaySDK
 from config import Config
 import logging
 import os
+import re
 
 logger = logging.getLogger(__name__)
 
 ecpay_bp = Blueprint('ecpay', __name__, url_prefix='/api/ecpay')
 
+# 重試付款交易編號：<訂單編號>R<次數>
+RETRY_TRADE_NO_PATTERN = re.compile(r'^(ORD\d+)R(\d{1,2})$')
+
+
+def _callback_result(result, body):
+    """記錄回調結果指標並回傳給 ECPay 的回應內容"""
+    metrics.inc('ecpay_callbacks_total', result=result)
+    return body
+
 
 @ecpay_bp.route('/callback', methods=['POST'])
 def ecpay_callback():
@@ -25,7 +36,7 @@ def ecpay_callback():
         received_check_mac = data.get('CheckMacValue')
         if not received_check_mac:
             logger.warning("No CheckMacValue in callback")
-            return '0|No CheckMacValue'
+            return _callback_result('missing_checksum', '0|No CheckMacValue')
         
         ecpay_service = ECPaySDK(
             Config.ECPAY_MERCHANT_ID,
@@ -38,46 +49,50 @@ def ecpay_callback():
         
         if received_check_mac != calculated_check_mac:
             logger.error(f"Checksum Invalid. Received: {received_check_mac}, Calculated: {calculated_check_mac}")
-            return '0|CheckSum Invalid'
+            return _callback_result('invalid_checksum', '0|CheckSum Invalid')
         
         # 檢查付款結果
         rtn_code = data.get('RtnCode')
         if rtn_code == '1':
             merchant_trade_no = data.get('MerchantTradeNo')
             
-            # 提取原訂單號（處理 "ORDxxxxxxxxRN" 格式）
-            # 如果是重試付款，交易編號會是 "ORDxxxxxxxxR1" 或 "ORDxxxxxxxxR2" 等
-            # 原訂單號長度為 11 字元 (ORD + 8位時間戳)，重試時會多一個 R 和數字
-            if len(merchant_trade_no) > 11 and merchant_trade_no[-2] == 'R':
-                # 格式：ORDxxxxxxxxRN
-                order_id = merchant_trade_no[:-2]  # 移除最後的 R 和數字
+            # 提取原訂單號（處理重試付款的 "<訂單編號>RN" 格式）
+            # 訂單編號為 ORD + 數字（舊格式 8 位、新格式 14 位），重試時加上 R 和 1-2 位數字
+            retry_match = RETRY_TRADE_NO_PATTERN.match(merchant_trade_no)
+            if retry_match:
+                order_id = retry_match.group(1)  # 移除最後的 R 和數字
                 logger.info(f"Payment Success for Retry Order: {order_id} (ECPay Trade No: {merchant_trade_no}, length: {len(merchant_trade_no)})")
             else:
                 order_id = merchant_trade_no
                 logger.info(f"Payment Success for Order: {order_id} (length: {len(merchant_trade_no)})")
             
-            # 更新付款狀態
-            success = DatabaseAdapter.update_order_payment_status(order_id, "已付款")
+            # 已取消的訂單不標記為已付款（預留庫存已釋放），需由店家退款
+            found, order = DatabaseAdapter.get_order_by_id(order_id)
+            if found and order.get('status') in DatabaseAdapter.STOCK_RELEASE_STATUSES:
+                logger.error(f"Payment received for cancelled order {order_id} (ECPay Trade No: {merchant_trade_no}), refund required")
+                return _callback_result('order_cancelled', '1|OK')
+            
+            # 更新付款狀態（交易中再次確認訂單未被取消）
+            success, result = DatabaseAdapter.update_order_payment_status(order_id, "已付款")
             
             if success:
                 # 取得使用者信息並發送 LINE 通知
-                orders = DatabaseAdapter.get_all_orders_with_members()
-                order = next((o for o in orders if o['orderId'] == order_id), None)
+                found, order = DatabaseAdapter.get_order_by_id(order_id)
                 
-                if order:
+                if found:
                     LINEService.send_payment_success(order['userId'], order_id)
                 
                 logger.info(f"Order {order_id} marked as paid")
-                return '1|OK'
+                return _callback_result('paid', '1|OK')
             else:
-                logger.warning(f"Order {order_id} not found or update failed")
-                return '0|Error'
+                logger.warning(f"Order {order_id} not marked as paid: {result}")
+                return _callback_result('order_not_found', '0|Error')
         else:
             logger.warning(f"Payment Failed. RtnCode: {rtn_code}, Msg: {data.get('RtnMsg')}")
-            return '1|OK'
+            return _callback_result('payment_failed', '1|OK')
     except Exception as e:
         logger.error(f"Error in ecpay_callback: {e}")
-        return '0|Error'
+        return _callback_result('error', '0|Error')
 
 
 @ecpay_bp.route('/client_return', methods=['GET', 'POST'])
@@ -4,10 +4,11 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime
 from services.database_adapter import DatabaseAdapter
-from services.firestore_service import FirestoreService
 from services.line_service import LINEService
+from services.order_id_service import OrderIdService
+from services.pricing_service import PriceQuote
 from validation import FormValidator
-from config import Config, ProductConfig
+from config import Config
 from ecpay_sdk import ECPaySDK
 import os
 import logging
@@ -121,12 +122,176 @@ def edit_member():
         return jsonify({"status": "error", "msg": "系統錯誤"}), 500
 
 
+def _ecpay_init_response(order_id, total_amount, item_name):
+    """建立綠界付款參數"""
+    base_url = Config.APP_BASE_URL
+    if not base_url:
+        base_url = request.url_root.rstrip('/')
+        if 'onrender.com' in base_url or 'herokuapp.com' in base_url:
+            base_url = base_url.replace('http://', 'https://')
+    else:
+        base_url = base_url.rstrip('/')
+    
+    return_url = f"{base_url}/api/ecpay/callback"
+    client_back_url = f"{base_url}/api/ecpay/client_return"
+    
+    ecpay_service = ECPaySDK(
+        Config.ECPAY_MERCHANT_ID,
+        Config.ECPAY_HASH_KEY,
+        Config.ECPAY_HASH_IV,
+        Config.ECPAY_ACTION_URL
+    )
+    
+    ecpay_params = ecpay_service.create_order(
+        order_id=order_id,
+        total_amount=total_amount,
+        item_name=item_name,
+        return_url=return_url,
+        client_back_url=client_back_url,
+        order_result_url=""
+    )
+    
+    return jsonify({
+        "status": "ecpay_init",
+        "msg": "前往綠界付款",
+        "orderId": order_id,
+        "ecpayParams": ecpay_params,
+        "actionUrl": Config.ECPAY_ACTION_URL
+    })
+
+
+def _cart_quantities(cart):
+    """同一商品合併數量（分級定價依合計數量計算）"""
+    quantities = {}
+    for line in cart:
+        product_id = str(line['productId']).strip()
+        quantities[product_id] = quantities.get(product_id, 0) + int(line.get('qty', 1))
+    return quantities
+
+
+def _load_cart_quote(quantities):
+    """讀取購物車商品與適用折扣的報價
+
+    Returns:
+        (PriceQuote, None) 或 (None, 錯誤訊息)：商品不存在或已下架時不報價
+    """
+    quote = PriceQuote.load(list(quantities))
+    for product_id in quantities:
+        product = quote.products.get(product_id)
+        if not product:
+            return None, f"商品不存在：{product_id}"
+        if product.get('status') != 'active':
+            return None, f"該商品已下架：{product.get('name', product_id)}"
+    return quote, None
+
+
+@member_bp.route('/quote', methods=['POST'])
+def quote_cart():
+    """訂購頁報價：與建立訂單相同的分級定價與折扣計算
+
+    Request:
+        {"cart": [{"productId": "...", "qty": 12}, ...]}
+
+    Response:
+        {"status": "success", "quotes": [{"productId", "qty", "listPrice", "tierPrice", "unitPrice",
+         "discountName", "discountAmount", "amount"}, ...], "totalAmount": 2880}
+    """
+    try:
+        data = request.json or {}
+        validation_errors = FormValidator.validate_cart(data.get('cart'))
+        if validation_errors:
+            return jsonify({
+                "status": "error",
+                "msg": "表單驗證失敗",
+                "errors": validation_errors
+            }), 400
+        
+        quantities = _cart_quantities(data['cart'])
+        quote, error = _load_cart_quote(quantities)
+        if error:
+            return jsonify({"status": "error", "msg": error}), 400
+        
+        quotes, total_amount = quote.quote_many(list(quantities.items()))
+        return jsonify({"status": "success", "quotes": quotes, "totalAmount": total_amount})
+    except Exception as e:
+        logger.error(f"Error in quote_cart: {e}")
+        return jsonify({"status": "error", "msg": "系統錯誤"}), 500
+
+
+def _create_cart_order(data):
+    """建立多商品訂單
+
+    商品與折扣由快取讀取計價；商品存在 / 上架 / 庫存檢查、扣庫存與訂單寫入在同一交易中完成，
+    只發送一則 LINE 確認訊息。
+    """
+    validation_errors = FormValidator.validate_cart_order_form(data)
+    if validation_errors:
+        return jsonify({
+            "status": "error",
+            "msg": "表單驗證失敗",
+            "errors": validation_errors
+        }), 400
+    
+    user_id = data.get('userId')
+    remarks = data.get('remarks', '').strip()
+    payment_method = data.get('paymentMethod', 'transfer')
+    
+    quantities = _cart_quantities(data['cart'])
+    quote, error = _load_cart_quote(quantities)
+    if error:
+        return jsonify({"status": "error", "msg": error}), 400
+    
+    line_items = [quote.line_item(product_id, qty) for product_id, qty in quantities.items()]
+    total_amount = sum(item['amount'] for item in line_items)
+    
+    item_names = [f"{item['name']} x{item['qty']}" for item in line_items]
+    item_str = ", ".join(item_names)
+    if remarks:
+        item_str += f" ({remarks})"
+    
+    initial_payment_status = "待付款" if payment_method == 'ecpay' else "未付款"
+    
+    # 以新訂單編號下單（編號重複時換號重試）
+    success, result, order_id = OrderIdService.place_order(
+        user_id=user_id,
+        item_str=item_str,
+        amount=total_amount,
+        status="處理中",
+        payment_status=initial_payment_status,
+        payment_method=payment_method,
+        line_items=line_items,
+        operator=user_id or "system"
+    )
+    if not success:
+        return jsonify({"status": "error", "msg": result}), 400
+    
+    LINEService.send_order_confirmation(user_id, order_id, item_str, total_amount, initial_payment_status)
+    
+    if payment_method == 'ecpay':
+        # 綠界以 # 分隔多項商品名稱
+        return _ecpay_init_response(order_id, total_amount, "#".join(item_names))
+    
+    return jsonify({
+        "status": "success",
+        "msg": "訂購成功",
+        "orderId": order_id,
+        "amount": total_amount
+    })
+
+
 @member_bp.route('/order', methods=['POST'])
 def create_order():
-    """建立訂單"""
+    """建立訂單
+
+    帶 cart 時為多商品訂單：
+        {"userId": "...", "cart": [{"productId": "...", "qty": 2}, ...], "paymentMethod": "transfer", "remarks": ""}
+    """
     try:
         data = request.json
         
+        if 'cart' in data:
+            return _create_cart_order(data)
+        
         # 表單驗證
         validation_errors = FormValidator.validate_order_form(data)
         if validation_errors:
@@ -158,13 +323,9 @@ def create_order():
                 "msg": "該商品已下架"
             }), 400
         
-        # 計算總金額：使用商品的實際價格
-        unit_price = product.get('price', 0)
-        total_amount = int(unit_price * qty)
-        
-        # 生成訂單編號：ORD + 時間戳後8位（保持綠界20字元限制）
-        timestamp_str = str(int(datetime.now(pytz.timezone('Asia/Taipei')).timestamp()))
-        order_id = "ORD" + timestamp_str[-8:]  # 取最後8位時間戳
+        # 計算總金額：商品售價、分級定價與適用折扣
+        line_item = PriceQuote.from_products({product_id: product}).line_item(product_id, qty)
+        total_amount = line_item['amount']
         
         # 組合商品字串
         item_str = f"{item_name} x{qty}"
@@ -174,68 +335,31 @@ def create_order():
         # 設定初始付款狀態
         initial_payment_status = "待付款" if payment_method == 'ecpay' else "未付款"
         
-        # 取得實際數量（默認為 1）
-        actual_quantity = product.get('actualQuantity', 1)
-        
-        # 新增訂單
-        success = DatabaseAdapter.add_order(
-            order_id=order_id,
+        # 下單：預留庫存（訂購數量 × 實際數量）並新增訂單，庫存不足時不建立；
+        # 訂單編號（17 字元，跨 worker 不重複，保持綠界 20 字元限制）重複時換號重試
+        success, result, order_id = OrderIdService.place_order(
             user_id=user_id,
-            product_id=product_id,
             item_str=item_str,
             amount=total_amount,
             status="處理中",
             payment_status=initial_payment_status,
             payment_method=payment_method,
-            actual_quantity=actual_quantity,
-            order_qty=qty
+            line_items=[{**line_item, "name": product.get('name') or item_name}],
+            operator=user_id
         )
         
         if not success:
             return jsonify({
                 "status": "error",
-                "msg": "訂單建立失敗"
-            }), 500
+                "msg": result
+            }), 400
         
         # 發送 LINE 確認訊息
         LINEService.send_order_confirmation(user_id, order_id, item_str, total_amount, initial_payment_status)
         
         # ECPay 付款
         if payment_method == 'ecpay':
-            base_url = Config.APP_BASE_URL
-            if not base_url:
-                base_url = request.url_root.rstrip('/')
-                if 'onrender.com' in base_url or 'herokuapp.com' in base_url:
-                    base_url = base_url.replace('http://', 'https://')
-            else:
-                base_url = base_url.rstrip('/')
-            
-            return_url = f"{base_url}/api/ecpay/callback"
-            client_back_url = f"{base_url}/api/ecpay/client_return"
-            
-            ecpay_service = ECPaySDK(
-                Config.ECPAY_MERCHANT_ID,
-                Config.ECPAY_HASH_KEY,
-                Config.ECPAY_HASH_IV,
-                Config.ECPAY_ACTION_URL
-            )
-            
-            ecpay_params = ecpay_service.create_order(
-                order_id=order_id,
-                total_amount=total_amount,
-                item_name=item_name,
-                return_url=return_url,
-                client_back_url=client_back_url,
-                order_result_url=""
-            )
-            
-            return jsonify({
-                "status": "ecpay_init",
-                "msg": "前往綠界付款",
-                "orderId": order_id,
-                "ecpayParams": ecpay_params,
-                "actionUrl": Config.ECPAY_ACTION_URL
-            })
+            return _ecpay_init_response(order_id, total_amount, item_name)
         
         return jsonify({
             "status": "success",
@@ -250,9 +374,22 @@ def create_order():
         }), 500
 
 
+HISTORY_PAGE_DEFAULT_LIMIT = 20
+HISTORY_PAGE_MAX_LIMIT = 100
+
+
 @member_bp.route('/history', methods=['POST'])
 def get_history():
-    """取得訂購紀錄"""
+    """取得訂購紀錄（新到舊，不含已刪除）
+
+    未帶 limit / startAfter 時回傳全部訂單陣列（舊版行為）。
+
+    Request (分頁模式):
+        {"userId": "...", "limit": 20, "startAfter": "<上一頁的 nextCursor>"}
+
+    Response (分頁模式):
+        {"status": "success", "orders": [...], "nextCursor": "...", "hasMore": true}
+    """
     try:
         data = request.json
         user_id = data.get('userId')
@@ -260,8 +397,23 @@ def get_history():
         if not user_id:
             return jsonify({"error": "userId required"}), 400
         
-        orders = DatabaseAdapter.get_user_orders(user_id)
-        return jsonify(orders)
+        if 'limit' not in data and 'startAfter' not in data:
+            orders = DatabaseAdapter.get_user_orders(user_id)
+            return jsonify(orders)
+
+        try:
+            limit = int(data.get('limit') or HISTORY_PAGE_DEFAULT_LIMIT)
+        except (TypeError, ValueError):
+            return jsonify({"status": "error", "msg": "limit 必須為整數"}), 400
+        if limit <= 0:
+            return jsonify({"status": "error", "msg": "limit 必須大於 0"}), 400
+
+        success, result = DatabaseAdapter.get_user_orders_page(
+            user_id, min(limit, HISTORY_PAGE_MAX_LIMIT), data.get('startAfter') or None
+        )
+        if not success:
+            return jsonify({"status": "error", "msg": result}), 400
+        return jsonify({"status": "success", **result})
     except Exception as e:
         logger.error(f"Error in get_history: {e}")
         return jsonify({"error": str(e)}), 500
@@ -278,13 +430,24 @@ def retry_payment():
         if not order_id:
             return jsonify({"status": "error", "msg": "訂單 ID 不存在"}), 400
         
+        # R + 最多 2 位數字，加上 17 字元訂單編號仍在綠界 20 字元限制內
+        try:
+            retry_count = int(retry_count)
+        except (TypeError, ValueError):
+            retry_count = 0
+        if not 1 <= retry_count <= 99:
+            return jsonify({"status": "error", "msg": "重試次數無效"}), 400
+        
         # 取得訂單信息
-        orders = DatabaseAdapter.get_all_orders_with_members()
-        order = next((o for o in orders if o['orderId'] == order_id), None)
+        found, order = DatabaseAdapter.get_order_by_id(order_id)
         
-        if not order:
+        if not found:
             return jsonify({"status": "error", "msg": "訂單不存在"}), 404
         
+        # 已取消的訂單預留庫存已釋放，不可再付款
+        if order.get('status') in DatabaseAdapter.STOCK_RELEASE_STATUSES:
+            return jsonify({"status": "error", "msg": "訂單已取消，無法付款"}), 400
+        
         # 確認是未付款狀態
         if order['paymentStatus'] not in ['未付款', '待付款']:
             return jsonify({"status": "error", "msg": "訂單已付款，無需重新付款"}), 400
@@ -345,16 +508,16 @@ def verify_line_id():
         if not token or not line_user_id or not phone:
             return jsonify({"status": "error", "msg": "缺少參數"}), 400
 
-        # 從 Firestore 讀取 token
-        token_ref = FirestoreService._db.collection('verificationTokens').document(token)
-        token_doc = token_ref.get()
-        if not token_doc.exists:
+        # 從資料庫讀取 token
+        success, token_data = DatabaseAdapter.get_verification_token(token)
+        if not success:
+            return jsonify({"status": "error", "msg": "系統錯誤"}), 500
+        if not token_data:
             return jsonify({"status": "error", "msg": "驗證連結無效或已使用"}), 400
 
-        token_data = token_doc.to_dict()
         expiry = token_data.get('expiresAt')
         if expiry and datetime.now(TW_TZ) > expiry:
-            token_ref.delete()
+            DatabaseAdapter.delete_verification_token(token)
             return jsonify({"status": "error", "msg": "驗證連結已過期（24小時內有效）"}), 400
 
         old_user_id = token_data.get('userId')
@@ -385,7 +548,7 @@ def verify_line_id():
 
         # 將舊 ADMIN_ 帳號標記為「已綁定-略」（預設列表自動隱藏）並刪除 token
         DatabaseAdapter.update_member_status(old_user_id, '已綁定-略')
-        token_ref.delete()
+        DatabaseAdapter.delete_verification_token(token)
 
         logger.info(f"LINE ID binding success: {old_user_id} -> {line_user_id}")
         return jsonify({"status": "success", "msg": "LINE 帳號綁定成功"})
@@ -1,19 +1,317 @@
 """
-資料庫適配器 - 統一介面包裝 Firestore
+資料庫適配器 - 統一介面包裝 Firestore / SQLite
 """
-from services.firestore_service import FirestoreService
+from services.firestore_service import FirestoreService, TW_TZ
+from services.sqlite_service import SQLiteService
+from services import order_rules
+from cachetools import TTLCache
+from config import Config
+import copy
 import logging
+import threading
+import time
+from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
 
+class DatabaseCache:
+    """進程內讀取快取
+
+    - 清單查詢（商品、分類、折扣）依集合設定 TTL
+    - 單一文件查詢使用有大小上限的 LRU + TTL
+    - 寫入時由 DatabaseAdapter 主動失效對應集合
+
+    快取只存在於目前進程，多個 gunicorn worker 之間的一致性由 TTL 保證。
+    """
+
+    _lock = threading.RLock()
+    _lists = {}
+    _documents = {}
+    # 各集合的失效次數：載入期間若集合被失效，載入結果不寫入快取
+    _generations = {}
+    _stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    @classmethod
+    def _ttl(cls, collection):
+        return Config.DB_CACHE_TTL.get(collection, 60)
+
+    @classmethod
+    def _list_cache(cls, collection):
+        if collection not in cls._lists:
+            cls._lists[collection] = TTLCache(maxsize=1, ttl=cls._ttl(collection))
+        return cls._lists[collection]
+
+    @classmethod
+    def _document_cache(cls, collection):
+        if collection not in cls._documents:
+            cls._documents[collection] = TTLCache(
+                maxsize=Config.DB_CACHE_MAX_DOCUMENTS, ttl=cls._ttl(collection)
+            )
+        return cls._documents[collection]
+
+    @classmethod
+    def _get_or_load(cls, collection, cache, key, loader):
+        """取得快取值；未命中時呼叫 loader，只快取成功的 (True, data) 結果
+
+        loader 執行期間若集合被 invalidate()，載入的可能是寫入前的資料，只回傳不快取。
+        """
+        if not Config.DB_CACHE_ENABLED:
+            return loader()
+
+        with cls._lock:
+            if key in cache:
+                cls._stats['hits'] += 1
+                return True, copy.deepcopy(cache[key])
+            cls._stats['misses'] += 1
+            generation = cls._generations.get(collection, 0)
+
+        success, data = loader()
+        if success:
+            with cls._lock:
+                if generation == cls._generations.get(collection, 0):
+                    cache[key] = copy.deepcopy(data)
+        return success, data
+
+    @classmethod
+    def get_list(cls, collection, loader):
+        """取得集合清單（例如所有商品）"""
+        with cls._lock:
+            cache = cls._list_cache(collection)
+        return cls._get_or_load(collection, cache, 'all', loader)
+
+    @classmethod
+    def get_document(cls, collection, doc_id, loader):
+        """取得單一文件"""
+        with cls._lock:
+            cache = cls._document_cache(collection)
+        return cls._get_or_load(collection, cache, doc_id, loader)
+
+    @classmethod
+    def invalidate(cls, collection, doc_id=None):
+        """寫入後失效快取：清除集合清單，以及指定文件（未指定則清除全部文件）"""
+        with cls._lock:
+            cls._stats['invalidations'] += 1
+            cls._generations[collection] = cls._generations.get(collection, 0) + 1
+            if collection in cls._lists:
+                cls._lists[collection].clear()
+            if collection in cls._documents:
+                if doc_id is None:
+                    cls._documents[collection].clear()
+                else:
+                    cls._documents[collection].pop(doc_id, None)
+
+    @classmethod
+    def clear(cls):
+        """清除所有快取與統計（含折扣索引）"""
+        with cls._lock:
+            cls._lists.clear()
+            cls._documents.clear()
+            cls._stats.update({'hits': 0, 'misses': 0, 'invalidations': 0})
+        DiscountIndex.invalidate()
+
+    @classmethod
+    def stats(cls):
+        """取得快取命中統計"""
+        with cls._lock:
+            hits = cls._stats['hits']
+            misses = cls._stats['misses']
+            total = hits + misses
+            return {
+                'enabled': Config.DB_CACHE_ENABLED,
+                'hits': hits,
+                'misses': misses,
+                'invalidations': cls._stats['invalidations'],
+                'hitRate': round(hits / total, 4) if total else 0.0,
+                'documents': {name: len(cache) for name, cache in cls._documents.items()}
+            }
+
+
+class DiscountIndex:
+    """進程內有效折扣索引
+
+    以一次查詢載入所有啟用中的折扣，依 (targetType, targetId) 分組並預先解析有效期間，
+    之後查詢適用折扣（含整張購物車的批次查詢）都在記憶體中完成。
+
+    - 新增、更新、刪除折扣時由 DatabaseAdapter 失效，下次查詢重新載入
+    - 其他 worker 的異動由 TTL（與折扣清單快取相同）保證
+    """
+
+    _lock = threading.Lock()
+    _load_lock = threading.Lock()
+    _entries = None
+    _loaded_at = 0.0
+    _generation = 0
+
+    @staticmethod
+    def build(discounts):
+        """建立索引：{(targetType, targetId): [(window, discount)]}，期間無法解析的折扣不列入"""
+        entries = {}
+        for discount in discounts:
+            try:
+                window = FirestoreService._discount_window(discount)
+            except (TypeError, ValueError) as e:
+                logger.warning(f"折扣 {discount.get('id')} 的有效期間無法解析，略過：{e}")
+                continue
+            key = (discount.get('targetType'), discount.get('targetId'))
+            entries.setdefault(key, []).append((window, discount))
+        return entries
+
+    @classmethod
+    def _get_entries(cls, loader):
+        """取得索引；過期或已失效時以 loader 重新載入（同時只有一個執行緒載入）"""
+        if not Config.DB_CACHE_ENABLED:
+            success, discounts = loader()
+            return cls.build(discounts) if success else None
+
+        ttl = Config.DB_CACHE_TTL.get('discounts', 60)
+        with cls._load_lock:
+            with cls._lock:
+                if cls._entries is not None and time.monotonic() - cls._loaded_at < ttl:
+                    return cls._entries
+                generation = cls._generation
+
+            success, discounts = loader()
+            if not success:
+                return None
+            entries = cls.build(discounts)
+            with cls._lock:
+                # 載入期間發生寫入時不保存，下次查詢重新載入
+                if generation == cls._generation:
+                    cls._entries = entries
+                    cls._loaded_at = time.monotonic()
+            return entries
+
+    @staticmethod
+    def _match(entries, product_id, category_id=None, member_level=None, now=None):
+        now = now or datetime.now(TW_TZ)
+        discounts = []
+        for target in FirestoreService._discount_targets(product_id, category_id, member_level):
+            for window, discount in entries.get(target, ()):
+                if FirestoreService._in_discount_window(window, now):
+                    discounts.append(dict(discount))
+        return discounts
+
+    @classmethod
+    def lookup(cls, loader, product_id, category_id=None, member_level=None, now=None):
+        """取得單一商品適用的折扣"""
+        entries = cls._get_entries(loader)
+        if entries is None:
+            return False, "無法載入折扣"
+        return True, cls._match(entries, product_id, category_id, member_level, now)
+
+    @classmethod
+    def lookup_many(cls, loader, items, member_level=None, now=None):
+        """批次取得多個商品適用的折扣
+
+        Args:
+            items: [(productId, categoryId)]
+
+        Returns:
+            (True, {productId: [discount, ...]})
+        """
+        entries = cls._get_entries(loader)
+        if entries is None:
+            return False, "無法載入折扣"
+        now = now or datetime.now(TW_TZ)
+        return True, {product_id: cls._match(entries, product_id, category_id, member_level, now)
+                      for product_id, category_id in items}
+
+    @classmethod
+    def invalidate(cls):
+        """折扣異動後失效索引"""
+        with cls._lock:
+            cls._entries = None
+            cls._generation += 1
+
+
 class DatabaseAdapter:
     """資料庫適配器 - 統一介面"""
 
+    # 各後端實作相同的類別方法介面（以 FirestoreService 為準）
+    BACKENDS = {
+        'firestore': FirestoreService,
+        'sqlite': SQLiteService
+    }
+
+    # 訂單改為這些狀態時釋放預留庫存，且不可再付款
+    STOCK_RELEASE_STATUSES = order_rules.STOCK_RELEASE_STATUSES
+    # place_order 因訂單編號已存在而失敗時的訊息
+    DUPLICATE_ORDER_ID_MSG = FirestoreService.DUPLICATE_ORDER_ID_MSG
+    # 訂單狀態 / 付款狀態更新時訂單不存在的訊息
+    ORDER_NOT_FOUND_MSG = FirestoreService.ORDER_NOT_FOUND_MSG
+
+    # 延遲初始化狀態：idle → initializing → ready / error
+    _init_lock = threading.Lock()
+    _init_state = {'status': 'idle', 'error': None, 'initMs': None}
+
+    @staticmethod
+    def _select_backend():
+        service = DatabaseAdapter.BACKENDS.get(Config.DATABASE_BACKEND)
+        if service is None:
+            raise ValueError(f"不支援的資料庫後端：{Config.DATABASE_BACKEND}")
+        return service
+
     @staticmethod
     def get_service():
-        """返回資料庫服務"""
-        return FirestoreService
+        """依 Config.DATABASE_BACKEND 返回資料庫服務，第一次使用時才初始化連線"""
+        service = DatabaseAdapter._select_backend()
+        if not service.is_initialized():
+            DatabaseAdapter._initialize(service)
+        return service
+
+    @staticmethod
+    def _initialize(service):
+        """初始化資料庫連線（執行緒安全，只有一個執行緒實際初始化；失敗時下次使用再重試）"""
+        with DatabaseAdapter._init_lock:
+            if service.is_initialized():
+                return
+            state = DatabaseAdapter._init_state
+            state.update(status='initializing', error=None)
+            started = time.perf_counter()
+            try:
+                service.init()
+            except Exception as e:
+                state.update(status='error', error=str(e))
+                raise
+            state.update(status='ready', initMs=round((time.perf_counter() - started) * 1000, 2))
+            logger.info(f"Database backend initialized: {Config.DATABASE_BACKEND} ({state['initMs']}ms)")
+
+    @staticmethod
+    def warm_up(background=True):
+        """預先初始化資料庫連線（gunicorn post_fork 或 /readyz 觸發）
+
+        Args:
+            background: True 時在背景執行緒初始化並立即返回
+        """
+        def run():
+            try:
+                DatabaseAdapter.get_service()
+            except Exception as e:
+                logger.error(f"Database warm-up failed: {e}")
+
+        if not background:
+            run()
+            return None
+        thread = threading.Thread(target=run, name="db-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    @staticmethod
+    def readiness():
+        """資料庫就緒狀態：{"backend", "status", "error", "initMs"}"""
+        state = dict(DatabaseAdapter._init_state)
+        try:
+            if DatabaseAdapter._select_backend().is_initialized():
+                state.update(status='ready', error=None)
+        except ValueError as e:
+            state.update(status='error', error=str(e))
+        return {'backend': Config.DATABASE_BACKEND, **state}
+
+    @staticmethod
+    def get_cache_stats():
+        """取得讀取快取命中統計"""
+        return DatabaseCache.stats()
 
     # ===== 會員相關操作 =====
     
@@ -35,12 +333,36 @@ class DatabaseAdapter:
         service = DatabaseAdapter.get_service()
         return service.update_member(user_id, name, phone, address, address2)
     
+    @staticmethod
+    def get_member_by_phone(phone):
+        """依手機號碼查詢會員"""
+        service = DatabaseAdapter.get_service()
+        return service.get_member_by_phone(phone)
+    
+    @staticmethod
+    def add_member_with_unique_phone(user_id, name, phone, address, birth_date=None, address2=None):
+        """新增會員並保證手機號碼未被使用"""
+        service = DatabaseAdapter.get_service()
+        return service.add_member_with_unique_phone(user_id, name, phone, address, birth_date, address2)
+    
     @staticmethod
     def get_all_members():
         """獲取所有會員"""
         service = DatabaseAdapter.get_service()
         return service.get_all_members()
     
+    @staticmethod
+    def iter_members():
+        """逐筆產生所有會員（串流匯出用，不經快取）"""
+        service = DatabaseAdapter.get_service()
+        return service.iter_members()
+    
+    @staticmethod
+    def iter_orders_with_members():
+        """逐筆產生所有訂單及會員資料（串流匯出用）"""
+        service = DatabaseAdapter.get_service()
+        return service.iter_orders_with_members()
+    
     @staticmethod
     def get_member_by_id(user_id):
         """按ID獲取會員資料"""
@@ -56,16 +378,42 @@ class DatabaseAdapter:
     # ===== 訂單相關操作 =====
     
     @staticmethod
-    def add_order(order_id, user_id, item_str, amount, status, payment_status, payment_method, product_id="", actual_quantity=1, order_qty=1):
+    def add_order(order_id, user_id, item_str, amount, status, payment_status, payment_method, product_id="", actual_quantity=1, order_qty=1, line_items=None):
         """新增訂單"""
         service = DatabaseAdapter.get_service()
-        return service.add_order(order_id, user_id, item_str, amount, status, payment_status, payment_method, product_id, actual_quantity, order_qty)
+        return service.add_order(order_id, user_id, item_str, amount, status, payment_status, payment_method, product_id, actual_quantity, order_qty, line_items)
+    
+    @staticmethod
+    def place_order(order_id, user_id, item_str, amount, status, payment_status, payment_method, line_items, operator="system"):
+        """下單：預留庫存並新增訂單（同一交易）"""
+        service = DatabaseAdapter.get_service()
+        result = service.place_order(order_id, user_id, item_str, amount, status, payment_status, payment_method, line_items, operator)
+        DatabaseCache.invalidate('products')
+        return result
+    
+    @staticmethod
+    def acquire_order_id_worker(token, lease_seconds, max_workers=100):
+        """取得訂單編號 worker 編號租約"""
+        service = DatabaseAdapter.get_service()
+        return service.acquire_order_id_worker(token, lease_seconds, max_workers)
+    
+    @staticmethod
+    def renew_order_id_worker(worker_id, token, lease_seconds):
+        """續約訂單編號 worker 編號"""
+        service = DatabaseAdapter.get_service()
+        return service.renew_order_id_worker(worker_id, token, lease_seconds)
     
     @staticmethod
     def get_user_orders(user_id):
         """取得使用者訂單"""
         service = DatabaseAdapter.get_service()
         return service.get_user_orders(user_id)
+
+    @staticmethod
+    def get_user_orders_page(user_id, limit=20, start_after=None):
+        """分頁取得使用者訂單"""
+        service = DatabaseAdapter.get_service()
+        return service.get_user_orders_page(user_id, limit, start_after)
     
     @staticmethod
     def get_all_orders_with_members():
@@ -73,17 +421,45 @@ class DatabaseAdapter:
         service = DatabaseAdapter.get_service()
         return service.get_all_orders_with_members()
     
+    @staticmethod
+    def get_order_by_id(order_id):
+        """按ID取得單一訂單"""
+        service = DatabaseAdapter.get_service()
+        return service.get_order_by_id(order_id)
+    
+    @staticmethod
+    def get_order_with_member(order_id):
+        """取得單一訂單併入會員資料"""
+        service = DatabaseAdapter.get_service()
+        return service.get_order_with_member(order_id)
+    
+    @staticmethod
+    def get_orders_page(limit=50, start_after=None, status=None, payment_status=None,
+                        date_from=None, date_to=None):
+        """分頁取得訂單併入會員資料"""
+        service = DatabaseAdapter.get_service()
+        return service.get_orders_page(limit, start_after, status, payment_status, date_from, date_to)
+    
     @staticmethod
     def update_order_status(order_id, status):
-        """更新訂單狀態"""
+        """更新訂單狀態（取消時釋放、恢復時重新預留庫存）"""
         service = DatabaseAdapter.get_service()
-        return service.update_order_status(order_id, status)
+        success, result = service.update_order_status(order_id, status)
+        if success:
+            DatabaseCache.invalidate('products')
+        return success, result
     
     @staticmethod
     def update_order_payment_status(order_id, payment_status):
         """更新訂單付款狀態"""
         service = DatabaseAdapter.get_service()
         return service.update_order_payment_status(order_id, payment_status)
+
+    @staticmethod
+    def get_order_stats(days=30, months=12):
+        """後台儀表板統計"""
+        service = DatabaseAdapter.get_service()
+        return service.get_order_stats(days, months)
     
     # ===== 出貨相關操作 =====
     
@@ -93,12 +469,24 @@ class DatabaseAdapter:
         service = DatabaseAdapter.get_service()
         return service.add_delivery_log(order_id, qty, address, delivery_date)
     
+    @staticmethod
+    def add_delivery_logs(deliveries):
+        """批次新增出貨紀錄"""
+        service = DatabaseAdapter.get_service()
+        return service.add_delivery_logs(deliveries)
+    
     @staticmethod
     def correct_delivery_log(order_id, log_index, new_qty, new_address="", new_delivery_date=""):
         """修正出貨紀錄"""
         service = DatabaseAdapter.get_service()
         return service.correct_delivery_log(order_id, log_index, new_qty, new_address, new_delivery_date)
     
+    @staticmethod
+    def get_delivery_records_by_date(delivery_date):
+        """依出貨日期取得出貨紀錄"""
+        service = DatabaseAdapter.get_service()
+        return service.get_delivery_records_by_date(delivery_date)
+    
     # ===== 審計日誌 =====
     
     @staticmethod
@@ -112,7 +500,7 @@ class DatabaseAdapter:
     def add_product(name, unit, price, cost, stock, min_stock_alert, category_id=None, supplier_id=None, description=None, image=None, actual_quantity=None):
         """新增商品"""
         service = DatabaseAdapter.get_service()
-        return service.add_product(
+        result = service.add_product(
             name=name,
             unit=unit,
             price=price,
@@ -125,36 +513,62 @@ class DatabaseAdapter:
             image=image or '',
             actual_quantity=int(actual_quantity) if actual_quantity else 1
         )
+        DatabaseCache.invalidate('products')
+        return result
     
     @staticmethod
     def get_all_products():
         """取得所有商品"""
         service = DatabaseAdapter.get_service()
-        return service.get_all_products()
+        return DatabaseCache.get_list('products', service.get_all_products)
     
     @staticmethod
     def get_product(product_id):
         """取得特定商品"""
         service = DatabaseAdapter.get_service()
-        return service.get_product(product_id)
+        return DatabaseCache.get_document(
+            'products', product_id, lambda: service.get_product(product_id)
+        )
     
     @staticmethod
     def update_product(product_id, **kwargs):
         """更新商品資訊"""
         service = DatabaseAdapter.get_service()
-        return service.update_product(product_id, **kwargs)
+        result = service.update_product(product_id, **kwargs)
+        DatabaseCache.invalidate('products', product_id)
+        return result
     
     @staticmethod
     def delete_product(product_id):
         """刪除商品（軟刪除）"""
         service = DatabaseAdapter.get_service()
-        return service.delete_product(product_id)
+        result = service.delete_product(product_id)
+        DatabaseCache.invalidate('products', product_id)
+        return result
     
     @staticmethod
     def update_product_stock(product_id, qty_change, reason, operator):
         """更新商品庫存"""
         service = DatabaseAdapter.get_service()
-        return service.update_product_stock(product_id, qty_change, reason, operator)
+        result = service.update_product_stock(product_id, qty_change, reason, operator)
+        DatabaseCache.invalidate('products', product_id)
+        return result
+    
+    @staticmethod
+    def set_stock_shards(product_id, shards):
+        """設定商品庫存分片數"""
+        service = DatabaseAdapter.get_service()
+        result = service.set_stock_shards(product_id, shards)
+        DatabaseCache.invalidate('products', product_id)
+        return result
+    
+    @staticmethod
+    def update_products_stock(changes, reason, operator):
+        """批次更新多個商品庫存（單一交易）"""
+        service = DatabaseAdapter.get_service()
+        result = service.update_products_stock(changes, reason, operator)
+        DatabaseCache.invalidate('products')
+        return result
     
     @staticmethod
     def get_stock_logs(product_id=None, limit=100):
@@ -178,31 +592,39 @@ class DatabaseAdapter:
     def add_category(name, description="", color="", icon=""):
         """新增分類"""
         service = DatabaseAdapter.get_service()
-        return service.add_category(name, description, color, icon)
+        result = service.add_category(name, description, color, icon)
+        DatabaseCache.invalidate('categories')
+        return result
     
     @staticmethod
     def get_all_categories():
         """取得所有分類"""
         service = DatabaseAdapter.get_service()
-        return service.get_all_categories()
+        return DatabaseCache.get_list('categories', service.get_all_categories)
     
     @staticmethod
     def get_category(category_id):
         """取得單一分類"""
         service = DatabaseAdapter.get_service()
-        return service.get_category(category_id)
+        return DatabaseCache.get_document(
+            'categories', category_id, lambda: service.get_category(category_id)
+        )
     
     @staticmethod
     def update_category(category_id, **kwargs):
         """更新分類"""
         service = DatabaseAdapter.get_service()
-        return service.update_category(category_id, **kwargs)
+        result = service.update_category(category_id, **kwargs)
+        DatabaseCache.invalidate('categories', category_id)
+        return result
     
     @staticmethod
     def delete_category(category_id):
         """刪除分類"""
         service = DatabaseAdapter.get_service()
-        return service.delete_category(category_id)
+        result = service.delete_category(category_id)
+        DatabaseCache.invalidate('categories', category_id)
+        return result
 
     # ===== 折扣管理 =====
     @staticmethod
@@ -210,45 +632,71 @@ class DatabaseAdapter:
                      target_id=None, start_date=None, end_date=None, description=""):
         """新增折扣"""
         service = DatabaseAdapter.get_service()
-        return service.add_discount(name, discount_type, discount_value, target_type, 
-                                   target_id, start_date, end_date, description)
+        result = service.add_discount(name, discount_type, discount_value, target_type, 
+                                     target_id, start_date, end_date, description)
+        DatabaseCache.invalidate('discounts')
+        DiscountIndex.invalidate()
+        return result
     
     @staticmethod
     def get_all_discounts():
         """取得所有折扣"""
         service = DatabaseAdapter.get_service()
-        return service.get_all_discounts()
+        return DatabaseCache.get_list('discounts', service.get_all_discounts)
     
     @staticmethod
     def get_discount(discount_id):
         """取得單一折扣"""
         service = DatabaseAdapter.get_service()
-        return service.get_discount(discount_id)
+        return DatabaseCache.get_document(
+            'discounts', discount_id, lambda: service.get_discount(discount_id)
+        )
     
     @staticmethod
     def update_discount(discount_id, **kwargs):
         """更新折扣"""
         service = DatabaseAdapter.get_service()
-        return service.update_discount(discount_id, **kwargs)
+        result = service.update_discount(discount_id, **kwargs)
+        DatabaseCache.invalidate('discounts', discount_id)
+        DiscountIndex.invalidate()
+        return result
     
     @staticmethod
     def delete_discount(discount_id):
         """刪除折扣"""
         service = DatabaseAdapter.get_service()
-        return service.delete_discount(discount_id)
+        result = service.delete_discount(discount_id)
+        DatabaseCache.invalidate('discounts', discount_id)
+        DiscountIndex.invalidate()
+        return result
     
     @staticmethod
     def get_applicable_discounts(product_id, category_id=None, member_level=None):
-        """取得適用的折扣"""
+        """取得適用的折扣（由進程內折扣索引查詢）"""
         service = DatabaseAdapter.get_service()
-        return service.get_applicable_discounts(product_id, category_id, member_level)
+        return DiscountIndex.lookup(service.get_active_discounts, product_id, category_id, member_level)
+    
+    @staticmethod
+    def get_applicable_discounts_batch(items, member_level=None):
+        """批次取得多個商品適用的折扣
+
+        Args:
+            items: [(productId, categoryId)]
+
+        Returns:
+            (True, {productId: [discount, ...]})
+        """
+        service = DatabaseAdapter.get_service()
+        return DiscountIndex.lookup_many(service.get_active_discounts, items, member_level)
 
     # ===== 庫存警告 =====
     @staticmethod
     def add_stock_alert(product_id, alert_type, threshold, operator="system"):
         """新增庫存警告"""
         service = DatabaseAdapter.get_service()
-        return service.add_stock_alert(product_id, alert_type, threshold, operator)
+        result = service.add_stock_alert(product_id, alert_type, threshold, operator)
+        DatabaseCache.invalidate('stockAlerts')
+        return result
     
     @staticmethod
     def get_stock_alerts(status='active', alert_type=None):
@@ -256,14 +704,83 @@ class DatabaseAdapter:
         service = DatabaseAdapter.get_service()
         return service.get_stock_alerts(status, alert_type)
     
+    @staticmethod
+    def get_stock_alerts_page(status='active', alert_type=None, limit=50, start_after=None):
+        """分頁取得庫存警告"""
+        service = DatabaseAdapter.get_service()
+        return service.get_stock_alerts_page(status, alert_type, limit, start_after)
+    
+    @staticmethod
+    def get_stock_alerts_version():
+        """取得警告清單版本（快取；其他 worker 的異動在 TTL 內可能尚未反映）"""
+        service = DatabaseAdapter.get_service()
+        return DatabaseCache.get_list('stockAlerts', service.get_stock_alerts_version)
+    
     @staticmethod
     def acknowledge_stock_alert(alert_id, acknowledged_by="admin"):
         """確認庫存警告"""
         service = DatabaseAdapter.get_service()
-        return service.acknowledge_stock_alert(alert_id, acknowledged_by)
+        result = service.acknowledge_stock_alert(alert_id, acknowledged_by)
+        DatabaseCache.invalidate('stockAlerts')
+        return result
     
     @staticmethod
     def check_and_create_stock_alerts(product_id):
         """檢查並創建庫存警告"""
         service = DatabaseAdapter.get_service()
-        return service.check_and_create_stock_alerts(product_id)
\ No newline at end of file
+        result = service.check_and_create_stock_alerts(product_id)
+        DatabaseCache.invalidate('stockAlerts')
+        return result
+
+    # ===== LINE 推播 outbox =====
+    @staticmethod
+    def add_line_outbox(message_id, user_id, text):
+        """寫入待送出的 LINE 推播訊息"""
+        service = DatabaseAdapter.get_service()
+        return service.add_line_outbox(message_id, user_id, text)
+
+    @staticmethod
+    def update_line_outbox(message_id, **kwargs):
+        """更新 outbox 訊息狀態"""
+        service = DatabaseAdapter.get_service()
+        return service.update_line_outbox(message_id, **kwargs)
+
+    @staticmethod
+    def delete_line_outbox(message_id):
+        """刪除已送出的 outbox 訊息"""
+        service = DatabaseAdapter.get_service()
+        return service.delete_line_outbox(message_id)
+
+    @staticmethod
+    def claim_stale_line_outbox(lease_seconds, limit=500):
+        """認領逾時未送出的 outbox 訊息"""
+        service = DatabaseAdapter.get_service()
+        return service.claim_stale_line_outbox(lease_seconds, limit)
+
+    # ===== 會員 LINE ID 驗證令牌 =====
+    @staticmethod
+    def add_verification_token(token, user_id, expires_at):
+        """儲存 LINE ID 綁定驗證令牌"""
+        service = DatabaseAdapter.get_service()
+        return service.add_verification_token(token, user_id, expires_at)
+
+    @staticmethod
+    def get_verification_token(token):
+        """取得驗證令牌"""
+        service = DatabaseAdapter.get_service()
+        return service.get_verification_token(token)
+
+    @staticmethod
+    def delete_verification_token(token):
+        """刪除驗證令牌"""
+        service = DatabaseAdapter.get_service()
+        return service.delete_verification_token(token)
+
+    # ===== 資料維護 =====
+    @staticmethod
+    def clear_collection(collection):
+        """刪除集合內所有文件"""
+        service = DatabaseAdapter.get_service()
+        result = service.clear_collection(collection)
+        DatabaseCache.invalidate(collection)
+        return result
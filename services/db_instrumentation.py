@@ -0,0 +1,231 @@
+"""
+資料庫用量統計
+
+以代理物件包裝 Firestore Client（FirestoreService._db），統計每個請求的文件讀取數、
+寫入數、RPC 次數與資料庫耗時（SQLite 後端由 SQLiteService 直接記錄）。
+app 於請求開始時呼叫 begin_request()，回應時以 server_timing() 輸出 Server-Timing 標頭，
+並以 log_request() 寫入結構化日誌（超過 DB_SLOW_REQUEST_MS 的請求以 WARNING 記錄）。
+
+讀取數依 Firestore 計費規則計算：查詢沒有結果時仍計 1 次讀取。
+"""
+import json
+import logging
+import threading
+import time
+from config import Config
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# 回傳查詢物件的方法（結果需繼續包裝）
+_QUERY_METHODS = {
+    'collection', 'where', 'order_by', 'limit', 'limit_to_last', 'offset', 'select',
+    'start_at', 'start_after', 'end_at', 'end_before', 'collection_group'
+}
+_WRITE_METHODS = {'set', 'create', 'update', 'delete'}
+
+
+class RequestUsage:
+    """單一請求的資料庫用量"""
+
+    __slots__ = ('reads', 'writes', 'rpcs', 'db_seconds', 'started')
+
+    def __init__(self):
+        self.reads = 0
+        self.writes = 0
+        self.rpcs = 0
+        self.db_seconds = 0.0
+        self.started = time.perf_counter()
+
+    def to_dict(self):
+        return {
+            'reads': self.reads,
+            'writes': self.writes,
+            'rpcs': self.rpcs,
+            'dbMs': round(self.db_seconds * 1000, 2),
+            'durationMs': round((time.perf_counter() - self.started) * 1000, 2)
+        }
+
+
+_local = threading.local()
+
+
+def begin_request():
+    """開始統計目前執行緒的請求用量"""
+    _local.usage = RequestUsage()
+    return _local.usage
+
+
+def current_usage():
+    """目前請求的用量；不在請求中（例如背景執行緒）時回傳 None"""
+    return getattr(_local, 'usage', None)
+
+
+def end_request():
+    """結束統計並回傳用量 dict"""
+    usage = current_usage()
+    _local.usage = None
+    return usage.to_dict() if usage else None
+
+
+def record(reads=0, writes=0, rpcs=1, seconds=0.0):
+    """記錄一次資料庫操作：累計至監控指標，請求中時另計入該請求的用量"""
+    if Config.METRICS_ENABLED:
+        backend = Config.DATABASE_BACKEND
+        metrics.inc('db_reads_total', reads, backend=backend)
+        metrics.inc('db_writes_total', writes, backend=backend)
+        metrics.inc('db_rpcs_total', rpcs, backend=backend)
+        metrics.observe('db_rpc_duration_seconds', seconds, backend=backend)
+
+    usage = current_usage()
+    if usage is None:
+        return
+    usage.reads += reads
+    usage.writes += writes
+    usage.rpcs += rpcs
+    usage.db_seconds += seconds
+
+
+def server_timing(usage):
+    """Server-Timing 標頭值：資料庫耗時、讀寫數與 RPC 次數、請求總耗時"""
+    return ', '.join([
+        f"db;dur={usage['dbMs']}",
+        f'db-reads;desc="{usage["reads"]}"',
+        f'db-writes;desc="{usage["writes"]}"',
+        f'db-rpcs;desc="{usage["rpcs"]}"',
+        f"total;dur={usage['durationMs']}"
+    ])
+
+
+def log_request(usage, method, path, endpoint, status, slow_ms, log_all=False):
+    """寫入結構化日誌；超過 slow_ms 的請求以 WARNING 記錄"""
+    slow = slow_ms is not None and usage['durationMs'] >= slow_ms
+    if not slow and not log_all:
+        return
+    line = json.dumps({
+        'event': 'db_usage',
+        'method': method,
+        'path': path,
+        'endpoint': endpoint,
+        'status': status,
+        'slow': slow,
+        **usage
+    }, ensure_ascii=False)
+    if slow:
+        logger.warning(line)
+    else:
+        logger.info(line)
+
+
+def instrument(client):
+    """包裝 Firestore Client，統計經由它發出的讀寫"""
+    return _Proxy(client, 'client')
+
+
+def _unwrap(value):
+    if isinstance(value, _Proxy):
+        return object.__getattribute__(value, '_target')
+    if isinstance(value, list):
+        return [_unwrap(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(_unwrap(item) for item in value)
+    return value
+
+
+def _count_stream(iterable, started):
+    """逐筆產生文件並於結束時記錄讀取數（只計入取得文件的時間，不含呼叫端處理時間）"""
+    elapsed = time.perf_counter() - started
+    count = 0
+    iterator = iter(iterable)
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - started
+                return
+            elapsed += time.perf_counter() - started
+            count += 1
+            yield item
+    finally:
+        record(reads=max(count, 1), seconds=elapsed)
+
+
+class _Proxy:
+    """Firestore 物件代理：依物件種類（client、query、document、batch）統計操作
+
+    batch 與 transaction 的寫入在 commit 時一次送出，先累計暫存的寫入數再於 commit 時記錄。
+    """
+
+    __slots__ = ('_target', '_kind', '_staged')
+
+    def __init__(self, target, kind):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_kind', kind)
+        object.__setattr__(self, '_staged', 0)
+
+    def __getattr__(self, name):
+        target = object.__getattribute__(self, '_target')
+        kind = object.__getattribute__(self, '_kind')
+        attr = getattr(target, name)
+        if not callable(attr):
+            return attr
+
+        if name in _QUERY_METHODS or (name == 'document' and kind in ('client', 'query')):
+            result_kind = 'document' if name == 'document' else 'query'
+            return lambda *args, **kwargs: _Proxy(attr(*_unwrap(args), **_unwrap(kwargs)), result_kind)
+        if kind == 'client' and name in ('batch', 'transaction'):
+            return lambda *args, **kwargs: _Proxy(attr(*args, **kwargs), 'batch')
+        if name == 'get_all' or (name in ('stream', 'get') and kind in ('query', 'batch')):
+            return lambda *args, **kwargs: self._proxy_read_many(attr, args, kwargs)
+        if name == 'get' and kind == 'document':
+            return lambda *args, **kwargs: self._proxy_call(attr, args, kwargs, reads=1)
+        if name in _WRITE_METHODS and kind == 'document':
+            return lambda *args, **kwargs: self._proxy_call(attr, args, kwargs, writes=1)
+        if name == 'add' and kind == 'query':
+            return lambda *args, **kwargs: self._proxy_call(attr, args, kwargs, writes=1)
+        if kind == 'batch':
+            if name in _WRITE_METHODS:
+                return lambda *args, **kwargs: self._proxy_stage(attr, args, kwargs)
+            if name in ('commit', '_commit'):
+                return lambda *args, **kwargs: self._proxy_commit(attr, args, kwargs)
+            if name in ('_begin', '_clean_up'):
+                object.__setattr__(self, '_staged', 0)
+        return lambda *args, **kwargs: attr(*_unwrap(args), **_unwrap(kwargs))
+
+    def __setattr__(self, name, value):
+        setattr(object.__getattribute__(self, '_target'), name, value)
+
+    def __eq__(self, other):
+        return object.__getattribute__(self, '_target') == _unwrap(other)
+
+    def __hash__(self):
+        return hash(object.__getattribute__(self, '_target'))
+
+    @staticmethod
+    def _proxy_call(method, args, kwargs, reads=0, writes=0):
+        started = time.perf_counter()
+        try:
+            return method(*_unwrap(args), **_unwrap(kwargs))
+        finally:
+            record(reads=reads, writes=writes, seconds=time.perf_counter() - started)
+
+    @staticmethod
+    def _proxy_read_many(method, args, kwargs):
+        started = time.perf_counter()
+        result = method(*_unwrap(args), **_unwrap(kwargs))
+        if isinstance(result, list):
+            record(reads=max(len(result), 1), seconds=time.perf_counter() - started)
+            return result
+        return _count_stream(result, started)
+
+    def _proxy_stage(self, method, args, kwargs):
+        result = method(*_unwrap(args), **_unwrap(kwargs))
+        object.__setattr__(self, '_staged', object.__getattribute__(self, '_staged') + 1)
+        return result
+
+    def _proxy_commit(self, method, args, kwargs):
+        writes = object.__getattribute__(self, '_staged')
+        object.__setattr__(self, '_staged', 0)
+        return self._proxy_call(method, args, kwargs, writes=writes)
@@ -3,11 +3,25 @@ Firebase Firestore 服務模組
 """
 import firebase_admin
 from firebase_admin import credentials, firestore
-from datetime import datetime
+from google.api_core import exceptions as core_exceptions
+from google.api_core import gapic_v1
+from google.api_core import retry as retries
+from google.api_core.exceptions import AlreadyExists
+from google.cloud.firestore_v1.services.firestore import client as firestore_client
+from google.cloud.firestore_v1.services.firestore.transports import grpc as firestore_grpc_transport
+from datetime import datetime, timedelta
+import grpc
+import itertools
 import pytz
 import logging
 import os
+import random
+import socket
+import threading
+import time
 from config import Config
+from services import db_instrumentation, order_rules
+from services.order_rules import OrderStockError
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +29,213 @@ logger = logging.getLogger(__name__)
 TW_TZ = pytz.timezone(Config.TIMEZONE)
 
 
+# ===== Firestore 連線池 =====
+
+# 讀取類 RPC：可安全重試
+READ_RPCS = ('get_document', 'batch_get_documents', 'run_query', 'run_aggregation_query',
+             'list_documents', 'list_collection_ids')
+# 寫入類 RPC：只在請求確定未被處理（UNAVAILABLE、RESOURCE_EXHAUSTED）時重試
+WRITE_RPCS = ('commit', 'begin_transaction', 'rollback', 'batch_write',
+              'create_document', 'update_document', 'delete_document')
+# 串流回應的 RPC：deadline 涵蓋整個串流，另外設定
+STREAMING_RPCS = ('batch_get_documents', 'run_query', 'run_aggregation_query')
+
+
+class _ChannelLimiter(grpc.UnaryUnaryClientInterceptor, grpc.UnaryStreamClientInterceptor):
+    """gRPC 攔截器：限制單一 channel 同時進行的 RPC 數（串流 RPC 佔用到串流結束）"""
+
+    def __init__(self, max_concurrent):
+        self.max_concurrent = max_concurrent
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def _acquire(self, timeout):
+        if not self._semaphore.acquire(timeout=timeout):
+            raise core_exceptions.DeadlineExceeded("等待 Firestore channel 可用的 RPC 名額逾時")
+        with self._lock:
+            self.in_flight += 1
+
+    def _release(self, *_):
+        with self._lock:
+            self.in_flight -= 1
+        self._semaphore.release()
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        self._acquire(client_call_details.timeout)
+        try:
+            return continuation(client_call_details, request)
+        finally:
+            self._release()
+
+    def intercept_unary_stream(self, continuation, client_call_details, request):
+        self._acquire(client_call_details.timeout)
+        try:
+            call = continuation(client_call_details, request)
+        except Exception:
+            self._release()
+            raise
+        call.add_done_callback(self._release)
+        return call
+
+
+class _PooledClient(firestore.Client):
+    """使用自訂 gRPC channel 選項、並行上限與 deadline / 重試策略的 Firestore Client
+
+    firestore.Client 沒有傳入 transport 的參數，只能覆寫 _firestore_api 建立 GAPIC client；
+    channel、transport 與 GAPIC client 皆以公開建構參數建立，依賴的 Client 內部屬性列於
+    REQUIRED_CLIENT_ATTRIBUTES（requirements.txt 固定 google-cloud-firestore 版本，
+    tests 以真實 Client 驗證這些屬性仍存在）。
+    """
+
+    # 覆寫 _firestore_api 時讀取的 firestore.Client 內部屬性
+    REQUIRED_CLIENT_ATTRIBUTES = ('_firestore_api_internal', '_emulator_host', '_emulator_channel', '_target',
+                                  '_credentials', '_client_info', '_client_options')
+
+    def __init__(self, *args, channel_options=(), limiter=None, rpc_defaults=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._channel_options = list(channel_options)
+        self._limiter = limiter
+        self._rpc_defaults = rpc_defaults or {}
+
+    def _create_channel(self, transport_class):
+        if self._emulator_host is not None:
+            channel = self._emulator_channel(transport_class)
+        else:
+            channel = transport_class.create_channel(
+                self._target, credentials=self._credentials, options=self._channel_options
+            )
+        if self._limiter is not None:
+            channel = grpc.intercept_channel(channel, self._limiter)
+        return channel
+
+    def _apply_rpc_defaults(self, transport):
+        """以設定的 deadline 與重試策略取代 GAPIC 預設值（呼叫端仍可逐次指定 retry / timeout）"""
+        wrapped_methods = getattr(transport, '_wrapped_methods', None)
+        if not isinstance(wrapped_methods, dict):
+            # GAPIC transport 結構改變時明確失敗，而不是默默失去 deadline 與重試設定
+            raise RuntimeError("不支援的 google-cloud-firestore 版本：transport 缺少 _wrapped_methods")
+        for name, (retry, timeout) in self._rpc_defaults.items():
+            method = getattr(transport, name)
+            wrapped_methods[method] = gapic_v1.method.wrap_method(
+                method, default_retry=retry, default_timeout=timeout,
+                client_info=self._client_info
+            )
+
+    @property
+    def _firestore_api(self):
+        if self._firestore_api_internal is None:
+            transport_class = firestore_grpc_transport.FirestoreGrpcTransport
+            transport = transport_class(
+                host=self._target, channel=self._create_channel(transport_class), client_info=self._client_info
+            )
+            self._apply_rpc_defaults(transport)
+            self._firestore_api_internal = firestore_client.FirestoreClient(
+                transport=transport, client_options=self._client_options, client_info=self._client_info
+            )
+        return self._firestore_api_internal
+
+
+class FirestoreClientPool:
+    """Firestore Client 連線池
+
+    每個 Client 各自一條 gRPC channel（HTTP/2 連線）；取得 collection / document / batch /
+    transaction 時挑選進行中 RPC 最少的 channel（相同時輪流），讓多執行緒的 worker
+    不會全部擠在單一連線的串流上限。
+    """
+
+    def __init__(self, clients, limiters=None):
+        self._clients = list(clients)
+        self._limiters = list(limiters) if limiters else [None] * len(self._clients)
+        self._counter = itertools.count()
+
+    @classmethod
+    def create(cls, project, credentials, database=None, channels=None, max_concurrent_rpcs=None,
+               rpc_timeout=None, stream_timeout=None, retry_deadline=None, keepalive_ms=None):
+        """依 Config 預設值建立連線池
+
+        Args:
+            channels: gRPC channel 數
+            max_concurrent_rpcs: 每個 channel 同時進行的 RPC 上限
+            rpc_timeout: 單次 RPC deadline（秒）
+            stream_timeout: 串流 RPC（查詢、批次讀取）deadline（秒）
+            retry_deadline: 含重試的總時間上限（秒）
+            keepalive_ms: gRPC keepalive ping 間隔（毫秒）
+        """
+        channels = channels or Config.FIRESTORE_CHANNELS
+        max_concurrent_rpcs = max_concurrent_rpcs or Config.FIRESTORE_MAX_CONCURRENT_RPCS
+        rpc_timeout = rpc_timeout or Config.FIRESTORE_RPC_TIMEOUT
+        stream_timeout = stream_timeout or Config.FIRESTORE_STREAM_TIMEOUT
+        retry_deadline = retry_deadline or Config.FIRESTORE_RETRY_DEADLINE
+        keepalive_ms = keepalive_ms or Config.FIRESTORE_KEEPALIVE_MS
+
+        channel_options = [
+            ('grpc.keepalive_time_ms', keepalive_ms),
+            ('grpc.keepalive_timeout_ms', min(keepalive_ms, 20000)),
+            ('grpc.max_send_message_length', -1),
+            ('grpc.max_receive_message_length', -1),
+        ]
+
+        def policy(*errors):
+            return retries.Retry(initial=0.1, maximum=5.0, multiplier=2.0,
+                                 predicate=retries.if_exception_type(*errors), timeout=retry_deadline)
+
+        read_retry = policy(core_exceptions.DeadlineExceeded, core_exceptions.InternalServerError,
+                            core_exceptions.ResourceExhausted, core_exceptions.ServiceUnavailable)
+        write_retry = policy(core_exceptions.ResourceExhausted, core_exceptions.ServiceUnavailable)
+        rpc_defaults = {name: (read_retry, stream_timeout if name in STREAMING_RPCS else rpc_timeout)
+                        for name in READ_RPCS}
+        rpc_defaults.update({name: (write_retry, rpc_timeout) for name in WRITE_RPCS})
+
+        clients, limiters = [], []
+        for _ in range(channels):
+            limiter = _ChannelLimiter(max_concurrent_rpcs)
+            kwargs = {'database': database} if database else {}
+            clients.append(_PooledClient(project=project, credentials=credentials, channel_options=channel_options,
+                                         limiter=limiter, rpc_defaults=rpc_defaults, **kwargs))
+            limiters.append(limiter)
+        logger.info(f"Firestore client pool created: {channels} channels, "
+                    f"{max_concurrent_rpcs} concurrent RPCs per channel, timeout {rpc_timeout}s")
+        return cls(clients, limiters)
+
+    def _pick(self):
+        if len(self._clients) == 1:
+            return self._clients[0]
+        start = next(self._counter) % len(self._clients)
+        order = [(start + i) % len(self._clients) for i in range(len(self._clients))]
+        best = min(order, key=lambda i: self._limiters[i].in_flight if self._limiters[i] else 0)
+        return self._clients[best]
+
+    def collection(self, *path):
+        return self._pick().collection(*path)
+
+    def document(self, *path):
+        return self._pick().document(*path)
+
+    def batch(self):
+        return self._pick().batch()
+
+    def transaction(self, **kwargs):
+        return self._pick().transaction(**kwargs)
+
+    def get_all(self, references, *args, **kwargs):
+        return self._pick().get_all(references, *args, **kwargs)
+
+    def collections(self, *args, **kwargs):
+        return self._pick().collections(*args, **kwargs)
+
+    def stats(self):
+        """各 channel 進行中的 RPC 數"""
+        return [
+            {'inFlight': limiter.in_flight, 'maxConcurrent': limiter.max_concurrent}
+            for limiter in self._limiters if limiter
+        ]
+
+    def close(self):
+        for client in self._clients:
+            client.close()
+
+
 class FirestoreService:
     """Firebase Firestore 連線與操作服務"""
     
@@ -39,12 +260,20 @@ class FirestoreService:
                 cred = credentials.Certificate(creds_dict)
                 firebase_admin.initialize_app(cred)
             
-            cls._db = firestore.client()
+            app = firebase_admin.get_app()
+            cls._db = FirestoreClientPool.create(app.project_id, app.credential.get_credential())
+            if Config.DB_INSTRUMENTATION_ENABLED:
+                cls._db = db_instrumentation.instrument(cls._db)
             logger.info("Firebase Firestore initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize Firebase: {e}")
             raise
     
+    @classmethod
+    def is_initialized(cls):
+        """是否已建立 Firestore 連線"""
+        return cls._db is not None
+    
     @classmethod
     def add_member(cls, user_id, name, phone, address, birth_date=None, address2=None):
         """新增會員"""
@@ -65,6 +294,70 @@ class FirestoreService:
             logger.error(f"Error adding member: {e}")
             return False
     
+    @classmethod
+    def get_member_by_phone(cls, phone):
+        """依手機號碼查詢會員（單欄位索引查詢，最多讀取 1 筆）
+
+        Returns:
+            (True, member) 找到會員；(True, None) 查無資料；(False, 錯誤訊息)
+        """
+        try:
+            docs = cls._db.collection('members').where('phone', '==', phone).limit(1).stream()
+            for doc in docs:
+                return True, doc.to_dict()
+            return True, None
+        except Exception as e:
+            logger.error(f"Error getting member by phone: {e}")
+            return False, str(e)
+    
+    @classmethod
+    def _create_member_unique_phone(cls, transaction, user_id, member_data):
+        phone = member_data['phone']
+        reservation_ref = cls._db.collection('memberPhones').document(phone)
+        if reservation_ref.get(transaction=transaction).exists:
+            return False
+        existing = cls._db.collection('members').where('phone', '==', phone).limit(1)
+        if list(existing.stream(transaction=transaction)):
+            return False
+        
+        transaction.create(cls._db.collection('members').document(user_id), member_data)
+        transaction.set(reservation_ref, {'userId': user_id, 'createdAt': member_data['createdAt']})
+        return True
+    
+    @classmethod
+    def add_member_with_unique_phone(cls, user_id, name, phone, address, birth_date=None, address2=None):
+        """新增會員並保證手機號碼未被使用（管理者建立會員用）
+        
+        同一交易中讀取 memberPhones/{phone} 保留文件並以索引查詢既有會員，
+        同時寫入會員與保留文件；同一支手機的並行新增會因交易衝突而重試，
+        重試時即會看到對方的保留文件。
+        
+        Returns:
+            (True, user_id) 新增成功；(False, None) 手機號碼已有會員；(False, 錯誤訊息)
+        """
+        try:
+            now = datetime.now(TW_TZ)
+            member_data = {
+                'userId': user_id,
+                'name': name,
+                'phone': phone,
+                'address': address,
+                'birthDate': birth_date or '',
+                'address2': address2 or '',
+                'createdAt': now,
+                'updatedAt': now
+            }
+            created = firestore.transactional(cls._create_member_unique_phone)(
+                cls._db.transaction(), user_id, member_data
+            )
+            if not created:
+                return False, None
+            logger.info(f"Member added: {user_id}")
+            return True, user_id
+        except Exception as e:
+            logger.error(f"Error adding member with unique phone: {e}")
+            return False, str(e)
+    
     @classmethod
     def check_member_exists(cls, user_id):
         """檢查會員是否存在"""
@@ -102,33 +395,33 @@ class FirestoreService:
             logger.error(f"Error updating member: {e}")
             return False
     
+    @staticmethod
+    def _normalize_member(data):
+        """處理會員時間戳記與預設狀態"""
+        created_at = data.get('createdAt')
+        updated_at = data.get('updatedAt')
+        
+        if created_at and hasattr(created_at, 'strftime'):
+            data['createdAt'] = created_at.strftime('%Y-%m-%d %H:%M:%S')
+        else:
+            data['createdAt'] = str(created_at) if created_at else ''
+        
+        if updated_at and hasattr(updated_at, 'strftime'):
+            data['updatedAt'] = updated_at.strftime('%Y-%m-%d %H:%M:%S')
+        else:
+            data['updatedAt'] = str(updated_at) if updated_at else ''
+        
+        # 添加默認狀態如果不存在
+        if 'status' not in data:
+            data['status'] = '啟用'
+        return data
+    
     @classmethod
     def get_all_members(cls):
         """獲取所有會員"""
         try:
             docs = cls._db.collection('members').stream()
-            members = []
-            for doc in docs:
-                data = doc.to_dict()
-                # 處理時間戳記
-                created_at = data.get('createdAt')
-                updated_at = data.get('updatedAt')
-                
-                if created_at and hasattr(created_at, 'strftime'):
-                    data['createdAt'] = created_at.strftime('%Y-%m-%d %H:%M:%S')
-                else:
-                    data['createdAt'] = str(created_at) if created_at else ''
-                
-                if updated_at and hasattr(updated_at, 'strftime'):
-                    data['updatedAt'] = updated_at.strftime('%Y-%m-%d %H:%M:%S')
-                else:
-                    data['updatedAt'] = str(updated_at) if updated_at else ''
-                
-                # 添加默認狀態如果不存在
-                if 'status' not in data:
-                    data['status'] = '啟用'
-                
-                members.append(data)
+            members = [cls._normalize_member(doc.to_dict()) for doc in docs]
             
             # 按更新時間排序（最新優先）
             members.sort(key=lambda x: x.get('updatedAt', ''), reverse=True)
@@ -137,6 +430,51 @@ class FirestoreService:
             logger.error(f"Error getting all members: {e}")
             return []
     
+    # 匯出時每次讀取的文件數
+    EXPORT_PAGE_SIZE = 500
+    
+    @classmethod
+    def _iter_collection_pages(cls, collection, page_size=None):
+        """依文件 ID 分頁讀取整個集合，每次只有一頁在記憶體中"""
+        page_size = page_size or cls.EXPORT_PAGE_SIZE
+        query = cls._db.collection(collection).order_by('__name__').limit(page_size)
+        last_doc = None
+        while True:
+            page_query = query.start_after(last_doc) if last_doc is not None else query
+            docs = list(page_query.stream())
+            if docs:
+                yield docs
+            if len(docs) < page_size:
+                return
+            last_doc = docs[-1]
+    
+    @classmethod
+    def iter_members(cls, page_size=None):
+        """逐筆產生所有會員（依文件 ID 排序，供串流匯出）"""
+        for docs in cls._iter_collection_pages('members', page_size):
+            for doc in docs:
+                yield cls._normalize_member(doc.to_dict())
+    
+    @classmethod
+    def iter_orders_with_members(cls, page_size=None):
+        """逐筆產生所有訂單及會員資料（依訂單 ID 排序，供串流匯出）
+        
+        每頁訂單以一次 get_all 讀取該頁相關的會員。
+        """
+        for docs in cls._iter_collection_pages('orders', page_size):
+            orders = [doc.to_dict() for doc in docs]
+            user_ids = sorted({o.get('userId') for o in orders if o.get('userId')})
+            members_map = {}
+            if user_ids:
+                refs = [cls._db.collection('members').document(uid) for uid in user_ids]
+                for member_doc in cls._db.get_all(refs):
+                    if member_doc.exists:
+                        members_map[member_doc.id] = member_doc.to_dict()
+            for order in orders:
+                order_rules.normalize_order_date(order)
+                order['customer'] = members_map.get(order.get('userId'), {})
+                yield order
+    
     @classmethod
     def get_member_by_id(cls, user_id):
         """按ID獲取會員資料"""
@@ -182,86 +520,233 @@ class FirestoreService:
             return False, str(e)
     
     @classmethod
-    def add_order(cls, order_id, user_id, item_str, amount, status, payment_status, payment_method, product_id="", actual_quantity=1, order_qty=1):
-        """新增訂單"""
+    def add_order(cls, order_id, user_id, item_str, amount, status, payment_status, payment_method, product_id="", actual_quantity=1, order_qty=1, line_items=None):
+        """新增訂單（僅新增，訂單編號已存在時失敗而不覆寫）
+
+        line_items: 訂單品項 [{"productId", "name", "qty", "actualQuantity", "unitPrice", "amount"}]
+        """
         try:
-            now = datetime.now(TW_TZ)
-            cls._db.collection('orders').document(order_id).set({
-                'orderId': order_id,
-                'userId': user_id,
-                'productId': product_id,
-                'items': item_str,
-                'amount': amount,
-                'status': status,
-                'paymentStatus': payment_status,
-                'paymentMethod': payment_method,
-                'actualQuantity': int(actual_quantity),
-                'orderQty': int(order_qty),
-                'date': now.strftime('%Y-%m-%d %H:%M:%S'),
-                'deliveryLogs': [],
-                'createdAt': now,
-                'updatedAt': now
-            })
+            order_data = order_rules.new_order_data(order_id, user_id, item_str, amount, status, payment_status,
+                                             payment_method, product_id, actual_quantity, order_qty, line_items)
+            # 訂單與統計計數在同一批次中提交
+            batch = cls._db.batch()
+            batch.create(cls._db.collection('orders').document(order_id), order_data)
+            cls._stage_order_stats(batch, order_rules.order_stats_delta(None, order_data))
+            batch.commit()
             logger.info(f"Order added: {order_id}")
             return True
+        except AlreadyExists:
+            logger.error(f"Order ID collision, order not written: {order_id}")
+            return False
         except Exception as e:
             logger.error(f"Error adding order: {e}")
             return False
+
+    # 單筆訂單的商品上限（每個商品需 1 筆庫存更新 + 1 筆異動紀錄，遠低於單次提交 500 筆寫入）
+    MAX_CART_PRODUCTS = 50
+    # 訂單編號已存在時 place_order 回傳的訊息，呼叫端據此換新編號重試
+    DUPLICATE_ORDER_ID_MSG = "訂單編號重複"
+    # 訂單狀態 / 付款狀態更新時訂單不存在的訊息，呼叫端據此與不允許的變更區分
+    ORDER_NOT_FOUND_MSG = "訂單不存在"
+
+    @classmethod
+    def _place_order(cls, transaction, order_data, changes, operator):
+        """在交易中檢查商品（單次 get_all）、預留庫存、寫入異動紀錄、訂單與統計計數"""
+        success, result = cls._apply_stock_changes(
+            transaction, changes, f"訂單 {order_data['orderId']}", operator, reserve=True
+        )
+        if not success:
+            return False, result
+        transaction.create(cls._db.collection('orders').document(order_data['orderId']), order_data)
+        cls._stage_order_stats(transaction, order_rules.order_stats_delta(None, order_data))
+        return True, order_data
+
+    @classmethod
+    def place_order(cls, order_id, user_id, item_str, amount, status, payment_status, payment_method,
+                    line_items, operator="system"):
+        """下單：預留庫存並新增訂單（單一或多商品）
+
+        商品存在、上架與庫存檢查、扣庫存（訂購數量 × 實際數量）、庫存異動紀錄與訂單在同一交易中提交，
+        任一商品不合法或庫存不足則全部不寫入。訂單標記 stockReserved，取消時釋放庫存。
+
+        Returns:
+            (True, 訂單資料) 或 (False, 錯誤訊息)
+        """
+        try:
+            if not line_items:
+                return False, "購物車沒有商品"
+            changes = order_rules.line_item_stock_changes(line_items)
+            if len(changes) > cls.MAX_CART_PRODUCTS:
+                return False, f"單筆訂單最多 {cls.MAX_CART_PRODUCTS} 項商品"
+
+            # 單一商品訂單保留 orderQty / actualQuantity 欄位（舊版頁面與報表使用）
+            single = line_items[0] if len(line_items) == 1 else {'qty': 1}
+            order_data = order_rules.new_order_data(order_id, user_id, item_str, amount, status, payment_status,
+                                             payment_method, line_items[0]['productId'],
+                                             single.get('actualQuantity', 1), single['qty'],
+                                             line_items=line_items)
+            order_data['stockReserved'] = True
+            success, result = firestore.transactional(cls._place_order)(
+                cls._db.transaction(), order_data, changes, operator
+            )
+            if not success:
+                return False, result
+            logger.info(f"Order placed: {order_id} ({len(line_items)} items)")
+            return True, result
+        except AlreadyExists:
+            logger.error(f"Order ID collision, order not written: {order_id}")
+            return False, cls.DUPLICATE_ORDER_ID_MSG
+        except Exception as e:
+            logger.error(f"Error placing order: {e}")
+            return False, str(e)
     
+    # ===== 訂單編號 worker 租約 =====
     @classmethod
-    def get_user_orders(cls, user_id):
-        """取得使用者訂單"""
+    def _acquire_worker_slot(cls, transaction, token, lease_seconds, max_workers):
+        refs = [cls._db.collection('orderIdWorkers').document(f"{i:02d}") for i in range(max_workers)]
+        slots = {doc.id: doc for doc in cls._db.get_all(refs, transaction=transaction)}
+        now = time.time()
+
+        # 優先取回自己原本的編號，其次從隨機位置找第一個過期或未使用的編號
+        offset = random.randrange(max_workers)
+        candidates = sorted(range(max_workers), key=lambda i: (i - offset) % max_workers)
+        chosen = None
+        for i in candidates:
+            doc = slots.get(f"{i:02d}")
+            data = doc.to_dict() if doc is not None and doc.exists else None
+            if data and data.get('token') == token:
+                chosen = i
+                break
+            if chosen is None and (not data or data.get('leaseUntil', 0) < now):
+                chosen = i
+        if chosen is None:
+            return None
+
+        lease_until = now + lease_seconds
+        transaction.set(refs[chosen], {
+            'token': token,
+            'pid': os.getpid(),
+            'host': socket.gethostname(),
+            'leaseUntil': lease_until
+        })
+        return chosen, lease_until
+
+    @classmethod
+    def acquire_order_id_worker(cls, token, lease_seconds, max_workers=100):
+        """取得訂單編號 worker 編號租約
+
+        Returns:
+            (True, (worker_id, lease_until)) 或 (False, 錯誤訊息)
+        """
         try:
-            docs = cls._db.collection('orders').where('userId', '==', user_id).stream()
-            orders = []
-            for doc in docs:
-                order_data = doc.to_dict()
+            result = firestore.transactional(cls._acquire_worker_slot)(
+                cls._db.transaction(), token, lease_seconds, max_workers
+            )
+            if result is None:
+                return False, "沒有可用的 worker 編號"
+            return True, result
+        except Exception as e:
+            logger.error(f"Error acquiring order ID worker: {e}")
+            return False, str(e)
 
-                if order_data.get('status') == '已刪除':
-                    continue
+    @classmethod
+    def _renew_worker_slot(cls, transaction, worker_id, token, lease_seconds):
+        ref = cls._db.collection('orderIdWorkers').document(f"{worker_id:02d}")
+        doc = ref.get(transaction=transaction)
+        if not doc.exists or doc.to_dict().get('token') != token:
+            return None
+        lease_until = time.time() + lease_seconds
+        transaction.update(ref, {'leaseUntil': lease_until})
+        return lease_until
 
-                # 確保 date 字段存在且是字符串格式
-                if 'date' not in order_data or order_data['date'] is None:
-                    # 如果沒有 date，使用 createdAt
-                    created_at = order_data.get('createdAt')
-                    if created_at:
-                        if hasattr(created_at, 'strftime'):
-                            order_data['date'] = created_at.strftime('%Y-%m-%d %H:%M:%S')
-                        else:
-                            order_data['date'] = str(created_at)
-                    else:
-                        order_data['date'] = datetime.now(TW_TZ).strftime('%Y-%m-%d %H:%M:%S')
-                
-                # 轉換 Firestore Timestamp 為字符串
-                if order_data['date'] and hasattr(order_data['date'], 'strftime'):
-                    order_data['date'] = order_data['date'].strftime('%Y-%m-%d %H:%M:%S')
-                
-                # 計算剩餘盤數（用於部分配送狀態）
-                import re
-                
-                # 獲取應該出貨的總數
-                actual_quantity = order_data.get('actualQuantity', 1)
-                order_qty = order_data.get('orderQty')
-                
-                if order_qty is not None:
-                    # 新訂單格式：應該出貨 = 訂購數量 × 實際數量
-                    expected_total = int(actual_quantity) * int(order_qty)
-                else:
-                    # 舊訂單格式（向後兼容）
-                    items_str = order_data.get('items', '')
-                    match = re.search(r'x(\d+)', items_str)
-                    expected_total = int(match.group(1)) if match else 1
-                
-                delivery_logs = order_data.get('deliveryLogs', [])
-                total_delivered = sum(int(log.get('corrected_qty') or log.get('qty', 0)) for log in delivery_logs)
-                
-                order_data['remainingQty'] = max(0, expected_total - total_delivered)
-                
-                orders.append(order_data)
-            return orders
+    @classmethod
+    def renew_order_id_worker(cls, worker_id, token, lease_seconds):
+        """續約訂單編號 worker 編號；編號已被其他進程取得時回傳失敗"""
+        try:
+            lease_until = firestore.transactional(cls._renew_worker_slot)(
+                cls._db.transaction(), worker_id, token, lease_seconds
+            )
+            if lease_until is None:
+                return False, "租約已失效"
+            return True, lease_until
+        except Exception as e:
+            logger.error(f"Error renewing order ID worker {worker_id}: {e}")
+            return False, str(e)
+    
+    # 會員訂單紀錄頁 (index.html) 顯示與計算剩餘盤數所需的欄位，不讀取 deliveryLogs 等大型欄位
+    USER_ORDER_FIELDS = ['orderId', 'date', 'createdAt', 'status', 'items', 'amount', 'paymentStatus',
+                         'paymentMethod', 'expectedTotal', 'totalDelivered', 'actualQuantity', 'orderQty',
+                         'lineItems']
+
+    @classmethod
+    def _user_orders_query(cls, user_id, start_after=None):
+        """會員訂單查詢：排除已刪除、依 createdAt、orderId 倒序、只取顯示欄位
+
+        需要 firestore.indexes.json 中 (userId, createdAt, orderId, status) 的複合索引。
+        """
+        query = cls._db.collection('orders') \
+            .where('userId', '==', user_id) \
+            .where('status', '!=', order_rules.DELETED_ORDER_STATUS) \
+            .order_by('createdAt', direction=firestore.Query.DESCENDING) \
+            .order_by('orderId', direction=firestore.Query.DESCENDING) \
+            .select(cls.USER_ORDER_FIELDS)
+        if start_after:
+            cursor_created_at, cursor_order_id = cls._decode_order_cursor(start_after)
+            query = query.start_after({'createdAt': cursor_created_at, 'orderId': cursor_order_id})
+        return query
+
+    @classmethod
+    def _prepare_user_orders(cls, docs):
+        """整理會員訂單：日期格式與剩餘盤數
+
+        尚未回填 totalDelivered 的舊訂單另外讀取 deliveryLogs 計算已出貨數量
+        （執行過 migrate_delivery_counters.py 後不會發生）。
+        """
+        orders = [doc.to_dict() for doc in docs]
+        legacy = {o.get('orderId'): o for o in orders if o.get('totalDelivered') is None and o.get('orderId')}
+        if legacy:
+            refs = [cls._db.collection('orders').document(order_id) for order_id in legacy]
+            for doc in cls._db.get_all(refs, field_paths=['deliveryLogs']):
+                if doc.exists:
+                    legacy[doc.id]['deliveryLogs'] = (doc.to_dict() or {}).get('deliveryLogs', [])
+
+        return [order_rules.finish_user_order(order_data) for order_data in orders]
+
+    @classmethod
+    def get_user_orders(cls, user_id):
+        """取得使用者訂單（新到舊，不含已刪除）"""
+        try:
+            return cls._prepare_user_orders(cls._user_orders_query(user_id).stream())
         except Exception as e:
             logger.error(f"Error getting user orders: {e}")
             return []
+
+    @classmethod
+    def get_user_orders_page(cls, user_id, limit=20, start_after=None):
+        """分頁取得使用者訂單（新到舊，不含已刪除）
+
+        Args:
+            user_id: 會員 ID
+            limit: 每頁筆數
+            start_after: 上一頁回傳的 nextCursor
+
+        Returns:
+            (True, {"orders": [...], "nextCursor": str | None, "hasMore": bool})
+        """
+        try:
+            # 多取一筆以判斷是否還有下一頁
+            docs = list(cls._user_orders_query(user_id, start_after).limit(limit + 1).stream())
+            has_more = len(docs) > limit
+            orders = cls._prepare_user_orders(docs[:limit])
+
+            next_cursor = None
+            if has_more and orders:
+                last = orders[-1]
+                next_cursor = cls._encode_order_cursor(last.get('createdAt'), last.get('orderId'))
+            return True, {"orders": orders, "nextCursor": next_cursor, "hasMore": has_more}
+        except Exception as e:
+            logger.error(f"Error getting user orders page: {e}")
+            return False, str(e)
     
     @classmethod
     def get_all_orders_with_members(cls):
@@ -282,34 +767,204 @@ class FirestoreService:
 
                 # 從 map 取得會員資料，不再個別查詢
                 customer = members_map.get(user_id, {})
-                
-                # 確保 date 字段存在且是字符串格式
-                if 'date' not in order_data or order_data['date'] is None:
-                    # 如果沒有 date，使用 createdAt
-                    created_at = order_data.get('createdAt')
-                    if created_at:
-                        if hasattr(created_at, 'strftime'):
-                            order_data['date'] = created_at.strftime('%Y-%m-%d %H:%M:%S')
-                        else:
-                            order_data['date'] = str(created_at)
-                    else:
-                        order_data['date'] = datetime.now(TW_TZ).strftime('%Y-%m-%d %H:%M:%S')
-                
-                # 轉換 Firestore Timestamp 為字符串
-                if order_data['date'] and hasattr(order_data['date'], 'strftime'):
-                    order_data['date'] = order_data['date'].strftime('%Y-%m-%d %H:%M:%S')
-                
+
+                order_rules.normalize_order_date(order_data)
+
                 order_data['customer'] = customer
                 results.append(order_data)
-            
+
             return results
         except Exception as e:
             logger.error(f"Error getting all orders: {e}")
             return []
-    
+
+    @classmethod
+    def get_order_by_id(cls, order_id):
+        """按ID取得單一訂單（單次文件讀取）"""
+        try:
+            doc = cls._db.collection('orders').document(order_id).get()
+            if not doc.exists:
+                return False, "訂單不存在"
+            return True, order_rules.normalize_order_date(doc.to_dict())
+        except Exception as e:
+            logger.error(f"Error getting order {order_id}: {e}")
+            return False, str(e)
+
+    @classmethod
+    def get_order_with_member(cls, order_id):
+        """取得單一訂單併入會員資料（訂單與會員各一次讀取）"""
+        success, order_data = cls.get_order_by_id(order_id)
+        if not success:
+            return False, order_data
+
+        try:
+            customer = {}
+            user_id = order_data.get('userId')
+            if user_id:
+                member_doc = cls._db.collection('members').document(user_id).get()
+                if member_doc.exists:
+                    customer = member_doc.to_dict()
+            order_data['customer'] = customer
+            return True, order_data
+        except Exception as e:
+            logger.error(f"Error getting member for order {order_id}: {e}")
+            return False, str(e)
+
+    @classmethod
+    def get_delivery_records_by_date(cls, delivery_date):
+        """依出貨日期取得出貨紀錄（含客戶姓名、電話）
+
+        由 deliveries 索引集合單次查詢，再批次讀取相關會員。
+        """
+        try:
+            docs = cls._db.collection('deliveries') \
+                .where('delivery_date', '==', delivery_date) \
+                .order_by('orderId').stream()
+            entries = [doc.to_dict() for doc in docs]
+
+            user_ids = sorted({e.get('userId') for e in entries if e.get('userId')})
+            members_map = {}
+            if user_ids:
+                refs = [cls._db.collection('members').document(uid) for uid in user_ids]
+                for member_doc in cls._db.get_all(refs):
+                    if member_doc.exists:
+                        members_map[member_doc.id] = member_doc.to_dict()
+
+            records = []
+            for entry in entries:
+                customer = members_map.get(entry.get('userId'), {})
+                records.append({
+                    "orderId": entry.get('orderId', ''),
+                    "delivery_qty": entry.get('qty', 0),
+                    "delivery_address": entry.get('address', ''),
+                    "customer_name": customer.get('name', ''),
+                    "customer_phone": customer.get('phone', '')
+                })
+            return True, records
+        except Exception as e:
+            logger.error(f"Error getting delivery records for {delivery_date}: {e}")
+            return False, str(e)
+
+    @staticmethod
+    def _encode_order_cursor(created_at, order_id):
+        """將 (createdAt, orderId) 編碼為分頁游標字串"""
+        created_str = created_at.isoformat() if hasattr(created_at, 'isoformat') else str(created_at)
+        return f"{created_str}|{order_id}"
+
+    @staticmethod
+    def _decode_order_cursor(cursor):
+        """解析分頁游標字串，回傳 (createdAt, orderId)"""
+        created_str, sep, order_id = cursor.rpartition('|')
+        if not sep or not created_str or not order_id:
+            raise ValueError("無效的分頁游標")
+        return datetime.fromisoformat(created_str), order_id
+
+    @classmethod
+    def get_orders_page(cls, limit=50, start_after=None, status=None, payment_status=None,
+                        date_from=None, date_to=None):
+        """分頁取得訂單併入會員資料
+
+        依 createdAt、orderId 倒序排列，篩選條件由 Firestore 查詢處理，
+        且只讀取本頁訂單所屬的會員文件。
+
+        Args:
+            limit: 每頁筆數
+            start_after: 上一頁回傳的 nextCursor
+            status: 訂單狀態篩選
+            payment_status: 付款狀態篩選
+            date_from: 起始日期 (YYYY-MM-DD，含)
+            date_to: 結束日期 (YYYY-MM-DD，含)
+
+        Returns:
+            (True, {"orders": [...], "nextCursor": str | None, "hasMore": bool})
+        """
+        try:
+            query = cls._db.collection('orders')
+
+            if status:
+                query = query.where('status', '==', status)
+            if payment_status:
+                query = query.where('paymentStatus', '==', payment_status)
+            if date_from:
+                start = TW_TZ.localize(datetime.strptime(date_from, '%Y-%m-%d'))
+                query = query.where('createdAt', '>=', start)
+            if date_to:
+                end = TW_TZ.localize(datetime.strptime(date_to, '%Y-%m-%d')) + timedelta(days=1)
+                query = query.where('createdAt', '<', end)
+
+            query = query.order_by('createdAt', direction=firestore.Query.DESCENDING) \
+                .order_by('orderId', direction=firestore.Query.DESCENDING)
+
+            if start_after:
+                cursor_created_at, cursor_order_id = cls._decode_order_cursor(start_after)
+                query = query.start_after({
+                    'createdAt': cursor_created_at,
+                    'orderId': cursor_order_id
+                })
+
+            # 多取一筆以判斷是否還有下一頁
+            docs = list(query.limit(limit + 1).stream())
+            has_more = len(docs) > limit
+            docs = docs[:limit]
+
+            orders = [doc.to_dict() for doc in docs]
+
+            # 只批次讀取本頁需要的會員
+            user_ids = sorted({o.get('userId') for o in orders if o.get('userId')})
+            members_map = {}
+            if user_ids:
+                refs = [cls._db.collection('members').document(uid) for uid in user_ids]
+                for member_doc in cls._db.get_all(refs):
+                    if member_doc.exists:
+                        members_map[member_doc.id] = member_doc.to_dict()
+
+            next_cursor = None
+            if has_more and orders:
+                last = orders[-1]
+                next_cursor = cls._encode_order_cursor(last.get('createdAt'), last.get('orderId'))
+
+            for order_data in orders:
+                order_rules.normalize_order_date(order_data)
+                order_data['customer'] = members_map.get(order_data.get('userId'), {})
+
+            return True, {
+                "orders": orders,
+                "nextCursor": next_cursor,
+                "hasMore": has_more
+            }
+        except Exception as e:
+            logger.error(f"Error getting orders page: {e}")
+            return False, str(e)
+
+    # Firestore 單一批次或交易的寫入上限；批次出貨每筆至少 1 筆寫入，需低於此上限
+    BATCH_WRITE_LIMIT = 500
+    MAX_BULK_DELIVERIES = 400
+
+    @classmethod
+    def _add_delivery_log(cls, transaction, order_id, qty, address, delivery_date):
+        """交易中讀取訂單並寫入出貨紀錄、出貨日索引與統計計數；訂單不存在時回傳 None"""
+        order_ref = cls._db.collection('orders').document(order_id)
+        order_doc = order_ref.get(transaction=transaction)
+        if not order_doc.exists:
+            return None
+
+        order_data = order_doc.to_dict()
+        update_data, new_logs, results = order_rules.delivery_update(
+            order_data, [(qty, address, delivery_date)]
+        )
+        transaction.update(order_ref, update_data)
+        transaction.set(
+            cls._db.collection('deliveries').document(new_logs[0]['logId']),
+            order_rules.delivery_index_entry(order_id, order_data.get('userId', ''), new_logs[0])
+        )
+        cls._stage_order_stats(transaction, order_rules.delivery_stats_delta(order_data, results[-1]))
+        return results[0]
+
     @classmethod
     def add_delivery_log(cls, order_id, qty, address="", delivery_date=""):
         """新增出貨紀錄
+
+        讀取訂單與寫入在同一交易中完成，同時登錄的出貨不會以過期的累計數量計算狀態與統計。
         
         Args:
             order_id: 訂單 ID
@@ -318,161 +973,411 @@ class FirestoreService:
             delivery_date: 與客戶約定的出貨日期 (YYYY-MM-DD)
         """
         try:
-            order_doc = cls._db.collection('orders').document(order_id).get()
-            if not order_doc.exists:
+            result = firestore.transactional(cls._add_delivery_log)(
+                cls._db.transaction(), order_id, qty, address, delivery_date
+            )
+            if result is None:
                 return False, "訂單不存在"
             
-            order_data = order_doc.to_dict()
-            delivery_logs = order_data.get('deliveryLogs', [])
-            
-            # 新增日誌 - 現在包含 stamp（時間戳記）和 delivery_date（約定出貨日期）
-            now = datetime.now(TW_TZ)
-            new_log = {
-                "stamp": now.strftime('%Y-%m-%d %H:%M:%S'),  # 系統記錄時間
-                "delivery_date": delivery_date or now.strftime('%Y-%m-%d'),  # 與客戶約定的日期
-                "qty": qty,
-                "address": address
-            }
-            delivery_logs.append(new_log)
-            
-            # 計算新狀態（使用 corrected_qty 如果存在，否則使用 qty）
-            total_delivered = sum(int(log.get('corrected_qty') or log.get('qty', 0)) for log in delivery_logs)
-            
-            # 獲取應該出貨的總數
-            # 如果訂單中有 actualQuantity 和 orderQty，使用它們
-            # 否則從 items_str 中提取訂購數量（向後兼容）
-            actual_quantity = order_data.get('actualQuantity', 1)
-            order_qty = order_data.get('orderQty')
-            
-            if order_qty is not None:
-                # 新訂單格式：應該出貨 = 訂購數量 × 實際數量
-                expected_total = int(actual_quantity) * int(order_qty)
-            else:
-                # 舊訂單格式（向後兼容）：只比較訂購數量
-                items_str = order_data.get('items', '')
-                import re
-                match = re.search(r'x(\d+)', items_str)
-                expected_total = int(match.group(1)) if match else 1
-            
-            new_status = "已完成" if total_delivered >= expected_total else "部分配送"
-            
-            # 更新訂單
-            cls._db.collection('orders').document(order_id).update({
-                'deliveryLogs': delivery_logs,
-                'status': new_status,
-                'updatedAt': datetime.now(TW_TZ)
-            })
-            
             logger.info(f"Delivery log added for order {order_id}")
-            return True, {
-                "status": new_status,
-                "total_delivered": total_delivered,
-                "total_ordered": expected_total,
-                "delivery_date": new_log.get("delivery_date", new_log.get("stamp", ""))
-            }
+            return True, result
         except Exception as e:
             logger.error(f"Error adding delivery log: {e}")
             return False, str(e)
+
+    @classmethod
+    def _add_delivery_logs_chunk(cls, transaction, order_entries):
+        """交易中讀取一組訂單並寫入其出貨紀錄、出貨日索引與統計計數
+
+        Args:
+            order_entries: {order_id: [(qty, address, delivery_date), ...]}
+
+        Returns:
+            {order_id: (user_id, results)}；訂單不存在時為 None
+        """
+        refs = [cls._db.collection('orders').document(order_id) for order_id in order_entries]
+        order_docs = {doc.id: doc for doc in cls._db.get_all(refs, transaction=transaction)}
+
+        outcome = {}
+        stats_delta = {}
+        for order_id, entries in order_entries.items():
+            order_doc = order_docs.get(order_id)
+            if order_doc is None or not order_doc.exists:
+                outcome[order_id] = None
+                continue
+
+            order_data = order_doc.to_dict()
+            user_id = order_data.get('userId', '')
+            update_data, new_logs, order_results = order_rules.delivery_update(order_data, entries)
+            transaction.update(order_doc.reference, update_data)
+            for new_log in new_logs:
+                transaction.set(
+                    cls._db.collection('deliveries').document(new_log['logId']),
+                    order_rules.delivery_index_entry(order_id, user_id, new_log)
+                )
+            for path, value in order_rules.delivery_stats_delta(order_data, order_results[-1]).items():
+                stats_delta[path] = stats_delta.get(path, 0) + value
+            outcome[order_id] = (user_id, order_results)
+
+        cls._stage_order_stats(transaction, stats_delta)
+        return outcome
+
+    @classmethod
+    def add_delivery_logs(cls, deliveries):
+        """批次新增出貨紀錄（出貨日整批登錄）
+
+        依訂單分組後以交易提交，每個交易以一次 get_all 讀取該組訂單，同一訂單的多筆出貨
+        合併為一次更新；讀取與寫入在同一交易中，不會以過期的累計數量計算狀態與統計。
+
+        Args:
+            deliveries: [{"orderId", "qty", "address", "delivery_date"}, ...]
+
+        Returns:
+            (True, results)：results 與 deliveries 順序一致，每筆為
+            {"orderId", "success", "msg"} 或 {"orderId", "success", "userId", "qty", ...出貨結果}
+        """
+        if len(deliveries) > cls.MAX_BULK_DELIVERIES:
+            return False, f"單次最多登錄 {cls.MAX_BULK_DELIVERIES} 筆出貨"
+
+        try:
+            results = [None] * len(deliveries)
+            grouped = {}
+            for index, item in enumerate(deliveries):
+                grouped.setdefault(item['orderId'], []).append(index)
+
+            # 每張訂單的寫入：訂單更新 1 筆 + 每筆出貨的索引文件；
+            # 同一張訂單不會跨交易，每個交易保留 1 筆寫入給統計計數
+            chunks = []
+            chunk, chunk_writes = {}, 0
+            for order_id, indexes in grouped.items():
+                writes = 1 + len(indexes)
+                if chunk and chunk_writes + writes > cls.BATCH_WRITE_LIMIT - 1:
+                    chunks.append(chunk)
+                    chunk, chunk_writes = {}, 0
+                chunk[order_id] = indexes
+                chunk_writes += writes
+            if chunk:
+                chunks.append(chunk)
+
+            for chunk in chunks:
+                order_entries = {
+                    order_id: [
+                        (deliveries[i]['qty'], deliveries[i].get('address', ''), deliveries[i].get('delivery_date', ''))
+                        for i in indexes
+                    ]
+                    for order_id, indexes in chunk.items()
+                }
+                try:
+                    outcome = firestore.transactional(cls._add_delivery_logs_chunk)(
+                        cls._db.transaction(), order_entries
+                    )
+                except Exception as e:
+                    logger.error(f"Error committing delivery transaction: {e}")
+                    for order_id, indexes in chunk.items():
+                        for index in indexes:
+                            results[index] = {"orderId": order_id, "success": False, "msg": str(e)}
+                    continue
+
+                for order_id, indexes in chunk.items():
+                    if outcome[order_id] is None:
+                        for index in indexes:
+                            results[index] = {"orderId": order_id, "success": False, "msg": "訂單不存在"}
+                        continue
+                    user_id, order_results = outcome[order_id]
+                    for index, result in zip(indexes, order_results):
+                        results[index] = {
+                            "orderId": order_id, "success": True, "userId": user_id,
+                            "qty": deliveries[index]['qty'], **result
+                        }
+
+            succeeded = sum(1 for r in results if r['success'])
+            logger.info(f"Bulk delivery logs added: {succeeded}/{len(deliveries)}")
+            return True, results
+        except Exception as e:
+            logger.error(f"Error adding delivery logs: {e}")
+            return False, str(e)
     
+    @classmethod
+    def _correct_delivery_log(cls, transaction, order_id, log_index, new_qty, new_address, new_delivery_date):
+        """交易中讀取訂單並寫入修正後的出貨紀錄、出貨日索引與統計計數
+
+        Returns:
+            (True, result) 或 (False, 錯誤訊息)
+        """
+        order_ref = cls._db.collection('orders').document(order_id)
+        order_doc = order_ref.get(transaction=transaction)
+        if not order_doc.exists:
+            return False, "訂單不存在"
+
+        order_data = order_doc.to_dict()
+        correction = order_rules.delivery_correction(
+            order_id, order_data, log_index, new_qty, new_address, new_delivery_date
+        )
+        if correction is None:
+            return False, "出貨紀錄不存在"
+        update_data, corrected_log, result = correction
+
+        transaction.update(order_ref, update_data)
+        transaction.set(
+            cls._db.collection('deliveries').document(corrected_log['logId']),
+            order_rules.delivery_index_entry(order_id, order_data.get('userId', ''), corrected_log)
+        )
+        cls._stage_order_stats(transaction, order_rules.delivery_stats_delta(order_data, result))
+        return True, result
+
     @classmethod
     def correct_delivery_log(cls, order_id, log_index, new_qty, new_address="", new_delivery_date=""):
-        """修正出貨紀錄
+        """修正出貨紀錄（讀取與寫入在同一交易中完成）
         
         Args:
             order_id: 訂單 ID
             log_index: 出貨紀錄索引
             new_qty: 新的數量
             new_address: 新的地點
-            new_delivery_date: 新的出貨日期 (YYYY-MM-DD)
-        """
-        try:
-            order_doc = cls._db.collection('orders').document(order_id).get()
-            if not order_doc.exists:
-                return False, "訂單不存在"
-            
-            order_data = order_doc.to_dict()
-            delivery_logs = order_data.get('deliveryLogs', [])
-            
-            if log_index < 0 or log_index >= len(delivery_logs):
-                return False, "出貨紀錄不存在"
-            
-            # 取得修改前的數據（需取得 corrected_qty 如果存在，否則取 qty）
-            old_log = delivery_logs[log_index]
-            old_qty = old_log.get('corrected_qty') or old_log.get('qty', 0)
-            old_address = old_log.get('address', '')
-            old_delivery_date = old_log.get('delivery_date', '')
-            
-            # 修改出貨紀錄（保留原始 qty，新增 corrected_qty 追蹤修正後的值）
-            delivery_logs[log_index] = {
-                "stamp": old_log.get('stamp', old_log.get('date', datetime.now(TW_TZ).strftime('%Y-%m-%d %H:%M:%S'))),
-                "delivery_date": new_delivery_date or old_delivery_date,  # 使用新日期或保留舊日期
-                "date": old_log.get('date', datetime.now(TW_TZ).strftime('%Y-%m-%d %H:%M')),  # 兼容舊格式
-                "qty": old_qty,  # 保留原始的預期數量
-                "corrected_qty": new_qty,  # 新增修正後的實際數量
-                "address": new_address,
-                "original_qty": old_log.get('original_qty', old_log.get('qty', 0)),  # 記錄最初的原始值
-                "is_corrected": True,
-                "last_correction": datetime.now(TW_TZ).strftime('%Y-%m-%d %H:%M')
-            }
-            
-            # 計算新狀態（使用 corrected_qty 如果存在）
-            total_delivered = sum(int(log.get('corrected_qty') or log.get('qty', 0)) for log in delivery_logs)
-            items_str = order_data.get('items', '')
-            import re
-            match = re.search(r'x(\d+)', items_str)
-            total_ordered = int(match.group(1)) if match else 1
-            
-            new_status = "已完成" if total_delivered >= total_ordered else "部分配送"
-            
-            # 更新訂單
-            cls._db.collection('orders').document(order_id).update({
-                'deliveryLogs': delivery_logs,
-                'status': new_status,
-                'updatedAt': datetime.now(TW_TZ)
-            })
+            new_delivery_date: 新的出貨日期 (YYYY-MM-DD)
+        """
+        try:
+            success, result = firestore.transactional(cls._correct_delivery_log)(
+                cls._db.transaction(), order_id, log_index, new_qty, new_address, new_delivery_date
+            )
+            if not success:
+                return False, result
             
             logger.info(f"Delivery log corrected for order {order_id}")
-            return True, {
-                "status": new_status,
-                "old_qty": old_qty,
-                "old_address": old_address,
-                "new_qty": new_qty,
-                "new_address": new_address,
-                "old_delivery_date": old_delivery_date,
-                "new_delivery_date": new_delivery_date or old_delivery_date,
-                "total_delivered": total_delivered
-            }
+            return True, result
         except Exception as e:
             logger.error(f"Error correcting delivery log: {e}")
             return False, str(e)
     
+    @classmethod
+    def _update_order_fields(cls, transaction, order_id, fields):
+        """交易中更新訂單欄位並依前後差異調整統計計數；訂單不存在時回傳 False"""
+        order_ref = cls._db.collection('orders').document(order_id)
+        order_doc = order_ref.get(transaction=transaction)
+        if not order_doc.exists:
+            return False
+        order_data = order_doc.to_dict()
+        error = order_rules.payment_status_error(order_data, fields['paymentStatus']) if 'paymentStatus' in fields else None
+        if error:
+            raise OrderStockError(error)
+        transaction.update(order_ref, {**fields, 'updatedAt': datetime.now(TW_TZ)})
+        cls._stage_order_stats(transaction, order_rules.order_stats_delta(order_data, {**order_data, **fields}))
+        return True
+
+    @classmethod
+    def _update_order_status(cls, transaction, order_id, status):
+        """交易中更新訂單狀態，並釋放或重新預留庫存
+
+        庫存異動失敗時拋出 OrderStockError，整筆交易（含狀態變更）不寫入。
+        """
+        order_ref = cls._db.collection('orders').document(order_id)
+        order_doc = order_ref.get(transaction=transaction)
+        if not order_doc.exists:
+            return False
+        order_data = order_doc.to_dict()
+        fields = {'status': status}
+
+        stock_change = order_rules.status_stock_changes(order_data, status)
+        if stock_change:
+            changes, reason, reserve, reserved_after = stock_change
+            success, result = cls._apply_stock_changes(transaction, changes, reason, "system", reserve=reserve)
+            if not success:
+                raise OrderStockError(result)
+            fields['stockReserved'] = reserved_after
+
+        transaction.update(order_ref, {**fields, 'updatedAt': datetime.now(TW_TZ)})
+        cls._stage_order_stats(transaction, order_rules.order_stats_delta(order_data, {**order_data, **fields}))
+        return True
+
     @classmethod
     def update_order_status(cls, order_id, status):
-        """更新訂單狀態"""
+        """更新訂單狀態（取消時釋放預留庫存）
+
+        Returns:
+            (True, 訊息) 或 (False, 錯誤訊息)；訂單不存在時為 ORDER_NOT_FOUND_MSG，
+            庫存不足無法恢復等不允許的變更回傳原因
+        """
         try:
-            cls._db.collection('orders').document(order_id).update({
-                'status': status,
-                'updatedAt': datetime.now(TW_TZ)
-            })
+            updated = firestore.transactional(cls._update_order_status)(
+                cls._db.transaction(), order_id, status
+            )
+            if not updated:
+                logger.error(f"Order not found when updating status: {order_id}")
+                return False, cls.ORDER_NOT_FOUND_MSG
             logger.info(f"Order {order_id} status updated to {status}")
-            return True
+            return True, "訂單狀態已更新"
+        except OrderStockError as e:
+            logger.error(f"Order {order_id} status not updated to {status}: {e}")
+            return False, str(e)
         except Exception as e:
             logger.error(f"Error updating order status: {e}")
-            return False
+            return False, str(e)
     
     @classmethod
     def update_order_payment_status(cls, order_id, payment_status):
-        """更新訂單付款狀態"""
+        """更新訂單付款狀態
+
+        Returns:
+            (True, 訊息) 或 (False, 錯誤訊息)；訂單不存在時為 ORDER_NOT_FOUND_MSG，
+            已取消 / 刪除的訂單標記為已付款時回傳原因
+        """
         try:
-            cls._db.collection('orders').document(order_id).update({
-                'paymentStatus': payment_status,
-                'updatedAt': datetime.now(TW_TZ)
-            })
+            updated = firestore.transactional(cls._update_order_fields)(
+                cls._db.transaction(), order_id, {'paymentStatus': payment_status}
+            )
+            if not updated:
+                logger.error(f"Order not found when updating payment status: {order_id}")
+                return False, cls.ORDER_NOT_FOUND_MSG
             logger.info(f"Order {order_id} payment status updated to {payment_status}")
-            return True
+            return True, "付款狀態已更新"
+        except OrderStockError as e:
+            logger.error(f"Order {order_id} payment status not updated to {payment_status}: {e}")
+            return False, str(e)
         except Exception as e:
             logger.error(f"Error updating payment status: {e}")
-            return False
+            return False, str(e)
+
+    # ===== 訂單統計（後台儀表板） =====
+    # 計數分散在多個分片文件，避免所有訂單寫入集中在同一份文件（單一文件約每秒 1 次寫入）
+    ORDER_STATS_COLLECTION = 'orderStats'
+    ORDER_STATS_SHARDS = 10
+
+    @classmethod
+    def _stage_order_stats(cls, writer, delta):
+        """在批次或交易中累加統計計數（隨機選一個分片）"""
+        if not delta:
+            return
+        nested = order_rules.nest_order_stats({path: firestore.Increment(value) for path, value in delta.items()})
+        shard = random.randrange(cls.ORDER_STATS_SHARDS)
+        writer.set(cls._db.collection(cls.ORDER_STATS_COLLECTION).document(f"shard_{shard:02d}"), nested, merge=True)
+
+    @staticmethod
+    def _add_order_stats(totals, values):
+        """把一份計數（可含巢狀 map）加到 totals"""
+        for key, value in values.items():
+            if isinstance(value, dict):
+                FirestoreService._add_order_stats(totals.setdefault(key, {}), value)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                totals[key] = totals.get(key, 0) + value
+
+    @classmethod
+    def get_order_stats(cls, days=30, months=12):
+        """後台儀表板統計：各狀態訂單數、未付款金額、每日 / 每月營收、待出貨盤數
+
+        讀取所有統計分片（ORDER_STATS_SHARDS 次文件讀取）後加總，不需讀取訂單。
+        營收以訂單建立日期與訂單金額計算，已刪除的訂單不計入營收、未付款與待出貨。
+        """
+        try:
+            refs = [cls._db.collection(cls.ORDER_STATS_COLLECTION).document(f"shard_{i:02d}")
+                    for i in range(cls.ORDER_STATS_SHARDS)]
+            totals = {}
+            for doc in cls._db.get_all(refs):
+                if doc.exists:
+                    cls._add_order_stats(totals, doc.to_dict())
+            return True, order_rules.summarize_order_stats(totals, days, months)
+        except Exception as e:
+            logger.error(f"Error getting order stats: {e}")
+            return False, str(e)
+
+    @classmethod
+    def rebuild_order_stats(cls, page_size=None):
+        """由全部訂單重新計算統計計數（回填既有訂單用，寫入第一個分片並清空其他分片）
+
+        執行期間新增或修改的訂單可能不會被計入，應在離峰時段執行。
+        """
+        try:
+            flat = {}
+            count = 0
+            for docs in cls._iter_collection_pages('orders', page_size):
+                for doc in docs:
+                    for path, value in order_rules.order_stats_contribution(doc.to_dict()).items():
+                        flat[path] = flat.get(path, 0) + value
+                    count += 1
+            totals = order_rules.nest_order_stats(flat)
+
+            batch = cls._db.batch()
+            for i in range(cls.ORDER_STATS_SHARDS):
+                ref = cls._db.collection(cls.ORDER_STATS_COLLECTION).document(f"shard_{i:02d}")
+                if i == 0:
+                    batch.set(ref, totals)
+                else:
+                    batch.delete(ref)
+            batch.commit()
+            logger.info(f"Order stats rebuilt from {count} orders")
+            return True, count
+        except Exception as e:
+            logger.error(f"Error rebuilding order stats: {e}")
+            return False, str(e)
+    
+    @classmethod
+    def _legacy_order_fields(cls, order_data, products_by_id, products_by_name):
+        """舊訂單回填用的型別化欄位：lineItems、orderQty、actualQuantity、expectedTotal
+
+        已有的 orderQty / actualQuantity / expectedTotal 保留不變；實際數量缺少時依商品 ID、再依商品名稱查詢。
+        """
+        name, parsed_qty = order_rules.parse_legacy_items(order_data.get('items'))
+        product_id = order_data.get('productId') or ''
+        product = products_by_id.get(product_id) or products_by_name.get(name) or {}
+        if not product_id:
+            product_id = product.get('productId', '')
+
+        order_qty = int(order_data['orderQty']) if order_data.get('orderQty') is not None else parsed_qty
+        actual_quantity = int(order_data.get('actualQuantity') or product.get('actualQuantity') or 1)
+        fields = {
+            'lineItems': [{
+                'productId': product_id,
+                'name': product.get('name', name),
+                'qty': order_qty,
+                'actualQuantity': actual_quantity,
+                'amount': order_data.get('amount', 0)
+            }],
+            'orderQty': order_qty,
+            'actualQuantity': actual_quantity
+        }
+        if order_data.get('expectedTotal') is None:
+            fields['expectedTotal'] = order_qty * actual_quantity
+        return fields
+
+    @classmethod
+    def backfill_order_line_items(cls, page_size=None):
+        """為缺少 lineItems 的舊訂單回填型別化品項欄位（每批最多 BATCH_WRITE_LIMIT 筆寫入）
+
+        商品只讀取一次並在記憶體中依 ID / 名稱對應。新補上的 expectedTotal 會改變應出貨盤數，
+        回填後請執行 migrate_order_stats.py 重建統計計數。
+
+        Returns:
+            (True, {"total", "updated", "skipped"}) 或 (False, 錯誤訊息)
+        """
+        try:
+            products_by_id, products_by_name = {}, {}
+            for doc in cls._db.collection('products').stream():
+                product = {**doc.to_dict(), 'productId': doc.id}
+                products_by_id[doc.id] = product
+                if product.get('name'):
+                    products_by_name.setdefault(product['name'], product)
+
+            total = updated = 0
+            batch, pending = cls._db.batch(), 0
+            for docs in cls._iter_collection_pages('orders', page_size):
+                for doc in docs:
+                    total += 1
+                    order_data = doc.to_dict()
+                    if order_data.get('lineItems'):
+                        continue
+                    batch.update(doc.reference, cls._legacy_order_fields(order_data, products_by_id, products_by_name))
+                    pending += 1
+                    updated += 1
+                    if pending >= cls.BATCH_WRITE_LIMIT:
+                        batch.commit()
+                        batch, pending = cls._db.batch(), 0
+            if pending:
+                batch.commit()
+
+            logger.info(f"Order line items backfilled: {updated}/{total}")
+            return True, {"total": total, "updated": updated, "skipped": total - updated}
+        except Exception as e:
+            logger.error(f"Error backfilling order line items: {e}")
+            return False, str(e)
     
     @classmethod
     def add_audit_log(cls, order_id, operation, admin_name, before_value, after_value, reason):
@@ -534,6 +1439,7 @@ class FirestoreService:
             for doc in docs:
                 product_data = doc.to_dict()
                 products.append(product_data)
+            cls._attach_shard_stock(products)
             logger.info(f"Retrieved {len(products)} products")
             return True, products
         except Exception as e:
@@ -547,7 +1453,7 @@ class FirestoreService:
             doc = cls._db.collection('products').document(product_id).get()
             if doc.exists:
                 logger.info(f"Retrieved product: {product_id}")
-                return True, doc.to_dict()
+                return True, cls._attach_shard_stock([doc.to_dict()])[0]
             return False, "商品不存在"
         except Exception as e:
             logger.error(f"Error getting product: {e}")
@@ -582,50 +1488,255 @@ class FirestoreService:
             logger.error(f"Error deleting product: {e}")
             return False, str(e)
     
+    # Firestore 單次提交最多 500 筆寫入；每個商品需 1 筆庫存更新 + 1 筆異動紀錄
+    MAX_BULK_STOCK_PRODUCTS = 250
+
+    # ===== 庫存分片 =====
+    # 搶購商品的庫存可分散在多個分片文件 (stockShards/{productId}_{nn})，商品文件的 stockShards 為分片數
+    # （0 或未設定表示庫存在商品文件上）。下單交易只讀寫隨機挑選的分片，不更新商品文件，
+    # 同時下單的交易分散在不同文件上，不會全部排隊等待同一份文件。
+    STOCK_SHARD_COLLECTION = 'stockShards'
+    MAX_STOCK_SHARDS = 50
+
     @classmethod
-    def update_product_stock(cls, product_id, qty_change, reason, operator="admin"):
-        """更新商品庫存並記錄"""
+    def _stock_shard_ref(cls, product_id, index):
+        return cls._db.collection(cls.STOCK_SHARD_COLLECTION).document(f"{product_id}_{index:02d}")
+
+    @staticmethod
+    def _shard_stock(doc):
+        return (doc.to_dict() or {}).get('stock', 0) if doc is not None and doc.exists else 0
+
+    @staticmethod
+    def _split_stock(total, shards):
+        """將庫存平均分配到各分片"""
+        base, extra = divmod(int(total), shards)
+        return [base + (1 if i < extra else 0) for i in range(shards)]
+
+    @classmethod
+    def _plan_shard_changes(cls, transaction, product_id, shards, qty_change, reserve):
+        """在交易中規劃分片庫存異動（只讀取，不寫入）
+
+        下單預留時依隨機順序逐一讀取分片，扣足數量即停止（通常只讀寫一個分片）；
+        後台調整時讀取全部分片以取得正確總庫存，扣除由庫存最多的分片開始，增加寫入庫存最少的分片。
+
+        Returns:
+            ([(分片 ref, 舊庫存, 新庫存)], 總庫存；預留時未讀取全部分片則為 None)
+            庫存不足時為 (None, 總庫存)
+        """
+        refs = [cls._stock_shard_ref(product_id, i) for i in range(shards)]
+        if reserve and qty_change < 0:
+            random.shuffle(refs)
+            remaining, total, writes = -qty_change, 0, []
+            for ref in refs:
+                stock = cls._shard_stock(ref.get(transaction=transaction))
+                total += stock
+                take = min(stock, remaining)
+                if take > 0:
+                    writes.append((ref, stock, stock - take))
+                    remaining -= take
+                if remaining == 0:
+                    return writes, None
+            return None, total
+
+        docs = {doc.id: doc for doc in cls._db.get_all(refs, transaction=transaction)}
+        stocks = [(ref, cls._shard_stock(docs.get(ref.id))) for ref in refs]
+        total = sum(stock for _, stock in stocks)
+        if total + qty_change < 0:
+            return None, total
+        if qty_change >= 0:
+            ref, stock = min(stocks, key=lambda item: item[1])
+            return [(ref, stock, stock + qty_change)], total
+
+        remaining, writes = -qty_change, []
+        for ref, stock in sorted(stocks, key=lambda item: -item[1]):
+            take = min(stock, remaining)
+            if take > 0:
+                writes.append((ref, stock, stock - take))
+                remaining -= take
+            if remaining == 0:
+                break
+        return writes, total
+
+    @classmethod
+    def _attach_shard_stock(cls, products):
+        """分片商品的 stock 改為各分片加總（商品文件上的 stock 為分片當時的數量）"""
+        sharded = {p.get('productId'): p for p in products if p.get('stockShards')}
+        if not sharded:
+            return products
+        totals = dict.fromkeys(sharded, 0)
+        product_ids = list(sharded)
+        for start in range(0, len(product_ids), 30):
+            query = cls._db.collection(cls.STOCK_SHARD_COLLECTION) \
+                .where('productId', 'in', product_ids[start:start + 30])
+            for doc in query.stream():
+                shard = doc.to_dict()
+                totals[shard['productId']] += shard.get('stock', 0)
+        for product_id, product in sharded.items():
+            product['stock'] = totals[product_id]
+        return products
+
+    @classmethod
+    def _reshard_stock(cls, transaction, product_id, shards):
+        product_ref = cls._db.collection('products').document(product_id)
+        product_doc = product_ref.get(transaction=transaction)
+        if not product_doc.exists:
+            return False, "商品不存在"
+        product = product_doc.to_dict()
+        old_shards = int(product.get('stockShards') or 0)
+        if old_shards:
+            old_refs = [cls._stock_shard_ref(product_id, i) for i in range(old_shards)]
+            total = sum(cls._shard_stock(doc) for doc in cls._db.get_all(old_refs, transaction=transaction))
+        else:
+            total = product.get('stock', 0)
+
+        for i, stock in enumerate(cls._split_stock(total, shards) if shards else []):
+            transaction.set(cls._stock_shard_ref(product_id, i), {'productId': product_id, 'stock': stock})
+        for i in range(shards, old_shards):
+            transaction.delete(cls._stock_shard_ref(product_id, i))
+        transaction.update(product_ref, {'stockShards': shards, 'stock': total,
+                                         'updatedAt': datetime.now(TW_TZ)})
+        return True, {"productId": product_id, "stockShards": shards, "stock": total}
+
+    @classmethod
+    def set_stock_shards(cls, product_id, shards):
+        """設定商品庫存分片數（0 表示合併回商品文件），現有庫存平均分配到各分片
+
+        Returns:
+            (True, {"productId", "stockShards", "stock"}) 或 (False, 錯誤訊息)
+        """
         try:
-            product_doc = cls._db.collection('products').document(product_id).get()
-            if not product_doc.exists:
-                return False, "商品不存在"
-            
-            product = product_doc.to_dict()
-            old_stock = product.get('stock', 0)
-            new_stock = old_stock + qty_change
-            
+            shards = int(shards)
+            if not 0 <= shards <= cls.MAX_STOCK_SHARDS:
+                return False, f"分片數必須介於 0 到 {cls.MAX_STOCK_SHARDS}"
+            success, result = firestore.transactional(cls._reshard_stock)(
+                cls._db.transaction(), product_id, shards
+            )
+            if success:
+                logger.info(f"Stock shards set: {product_id} -> {shards}")
+            return success, result
+        except Exception as e:
+            logger.error(f"Error setting stock shards: {e}")
+            return False, str(e)
+
+    @classmethod
+    def _apply_stock_changes(cls, transaction, changes, reason, operator, reserve=False):
+        """在交易中讀取商品、檢查庫存並寫入庫存與異動紀錄
+
+        Args:
+            transaction: Firestore 交易
+            changes: {product_id: qty_change}
+            reserve: 下單預留庫存：商品須為上架狀態，分片商品只讀寫需要的分片
+                     （異動紀錄與回傳的 oldStock / newStock 為 None）
+
+        Returns:
+            (True, {product_id: {"oldStock", "newStock"}}) 或 (False, 錯誤訊息)
+        """
+        refs = [cls._db.collection('products').document(pid) for pid in changes]
+        if len(refs) == 1:
+            snapshots = {next(iter(changes)): refs[0].get(transaction=transaction)}
+        else:
+            snapshots = {doc.id: doc for doc in cls._db.get_all(refs, transaction=transaction)}
+
+        # 先全部檢查（所有讀取在寫入之前），任一商品不合法則整批不寫入
+        planned = []
+        for ref, (product_id, qty_change) in zip(refs, changes.items()):
+            doc = snapshots.get(product_id)
+            product = doc.to_dict() if doc is not None and doc.exists else None
+            error = order_rules.stock_product_error(product_id, product, len(changes) == 1, reserve)
+            if error:
+                return False, error
+
+            shards = int(product.get('stockShards') or 0)
+            if shards:
+                shard_writes, old_stock = cls._plan_shard_changes(transaction, product_id, shards, qty_change, reserve)
+                new_stock = old_stock + qty_change if old_stock is not None else None
+            else:
+                shard_writes, old_stock = None, product.get('stock', 0)
+                new_stock = old_stock + qty_change
+
             # 不允許負庫存
-            if new_stock < 0:
-                return False, f"庫存不足，目前庫存：{old_stock}"
-            
-            # 更新商品庫存
-            cls._db.collection('products').document(product_id).update({
-                'stock': new_stock,
-                'updatedAt': datetime.now(TW_TZ)
-            })
-            
-            # 記錄庫存異動
-            cls._db.collection('stockLogs').add({
-                'productId': product_id,
-                'productName': product.get('name'),
-                'type': 'in' if qty_change > 0 else 'out',
-                'quantity': abs(qty_change),
-                'oldStock': old_stock,
-                'newStock': new_stock,
-                'reason': reason,
-                'operator': operator,
-                'timestamp': datetime.now(TW_TZ).isoformat()
-            })
-            
+            if (shard_writes is None) if shards else new_stock < 0:
+                return False, order_rules.insufficient_stock_message(product_id, product, old_stock, len(changes) == 1)
+
+            planned.append((ref, product_id, product, qty_change, old_stock, new_stock, shard_writes))
+
+        now = datetime.now(TW_TZ)
+        results = {}
+        for ref, product_id, product, qty_change, old_stock, new_stock, shard_writes in planned:
+            if shard_writes is None:
+                transaction.update(ref, {
+                    'stock': new_stock,
+                    'updatedAt': now
+                })
+            else:
+                for shard_ref, _, shard_stock in shard_writes:
+                    transaction.set(shard_ref, {'productId': product_id, 'stock': shard_stock})
+            transaction.set(cls._db.collection('stockLogs').document(), order_rules.stock_log_entry(
+                product_id, product, qty_change, old_stock, new_stock, reason, operator, now
+            ))
+            results[product_id] = {"oldStock": old_stock, "newStock": new_stock}
+
+        return True, results
+
+    @classmethod
+    def update_product_stock(cls, product_id, qty_change, reason, operator="admin"):
+        """更新商品庫存並記錄
+
+        讀取、檢查與寫入（庫存 + 異動紀錄）在同一個交易中完成，
+        多個 worker 同時調整同一商品時由 Firestore 重試，不會遺失更新。
+        """
+        try:
+            success, result = firestore.transactional(cls._apply_stock_changes)(
+                cls._db.transaction(), {product_id: qty_change}, reason, operator
+            )
+            if not success:
+                return False, result
+
             logger.info(f"Stock updated: {product_id}, change: {qty_change}")
             return True, {
-                "oldStock": old_stock,
-                "newStock": new_stock,
+                **result[product_id],
                 "timestamp": datetime.now(TW_TZ).isoformat()
             }
         except Exception as e:
             logger.error(f"Error updating stock: {e}")
             return False, str(e)
+
+    @classmethod
+    def update_products_stock(cls, changes, reason, operator="admin"):
+        """批次更新多個商品庫存（單一交易，全部成功或全部不變）
+
+        Args:
+            changes: [{"productId": ..., "qtyChange": ...}, ...]，同一商品會合併數量
+            reason: 異動原因
+            operator: 操作人員
+
+        Returns:
+            (True, {product_id: {"oldStock", "newStock"}}) 或 (False, 錯誤訊息)
+        """
+        try:
+            merged = {}
+            for change in changes:
+                product_id = change.get('productId')
+                if not product_id:
+                    return False, "缺少商品 ID"
+                merged[product_id] = merged.get(product_id, 0) + int(change.get('qtyChange', 0))
+
+            if not merged:
+                return False, "沒有庫存異動"
+            if len(merged) > cls.MAX_BULK_STOCK_PRODUCTS:
+                return False, f"單次最多調整 {cls.MAX_BULK_STOCK_PRODUCTS} 項商品"
+
+            success, result = firestore.transactional(cls._apply_stock_changes)(
+                cls._db.transaction(), merged, reason, operator
+            )
+            if not success:
+                return False, result
+
+            logger.info(f"Bulk stock updated: {len(merged)} products")
+            return True, result
+        except Exception as e:
+            logger.error(f"Error bulk updating stock: {e}")
+            return False, str(e)
     
     @classmethod
     def get_stock_logs(cls, product_id=None, limit=100):
@@ -651,8 +1762,7 @@ class FirestoreService:
             # 取得所有未刪除的商品
             docs = cls._db.collection('products').where('status', '!=', 'deleted').stream()
             low_stock = []
-            for doc in docs:
-                product = doc.to_dict()
+            for product in cls._attach_shard_stock([doc.to_dict() for doc in docs]):
                 if product.get('stock', 0) <= product.get('minStockAlert', 10):
                     low_stock.append(product)
             logger.info(f"Retrieved {len(low_stock)} low stock products")
@@ -822,53 +1932,89 @@ class FirestoreService:
             logger.error(f"Error deleting discount: {e}")
             return False, str(e)
     
+    @staticmethod
+    def _parse_discount_time(value, end=False):
+        """解析折扣起訖時間（YYYY-MM-DD、ISO 8601 字串或 datetime），無時區者視為台灣時間
+
+        只有日期的結束時間包含當天整天。
+        """
+        if not value:
+            return None
+        if isinstance(value, str):
+            parsed = datetime.fromisoformat(value)
+            if end and len(value) == 10:
+                parsed += timedelta(days=1, microseconds=-1)
+        else:
+            parsed = value
+        return TW_TZ.localize(parsed) if parsed.tzinfo is None else parsed
+
+    @classmethod
+    def _discount_window(cls, discount):
+        """回傳折扣有效期間 (start, end)，未設定的一端為 None"""
+        return (cls._parse_discount_time(discount.get('startDate')),
+                cls._parse_discount_time(discount.get('endDate'), end=True))
+
+    @staticmethod
+    def _in_discount_window(window, now):
+        start, end = window
+        return (start is None or start <= now) and (end is None or now <= end)
+
+    @staticmethod
+    def _discount_targets(product_id, category_id=None, member_level=None):
+        """商品適用的折扣目標 [(targetType, targetId)]"""
+        targets = [('product', product_id)]
+        if category_id:
+            targets.append(('category', category_id))
+        if member_level:
+            targets.append(('member_level', member_level))
+        return targets
+
+    @classmethod
+    def get_active_discounts(cls):
+        """取得所有啟用中的折扣（單一查詢，不檢查有效期間；供折扣索引載入）"""
+        try:
+            docs = cls._db.collection('discounts').where('status', '==', 'active').stream()
+            return True, [{'id': doc.id, **doc.to_dict()} for doc in docs]
+        except Exception as e:
+            logger.error(f"Error getting active discounts: {e}")
+            return False, str(e)
+
     @classmethod
     def get_applicable_discounts(cls, product_id, category_id=None, member_level=None):
-        """取得適用的折扣"""
+        """取得適用的折扣（商品、分類與會員等級折扣，只回傳在有效期間內的）
+
+        以單一 targetId in [...] 查詢取得所有目標的折扣，再比對 targetType。
+        """
         try:
-            discounts = []
             now = datetime.now(TW_TZ)
-            
-            # 查詢商品折扣
+            targets = cls._discount_targets(product_id, category_id, member_level)
             docs = cls._db.collection('discounts') \
                 .where('status', '==', 'active') \
-                .where('targetType', '==', 'product') \
-                .where('targetId', '==', product_id).stream()
-            
+                .where('targetId', 'in', sorted({target_id for _, target_id in targets})).stream()
+
+            discounts = []
             for doc in docs:
                 discount = doc.to_dict()
-                # 檢查時間範圍
-                if discount.get('startDate') and discount.get('endDate'):
-                    start = datetime.fromisoformat(discount['startDate']) if isinstance(discount['startDate'], str) else discount['startDate']
-                    end = datetime.fromisoformat(discount['endDate']) if isinstance(discount['endDate'], str) else discount['endDate']
-                    if start <= now <= end:
-                        discounts.append({'id': doc.id, **discount})
-                else:
+                if (discount.get('targetType'), discount.get('targetId')) not in targets:
+                    continue
+                if cls._in_discount_window(cls._discount_window(discount), now):
                     discounts.append({'id': doc.id, **discount})
-            
-            # 查詢分類折扣
-            if category_id:
-                docs = cls._db.collection('discounts') \
-                    .where('status', '==', 'active') \
-                    .where('targetType', '==', 'category') \
-                    .where('targetId', '==', category_id).stream()
-                
-                for doc in docs:
-                    discount = doc.to_dict()
-                    if discount.get('startDate') and discount.get('endDate'):
-                        start = datetime.fromisoformat(discount['startDate']) if isinstance(discount['startDate'], str) else discount['startDate']
-                        end = datetime.fromisoformat(discount['endDate']) if isinstance(discount['endDate'], str) else discount['endDate']
-                        if start <= now <= end:
-                            discounts.append({'id': doc.id, **discount})
-                    else:
-                        discounts.append({'id': doc.id, **discount})
-            
             return True, discounts
         except Exception as e:
             logger.error(f"Error getting applicable discounts: {e}")
             return False, str(e)
 
     # ===== 庫存警告 =====
+    # 警告清單版本：每次新增或確認警告時在同一批次中遞增，後台輪詢以此判斷清單是否變更
+    STOCK_ALERT_META_COLLECTION = 'stockAlertMeta'
+    STOCK_ALERT_VERSION_DOC = 'version'
+
+    @classmethod
+    def _stage_stock_alert_version(cls, writer):
+        """在批次或交易中遞增警告清單版本"""
+        ref = cls._db.collection(cls.STOCK_ALERT_META_COLLECTION).document(cls.STOCK_ALERT_VERSION_DOC)
+        writer.set(ref, {'version': firestore.Increment(1), 'updatedAt': datetime.now(TW_TZ)}, merge=True)
+
     @classmethod
     def add_stock_alert(cls, product_id, alert_type, threshold, operator="system"):
         """
@@ -876,7 +2022,8 @@ class FirestoreService:
         alert_type: 'critical' (超低), 'low' (低於), 'high' (超過)
         """
         try:
-            cls._db.collection('stockAlerts').add({
+            batch = cls._db.batch()
+            batch.set(cls._db.collection('stockAlerts').document(), {
                 'productId': product_id,
                 'alertType': alert_type,
                 'threshold': threshold,
@@ -886,45 +2033,94 @@ class FirestoreService:
                 'acknowledgedAt': None,
                 'acknowledgedBy': None
             })
+            cls._stage_stock_alert_version(batch)
+            batch.commit()
             logger.info(f"Stock alert added: {product_id} - {alert_type}")
             return True, "警告已記錄"
         except Exception as e:
             logger.error(f"Error adding stock alert: {e}")
             return False, str(e)
-    
+
+    @classmethod
+    def _stock_alerts_query(cls, status='active', alert_type=None, start_after=None):
+        """庫存警告查詢：依狀態 / 類型篩選（未指定則不篩選），依 createdAt、文件 ID (__name__) 倒序
+
+        需要 firestore.indexes.json 中 stockAlerts 的複合索引。
+        """
+        query = cls._db.collection('stockAlerts')
+        if status:
+            query = query.where('status', '==', status)
+        if alert_type:
+            query = query.where('alertType', '==', alert_type)
+        query = query.order_by('createdAt', direction=firestore.Query.DESCENDING) \
+            .order_by('__name__', direction=firestore.Query.DESCENDING)
+        if start_after:
+            cursor_created_at, cursor_id = cls._decode_order_cursor(start_after)
+            query = query.start_after({'createdAt': cursor_created_at, '__name__': cursor_id})
+        return query
+
     @classmethod
     def get_stock_alerts(cls, status='active', alert_type=None):
-        """取得庫存警告"""
+        """取得庫存警告（依 createdAt 倒序）"""
         try:
-            # 簡化查詢，避免複合索引需求
-            docs = cls._db.collection('stockAlerts').stream()
-            alerts = []
-            
-            for doc in docs:
-                alert = doc.to_dict()
-                # 在記憶體中進行篩選
-                if alert.get('status') == status:
-                    if not alert_type or alert.get('alertType') == alert_type:
-                        alerts.append({'id': doc.id, **alert})
-            
-            # 按 createdAt 倒序排列
-            alerts.sort(key=lambda x: x.get('createdAt', ''), reverse=True)
-            
+            alerts = [{'id': doc.id, **doc.to_dict()}
+                      for doc in cls._stock_alerts_query(status, alert_type).stream()]
             logger.info(f"Retrieved {len(alerts)} stock alerts")
             return True, alerts
         except Exception as e:
             logger.error(f"Error getting stock alerts: {e}")
             return False, str(e)
+
+    @classmethod
+    def get_stock_alerts_page(cls, status='active', alert_type=None, limit=50, start_after=None):
+        """分頁取得庫存警告（依 createdAt 倒序）
+
+        Args:
+            status: 警告狀態 (active / acknowledged)，None 表示全部
+            alert_type: 警告類型篩選
+            limit: 每頁筆數
+            start_after: 上一頁回傳的 nextCursor
+
+        Returns:
+            (True, {"alerts": [...], "nextCursor": str | None, "hasMore": bool})
+        """
+        try:
+            # 多取一筆以判斷是否還有下一頁
+            docs = list(cls._stock_alerts_query(status, alert_type, start_after).limit(limit + 1).stream())
+            has_more = len(docs) > limit
+            alerts = [{'id': doc.id, **doc.to_dict()} for doc in docs[:limit]]
+
+            next_cursor = None
+            if has_more and alerts:
+                last = alerts[-1]
+                next_cursor = cls._encode_order_cursor(last.get('createdAt'), last['id'])
+            return True, {"alerts": alerts, "nextCursor": next_cursor, "hasMore": has_more}
+        except Exception as e:
+            logger.error(f"Error getting stock alerts page: {e}")
+            return False, str(e)
+
+    @classmethod
+    def get_stock_alerts_version(cls):
+        """取得警告清單版本（單一文件讀取，尚未有任何警告時為 0）"""
+        try:
+            doc = cls._db.collection(cls.STOCK_ALERT_META_COLLECTION).document(cls.STOCK_ALERT_VERSION_DOC).get()
+            return True, int((doc.to_dict() or {}).get('version', 0)) if doc.exists else 0
+        except Exception as e:
+            logger.error(f"Error getting stock alerts version: {e}")
+            return False, str(e)
     
     @classmethod
     def acknowledge_stock_alert(cls, alert_id, acknowledged_by="admin"):
         """確認庫存警告"""
         try:
-            cls._db.collection('stockAlerts').document(alert_id).update({
+            batch = cls._db.batch()
+            batch.update(cls._db.collection('stockAlerts').document(alert_id), {
                 'status': 'acknowledged',
                 'acknowledgedAt': datetime.now(TW_TZ),
                 'acknowledgedBy': acknowledged_by
             })
+            cls._stage_stock_alert_version(batch)
+            batch.commit()
             logger.info(f"Stock alert acknowledged: {alert_id}")
             return True, "警告已確認"
         except Exception as e:
@@ -939,7 +2135,7 @@ class FirestoreService:
             if not product_doc.exists:
                 return False, "商品不存在"
             
-            product = product_doc.to_dict()
+            product = cls._attach_shard_stock([product_doc.to_dict()])[0]
             stock = product.get('stock', 0)
             min_stock_alert = product.get('minStockAlert', 10)
             max_stock_alert = product.get('maxStockAlert', 1000)
@@ -960,4 +2156,141 @@ class FirestoreService:
             return True, "警告檢查完成"
         except Exception as e:
             logger.error(f"Error checking stock alerts: {e}")
-            return False, str(e)
\ No newline at end of file
+            return False, str(e)
+
+    # ===== LINE 推播 outbox =====
+    @classmethod
+    def add_line_outbox(cls, message_id, user_id, text):
+        """寫入待送出的 LINE 推播訊息（送出成功後刪除）"""
+        try:
+            now = datetime.now(TW_TZ)
+            cls._db.collection('lineOutbox').document(message_id).set({
+                'messageId': message_id,
+                'userId': user_id,
+                'text': text,
+                'status': 'pending',
+                'attempts': 0,
+                'lastError': '',
+                'createdAt': now,
+                'updatedAt': now
+            })
+            return True, message_id
+        except Exception as e:
+            logger.error(f"Error adding LINE outbox message: {e}")
+            return False, str(e)
+
+    @classmethod
+    def update_line_outbox(cls, message_id, **kwargs):
+        """更新 outbox 訊息狀態（重試次數、錯誤訊息等）"""
+        try:
+            kwargs['updatedAt'] = datetime.now(TW_TZ)
+            cls._db.collection('lineOutbox').document(message_id).update(kwargs)
+            return True, "訊息已更新"
+        except Exception as e:
+            logger.error(f"Error updating LINE outbox message {message_id}: {e}")
+            return False, str(e)
+
+    @classmethod
+    def delete_line_outbox(cls, message_id):
+        """刪除已送出的 outbox 訊息"""
+        try:
+            cls._db.collection('lineOutbox').document(message_id).delete()
+            return True, "訊息已刪除"
+        except Exception as e:
+            logger.error(f"Error deleting LINE outbox message {message_id}: {e}")
+            return False, str(e)
+
+    @classmethod
+    def _claim_stale_line_outbox(cls, transaction, lease_seconds, limit):
+        """交易中讀取逾時的 pending 訊息並更新 updatedAt（取得新的租約）"""
+        now = datetime.now(TW_TZ)
+        query = cls._db.collection('lineOutbox') \
+            .where('status', '==', 'pending') \
+            .where('updatedAt', '<=', now - timedelta(seconds=lease_seconds)) \
+            .order_by('updatedAt') \
+            .limit(limit)
+        docs = list(transaction.get(query))
+        for doc in docs:
+            transaction.update(doc.reference, {'updatedAt': now})
+        return [doc.to_dict() for doc in docs]
+
+    @classmethod
+    def claim_stale_line_outbox(cls, lease_seconds, limit=500):
+        """認領逾時未送出的 outbox 訊息（重新啟動後補送用）
+
+        updatedAt 即租約：寫入、重試與認領時更新，超過 lease_seconds 未更新的 pending 訊息
+        視為原本的進程已停止。認領在交易中完成，多個進程同時啟動時每則訊息只由一個進程補送。
+        """
+        try:
+            messages = firestore.transactional(cls._claim_stale_line_outbox)(
+                cls._db.transaction(), lease_seconds, min(limit, cls.BATCH_WRITE_LIMIT)
+            )
+            return True, messages
+        except Exception as e:
+            logger.error(f"Error claiming stale LINE outbox messages: {e}")
+            return False, str(e)
+
+    # ===== 會員 LINE ID 驗證令牌 =====
+    @classmethod
+    def add_verification_token(cls, token, user_id, expires_at):
+        """儲存 LINE ID 綁定驗證令牌"""
+        try:
+            cls._db.collection('verificationTokens').document(token).set({
+                'userId': user_id,
+                'createdAt': datetime.now(TW_TZ),
+                'expiresAt': expires_at
+            })
+            return True, token
+        except Exception as e:
+            logger.error(f"Error adding verification token: {e}")
+            return False, str(e)
+
+    @classmethod
+    def get_verification_token(cls, token):
+        """取得驗證令牌
+
+        Returns:
+            (True, token_data) 找到令牌；(True, None) 令牌不存在；(False, 錯誤訊息)
+        """
+        try:
+            doc = cls._db.collection('verificationTokens').document(token).get()
+            return True, doc.to_dict() if doc.exists else None
+        except Exception as e:
+            logger.error(f"Error getting verification token: {e}")
+            return False, str(e)
+
+    @classmethod
+    def delete_verification_token(cls, token):
+        """刪除已使用或已過期的驗證令牌"""
+        try:
+            cls._db.collection('verificationTokens').document(token).delete()
+            return True, "令牌已刪除"
+        except Exception as e:
+            logger.error(f"Error deleting verification token: {e}")
+            return False, str(e)
+
+    # ===== 資料維護 =====
+    @classmethod
+    def clear_collection(cls, collection):
+        """刪除集合內所有文件（每批最多 500 筆）
+
+        Returns:
+            (True, 刪除筆數) 或 (False, 錯誤訊息)
+        """
+        try:
+            deleted = 0
+            while True:
+                docs = list(cls._db.collection(collection).limit(cls.BATCH_WRITE_LIMIT).stream())
+                if not docs:
+                    break
+                batch = cls._db.batch()
+                for doc in docs:
+                    batch.delete(doc.reference)
+                batch.commit()
+                deleted += len(docs)
+                if len(docs) < cls.BATCH_WRITE_LIMIT:
+                    break
+            return True, deleted
+        except Exception as e:
+            logger.error(f"Error clearing collection {collection}: {e}")
+            return False, str(e)
@@ -2,14 +2,22 @@
 LINE Messaging Service 模組
 """
 import logging
+import os
+import queue
+import threading
+import time
+import uuid
 from linebot.v3.messaging import (
     Configuration,
     ApiClient,
+    ApiException,
     MessagingApi,
     PushMessageRequest,
     TextMessage
 )
 from config import Config
+from services.database_adapter import DatabaseAdapter
+from services.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -19,7 +27,11 @@ class LINEService:
     
     @staticmethod
     def send_push_message(user_id, text):
-        """推送訊息給使用者"""
+        """推送訊息給使用者
+        
+        背景派送器啟動時只寫入 outbox 並排入佇列，不在請求中等待 LINE API；
+        未啟動（測試、單次腳本）時維持同步送出。
+        """
         if not Config.LINE_CHANNEL_ACCESS_TOKEN or \
            Config.LINE_CHANNEL_ACCESS_TOKEN == 'YOUR_CHANNEL_ACCESS_TOKEN':
             logger.warning("LINE token not configured, skipping push message")
@@ -29,6 +41,10 @@ class LINEService:
             logger.warning("User ID is empty")
             return False
         
+        if line_dispatcher.running:
+            return line_dispatcher.enqueue(user_id, text)
+        
+        started = time.perf_counter()
         try:
             configuration = Configuration(access_token=Config.LINE_CHANNEL_ACCESS_TOKEN)
             with ApiClient(configuration) as api_client:
@@ -39,10 +55,14 @@ class LINEService:
                 )
                 line_bot_api.push_message(push_message_request)
                 logger.info(f"Push message sent to {user_id}")
+                metrics.inc('line_push_total', mode='sync', result='success')
                 return True
         except Exception as e:
             logger.error(f"Error sending push message: {e}")
+            metrics.inc('line_push_total', mode='sync', result='failure')
             return False
+        finally:
+            metrics.observe('line_push_duration_seconds', time.perf_counter() - started, mode='sync')
     
     @staticmethod
     def send_order_confirmation(user_id, order_id, item_str, amount, payment_status):
@@ -97,3 +117,202 @@ class LINEService:
         }
         msg = msg_map.get(new_status, f"您的訂單狀態已更新為：{new_status}")
         return LINEService.send_push_message(user_id, msg)
+
+
+class LINEDispatcher:
+    """LINE 推播背景派送器
+    
+    - 有上限的佇列 + 固定數量的工作執行緒
+    - 所有工作執行緒共用一個 ApiClient（底層 urllib3 連線池）
+    - 429 / 5xx / 連線錯誤以指數退避重試，其餘 4xx 直接標記失敗
+    - 訊息先寫入 Firestore lineOutbox，送出後刪除；每個進程啟動時補送一次逾時的訊息
+    
+    outbox 的 updatedAt 即租約：寫入、重試與認領時更新，超過 LINE_OUTBOX_LEASE_SECONDS
+    未更新才視為原本的進程已停止，其他進程仍在送出的訊息不會被重複排入佇列。
+    outbox 的文件 ID 同時作為 X-Line-Retry-Key，重送不會造成使用者收到重複訊息。
+    """
+    
+    def __init__(self):
+        self.running = False
+        self._queue = None
+        self._workers = []
+        self._api_client = None
+        self._client_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'enqueued': 0, 'sent': 0, 'retried': 0, 'failed': 0, 'dropped': 0}
+        self._recovered_pid = None
+    
+    def start(self, workers=None, queue_size=None, recover=True):
+        """啟動工作執行緒，並在背景補送 outbox 中逾時的訊息（每個進程一次）"""
+        if self.running:
+            return
+        self._queue = queue.Queue(maxsize=queue_size or Config.LINE_DISPATCH_QUEUE_SIZE)
+        self._workers = [
+            threading.Thread(target=self._worker_loop, name=f"line-dispatch-{i}", daemon=True)
+            for i in range(workers or Config.LINE_DISPATCH_WORKERS)
+        ]
+        for worker in self._workers:
+            worker.start()
+        self.running = True
+        logger.info(f"LINE dispatcher started with {len(self._workers)} workers")
+        
+        if recover and self._recovered_pid != os.getpid():
+            self._recovered_pid = os.getpid()
+            threading.Thread(target=self.recover_outbox, name="line-dispatch-recover", daemon=True).start()
+    
+    def stop(self, timeout=5):
+        """停止工作執行緒（佇列中未送出的訊息仍保留在 outbox）"""
+        if not self.running:
+            return
+        self.running = False
+        for _ in self._workers:
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                break
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+        with self._client_lock:
+            if self._api_client is not None:
+                self._api_client.close()
+                self._api_client = None
+    
+    def join(self):
+        """等待佇列中的訊息處理完畢（不含排程中的重試）"""
+        if self._queue is not None:
+            self._queue.join()
+    
+    def stats(self):
+        """派送統計"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize() if self._queue is not None else 0
+        stats['workers'] = len(self._workers)
+        return stats
+    
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+    
+    def enqueue(self, user_id, text):
+        """寫入 outbox 並排入佇列"""
+        message_id = str(uuid.uuid4())
+        success, _ = DatabaseAdapter.add_line_outbox(message_id, user_id, text)
+        if not success:
+            logger.warning(f"LINE outbox write failed, message {message_id} is not durable")
+        
+        self._count('enqueued')
+        return self._put({'messageId': message_id, 'userId': user_id, 'text': text, 'attempts': 0}) or success
+    
+    def recover_outbox(self):
+        """認領 outbox 中租約已過期的訊息並重新排入佇列"""
+        success, messages = DatabaseAdapter.claim_stale_line_outbox(Config.LINE_OUTBOX_LEASE_SECONDS)
+        if not success:
+            logger.error(f"Failed to load LINE outbox: {messages}")
+            return 0
+        
+        recovered = 0
+        for message in messages:
+            if self._put({
+                'messageId': message['messageId'],
+                'userId': message.get('userId', ''),
+                'text': message.get('text', ''),
+                'attempts': message.get('attempts', 0)
+            }):
+                recovered += 1
+        if recovered:
+            logger.info(f"Recovered {recovered} LINE outbox messages")
+        return recovered
+    
+    def _put(self, item):
+        if not self.running:
+            return False
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            # 訊息仍保留在 outbox，下次啟動時補送
+            self._count('dropped')
+            logger.warning(f"LINE dispatch queue full, message {item['messageId']} left in outbox")
+            return False
+    
+    def _get_api_client(self):
+        with self._client_lock:
+            if self._api_client is None:
+                configuration = Configuration(
+                    host=Config.LINE_API_HOST,
+                    access_token=Config.LINE_CHANNEL_ACCESS_TOKEN
+                )
+                configuration.connection_pool_maxsize = max(len(self._workers), 1)
+                self._api_client = ApiClient(configuration)
+            return self._api_client
+    
+    def _worker_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._process(item)
+            except Exception as e:
+                logger.error(f"Unexpected error in LINE dispatcher: {e}")
+            finally:
+                self._queue.task_done()
+    
+    @staticmethod
+    def _is_retryable(error):
+        if isinstance(error, ApiException):
+            return error.status == 429 or (error.status or 0) >= 500
+        return True
+    
+    @staticmethod
+    def _error_text(error):
+        if isinstance(error, ApiException):
+            return f"{error.status} {error.reason}"
+        return str(error)
+    
+    def _process(self, item):
+        item['attempts'] += 1
+        started = time.perf_counter()
+        try:
+            MessagingApi(self._get_api_client()).push_message(
+                PushMessageRequest(to=item['userId'], messages=[TextMessage(text=item['text'])]),
+                x_line_retry_key=item['messageId']
+            )
+        except Exception as e:
+            # 409：相同 retry key 已被 LINE 接受過，視為已送出
+            if not (isinstance(e, ApiException) and e.status == 409):
+                metrics.observe('line_push_duration_seconds', time.perf_counter() - started, mode='async')
+                self._handle_failure(item, e)
+                return
+        
+        metrics.observe('line_push_duration_seconds', time.perf_counter() - started, mode='async')
+        metrics.inc('line_push_total', mode='async', result='success')
+        self._count('sent')
+        DatabaseAdapter.delete_line_outbox(item['messageId'])
+        logger.info(f"Push message sent to {item['userId']}")
+    
+    def _handle_failure(self, item, error):
+        error_text = self._error_text(error)
+        if self._is_retryable(error) and item['attempts'] < Config.LINE_DISPATCH_MAX_ATTEMPTS:
+            delay = Config.LINE_DISPATCH_BACKOFF * (2 ** (item['attempts'] - 1))
+            self._count('retried')
+            metrics.inc('line_push_total', mode='async', result='retry')
+            logger.warning(f"Push message to {item['userId']} failed (attempt {item['attempts']}), retrying in {delay}s: {error_text}")
+            DatabaseAdapter.update_line_outbox(item['messageId'], attempts=item['attempts'], lastError=error_text)
+            timer = threading.Timer(delay, self._put, args=(item,))
+            timer.daemon = True
+            timer.start()
+            return
+        
+        self._count('failed')
+        metrics.inc('line_push_total', mode='async', result='failure')
+        logger.error(f"Push message to {item['userId']} failed after {item['attempts']} attempts: {error_text}")
+        DatabaseAdapter.update_line_outbox(
+            item['messageId'], status='failed', attempts=item['attempts'], lastError=error_text
+        )
+
+
+# 全域派送器，由 app.py 在啟動時呼叫 start()
+line_dispatcher = LINEDispatcher()
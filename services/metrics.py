@@ -0,0 +1,222 @@
+"""
+應用程式監控指標（Prometheus 文字格式）
+
+記錄路由延遲直方圖、狀態碼計數、進行中請求數、資料庫讀寫 / RPC 次數、
+LINE 推播延遲與失敗數、ECPay 回調結果，由 /metrics 輸出。
+
+多個 gunicorn worker：設定 METRICS_MULTIPROC_DIR 時，各進程每 METRICS_FLUSH_INTERVAL 秒
+把自己的數值寫入 <目錄>/metrics_<pid>.json，/metrics 讀取整個目錄合併後輸出。
+已結束進程的計數器與直方圖會保留，gauge（進行中請求數）只計入仍存活的進程。
+目錄需在啟動 gunicorn 前清空，否則會累加上次執行的數值。
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 延遲直方圖的區間上限（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MetricsRegistry:
+    """進程內的指標登錄表：counter、gauge、histogram"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._definitions = {}
+        self._values = {}
+        self._last_flush = 0.0
+
+    # ===== 定義 =====
+
+    def _define(self, name, metric_type, help_text, buckets=None):
+        self._definitions[name] = {'type': metric_type, 'help': help_text, 'buckets': buckets}
+
+    def counter(self, name, help_text):
+        self._define(name, 'counter', help_text)
+
+    def gauge(self, name, help_text):
+        self._define(name, 'gauge', help_text)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self._define(name, 'histogram', help_text, tuple(buckets))
+
+    # ===== 記錄 =====
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        """計數器加值（gauge 可傳入負值）"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """記錄一筆直方圖觀測值"""
+        buckets = self._definitions[name]['buckets']
+        key = self._key(name, labels)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = {'buckets': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    data['buckets'][i] += 1
+                    break
+            data['sum'] += value
+            data['count'] += 1
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    # ===== 多進程 =====
+
+    def snapshot(self):
+        """目前進程的數值（可存成 JSON）"""
+        with self._lock:
+            return [
+                [name, [list(label) for label in labels],
+                 dict(value, buckets=list(value['buckets'])) if isinstance(value, dict) else value]
+                for (name, labels), value in self._values.items()
+            ]
+
+    def flush(self, directory):
+        """把目前進程的數值寫入多進程目錄（先寫暫存檔再改名，讀取端不會讀到寫一半的檔案）"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"metrics_{os.getpid()}.json")
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'pid': os.getpid(), 'values': self.snapshot()}, f)
+        os.replace(temp_path, path)
+        self._last_flush = time.monotonic()
+
+    def maybe_flush(self, directory, interval):
+        """距離上次寫入超過 interval 秒時寫入多進程目錄"""
+        if directory and time.monotonic() - self._last_flush >= interval:
+            try:
+                self.flush(directory)
+            except OSError as e:
+                logger.error(f"Failed to write metrics to {directory}: {e}")
+
+    def _load_directory(self, directory):
+        """讀取其他進程寫入的數值"""
+        snapshots = []
+        if not directory or not os.path.isdir(directory):
+            return snapshots
+        for filename in os.listdir(directory):
+            if not (filename.startswith('metrics_') and filename.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(directory, filename), encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable metrics file {filename}: {e}")
+                continue
+            if data.get('pid') != os.getpid():
+                snapshots.append(data)
+        return snapshots
+
+    def collect(self, directory=None):
+        """合併目前進程與多進程目錄中的數值，回傳 {(name, labels): value}"""
+        merged = {}
+
+        def add(name, labels, value, alive):
+            definition = self._definitions.get(name)
+            if definition is None or (definition['type'] == 'gauge' and not alive):
+                return
+            key = (name, tuple(tuple(label) for label in labels))
+            if isinstance(value, dict):
+                current = merged.setdefault(key, {'buckets': [0] * len(value['buckets']), 'sum': 0.0, 'count': 0})
+                current['buckets'] = [a + b for a, b in zip(current['buckets'], value['buckets'])]
+                current['sum'] += value['sum']
+                current['count'] += value['count']
+            else:
+                merged[key] = merged.get(key, 0) + value
+
+        for name, labels, value in self.snapshot():
+            add(name, labels, value, True)
+        for data in self._load_directory(directory):
+            alive = _pid_alive(data.get('pid', 0))
+            for name, labels, value in data.get('values', []):
+                add(name, labels, value, alive)
+        return merged
+
+    def render(self, directory=None):
+        """輸出 Prometheus 文字格式"""
+        merged = self.collect(directory)
+        lines = []
+        for name in sorted(self._definitions):
+            definition = self._definitions[name]
+            lines.append(f"# HELP {name} {definition['help']}")
+            lines.append(f"# TYPE {name} {definition['type']}")
+            for (metric_name, labels), value in sorted(merged.items()):
+                if metric_name != name:
+                    continue
+                if definition['type'] != 'histogram':
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(definition['buckets'], value['buckets']):
+                    cumulative += count
+                    bound_labels = labels + (('le', _format_value(float(bound))),)
+                    lines.append(f"{name}_bucket{_format_labels(bound_labels)} {cumulative}")
+                # +Inf 區間包含所有觀測值
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {value['count']}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value['sum'])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+metrics.counter('http_requests_total', 'HTTP 請求數（依藍圖、路由、方法、狀態碼）')
+metrics.histogram('http_request_duration_seconds', 'HTTP 請求處理時間（秒）')
+metrics.gauge('http_requests_in_flight', '處理中的 HTTP 請求數')
+metrics.counter('db_reads_total', '資料庫文件讀取數')
+metrics.counter('db_writes_total', '資料庫文件寫入數')
+metrics.counter('db_rpcs_total', '資料庫 RPC / SQL 敘述次數')
+metrics.histogram('db_rpc_duration_seconds', '單次資料庫 RPC 耗時（秒）')
+metrics.counter('line_push_total', 'LINE 推播次數（依模式、結果）')
+metrics.histogram('line_push_duration_seconds', 'LINE 推播 API 呼叫耗時（秒）')
+metrics.counter('ecpay_callbacks_total', 'ECPay 付款回調次數（依結果）')
+
+
+def flush_on_exit(directory):
+    """進程結束時寫入最後的數值"""
+    if directory:
+        atexit.register(lambda: metrics.maybe_flush(directory, 0))
@@ -0,0 +1,201 @@
+"""
+訂單編號產生器
+
+格式：ORD + 9 位秒數（自 2024-01-01 起）+ 2 位 worker 編號 + 3 位序號，共 17 字元。
+重試付款的交易編號再加上 R + 次數（最多 2 位數），仍在綠界 MerchantTradeNo 20 字元限制內。
+
+- 同一進程內單調遞增：每秒最多 1000 筆，序號用完時借用下一秒
+- 跨進程不重複：worker 編號由 Firestore orderIdWorkers 租約分配（或以
+  ORDER_ID_WORKER_ID 環境變數固定指定），同一時間每個編號只屬於一個進程
+- 續約在背景計時器中進行，產生編號時不等待 Firestore 交易；租約到期前保留
+  LEASE_SAFETY_SECONDS 的安全時間，期間仍無法續約或重新取得時停止產生編號
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from config import Config
+from services.database_adapter import DatabaseAdapter
+
+logger = logging.getLogger(__name__)
+
+ORDER_ID_PREFIX = 'ORD'
+ORDER_ID_EPOCH = 1704038400  # 2024-01-01 00:00:00 (Asia/Taipei)
+ORDER_ID_MAX_WORKERS = 100
+ORDER_ID_MAX_SEQUENCE = 1000
+ORDER_ID_LENGTH = 17
+
+# 租約到期前多久停止使用該 worker 編號（容許各主機時鐘誤差）
+LEASE_SAFETY_SECONDS = 30
+# 續約或申請失敗時，背景計時器在此秒數後重試
+FALLBACK_RETRY_SECONDS = 30
+# 訂單編號重複時換新編號重試的次數
+PLACE_ORDER_MAX_ATTEMPTS = 3
+
+
+class OrderIdUnavailable(Exception):
+    """沒有有效的 worker 編號租約，無法產生不重複的訂單編號"""
+
+
+class OrderIdService:
+    """訂單編號分配"""
+
+    _lock = threading.Lock()
+    _lease_lock = threading.Lock()
+    _pid = None
+    _worker_id = None
+    _lease_token = None
+    _valid_until = 0
+    _renewer = None
+    _last_second = -1
+    _sequence = 0
+
+    @classmethod
+    def configure(cls, worker_id):
+        """固定指定 worker 編號（不使用租約），供單機部署、測試與壓力測試使用"""
+        if not 0 <= int(worker_id) < ORDER_ID_MAX_WORKERS:
+            raise ValueError(f"worker_id 必須介於 0 與 {ORDER_ID_MAX_WORKERS - 1} 之間")
+        with cls._lease_lock, cls._lock:
+            cls._reset()
+            cls._pid = os.getpid()
+            cls._worker_id = int(worker_id)
+            cls._valid_until = float('inf')
+
+    @classmethod
+    def _reset(cls):
+        if cls._renewer is not None and cls._pid == os.getpid():
+            cls._renewer.cancel()
+        cls._renewer = None
+        cls._pid = None
+        cls._worker_id = None
+        cls._lease_token = None
+        cls._valid_until = 0
+        cls._last_second = -1
+        cls._sequence = 0
+
+    @classmethod
+    def next_order_id(cls):
+        """產生下一個訂單編號
+
+        Raises:
+            OrderIdUnavailable: 無法取得 worker 編號租約
+        """
+        worker_id = cls._ensure_worker()
+        with cls._lock:
+            now = int(time.time()) - ORDER_ID_EPOCH
+            if now > cls._last_second:
+                cls._last_second = now
+                cls._sequence = 0
+            else:
+                cls._sequence += 1
+                if cls._sequence >= ORDER_ID_MAX_SEQUENCE:
+                    # 同一秒序號用完：借用下一秒，維持單調遞增
+                    cls._last_second += 1
+                    cls._sequence = 0
+            return f"{ORDER_ID_PREFIX}{cls._last_second:09d}{worker_id:02d}{cls._sequence:03d}"
+
+    @classmethod
+    def place_order(cls, **order_fields):
+        """以新的訂單編號下單；編號已存在時換新編號重試
+
+        Args:
+            order_fields: DatabaseAdapter.place_order 除 order_id 以外的參數
+
+        Returns:
+            (success, result, order_id)：失敗時 result 為錯誤訊息
+        """
+        for attempt in range(PLACE_ORDER_MAX_ATTEMPTS):
+            try:
+                order_id = cls.next_order_id()
+            except OrderIdUnavailable as e:
+                logger.error(f"Order ID unavailable: {e}")
+                return False, "暫時無法建立訂單，請稍後再試", None
+
+            success, result = DatabaseAdapter.place_order(order_id=order_id, **order_fields)
+            if success or result != DatabaseAdapter.DUPLICATE_ORDER_ID_MSG:
+                return success, result, order_id
+            logger.warning(f"Order ID {order_id} already exists, retrying ({attempt + 1}/{PLACE_ORDER_MAX_ATTEMPTS})")
+        return False, result, order_id
+
+    @classmethod
+    def _lease_is_valid(cls):
+        return cls._pid == os.getpid() and cls._worker_id is not None and time.time() < cls._valid_until
+
+    @classmethod
+    def _ensure_worker(cls):
+        """取得目前進程有效的 worker 編號；只有尚未取得或租約已失效時才在請求中申請"""
+        if cls._lease_is_valid():
+            return cls._worker_id
+
+        with cls._lease_lock:
+            if cls._pid != os.getpid():
+                # gunicorn --preload fork 後不沿用父進程的編號（背景計時器不會隨 fork 複製）
+                with cls._lock:
+                    cls._reset()
+                cls._pid = os.getpid()
+                if Config.ORDER_ID_WORKER_ID is not None:
+                    cls._worker_id = int(Config.ORDER_ID_WORKER_ID)
+                    cls._valid_until = float('inf')
+
+            if not cls._lease_is_valid():
+                cls._refresh_lease()
+            if not cls._lease_is_valid():
+                raise OrderIdUnavailable("無法取得訂單編號 worker 租約")
+            return cls._worker_id
+
+    @classmethod
+    def _refresh_lease(cls):
+        """續約或申請 worker 編號租約並排定下次背景續約（需在 _lease_lock 內呼叫）
+
+        租約只有在到期後才會被其他進程取得，因此續約失敗時仍可使用到原到期時間減去安全時間。
+        """
+        lease_seconds = Config.ORDER_ID_LEASE_SECONDS
+        safety = min(LEASE_SAFETY_SECONDS, lease_seconds / 4)
+
+        if cls._worker_id is not None and cls._lease_token:
+            success, lease_until = DatabaseAdapter.renew_order_id_worker(
+                cls._worker_id, cls._lease_token, lease_seconds
+            )
+            if success:
+                cls._valid_until = lease_until - safety
+                cls._schedule_renewal(lease_seconds / 2)
+                return
+            logger.warning(f"Order ID worker lease {cls._worker_id} not renewed ({lease_until}), acquiring again")
+
+        # 沿用原 token：租約仍屬於本進程時會取回同一編號
+        token = cls._lease_token or uuid.uuid4().hex
+        success, result = DatabaseAdapter.acquire_order_id_worker(token, lease_seconds, ORDER_ID_MAX_WORKERS)
+        if success:
+            worker_id, lease_until = result
+            if worker_id != cls._worker_id:
+                logger.info(f"Order ID worker lease acquired: {worker_id}")
+            cls._worker_id = worker_id
+            cls._lease_token = token
+            cls._valid_until = lease_until - safety
+            cls._schedule_renewal(lease_seconds / 2)
+            return
+
+        logger.error(f"Failed to acquire order ID worker lease: {result}")
+        cls._schedule_renewal(FALLBACK_RETRY_SECONDS)
+
+    @classmethod
+    def _schedule_renewal(cls, delay):
+        """排定背景續約（取代尚未執行的前一個計時器）"""
+        if cls._renewer is not None:
+            cls._renewer.cancel()
+        cls._renewer = threading.Timer(delay, cls._renew_in_background)
+        cls._renewer.daemon = True
+        cls._renewer.start()
+
+    @classmethod
+    def _renew_in_background(cls):
+        """背景計時器：續約目前進程的租約"""
+        with cls._lease_lock:
+            if cls._pid != os.getpid() or cls._valid_until == float('inf'):
+                return
+            try:
+                cls._refresh_lease()
+            except Exception as e:
+                logger.error(f"Error renewing order ID worker lease: {e}")
+                cls._schedule_renewal(FALLBACK_RETRY_SECONDS)
@@ -0,0 +1,447 @@
+"""
+訂單業務規則（與資料庫後端無關）
+
+FirestoreService 與 SQLiteService 共用的規則：新訂單文件、應出貨 / 已出貨數量與出貨狀態、
+出貨新增與修正的欄位更新、訂單狀態變更的庫存異動與付款限制、庫存檢查訊息與異動紀錄、
+儀表板統計計數。各後端只負責讀寫（交易、批次、計數分片）。
+
+欄位更新以 firestore.ArrayUnion / Increment 表示，SQLite 後端寫入時在文件上套用。
+"""
+from firebase_admin import firestore
+from datetime import datetime, timedelta
+import logging
+import re
+import uuid
+import pytz
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+TW_TZ = pytz.timezone(Config.TIMEZONE)
+
+# 舊訂單的 items 顯示字串："商品名稱 x數量" 或 "商品名稱 x數量 (備註)"（僅供尚未回填 lineItems 的訂單使用）
+LEGACY_ITEMS_PATTERN = re.compile(r'^(?P<name>.+?) x(?P<qty>\d+)(?: \(.*\))?$', re.DOTALL)
+
+# 訂單改為這些狀態時釋放下單時預留的庫存；由這些狀態改回其他狀態時重新預留
+STOCK_RELEASE_STATUSES = ('已取消', '已刪除')
+PAID_PAYMENT_STATUS = '已付款'
+DELETED_ORDER_STATUS = '已刪除'
+UNPAID_PAYMENT_STATUSES = ('未付款', '待付款')
+
+DELIVERY_COMPLETED_STATUS = '已完成'
+DELIVERY_PARTIAL_STATUS = '部分配送'
+
+
+class OrderStockError(Exception):
+    """訂單狀態變更所需的庫存異動或付款標記不被允許（交易整筆不寫入）"""
+
+
+# ===== 訂單文件 =====
+
+def new_order_data(order_id, user_id, item_str, amount, status, payment_status, payment_method,
+                   product_id="", actual_quantity=1, order_qty=1, line_items=None):
+    """組合新訂單文件
+
+    品項存於 lineItems（未指定時以 product_id / order_qty / actual_quantity 建立單一品項），
+    應出貨總數為各品項 數量 × 實際數量 的加總；items 僅為顯示用字串。
+    """
+    now = datetime.now(TW_TZ)
+    order_data = {
+        'orderId': order_id,
+        'userId': user_id,
+        'productId': product_id,
+        'items': item_str,
+        'amount': amount,
+        'status': status,
+        'paymentStatus': payment_status,
+        'paymentMethod': payment_method,
+        'actualQuantity': int(actual_quantity),
+        'orderQty': int(order_qty),
+        'expectedTotal': int(actual_quantity) * int(order_qty),
+        'totalDelivered': 0,
+        'date': now.strftime('%Y-%m-%d %H:%M:%S'),
+        'deliveryLogs': [],
+        'createdAt': now,
+        'updatedAt': now
+    }
+    if not line_items:
+        line_items = [{'productId': product_id, 'qty': int(order_qty), 'actualQuantity': int(actual_quantity)}]
+    order_data['lineItems'] = line_items
+    order_data['expectedTotal'] = sum(int(item['qty']) * int(item.get('actualQuantity', 1))
+                                      for item in line_items)
+    return order_data
+
+
+def normalize_order_date(order_data):
+    """確保 date 字段存在且是字符串格式"""
+    if 'date' not in order_data or order_data['date'] is None:
+        # 如果沒有 date，使用 createdAt
+        created_at = order_data.get('createdAt')
+        if created_at:
+            if hasattr(created_at, 'strftime'):
+                order_data['date'] = created_at.strftime('%Y-%m-%d %H:%M:%S')
+            else:
+                order_data['date'] = str(created_at)
+        else:
+            order_data['date'] = datetime.now(TW_TZ).strftime('%Y-%m-%d %H:%M:%S')
+
+    # 轉換 Firestore Timestamp 為字符串
+    if order_data['date'] and hasattr(order_data['date'], 'strftime'):
+        order_data['date'] = order_data['date'].strftime('%Y-%m-%d %H:%M:%S')
+    return order_data
+
+
+def parse_legacy_items(items_str):
+    """從舊訂單的 items 字串取得 (商品名稱, 訂購數量)；無法解析時數量為 1
+
+    數量取自商品名稱後的 " x數量"，備註中的 "x3" 等文字不影響結果。
+    """
+    match = LEGACY_ITEMS_PATTERN.match((items_str or '').strip())
+    if match:
+        return match.group('name').strip(), int(match.group('qty'))
+    return (items_str or '').split(' (')[0].strip(), 1
+
+
+# ===== 出貨 =====
+
+def delivered_qty(log):
+    """單筆出貨紀錄的實際出貨數量（使用 corrected_qty 如果存在，否則使用 qty；修正為 0 也是有效值）"""
+    corrected = log.get('corrected_qty')
+    return int(corrected if corrected is not None else log.get('qty', 0))
+
+
+def expected_total(order_data):
+    """訂單應該出貨的總數
+
+    依序使用 expectedTotal、lineItems、訂購數量 × 實際數量；
+    只有尚未回填的舊訂單（執行 migrate_orders.py 前）才從 items 字串取得訂購數量。
+    """
+    if order_data.get('expectedTotal') is not None:
+        return int(order_data['expectedTotal'])
+
+    line_items = order_data.get('lineItems')
+    if line_items:
+        return sum(int(item['qty']) * int(item.get('actualQuantity', 1)) for item in line_items)
+
+    actual_quantity = order_data.get('actualQuantity', 1)
+    order_qty = order_data.get('orderQty')
+    if order_qty is not None:
+        return int(actual_quantity) * int(order_qty)
+
+    return parse_legacy_items(order_data.get('items'))[1]
+
+
+def total_delivered(order_data):
+    """訂單已出貨總數：優先使用 totalDelivered 欄位，舊訂單加總 deliveryLogs"""
+    if order_data.get('totalDelivered') is not None:
+        return int(order_data['totalDelivered'])
+    return sum(delivered_qty(log) for log in order_data.get('deliveryLogs', []))
+
+
+def delivery_status(delivered, expected):
+    """依累計出貨數量決定訂單狀態"""
+    return DELIVERY_COMPLETED_STATUS if delivered >= expected else DELIVERY_PARTIAL_STATUS
+
+
+def finish_user_order(order_data):
+    """日期轉為字串並計算剩餘盤數（用於部分配送狀態），優先使用訂單上的計數欄位"""
+    normalize_order_date(order_data)
+    order_data['remainingQty'] = max(0, expected_total(order_data) - total_delivered(order_data))
+    order_data.pop('deliveryLogs', None)
+    return order_data
+
+
+def delivery_index_entry(order_id, user_id, log):
+    """出貨日索引文件 (deliveries/{logId})，供出貨單報表依日期查詢"""
+    return {
+        'logId': log.get('logId'),
+        'orderId': order_id,
+        'userId': user_id,
+        'delivery_date': log.get('delivery_date', ''),
+        'qty': delivered_qty(log),
+        'address': log.get('address', ''),
+        'updatedAt': datetime.now(TW_TZ)
+    }
+
+
+def delivery_update(order_data, entries):
+    """為同一張訂單的一或多筆出貨建立更新內容
+
+    Args:
+        order_data: 訂單資料（交易中讀取的狀態）
+        entries: [(qty, address, delivery_date), ...]
+
+    Returns:
+        (update_data, new_logs, results)：results 與 entries 一一對應，
+        記錄每筆出貨後的狀態與累計數量
+    """
+    # 新增日誌 - 現在包含 stamp（時間戳記）和 delivery_date（約定出貨日期）
+    # logId 讓同一秒內內容相同的紀錄在 ArrayUnion 時不會被合併
+    now = datetime.now(TW_TZ)
+    expected = expected_total(order_data)
+    delivered = total_delivered(order_data)
+    added_qty = 0
+    new_logs = []
+    results = []
+    for qty, address, delivery_date in entries:
+        new_log = {
+            "logId": uuid.uuid4().hex[:12],
+            "stamp": now.strftime('%Y-%m-%d %H:%M:%S'),  # 系統記錄時間
+            "delivery_date": delivery_date or now.strftime('%Y-%m-%d'),  # 與客戶約定的日期
+            "qty": qty,
+            "address": address
+        }
+        new_logs.append(new_log)
+        added_qty += int(qty)
+        delivered += int(qty)
+        results.append({
+            "status": delivery_status(delivered, expected),
+            "total_delivered": delivered,
+            "total_ordered": expected,
+            "delivery_date": new_log["delivery_date"]
+        })
+
+    # 同一次寫入中追加紀錄並累加出貨數量
+    update_data = {
+        'deliveryLogs': firestore.ArrayUnion(new_logs),
+        'status': results[-1]['status'],
+        'updatedAt': now
+    }
+    if order_data.get('totalDelivered') is not None:
+        update_data['totalDelivered'] = firestore.Increment(added_qty)
+    else:
+        # 尚未回填計數欄位的舊訂單：直接寫入完整數值
+        update_data['totalDelivered'] = delivered
+    if order_data.get('expectedTotal') is None:
+        update_data['expectedTotal'] = expected
+    return update_data, new_logs, results
+
+
+def delivery_correction(order_id, order_data, log_index, new_qty, new_address, new_delivery_date):
+    """為出貨紀錄修正建立更新內容
+
+    Returns:
+        (update_data, corrected_log, result)；出貨紀錄不存在時回傳 None
+    """
+    delivery_logs = order_data.get('deliveryLogs', [])
+
+    if log_index < 0 or log_index >= len(delivery_logs):
+        return None
+
+    # 取得修改前的數據（需取得 corrected_qty 如果存在，否則取 qty）
+    old_log = delivery_logs[log_index]
+    old_qty = delivered_qty(old_log)
+    old_address = old_log.get('address', '')
+    old_delivery_date = old_log.get('delivery_date', '')
+    total_before = total_delivered(order_data)
+
+    # 修改出貨紀錄（保留原始 qty，新增 corrected_qty 追蹤修正後的值）
+    delivery_logs[log_index] = {
+        "stamp": old_log.get('stamp', old_log.get('date', datetime.now(TW_TZ).strftime('%Y-%m-%d %H:%M:%S'))),
+        "delivery_date": new_delivery_date or old_delivery_date,  # 使用新日期或保留舊日期
+        "date": old_log.get('date', datetime.now(TW_TZ).strftime('%Y-%m-%d %H:%M')),  # 兼容舊格式
+        "qty": old_qty,  # 保留原始的預期數量
+        "corrected_qty": new_qty,  # 新增修正後的實際數量
+        "address": new_address,
+        "original_qty": old_log.get('original_qty', old_log.get('qty', 0)),  # 記錄最初的原始值
+        "is_corrected": True,
+        "last_correction": datetime.now(TW_TZ).strftime('%Y-%m-%d %H:%M')
+    }
+
+    # 舊紀錄沒有 logId 時以訂單編號與索引產生固定值
+    log_id = old_log.get('logId') or f"{order_id}-{log_index}"
+    delivery_logs[log_index]['logId'] = log_id
+
+    # 計算新狀態：以修正前後的差額調整已出貨總數
+    qty_delta = int(new_qty) - int(old_qty)
+    delivered = total_before + qty_delta
+    expected = expected_total(order_data)
+    new_status = delivery_status(delivered, expected)
+
+    # 更新訂單
+    update_data = {
+        'deliveryLogs': delivery_logs,
+        'status': new_status,
+        'updatedAt': datetime.now(TW_TZ)
+    }
+    if order_data.get('totalDelivered') is not None:
+        update_data['totalDelivered'] = firestore.Increment(qty_delta)
+    else:
+        update_data['totalDelivered'] = delivered
+    if order_data.get('expectedTotal') is None:
+        update_data['expectedTotal'] = expected
+
+    return update_data, delivery_logs[log_index], {
+        "status": new_status,
+        "old_qty": old_qty,
+        "old_address": old_address,
+        "new_qty": new_qty,
+        "new_address": new_address,
+        "old_delivery_date": old_delivery_date,
+        "new_delivery_date": new_delivery_date or old_delivery_date,
+        "total_delivered": delivered
+    }
+
+
+# ===== 庫存 =====
+
+def line_item_stock_changes(line_items, sign=-1):
+    """各商品的庫存異動：訂購數量 × 實際數量，同一商品合併（預留為負、釋放為正）"""
+    changes = {}
+    for item in line_items:
+        units = int(item['qty']) * int(item.get('actualQuantity', 1))
+        changes[item['productId']] = changes.get(item['productId'], 0) + sign * units
+    return changes
+
+
+def stock_product_error(product_id, product, single, reserve=False):
+    """庫存異動前的商品檢查：不存在或（下單預留時）已下架回傳錯誤訊息，否則回傳 None
+
+    single: 是否只異動一項商品（單項時訊息不含商品名稱）
+    """
+    if product is None:
+        return "商品不存在" if single else f"商品不存在：{product_id}"
+    if reserve and product.get('status') != 'active':
+        return f"該商品已下架：{product.get('name', product_id)}"
+    return None
+
+
+def insufficient_stock_message(product_id, product, old_stock, single):
+    """庫存不足（不允許負庫存）的錯誤訊息"""
+    if single:
+        return f"庫存不足，目前庫存：{old_stock}"
+    return f"庫存不足：{product.get('name', product_id)}，目前庫存：{old_stock}"
+
+
+def stock_log_entry(product_id, product, qty_change, old_stock, new_stock, reason, operator, now):
+    """庫存異動紀錄 (stockLogs)"""
+    return {
+        'productId': product_id,
+        'productName': product.get('name'),
+        'type': 'in' if qty_change > 0 else 'out',
+        'quantity': abs(qty_change),
+        'oldStock': old_stock,
+        'newStock': new_stock,
+        'reason': reason,
+        'operator': operator,
+        'timestamp': now.isoformat()
+    }
+
+
+def status_stock_changes(order_data, status):
+    """訂單狀態變更需要的庫存異動
+
+    - 改為取消 / 刪除：釋放下單時預留（stockReserved）且尚未出貨的庫存；
+      已有出貨的訂單保留預留，由後台手動調整庫存
+    - 由取消 / 刪除改回其他狀態：曾預留且已釋放的訂單重新預留（庫存不足時不可改回）
+
+    Returns:
+        (changes, 異動原因, 是否為預留, 異動後的 stockReserved)；不需異動時回傳 None
+    """
+    if 'stockReserved' not in order_data or not order_data.get('lineItems'):
+        return None
+    order_id = order_data.get('orderId')
+    reserved = order_data['stockReserved']
+    if status in STOCK_RELEASE_STATUSES:
+        if not reserved:
+            return None
+        if total_delivered(order_data) > 0:
+            logger.warning(f"Order {order_id} has deliveries, reserved stock not released")
+            return None
+        return line_item_stock_changes(order_data['lineItems'], sign=1), f"取消訂單 {order_id}", False, False
+    if not reserved:
+        return line_item_stock_changes(order_data['lineItems']), f"恢復訂單 {order_id}", True, True
+    return None
+
+
+def payment_status_error(order_data, payment_status):
+    """已取消 / 刪除的訂單不可標記為已付款（預留庫存可能已釋放）；允許時回傳 None"""
+    if payment_status == PAID_PAYMENT_STATUS and order_data.get('status') in STOCK_RELEASE_STATUSES:
+        return f"訂單已{order_data.get('status')}，不可標記為已付款"
+    return None
+
+
+# ===== 訂單統計（後台儀表板） =====
+
+def order_stats_contribution(order_data):
+    """單張訂單對統計的貢獻 {欄位路徑: 數值}
+
+    已取消 / 刪除的訂單只計入狀態數量，不計入營收、未付款與應出貨盤數；
+    狀態變更前後的差異因此會移除或加回該訂單的金額與盤數。
+    """
+    if not order_data:
+        return {}
+    status = order_data.get('status') or '未知'
+    contribution = {'totalOrders': 1, f"ordersByStatus.{status}": 1}
+    if status in STOCK_RELEASE_STATUSES:
+        return contribution
+
+    amount = order_data.get('amount') or 0
+    day = normalize_order_date(dict(order_data))['date'][:10]
+    contribution['revenue'] = amount
+    contribution[f"revenueByDay.{day}"] = amount
+    contribution[f"revenueByMonth.{day[:7]}"] = amount
+    if (order_data.get('paymentStatus') or '未付款') in UNPAID_PAYMENT_STATUSES:
+        contribution['unpaidOrders'] = 1
+        contribution['unpaidAmount'] = amount
+    contribution['expectedTrays'] = expected_total(order_data)
+    contribution['deliveredTrays'] = total_delivered(order_data)
+    return contribution
+
+
+def order_stats_delta(before, after):
+    """訂單寫入前後的統計差異（省略為 0 的欄位）"""
+    delta = order_stats_contribution(after)
+    for path, value in order_stats_contribution(before).items():
+        delta[path] = delta.get(path, 0) - value
+    return {path: value for path, value in delta.items() if value}
+
+
+def delivery_stats_delta(order_data, result):
+    """出貨新增或修正後的統計差異（result 為出貨結果，含新狀態與累計出貨數）"""
+    return order_stats_delta(order_data, {
+        **order_data,
+        'status': result['status'],
+        'expectedTotal': expected_total(order_data),
+        'totalDelivered': result['total_delivered']
+    })
+
+
+def nest_order_stats(flat):
+    """{'a.b': 1} -> {'a': {'b': 1}}"""
+    nested = {}
+    for path, value in flat.items():
+        node = nested
+        *parents, leaf = path.split('.')
+        for key in parents:
+            node = node.setdefault(key, {})
+        node[leaf] = value
+    return nested
+
+
+def summarize_order_stats(totals, days=30, months=12):
+    """把加總後的計數整理成儀表板回應（只保留最近 days 天、months 個月的營收）"""
+    today = datetime.now(TW_TZ).date()
+    day_keys = [(today - timedelta(days=i)).isoformat() for i in range(days - 1, -1, -1)]
+    month_keys = []
+    year, month = today.year, today.month
+    for _ in range(months):
+        month_keys.insert(0, f"{year:04d}-{month:02d}")
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+
+    revenue_by_day = totals.get('revenueByDay', {})
+    revenue_by_month = totals.get('revenueByMonth', {})
+    expected = totals.get('expectedTrays', 0)
+    delivered = totals.get('deliveredTrays', 0)
+    return {
+        'totalOrders': totals.get('totalOrders', 0),
+        'ordersByStatus': {k: v for k, v in sorted(totals.get('ordersByStatus', {}).items()) if v},
+        'unpaidOrders': totals.get('unpaidOrders', 0),
+        'unpaidAmount': totals.get('unpaidAmount', 0),
+        'revenue': totals.get('revenue', 0),
+        'revenueByDay': {day: revenue_by_day.get(day, 0) for day in day_keys},
+        'revenueByMonth': {month: revenue_by_month.get(month, 0) for month in month_keys},
+        'expectedTrays': expected,
+        'deliveredTrays': delivered,
+        'outstandingTrays': max(expected - delivered, 0)
+    }
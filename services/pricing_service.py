@@ -0,0 +1,225 @@
+"""
+計價引擎
+
+單價 = 商品售價或分級定價（依訂購數量），再套用適用折扣中最優惠的一筆：
+
+- 分級定價：商品文件的 bulkPricing [{"minQty": 10, "price": 240}, ...]，未設定時使用
+  ProductConfig.BULK_PRICING（以商品名稱對應）；編譯為依 minQty 排序的陣列，以 bisect 查詢
+- 折扣：商品、所屬分類與會員等級折扣（DiscountIndex），percentage 為單價百分比、
+  fixed 為每單位折抵金額；多筆適用時取金額最低者，不疊加
+- 金額四捨五入至整數元
+
+同一批報價只讀取一次商品與折扣（皆來自進程內快取），之後在記憶體中計算。
+"""
+import bisect
+import logging
+from functools import lru_cache
+from config import ProductConfig
+from services.database_adapter import DatabaseAdapter
+
+logger = logging.getLogger(__name__)
+
+# 後台價格預覽的數量上限
+PRICE_PREVIEW_MAX_QTY = 1000
+
+
+class PricingError(ValueError):
+    """無法計價（商品不存在、數量無效）"""
+
+
+def _round_amount(value):
+    """四捨五入至整數元（不使用銀行家捨入）"""
+    return int(value + 0.5) if value >= 0 else -int(-value + 0.5)
+
+
+class PriceTiers:
+    """編譯後的分級定價：bounds 為遞增的最低數量，prices 為對應單價"""
+
+    __slots__ = ('base_price', 'bounds', 'prices')
+
+    def __init__(self, base_price, tiers=()):
+        self.base_price = base_price
+        ordered = sorted(tiers)
+        self.bounds = [min_qty for min_qty, _ in ordered]
+        self.prices = [price for _, price in ordered]
+
+    def unit_price(self, qty):
+        """數量對應的單價；低於最小級距時使用基本售價"""
+        index = bisect.bisect_right(self.bounds, qty) - 1
+        return self.prices[index] if index >= 0 else self.base_price
+
+    def unit_prices(self, max_qty):
+        """數量 1..max_qty 的單價陣列（依級距區段填入，不逐一查詢）"""
+        prices = [self.base_price] * max_qty
+        edges = self.bounds + [max_qty + 1]
+        for i, price in enumerate(self.prices):
+            start, end = max(edges[i], 1), min(edges[i + 1], max_qty + 1)
+            if start < end:
+                prices[start - 1:end - 1] = [price] * (end - start)
+        return prices
+
+
+@lru_cache(maxsize=1024)
+def compile_tiers(base_price, tiers=()):
+    """編譯分級定價
+
+    Args:
+        base_price: 基本售價
+        tiers: ((最低數量, 單價), ...)，需可雜湊以便快取
+    """
+    return PriceTiers(base_price, tiers)
+
+
+def _config_tiers(name):
+    """ProductConfig.BULK_PRICING 的 (最低數量, 單價) 級距"""
+    return tuple((int(min_qty), price) for min_qty, _, price in ProductConfig.BULK_PRICING.get(name, ()))
+
+
+def config_unit_price(item_name, qty):
+    """依 ProductConfig 計算單價（商品不存在時回傳 None）"""
+    base_price = ProductConfig.PRODUCTS.get(item_name)
+    tiers = _config_tiers(item_name)
+    if not tiers:
+        return base_price
+    return compile_tiers(base_price or 0, tiers).unit_price(qty)
+
+
+def product_tiers(product):
+    """取得商品的編譯後分級定價"""
+    base_price = product.get('price', 0)
+    bulk = product.get('bulkPricing')
+    if bulk:
+        tiers = tuple(sorted((int(t['minQty']), t['price']) for t in bulk))
+    else:
+        tiers = _config_tiers(product.get('name'))
+    return compile_tiers(base_price, tiers)
+
+
+def _discounted_price(unit_price, discount):
+    value = float(discount.get('discountValue') or 0)
+    if discount.get('discountType') == 'percentage':
+        return unit_price * (100 - value) / 100
+    return unit_price - value
+
+
+class PriceQuote:
+    """一批商品的報價：建立時讀取商品與折扣，之後的計算不存取資料庫"""
+
+    def __init__(self, products, discounts):
+        """
+        Args:
+            products: {productId: 商品資料}
+            discounts: {productId: [適用折扣]}
+        """
+        self.products = products
+        self.discounts = discounts
+
+    @classmethod
+    def load(cls, product_ids, member_level=None):
+        """讀取商品（快取）與適用折扣（折扣索引），不存在的商品不列入"""
+        products = {}
+        for product_id in dict.fromkeys(product_ids):
+            success, product = DatabaseAdapter.get_product(product_id)
+            if success and product:
+                products[product_id] = product
+        return cls.from_products(products, member_level)
+
+    @classmethod
+    def from_products(cls, products, member_level=None):
+        """以已讀取的商品建立報價，只查詢適用折扣"""
+        success, discounts = DatabaseAdapter.get_applicable_discounts_batch(
+            [(product_id, product.get('categoryId') or None) for product_id, product in products.items()],
+            member_level=member_level
+        )
+        if not success:
+            # 折扣無法載入時以原價計價，不阻擋下單
+            logger.warning(f"折扣載入失敗，以原價計價：{discounts}")
+            discounts = {}
+        return cls(products, discounts)
+
+    def _product(self, product_id):
+        product = self.products.get(product_id)
+        if product is None:
+            raise PricingError("商品不存在")
+        return product
+
+    def _best_discount(self, product_id, unit_price):
+        """回傳 (折扣後單價, 折扣)；沒有適用折扣時為 (原單價, None)"""
+        best_price, best = unit_price, None
+        for discount in self.discounts.get(product_id, ()):
+            price = max(_discounted_price(unit_price, discount), 0)
+            if price < best_price:
+                best_price, best = price, discount
+        return best_price, best
+
+    def quote(self, product_id, qty):
+        """單一商品報價
+
+        Returns:
+            {"productId", "qty", "listPrice", "tierPrice", "unitPrice", "discountId", "discountName",
+             "discountAmount", "amount"}
+        """
+        if qty <= 0:
+            raise PricingError("數量必須大於 0")
+        product = self._product(product_id)
+        tier_price = product_tiers(product).unit_price(qty)
+        unit_price, discount = self._best_discount(product_id, tier_price)
+        amount = _round_amount(unit_price * qty)
+        return {
+            "productId": product_id,
+            "qty": qty,
+            "listPrice": product.get('price', 0),
+            "tierPrice": tier_price,
+            "unitPrice": unit_price,
+            "discountId": discount.get('id') if discount else None,
+            "discountName": discount.get('name') if discount else None,
+            "discountAmount": _round_amount(tier_price * qty) - amount,
+            "amount": amount
+        }
+
+    def line_item(self, product_id, qty):
+        """訂單品項（存入訂單的 lineItems）"""
+        q = self.quote(product_id, qty)
+        product = self.products[product_id]
+        return {
+            "productId": product_id,
+            "name": product.get('name', ''),
+            "qty": qty,
+            "actualQuantity": int(product.get('actualQuantity', 1)),
+            "unitPrice": q['unitPrice'],
+            "amount": q['amount'],
+            "discountId": q['discountId']
+        }
+
+    def quote_many(self, lines):
+        """多筆報價
+
+        Args:
+            lines: [(productId, qty)]
+
+        Returns:
+            ([報價...], 總金額)
+        """
+        quotes = [self.quote(product_id, qty) for product_id, qty in lines]
+        return quotes, sum(q['amount'] for q in quotes)
+
+    def preview(self, product_id, max_qty=PRICE_PREVIEW_MAX_QTY):
+        """數量 1..max_qty 的價格表（後台價格預覽）
+
+        分級單價以區段填入，每個不同單價只計算一次折扣。
+        """
+        product = self._product(product_id)
+        discounted = {}
+        rows = []
+        for qty, tier_price in enumerate(product_tiers(product).unit_prices(max_qty), start=1):
+            if tier_price not in discounted:
+                discounted[tier_price] = self._best_discount(product_id, tier_price)
+            unit_price, discount = discounted[tier_price]
+            rows.append({
+                "qty": qty,
+                "tierPrice": tier_price,
+                "unitPrice": unit_price,
+                "discountId": discount.get('id') if discount else None,
+                "amount": _round_amount(unit_price * qty)
+            })
+        return rows
@@ -0,0 +1,1616 @@
+"""
+SQLite 資料庫服務模組
+
+與 FirestoreService 相同的類別方法介面，供本機開發、壓力測試與單機小型部署使用，
+不需 Firebase 憑證（DATABASE_BACKEND=sqlite）。
+
+- 每個 Firestore 集合對應一個資料表 (id, data)，data 為文件 JSON
+- 查詢欄位以 json_extract 運算式建立索引（orders.userId、orders.createdAt、
+  deliveries.delivery_date、products.status 等），查詢使用相同運算式即可命中索引
+- 時間欄位以「前綴 + UTC ISO 字串」儲存，字串順序即時間順序，讀取時還原為 datetime
+- 讀改寫操作在 BEGIN IMMEDIATE 交易中完成，多進程共用同一個檔案時由 SQLite 鎖序列化
+- 訂單、出貨、庫存檢查與統計的業務規則由 services/order_rules.py 提供，與 Firestore 後端共用
+"""
+from firebase_admin import firestore
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+import json
+import logging
+import os
+import random
+import re
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import pytz
+from config import Config
+from services import db_instrumentation, order_rules
+from services.firestore_service import FirestoreService
+from services.order_rules import OrderStockError
+
+logger = logging.getLogger(__name__)
+
+# 台灣時區
+TW_TZ = pytz.timezone(Config.TIMEZONE)
+
+DATETIME_PREFIX = '__datetime__:'
+
+# 各集合的查詢索引（欄位組合）
+INDEXES = {
+    'members': [('phone',)],
+    'orders': [('userId',), ('userId', 'createdAt', 'orderId'), ('createdAt', 'orderId'), ('status', 'createdAt'), ('paymentStatus', 'createdAt')],
+    'deliveries': [('delivery_date', 'orderId')],
+    'products': [('status',)],
+    'stockLogs': [('timestamp',), ('productId', 'timestamp')],
+    'auditLogs': [('orderId',)],
+    'categories': [('status',)],
+    'discounts': [('status', 'targetType', 'targetId')],
+    'stockAlerts': [('status', 'createdAt'), ('status', 'alertType', 'createdAt')],
+    'lineOutbox': [('status', 'updatedAt')],
+}
+
+_NAME_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+_OPERATORS = {'==': '=', '!=': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+
+
+class DocumentNotFound(Exception):
+    """更新不存在的文件"""
+
+
+class DocumentExists(Exception):
+    """新增已存在的文件"""
+
+
+class QueryStats:
+    """文件讀寫與 SQL 敘述統計，另以 thread-local 記錄目前請求的用量"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reads = 0
+        self.writes = 0
+        self.rpcs = 0
+
+    def begin_request(self):
+        self._local.usage = {'reads': 0, 'writes': 0, 'rpcs': 0}
+
+    def end_request(self):
+        return dict(getattr(self._local, 'usage', None) or {'reads': 0, 'writes': 0, 'rpcs': 0})
+
+    def record(self, reads=0, writes=0, statements=1):
+        with self._lock:
+            self.reads += reads
+            self.writes += writes
+            self.rpcs += statements
+        usage = getattr(self._local, 'usage', None)
+        if usage is not None:
+            usage['reads'] += reads
+            usage['writes'] += writes
+            usage['rpcs'] += statements
+
+
+# ===== 編碼 =====
+
+def _encode(value):
+    """轉為可存成 JSON 的值（datetime 轉為可排序的字串）"""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return DATETIME_PREFIX + value.astimezone(timezone.utc).isoformat(timespec='microseconds')
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    return value
+
+
+def _decode(value):
+    if isinstance(value, str) and value.startswith(DATETIME_PREFIX):
+        return datetime.fromisoformat(value[len(DATETIME_PREFIX):])
+    if isinstance(value, dict):
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+def _apply_fields(data, fields):
+    """套用欄位更新（支援 a.b 路徑與 Increment、ArrayUnion、ArrayRemove、DELETE_FIELD）"""
+    for path, value in fields.items():
+        parts = path.split('.')
+        target = data
+        for part in parts[:-1]:
+            if not isinstance(target.get(part), dict):
+                target[part] = {}
+            target = target[part]
+        key = parts[-1]
+        current = target.get(key)
+
+        if value is firestore.DELETE_FIELD:
+            target.pop(key, None)
+        elif value is firestore.SERVER_TIMESTAMP:
+            target[key] = datetime.now(TW_TZ)
+        elif isinstance(value, firestore.Increment):
+            base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0
+            target[key] = base + value.value
+        elif isinstance(value, firestore.ArrayUnion):
+            items = list(current) if isinstance(current, list) else []
+            items.extend(item for item in value.values if item not in items)
+            target[key] = items
+        elif isinstance(value, firestore.ArrayRemove):
+            items = list(current) if isinstance(current, list) else []
+            target[key] = [item for item in items if item not in value.values]
+        else:
+            target[key] = value
+    return data
+
+
+def _new_id():
+    """自動文件 ID（與 Firestore 相同的 20 字元長度）"""
+    return uuid.uuid4().hex[:20]
+
+
+class SQLiteService:
+    """SQLite 連線與操作服務"""
+
+    _conn = None
+    _path = None
+    _lock = threading.RLock()
+    _tables = set()
+    stats = QueryStats()
+
+    # 與 FirestoreService 相同的批次上限，讓兩種後端的 API 行為一致
+    BATCH_WRITE_LIMIT = FirestoreService.BATCH_WRITE_LIMIT
+    MAX_BULK_DELIVERIES = FirestoreService.MAX_BULK_DELIVERIES
+    MAX_BULK_STOCK_PRODUCTS = FirestoreService.MAX_BULK_STOCK_PRODUCTS
+    MAX_CART_PRODUCTS = FirestoreService.MAX_CART_PRODUCTS
+    EXPORT_PAGE_SIZE = FirestoreService.EXPORT_PAGE_SIZE
+    ORDER_NOT_FOUND_MSG = FirestoreService.ORDER_NOT_FOUND_MSG
+
+    @classmethod
+    def init(cls, path=None):
+        """開啟 SQLite 資料庫並建立資料表與索引
+
+        Args:
+            path: 資料庫檔案路徑，預設為 Config.SQLITE_PATH；':memory:' 為記憶體資料庫
+        """
+        path = path or Config.SQLITE_PATH
+        try:
+            with cls._lock:
+                if cls._conn is not None:
+                    cls._conn.close()
+                if path != ':memory:':
+                    directory = os.path.dirname(os.path.abspath(path))
+                    os.makedirs(directory, exist_ok=True)
+                cls._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+                if path != ':memory:':
+                    cls._conn.execute('PRAGMA journal_mode=WAL')
+                    cls._conn.execute('PRAGMA synchronous=NORMAL')
+                cls._path = path
+                cls._tables = set()
+                for collection in INDEXES:
+                    cls._table(collection)
+            logger.info(f"SQLite database initialized: {path}")
+        except Exception as e:
+            logger.error(f"Failed to initialize SQLite: {e}")
+            raise
+
+    @classmethod
+    def is_initialized(cls):
+        """是否已開啟 SQLite 連線"""
+        return cls._conn is not None
+
+    # ===== 基本操作 =====
+
+    @staticmethod
+    def _check_name(name):
+        if not _NAME_PATTERN.match(name):
+            raise ValueError(f"無效的名稱：{name}")
+        return name
+
+    @classmethod
+    def _field(cls, name):
+        """欄位對應的 SQL 運算式（索引與查詢必須使用相同寫法）"""
+        if name == '__name__':
+            return 'id'
+        for part in name.split('.'):
+            cls._check_name(part)
+        return f"json_extract(data, '$.{name}')"
+
+    @classmethod
+    def _table(cls, collection):
+        """取得集合對應的資料表名稱，不存在時建立資料表與索引"""
+        cls._check_name(collection)
+        if collection in cls._tables:
+            return collection
+        with cls._lock:
+            cls._conn.execute(f'CREATE TABLE IF NOT EXISTS "{collection}" (id TEXT PRIMARY KEY, data TEXT NOT NULL)')
+            for fields in INDEXES.get(collection, []):
+                name = f"idx_{collection}_{'_'.join(fields)}"
+                columns = ', '.join(cls._field(f) for f in fields)
+                cls._conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{collection}" ({columns})')
+            cls._tables.add(collection)
+        return collection
+
+    @classmethod
+    def _execute(cls, sql, params=(), reads=0, writes=0):
+        started = time.perf_counter()
+        with cls._lock:
+            cursor = cls._conn.execute(sql, params)
+            rows = cursor.fetchall()
+            rowcount = cursor.rowcount
+        reads = reads or len(rows)
+        cls.stats.record(reads=reads, writes=writes)
+        db_instrumentation.record(reads=reads, writes=writes, seconds=time.perf_counter() - started)
+        return rows, rowcount
+
+    @classmethod
+    @contextmanager
+    def _transaction(cls):
+        """寫入交易（BEGIN IMMEDIATE）：區塊內的讀取與寫入一起提交或回復"""
+        with cls._lock:
+            cls._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield
+            except BaseException:
+                cls._conn.execute('ROLLBACK')
+                raise
+            cls._conn.execute('COMMIT')
+
+    @staticmethod
+    def _loads(data):
+        return _decode(json.loads(data))
+
+    @staticmethod
+    def _dumps(data):
+        return json.dumps(_encode(data), ensure_ascii=False, default=str)
+
+    @classmethod
+    def _get(cls, collection, doc_id):
+        rows, _ = cls._execute(f'SELECT data FROM "{cls._table(collection)}" WHERE id = ?', (doc_id,))
+        return cls._loads(rows[0][0]) if rows else None
+
+    @classmethod
+    def _get_many(cls, collection, doc_ids):
+        """一次讀取多個文件，回傳 {id: data}（不存在的文件不列入）"""
+        doc_ids = list(dict.fromkeys(doc_ids))
+        results = {}
+        for start in range(0, len(doc_ids), 500):
+            chunk = doc_ids[start:start + 500]
+            placeholders = ', '.join('?' for _ in chunk)
+            rows, _ = cls._execute(
+                f'SELECT id, data FROM "{cls._table(collection)}" WHERE id IN ({placeholders})', chunk
+            )
+            for doc_id, data in rows:
+                results[doc_id] = cls._loads(data)
+        return results
+
+    @classmethod
+    def _put(cls, collection, doc_id, data):
+        cls._execute(
+            f'INSERT OR REPLACE INTO "{cls._table(collection)}" (id, data) VALUES (?, ?)',
+            (doc_id, cls._dumps(data)), writes=1
+        )
+
+    @classmethod
+    def _insert(cls, collection, doc_id, data):
+        try:
+            cls._execute(
+                f'INSERT INTO "{cls._table(collection)}" (id, data) VALUES (?, ?)',
+                (doc_id, cls._dumps(data)), writes=1
+            )
+        except sqlite3.IntegrityError:
+            raise DocumentExists(f"Document already exists: {collection}/{doc_id}")
+
+    @classmethod
+    def _update(cls, collection, doc_id, fields):
+        """更新文件欄位；文件不存在時拋出 DocumentNotFound"""
+        with cls._transaction():
+            data = cls._get(collection, doc_id)
+            if data is None:
+                raise DocumentNotFound(f"No document to update: {collection}/{doc_id}")
+            cls._put(collection, doc_id, _apply_fields(data, fields))
+
+    @classmethod
+    def _delete(cls, collection, doc_id):
+        cls._execute(f'DELETE FROM "{cls._table(collection)}" WHERE id = ?', (doc_id,), writes=1)
+
+    @classmethod
+    def _build_select(cls, collection, where=(), order_by=(), limit=None, after=None):
+        """組合查詢 SQL
+
+        Args:
+            where: [(欄位, 運算子, 值)]，運算子為 ==、!=、<、<=、>、>=、in
+            order_by: [(欄位, 是否倒序)]；排序欄位不存在的文件不列入（與 Firestore 相同）
+            after: 與 order_by 對應的游標值，只回傳排在其後的文件
+        """
+        conditions, params = [], []
+        for field, op, value in where:
+            expr = cls._field(field)
+            if op == 'in':
+                values = [_encode(v) for v in value]
+                conditions.append(f"{expr} IN ({', '.join('?' for _ in values)})" if values else '0')
+                params.extend(values)
+            elif value is None and op in ('==', '!='):
+                conditions.append(f"{expr} IS {'NOT ' if op == '!=' else ''}NULL")
+            else:
+                conditions.append(f"{expr} {_OPERATORS[op]} ?")
+                params.append(_encode(value))
+
+        order_terms = []
+        for field, descending in order_by:
+            expr = cls._field(field)
+            if field != '__name__':
+                conditions.append(f"{expr} IS NOT NULL")
+            order_terms.append(f"{expr} {'DESC' if descending else 'ASC'}")
+
+        if after is not None:
+            # (a, b) 在游標之後：a 超過游標，或 a 相同且 b 超過游標
+            alternatives = []
+            for i, ((field, descending), value) in enumerate(zip(order_by, after)):
+                terms = [f"{cls._field(f)} = ?" for f, _ in order_by[:i]]
+                terms.append(f"{cls._field(field)} {'<' if descending else '>'} ?")
+                alternatives.append(f"({' AND '.join(terms)})")
+                params.extend(_encode(v) for v in list(after[:i]) + [value])
+            conditions.append(f"({' OR '.join(alternatives)})")
+
+        sql = f'SELECT id, data FROM "{cls._table(collection)}"'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        if order_terms:
+            sql += ' ORDER BY ' + ', '.join(order_terms)
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(int(limit))
+        return sql, params
+
+    @classmethod
+    def _select(cls, collection, where=(), order_by=(), limit=None, after=None):
+        """查詢集合，回傳 [(id, data)]"""
+        sql, params = cls._build_select(collection, where, order_by, limit, after)
+        rows, _ = cls._execute(sql, params)
+        return [(doc_id, cls._loads(data)) for doc_id, data in rows]
+
+    @classmethod
+    def explain_query(cls, collection, where=(), order_by=(), limit=None):
+        """回傳查詢的 SQLite 執行計畫（檢查是否命中索引）"""
+        sql, params = cls._build_select(collection, where, order_by, limit)
+        with cls._lock:
+            rows = cls._conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+        return [row[-1] for row in rows]
+
+    @classmethod
+    def load(cls, collection, doc_id, data):
+        """直接寫入文件（匯入資料、建立測試資料用）"""
+        cls._put(collection, doc_id, data)
+
+    # ===== 會員 =====
+
+    @classmethod
+    def add_member(cls, user_id, name, phone, address, birth_date=None, address2=None):
+        """新增會員"""
+        try:
+            cls._put('members', user_id, {
+                'userId': user_id,
+                'name': name,
+                'phone': phone,
+                'address': address,
+                'birthDate': birth_date or '',
+                'address2': address2 or '',
+                'createdAt': datetime.now(TW_TZ),
+                'updatedAt': datetime.now(TW_TZ)
+            })
+            logger.info(f"Member added: {user_id}")
+            return True
+        except Exception as e:
+            logger.error(f"Error adding member: {e}")
+            return False
+
+    @classmethod
+    def get_member_by_phone(cls, phone):
+        """依手機號碼查詢會員（phone 索引，最多讀取 1 筆）"""
+        try:
+            docs = cls._select('members', [('phone', '==', phone)], limit=1)
+            return True, docs[0][1] if docs else None
+        except Exception as e:
+            logger.error(f"Error getting member by phone: {e}")
+            return False, str(e)
+
+    @classmethod
+    def add_member_with_unique_phone(cls, user_id, name, phone, address, birth_date=None, address2=None):
+        """新增會員並保證手機號碼未被使用（同一交易中檢查與寫入）
+
+        Returns:
+            (True, user_id) 新增成功；(False, None) 手機號碼已有會員；(False, 錯誤訊息)
+        """
+        try:
+            now = datetime.now(TW_TZ)
+            with cls._transaction():
+                if cls._get('memberPhones', phone) is not None or \
+                        cls._select('members', [('phone', '==', phone)], limit=1):
+                    return False, None
+                cls._insert('members', user_id, {
+                    'userId': user_id,
+                    'name': name,
+                    'phone': phone,
+                    'address': address,
+                    'birthDate': birth_date or '',
+                    'address2': address2 or '',
+                    'createdAt': now,
+                    'updatedAt': now
+                })
+                cls._put('memberPhones', phone, {'userId': user_id, 'createdAt': now})
+            logger.info(f"Member added: {user_id}")
+            return True, user_id
+        except Exception as e:
+            logger.error(f"Error adding member with unique phone: {e}")
+            return False, str(e)
+
+    @classmethod
+    def check_member_exists(cls, user_id):
+        """檢查會員是否存在"""
+        try:
+            data = cls._get('members', user_id)
+            if data is None:
+                return None
+            return {
+                "userId": data.get('userId', ''),
+                "name": data.get('name', ''),
+                "phone": data.get('phone', ''),
+                "address": data.get('address', ''),
+                "birthDate": data.get('birthDate', ''),
+                "address2": data.get('address2', '')
+            }
+        except Exception as e:
+            logger.error(f"Error checking member: {e}")
+            return None
+
+    @classmethod
+    def update_member(cls, user_id, name, phone, address, address2=""):
+        """更新會員資料"""
+        try:
+            cls._update('members', user_id, {
+                'name': name,
+                'phone': phone,
+                'address': address,
+                'address2': address2,
+                'updatedAt': datetime.now(TW_TZ)
+            })
+            logger.info(f"Member updated: {user_id}")
+            return True
+        except Exception as e:
+            logger.error(f"Error updating member: {e}")
+            return False
+
+    @classmethod
+    def get_all_members(cls):
+        """獲取所有會員"""
+        try:
+            members = [FirestoreService._normalize_member(data) for _, data in cls._select('members')]
+            members.sort(key=lambda x: x.get('updatedAt', ''), reverse=True)
+            return members
+        except Exception as e:
+            logger.error(f"Error getting all members: {e}")
+            return []
+
+    @classmethod
+    def _iter_collection_pages(cls, collection, page_size=None):
+        """依文件 ID 分頁讀取整個集合"""
+        page_size = page_size or cls.EXPORT_PAGE_SIZE
+        last_id = None
+        while True:
+            docs = cls._select(collection, order_by=[('__name__', False)], limit=page_size,
+                               after=[last_id] if last_id is not None else None)
+            if docs:
+                yield docs
+            if len(docs) < page_size:
+                return
+            last_id = docs[-1][0]
+
+    @classmethod
+    def iter_members(cls, page_size=None):
+        """逐筆產生所有會員（依文件 ID 排序，供串流匯出）"""
+        for docs in cls._iter_collection_pages('members', page_size):
+            for _, data in docs:
+                yield FirestoreService._normalize_member(data)
+
+    @classmethod
+    def iter_orders_with_members(cls, page_size=None):
+        """逐筆產生所有訂單及會員資料（依訂單 ID 排序，供串流匯出）"""
+        for docs in cls._iter_collection_pages('orders', page_size):
+            orders = [data for _, data in docs]
+            members_map = cls._get_many('members', [o.get('userId') for o in orders if o.get('userId')])
+            for order in orders:
+                order_rules.normalize_order_date(order)
+                order['customer'] = members_map.get(order.get('userId'), {})
+                yield order
+
+    @classmethod
+    def get_member_by_id(cls, user_id):
+        """按ID獲取會員資料"""
+        try:
+            data = cls._get('members', user_id)
+            if data is None:
+                return False, "會員不存在"
+            for field in ('createdAt', 'updatedAt'):
+                if data.get(field) and hasattr(data[field], 'strftime'):
+                    data[field] = data[field].strftime('%Y-%m-%d %H:%M:%S')
+            if 'status' not in data:
+                data['status'] = '啟用'
+            return True, data
+        except Exception as e:
+            logger.error(f"Error getting member {user_id}: {e}")
+            return False, str(e)
+
+    @classmethod
+    def update_member_status(cls, user_id, status):
+        """更新會員狀態"""
+        try:
+            valid_statuses = ['啟用', '停用', '黑名單', '已刪除', '已綁定-略']
+            if status not in valid_statuses:
+                return False, f"無效的狀態。必須是: {', '.join(valid_statuses)}"
+
+            cls._update('members', user_id, {
+                'status': status,
+                'updatedAt': datetime.now(TW_TZ)
+            })
+            logger.info(f"Member status updated: {user_id} -> {status}")
+            return True, "狀態更新成功"
+        except Exception as e:
+            logger.error(f"Error updating member status: {e}")
+            return False, str(e)
+
+    # ===== 訂單 =====
+
+    @classmethod
+    def add_order(cls, order_id, user_id, item_str, amount, status, payment_status, payment_method, product_id="", actual_quantity=1, order_qty=1, line_items=None):
+        """新增訂單（僅新增，訂單編號已存在時失敗而不覆寫）"""
+        try:
+            cls._insert('orders', order_id, order_rules.new_order_data(
+                order_id, user_id, item_str, amount, status, payment_status, payment_method,
+                product_id, actual_quantity, order_qty, line_items
+            ))
+            logger.info(f"Order added: {order_id}")
+            return True
+        except DocumentExists:
+            logger.error(f"Order ID collision, order not written: {order_id}")
+            return False
+        except Exception as e:
+            logger.error(f"Error adding order: {e}")
+            return False
+
+    @classmethod
+    def place_order(cls, order_id, user_id, item_str, amount, status, payment_status, payment_method,
+                    line_items, operator="system"):
+        """下單：預留庫存並新增訂單（檢查商品、扣庫存、異動紀錄與訂單在同一交易中提交）"""
+        try:
+            if not line_items:
+                return False, "購物車沒有商品"
+            changes = order_rules.line_item_stock_changes(line_items)
+            if len(changes) > cls.MAX_CART_PRODUCTS:
+                return False, f"單筆訂單最多 {cls.MAX_CART_PRODUCTS} 項商品"
+
+            single = line_items[0] if len(line_items) == 1 else {'qty': 1}
+            order_data = order_rules.new_order_data(
+                order_id, user_id, item_str, amount, status, payment_status, payment_method,
+                line_items[0]['productId'], single.get('actualQuantity', 1), single['qty'], line_items=line_items
+            )
+            order_data['stockReserved'] = True
+            with cls._transaction():
+                success, result = cls._apply_stock_changes(changes, f"訂單 {order_id}", operator, reserve=True)
+                if success:
+                    cls._insert('orders', order_id, order_data)
+            if not success:
+                return False, result
+            logger.info(f"Order placed: {order_id} ({len(line_items)} items)")
+            return True, order_data
+        except DocumentExists:
+            logger.error(f"Order ID collision, order not written: {order_id}")
+            return False, FirestoreService.DUPLICATE_ORDER_ID_MSG
+        except Exception as e:
+            logger.error(f"Error placing order: {e}")
+            return False, str(e)
+
+    @classmethod
+    def acquire_order_id_worker(cls, token, lease_seconds, max_workers=100):
+        """取得訂單編號 worker 編號租約
+
+        Returns:
+            (True, (worker_id, lease_until)) 或 (False, 錯誤訊息)
+        """
+        try:
+            with cls._transaction():
+                slots = cls._get_many('orderIdWorkers', [f"{i:02d}" for i in range(max_workers)])
+                now = time.time()
+
+                # 優先取回自己原本的編號，其次從隨機位置找第一個過期或未使用的編號
+                offset = random.randrange(max_workers)
+                chosen = None
+                for i in sorted(range(max_workers), key=lambda i: (i - offset) % max_workers):
+                    data = slots.get(f"{i:02d}")
+                    if data and data.get('token') == token:
+                        chosen = i
+                        break
+                    if chosen is None and (not data or data.get('leaseUntil', 0) < now):
+                        chosen = i
+                if chosen is None:
+                    return False, "沒有可用的 worker 編號"
+
+                lease_until = now + lease_seconds
+                cls._put('orderIdWorkers', f"{chosen:02d}", {
+                    'token': token,
+                    'pid': os.getpid(),
+                    'host': socket.gethostname(),
+                    'leaseUntil': lease_until
+                })
+            return True, (chosen, lease_until)
+        except Exception as e:
+            logger.error(f"Error acquiring order ID worker: {e}")
+            return False, str(e)
+
+    @classmethod
+    def renew_order_id_worker(cls, worker_id, token, lease_seconds):
+        """續約訂單編號 worker 編號；編號已被其他進程取得時回傳失敗"""
+        try:
+            with cls._transaction():
+                data = cls._get('orderIdWorkers', f"{worker_id:02d}")
+                if not data or data.get('token') != token:
+                    return False, "租約已失效"
+                lease_until = time.time() + lease_seconds
+                data['leaseUntil'] = lease_until
+                cls._put('orderIdWorkers', f"{worker_id:02d}", data)
+            return True, lease_until
+        except Exception as e:
+            logger.error(f"Error renewing order ID worker {worker_id}: {e}")
+            return False, str(e)
+
+    @classmethod
+    def _user_orders(cls, user_id, limit=None, start_after=None):
+        """會員訂單（排除已刪除、依 createdAt、orderId 倒序、只取顯示欄位）"""
+        after = list(FirestoreService._decode_order_cursor(start_after)) if start_after else None
+        docs = cls._select('orders', [('userId', '==', user_id), ('status', '!=', order_rules.DELETED_ORDER_STATUS)],
+                           order_by=[('createdAt', True), ('orderId', True)], limit=limit, after=after)
+        orders = []
+        for _, order_data in docs:
+            order = {field: order_data[field] for field in FirestoreService.USER_ORDER_FIELDS if field in order_data}
+            if order.get('totalDelivered') is None:
+                order['deliveryLogs'] = order_data.get('deliveryLogs', [])
+            orders.append(order)
+        return orders
+
+    @classmethod
+    def get_user_orders(cls, user_id):
+        """取得使用者訂單（新到舊，不含已刪除）"""
+        try:
+            return [order_rules.finish_user_order(order) for order in cls._user_orders(user_id)]
+        except Exception as e:
+            logger.error(f"Error getting user orders: {e}")
+            return []
+
+    @classmethod
+    def get_user_orders_page(cls, user_id, limit=20, start_after=None):
+        """分頁取得使用者訂單（新到舊，不含已刪除）
+
+        Returns:
+            (True, {"orders": [...], "nextCursor": str | None, "hasMore": bool})
+        """
+        try:
+            # 多取一筆以判斷是否還有下一頁
+            orders = cls._user_orders(user_id, limit + 1, start_after)
+            has_more = len(orders) > limit
+            orders = [order_rules.finish_user_order(order) for order in orders[:limit]]
+
+            next_cursor = None
+            if has_more and orders:
+                last = orders[-1]
+                next_cursor = FirestoreService._encode_order_cursor(last.get('createdAt'), last.get('orderId'))
+            return True, {"orders": orders, "nextCursor": next_cursor, "hasMore": has_more}
+        except Exception as e:
+            logger.error(f"Error getting user orders page: {e}")
+            return False, str(e)
+
+    @classmethod
+    def get_all_orders_with_members(cls):
+        """取得所有訂單併入會員資料"""
+        try:
+            members_map = dict(cls._select('members'))
+            results = []
+            for _, order_data in cls._select('orders'):
+                order_rules.normalize_order_date(order_data)
+                order_data['customer'] = members_map.get(order_data.get('userId'), {})
+                results.append(order_data)
+            return results
+        except Exception as e:
+            logger.error(f"Error getting all orders: {e}")
+            return []
+
+    @classmethod
+    def get_order_by_id(cls, order_id):
+        """按ID取得單一訂單"""
+        try:
+            data = cls._get('orders', order_id)
+            if data is None:
+                return False, "訂單不存在"
+            return True, order_rules.normalize_order_date(data)
+        except Exception as e:
+            logger.error(f"Error getting order {order_id}: {e}")
+            return False, str(e)
+
+    @classmethod
+    def get_order_with_member(cls, order_id):
+        """取得單一訂單併入會員資料"""
+        success, order_data = cls.get_order_by_id(order_id)
+        if not success:
+            return False, order_data
+
+        try:
+            user_id = order_data.get('userId')
+            order_data['customer'] = (cls._get('members', user_id) if user_id else None) or {}
+            return True, order_data
+        except Exception as e:
+            logger.error(f"Error getting member for order {order_id}: {e}")
+            return False, str(e)
+
+    @classmethod
+    def get_delivery_records_by_date(cls, delivery_date):
+        """依出貨日期取得出貨紀錄（delivery_date 索引，再批次讀取相關會員）"""
+        try:
+            entries = [data for _, data in cls._select(
+                'deliveries', [('delivery_date', '==', delivery_date)], order_by=[('orderId', False)]
+            )]
+            members_map = cls._get_many('members', [e.get('userId') for e in entries if e.get('userId')])
+
+            records = []
+            for entry in entries:
+                customer = members_map.get(entry.get('userId'), {})
+                records.append({
+                    "orderId": entry.get('orderId', ''),
+                    "delivery_qty": entry.get('qty', 0),
+                    "delivery_address": entry.get('address', ''),
+                    "customer_name": customer.get('name', ''),
+                    "customer_phone": customer.get('phone', '')
+                })
+            return True, records
+        except Exception as e:
+            logger.error(f"Error getting delivery records for {delivery_date}: {e}")
+            return False, str(e)
+
+    @classmethod
+    def get_orders_page(cls, limit=50, start_after=None, status=None, payment_status=None,
+                        date_from=None, date_to=None):
+        """分頁取得訂單併入會員資料（依 createdAt、orderId 倒序）
+
+        Returns:
+            (True, {"orders": [...], "nextCursor": str | None, "hasMore": bool})
+        """
+        try:
+            where = []
+            if status:
+                where.append(('status', '==', status))
+            if payment_status:
+                where.append(('paymentStatus', '==', payment_status))
+            if date_from:
+                where.append(('createdAt', '>=', TW_TZ.localize(datetime.strptime(date_from, '%Y-%m-%d'))))
+            if date_to:
+                end = TW_TZ.localize(datetime.strptime(date_to, '%Y-%m-%d')) + timedelta(days=1)
+                where.append(('createdAt', '<', end))
+
+            after = list(FirestoreService._decode_order_cursor(start_after)) if start_after else None
+
+            # 多取一筆以判斷是否還有下一頁
+            docs = cls._select('orders', where, order_by=[('createdAt', True), ('orderId', True)],
+                               limit=limit + 1, after=after)
+            has_more = len(docs) > limit
+            orders = [data for _, data in docs[:limit]]
+
+            members_map = cls._get_many('members', [o.get('userId') for o in orders if o.get('userId')])
+
+            next_cursor = None
+            if has_more and orders:
+                last = orders[-1]
+                next_cursor = FirestoreService._encode_order_cursor(last.get('createdAt'), last.get('orderId'))
+
+            for order_data in orders:
+                order_rules.normalize_order_date(order_data)
+                order_data['customer'] = members_map.get(order_data.get('userId'), {})
+
+            return True, {
+                "orders": orders,
+                "nextCursor": next_cursor,
+                "hasMore": has_more
+            }
+        except Exception as e:
+            logger.error(f"Error getting orders page: {e}")
+            return False, str(e)
+
+    @classmethod
+    def add_delivery_log(cls, order_id, qty, address="", delivery_date=""):
+        """新增出貨紀錄（訂單與出貨日索引在同一交易中寫入）"""
+        try:
+            with cls._transaction():
+                order_data = cls._get('orders', order_id)
+                if order_data is None:
+                    return False, "訂單不存在"
+
+                update_data, new_logs, results = order_rules.delivery_update(
+                    order_data, [(qty, address, delivery_date)]
+                )
+                cls._put('orders', order_id, _apply_fields(order_data, update_data))
+                cls._put('deliveries', new_logs[0]['logId'], order_rules.delivery_index_entry(
+                    order_id, order_data.get('userId', ''), new_logs[0]
+                ))
+
+            logger.info(f"Delivery log added for order {order_id}")
+            return True, results[0]
+        except Exception as e:
+            logger.error(f"Error adding delivery log: {e}")
+            return False, str(e)
+
+    @classmethod
+    def add_delivery_logs(cls, deliveries):
+        """批次新增出貨紀錄（出貨日整批登錄，單一交易）
+
+        Returns:
+            (True, results)：results 與 deliveries 順序一致
+        """
+        if len(deliveries) > cls.MAX_BULK_DELIVERIES:
+            return False, f"單次最多登錄 {cls.MAX_BULK_DELIVERIES} 筆出貨"
+
+        try:
+            results = [None] * len(deliveries)
+            grouped = {}
+            for index, item in enumerate(deliveries):
+                grouped.setdefault(item['orderId'], []).append(index)
+
+            with cls._transaction():
+                orders = cls._get_many('orders', list(grouped))
+                for order_id, indexes in grouped.items():
+                    order_data = orders.get(order_id)
+                    if order_data is None:
+                        for index in indexes:
+                            results[index] = {"orderId": order_id, "success": False, "msg": "訂單不存在"}
+                        continue
+
+                    user_id = order_data.get('userId', '')
+                    entries = [
+                        (deliveries[i]['qty'], deliveries[i].get('address', ''), deliveries[i].get('delivery_date', ''))
+                        for i in indexes
+                    ]
+                    update_data, new_logs, order_results = order_rules.delivery_update(order_data, entries)
+                    cls._put('orders', order_id, _apply_fields(order_data, update_data))
+                    for new_log in new_logs:
+                        cls._put('deliveries', new_log['logId'],
+                                 order_rules.delivery_index_entry(order_id, user_id, new_log))
+                    for index, entry, result in zip(indexes, entries, order_results):
+                        results[index] = {"orderId": order_id, "success": True, "userId": user_id, "qty": entry[0], **result}
+
+            succeeded = sum(1 for r in results if r['success'])
+            logger.info(f"Bulk delivery logs added: {succeeded}/{len(deliveries)}")
+            return True, results
+        except Exception as e:
+            logger.error(f"Error adding delivery logs: {e}")
+            return False, str(e)
+
+    @classmethod
+    def correct_delivery_log(cls, order_id, log_index, new_qty, new_address="", new_delivery_date=""):
+        """修正出貨紀錄"""
+        try:
+            with cls._transaction():
+                order_data = cls._get('orders', order_id)
+                if order_data is None:
+                    return False, "訂單不存在"
+
+                correction = order_rules.delivery_correction(
+                    order_id, order_data, log_index, new_qty, new_address, new_delivery_date
+                )
+                if correction is None:
+                    return False, "出貨紀錄不存在"
+                update_data, corrected_log, result = correction
+
+                cls._put('orders', order_id, _apply_fields(order_data, update_data))
+                cls._put('deliveries', corrected_log['logId'], order_rules.delivery_index_entry(
+                    order_id, order_data.get('userId', ''), corrected_log
+                ))
+
+            logger.info(f"Delivery log corrected for order {order_id}")
+            return True, result
+        except Exception as e:
+            logger.error(f"Error correcting delivery log: {e}")
+            return False, str(e)
+
+    @classmethod
+    def update_order_status(cls, order_id, status):
+        """更新訂單狀態（取消時釋放預留庫存）"""
+        try:
+            with cls._transaction():
+                order_data = cls._get('orders', order_id)
+                if order_data is None:
+                    logger.error(f"Order not found when updating status: {order_id}")
+                    return False, cls.ORDER_NOT_FOUND_MSG
+                fields = {'status': status, 'updatedAt': datetime.now(TW_TZ)}
+                stock_change = order_rules.status_stock_changes(order_data, status)
+                if stock_change:
+                    changes, reason, reserve, reserved_after = stock_change
+                    success, result = cls._apply_stock_changes(changes, reason, "system", reserve=reserve)
+                    if not success:
+                        raise OrderStockError(result)
+                    fields['stockReserved'] = reserved_after
+                cls._put('orders', order_id, _apply_fields(order_data, fields))
+            logger.info(f"Order {order_id} status updated to {status}")
+            return True, "訂單狀態已更新"
+        except OrderStockError as e:
+            logger.error(f"Order {order_id} status not updated to {status}: {e}")
+            return False, str(e)
+        except Exception as e:
+            logger.error(f"Error updating order status: {e}")
+            return False, str(e)
+
+    @classmethod
+    def update_order_payment_status(cls, order_id, payment_status):
+        """更新訂單付款狀態"""
+        try:
+            with cls._transaction():
+                order_data = cls._get('orders', order_id)
+                if order_data is None:
+                    logger.error(f"Order not found when updating payment status: {order_id}")
+                    return False, cls.ORDER_NOT_FOUND_MSG
+                error = order_rules.payment_status_error(order_data, payment_status)
+                if error:
+                    raise OrderStockError(error)
+                cls._put('orders', order_id, _apply_fields(order_data, {
+                    'paymentStatus': payment_status, 'updatedAt': datetime.now(TW_TZ)
+                }))
+            logger.info(f"Order {order_id} payment status updated to {payment_status}")
+            return True, "付款狀態已更新"
+        except OrderStockError as e:
+            logger.error(f"Order {order_id} payment status not updated to {payment_status}: {e}")
+            return False, str(e)
+        except Exception as e:
+            logger.error(f"Error updating payment status: {e}")
+            return False, str(e)
+
+    @classmethod
+    def get_order_stats(cls, days=30, months=12):
+        """後台儀表板統計（直接由訂單計算，不需維護計數文件）"""
+        try:
+            flat = {}
+            for _, order_data in cls._select('orders'):
+                for path, value in order_rules.order_stats_contribution(order_data).items():
+                    flat[path] = flat.get(path, 0) + value
+            totals = order_rules.nest_order_stats(flat)
+            return True, order_rules.summarize_order_stats(totals, days, months)
+        except Exception as e:
+            logger.error(f"Error getting order stats: {e}")
+            return False, str(e)
+
+    @classmethod
+    def add_audit_log(cls, order_id, operation, admin_name, before_value, after_value, reason):
+        """新增審計日誌"""
+        try:
+            cls._put('auditLogs', _new_id(), {
+                'timestamp': datetime.now(TW_TZ).isoformat(),
+                'orderId': order_id,
+                'operation': operation,
+                'adminName': admin_name,
+                'beforeValue': before_value,
+                'afterValue': after_value,
+                'reason': reason
+            })
+            logger.info(f"Audit log added: {operation} on {order_id}")
+            return True, {"orderId": order_id, "operation": operation}
+        except Exception as e:
+            logger.error(f"Error adding audit log: {e}")
+            return False, str(e)
+
+    @classmethod
+    def get_delivery_audit_logs(cls, order_id):
+        """取得特定訂單的審計日誌"""
+        try:
+            return [data for _, data in cls._select('auditLogs', [('orderId', '==', order_id)])]
+        except Exception as e:
+            logger.error(f"Error getting audit logs: {e}")
+            return []
+
+    # ===== 商品管理 =====
+
+    @classmethod
+    def add_product(cls, name, unit, price, cost, stock, min_stock_alert=10, max_stock_alert=1000, category_id="", supplier_id="", description="", image="", actual_quantity=1):
+        """新增商品"""
+        try:
+            product_id = f"prod_{datetime.now(TW_TZ).strftime('%Y%m%d%H%M%S')}"
+            cls._put('products', product_id, {
+                'productId': product_id,
+                'name': name,
+                'description': description,
+                'unit': unit,
+                'price': float(price),
+                'cost': float(cost),
+                'stock': int(stock),
+                'minStockAlert': int(min_stock_alert),
+                'maxStockAlert': int(max_stock_alert),
+                'categoryId': category_id,
+                'supplierId': supplier_id,
+                'image': image,
+                'actualQuantity': int(actual_quantity),
+                'status': 'active',
+                'createdAt': datetime.now(TW_TZ),
+                'updatedAt': datetime.now(TW_TZ)
+            })
+            logger.info(f"Product added: {product_id}")
+            return True, product_id
+        except Exception as e:
+            logger.error(f"Error adding product: {e}")
+            return False, str(e)
+
+    @classmethod
+    def get_all_products(cls):
+        """取得所有未刪除的商品（status 索引）"""
+        try:
+            products = [data for _, data in cls._select('products', [('status', '!=', 'deleted')])]
+            logger.info(f"Retrieved {len(products)} products")
+            return True, products
+        except Exception as e:
+            logger.error(f"Error getting products: {e}")
+            return False, str(e)
+
+    @classmethod
+    def get_product(cls, product_id):
+        """取得單一商品"""
+        try:
+            data = cls._get('products', product_id)
+            if data is not None:
+                return True, data
+            return False, "商品不存在"
+        except Exception as e:
+            logger.error(f"Error getting product: {e}")
+            return False, str(e)
+
+    @classmethod
+    def update_product(cls, product_id, **kwargs):
+        """更新商品資料"""
+        try:
+            cls._update('products', product_id, {'updatedAt': datetime.now(TW_TZ), **kwargs})
+            logger.info(f"Product updated: {product_id}")
+            return True, "商品已更新"
+        except Exception as e:
+            logger.error(f"Error updating product: {e}")
+            return False, str(e)
+
+    @classmethod
+    def delete_product(cls, product_id):
+        """刪除商品（軟刪除）"""
+        try:
+            cls._update('products', product_id, {'status': 'deleted', 'updatedAt': datetime.now(TW_TZ)})
+            logger.info(f"Product deleted: {product_id}")
+            return True, "商品已刪除"
+        except Exception as e:
+            logger.error(f"Error deleting product: {e}")
+            return False, str(e)
+
+    @classmethod
+    def _apply_stock_changes(cls, changes, reason, operator, reserve=False):
+        """在交易中檢查並寫入庫存與異動紀錄（需在 _transaction 內呼叫）
+
+        reserve: 下單預留庫存，商品須為上架狀態
+
+        Returns:
+            (True, {product_id: {"oldStock", "newStock"}}) 或 (False, 錯誤訊息)
+        """
+        products = cls._get_many('products', list(changes))
+
+        # 先全部檢查，任一商品不合法則整批不寫入
+        planned = []
+        for product_id, qty_change in changes.items():
+            product = products.get(product_id)
+            error = order_rules.stock_product_error(product_id, product, len(changes) == 1, reserve)
+            if error:
+                return False, error
+
+            old_stock = product.get('stock', 0)
+            new_stock = old_stock + qty_change
+            if new_stock < 0:
+                return False, order_rules.insufficient_stock_message(product_id, product, old_stock, len(changes) == 1)
+            planned.append((product_id, product, qty_change, old_stock, new_stock))
+
+        now = datetime.now(TW_TZ)
+        results = {}
+        for product_id, product, qty_change, old_stock, new_stock in planned:
+            product.update({'stock': new_stock, 'updatedAt': now})
+            cls._put('products', product_id, product)
+            cls._put('stockLogs', _new_id(), order_rules.stock_log_entry(
+                product_id, product, qty_change, old_stock, new_stock, reason, operator, now
+            ))
+            results[product_id] = {"oldStock": old_stock, "newStock": new_stock}
+        return True, results
+
+    @classmethod
+    def set_stock_shards(cls, product_id, shards):
+        """SQLite 的寫入已由單一寫入鎖序列化，庫存不分片"""
+        return False, "SQLite 後端不支援庫存分片"
+
+    @classmethod
+    def update_product_stock(cls, product_id, qty_change, reason, operator="admin"):
+        """更新商品庫存並記錄"""
+        try:
+            with cls._transaction():
+                success, result = cls._apply_stock_changes({product_id: qty_change}, reason, operator)
+            if not success:
+                return False, result
+
+            logger.info(f"Stock updated: {product_id}, change: {qty_change}")
+            return True, {
+                **result[product_id],
+                "timestamp": datetime.now(TW_TZ).isoformat()
+            }
+        except Exception as e:
+            logger.error(f"Error updating stock: {e}")
+            return False, str(e)
+
+    @classmethod
+    def update_products_stock(cls, changes, reason, operator="admin"):
+        """批次更新多個商品庫存（單一交易，全部成功或全部不變）"""
+        try:
+            merged = {}
+            for change in changes:
+                product_id = change.get('productId')
+                if not product_id:
+                    return False, "缺少商品 ID"
+                merged[product_id] = merged.get(product_id, 0) + int(change.get('qtyChange', 0))
+
+            if not merged:
+                return False, "沒有庫存異動"
+            if len(merged) > cls.MAX_BULK_STOCK_PRODUCTS:
+                return False, f"單次最多調整 {cls.MAX_BULK_STOCK_PRODUCTS} 項商品"
+
+            with cls._transaction():
+                success, result = cls._apply_stock_changes(merged, reason, operator)
+            if not success:
+                return False, result
+
+            logger.info(f"Bulk stock updated: {len(merged)} products")
+            return True, result
+        except Exception as e:
+            logger.error(f"Error bulk updating stock: {e}")
+            return False, str(e)
+
+    @classmethod
+    def get_stock_logs(cls, product_id=None, limit=100):
+        """取得庫存異動記錄（timestamp 索引）"""
+        try:
+            where = [('productId', '==', product_id)] if product_id else []
+            logs = [data for _, data in cls._select('stockLogs', where, order_by=[('timestamp', True)], limit=limit)]
+            logger.info(f"Retrieved {len(logs)} stock logs")
+            return True, logs
+        except Exception as e:
+            logger.error(f"Error getting stock logs: {e}")
+            return False, str(e)
+
+    @classmethod
+    def get_low_stock_products(cls):
+        """取得庫存不足的商品"""
+        try:
+            low_stock = [
+                product for _, product in cls._select('products', [('status', '!=', 'deleted')])
+                if product.get('stock', 0) <= product.get('minStockAlert', 10)
+            ]
+            logger.info(f"Retrieved {len(low_stock)} low stock products")
+            return True, low_stock
+        except Exception as e:
+            logger.error(f"Error getting low stock products: {e}")
+            return False, str(e)
+
+    # ===== 分類管理 =====
+
+    @classmethod
+    def add_category(cls, name, description="", color="", icon=""):
+        """新增分類"""
+        try:
+            category_id = _new_id()
+            cls._put('categories', category_id, {
+                'name': name,
+                'description': description,
+                'color': color,
+                'icon': icon,
+                'status': 'active',
+                'createdAt': datetime.now(TW_TZ),
+                'updatedAt': datetime.now(TW_TZ)
+            })
+            logger.info(f"Category added: {category_id}")
+            return True, category_id
+        except Exception as e:
+            logger.error(f"Error adding category: {e}")
+            return False, str(e)
+
+    @classmethod
+    def get_all_categories(cls):
+        """取得所有分類"""
+        try:
+            categories = [{'id': doc_id, **data}
+                          for doc_id, data in cls._select('categories', [('status', '!=', 'deleted')])]
+            logger.info(f"Retrieved {len(categories)} categories")
+            return True, categories
+        except Exception as e:
+            logger.error(f"Error getting categories: {e}")
+            return False, str(e)
+
+    @classmethod
+    def get_category(cls, category_id):
+        """取得單一分類"""
+        try:
+            data = cls._get('categories', category_id)
+            if data is None:
+                return False, "分類不存在"
+            return True, {'id': category_id, **data}
+        except Exception as e:
+            logger.error(f"Error getting category: {e}")
+            return False, str(e)
+
+    @classmethod
+    def update_category(cls, category_id, **kwargs):
+        """更新分類"""
+        try:
+            cls._update('categories', category_id, {**kwargs, 'updatedAt': datetime.now(TW_TZ)})
+            logger.info(f"Category updated: {category_id}")
+            return True, "分類已更新"
+        except Exception as e:
+            logger.error(f"Error updating category: {e}")
+            return False, str(e)
+
+    @classmethod
+    def delete_category(cls, category_id):
+        """刪除分類 (軟刪除)"""
+        try:
+            cls._update('categories', category_id, {'status': 'deleted', 'updatedAt': datetime.now(TW_TZ)})
+            logger.info(f"Category deleted: {category_id}")
+            return True, "分類已刪除"
+        except Exception as e:
+            logger.error(f"Error deleting category: {e}")
+            return False, str(e)
+
+    # ===== 折扣管理 =====
+
+    @classmethod
+    def add_discount(cls, name, discount_type, discount_value, target_type="product",
+                     target_id=None, start_date=None, end_date=None, description=""):
+        """新增折扣"""
+        try:
+            discount_id = _new_id()
+            cls._put('discounts', discount_id, {
+                'name': name,
+                'discountType': discount_type,
+                'discountValue': discount_value,
+                'targetType': target_type,
+                'targetId': target_id,
+                'startDate': start_date,
+                'endDate': end_date,
+                'description': description,
+                'status': 'active',
+                'createdAt': datetime.now(TW_TZ),
+                'updatedAt': datetime.now(TW_TZ)
+            })
+            logger.info(f"Discount added: {discount_id}")
+            return True, discount_id
+        except Exception as e:
+            logger.error(f"Error adding discount: {e}")
+            return False, str(e)
+
+    @classmethod
+    def get_all_discounts(cls):
+        """取得所有折扣"""
+        try:
+            discounts = [{'id': doc_id, **data}
+                         for doc_id, data in cls._select('discounts', [('status', '!=', 'deleted')])]
+            logger.info(f"Retrieved {len(discounts)} discounts")
+            return True, discounts
+        except Exception as e:
+            logger.error(f"Error getting discounts: {e}")
+            return False, str(e)
+
+    @classmethod
+    def get_discount(cls, discount_id):
+        """取得單一折扣"""
+        try:
+            data = cls._get('discounts', discount_id)
+            if data is None:
+                return False, "折扣不存在"
+            return True, {'id': discount_id, **data}
+        except Exception as e:
+            logger.error(f"Error getting discount: {e}")
+            return False, str(e)
+
+    @classmethod
+    def update_discount(cls, discount_id, **kwargs):
+        """更新折扣"""
+        try:
+            cls._update('discounts', discount_id, {**kwargs, 'updatedAt': datetime.now(TW_TZ)})
+            logger.info(f"Discount updated: {discount_id}")
+            return True, "折扣已更新"
+        except Exception as e:
+            logger.error(f"Error updating discount: {e}")
+            return False, str(e)
+
+    @classmethod
+    def delete_discount(cls, discount_id):
+        """刪除折扣 (軟刪除)"""
+        try:
+            cls._update('discounts', discount_id, {'status': 'deleted', 'updatedAt': datetime.now(TW_TZ)})
+            logger.info(f"Discount deleted: {discount_id}")
+            return True, "折扣已刪除"
+        except Exception as e:
+            logger.error(f"Error deleting discount: {e}")
+            return False, str(e)
+
+    @classmethod
+    def get_active_discounts(cls):
+        """取得所有啟用中的折扣（不檢查有效期間；供折扣索引載入）"""
+        try:
+            return True, [{'id': doc_id, **data}
+                          for doc_id, data in cls._select('discounts', [('status', '==', 'active')])]
+        except Exception as e:
+            logger.error(f"Error getting active discounts: {e}")
+            return False, str(e)
+
+    @classmethod
+    def get_applicable_discounts(cls, product_id, category_id=None, member_level=None):
+        """取得適用的折扣（商品、分類與會員等級折扣，只回傳在有效期間內的）"""
+        try:
+            now = datetime.now(TW_TZ)
+            discounts = []
+            for target_type, target_id in FirestoreService._discount_targets(product_id, category_id, member_level):
+                docs = cls._select('discounts', [
+                    ('status', '==', 'active'),
+                    ('targetType', '==', target_type),
+                    ('targetId', '==', target_id)
+                ])
+                for doc_id, discount in docs:
+                    if FirestoreService._in_discount_window(FirestoreService._discount_window(discount), now):
+                        discounts.append({'id': doc_id, **discount})
+            return True, discounts
+        except Exception as e:
+            logger.error(f"Error getting applicable discounts: {e}")
+            return False, str(e)
+
+    # ===== 庫存警告 =====
+
+    @classmethod
+    def _bump_stock_alert_version(cls):
+        """遞增警告清單版本（需在交易中呼叫）"""
+        meta = cls._get(FirestoreService.STOCK_ALERT_META_COLLECTION, FirestoreService.STOCK_ALERT_VERSION_DOC) or {}
+        cls._put(FirestoreService.STOCK_ALERT_META_COLLECTION, FirestoreService.STOCK_ALERT_VERSION_DOC, {
+            'version': int(meta.get('version', 0)) + 1,
+            'updatedAt': datetime.now(TW_TZ)
+        })
+
+    @classmethod
+    def add_stock_alert(cls, product_id, alert_type, threshold, operator="system"):
+        """新增庫存警告"""
+        try:
+            with cls._transaction():
+                cls._put('stockAlerts', _new_id(), {
+                    'productId': product_id,
+                    'alertType': alert_type,
+                    'threshold': threshold,
+                    'status': 'active',
+                    'operator': operator,
+                    'createdAt': datetime.now(TW_TZ),
+                    'acknowledgedAt': None,
+                    'acknowledgedBy': None
+                })
+                cls._bump_stock_alert_version()
+            logger.info(f"Stock alert added: {product_id} - {alert_type}")
+            return True, "警告已記錄"
+        except Exception as e:
+            logger.error(f"Error adding stock alert: {e}")
+            return False, str(e)
+
+    @classmethod
+    def _stock_alerts(cls, status='active', alert_type=None, limit=None, start_after=None):
+        """庫存警告（依 createdAt、id 倒序）"""
+        where = [('status', '==', status)] if status else []
+        if alert_type:
+            where.append(('alertType', '==', alert_type))
+        after = list(FirestoreService._decode_order_cursor(start_after)) if start_after else None
+        return [{'id': doc_id, **data}
+                for doc_id, data in cls._select('stockAlerts', where, order_by=[('createdAt', True), ('__name__', True)],
+                                                limit=limit, after=after)]
+
+    @classmethod
+    def get_stock_alerts(cls, status='active', alert_type=None):
+        """取得庫存警告（依 createdAt 倒序）"""
+        try:
+            alerts = cls._stock_alerts(status, alert_type)
+            logger.info(f"Retrieved {len(alerts)} stock alerts")
+            return True, alerts
+        except Exception as e:
+            logger.error(f"Error getting stock alerts: {e}")
+            return False, str(e)
+
+    @classmethod
+    def get_stock_alerts_page(cls, status='active', alert_type=None, limit=50, start_after=None):
+        """分頁取得庫存警告（依 createdAt 倒序）
+
+        Returns:
+            (True, {"alerts": [...], "nextCursor": str | None, "hasMore": bool})
+        """
+        try:
+            # 多取一筆以判斷是否還有下一頁
+            alerts = cls._stock_alerts(status, alert_type, limit + 1, start_after)
+            has_more = len(alerts) > limit
+            alerts = alerts[:limit]
+
+            next_cursor = None
+            if has_more and alerts:
+                last = alerts[-1]
+                next_cursor = FirestoreService._encode_order_cursor(last.get('createdAt'), last['id'])
+            return True, {"alerts": alerts, "nextCursor": next_cursor, "hasMore": has_more}
+        except Exception as e:
+            logger.error(f"Error getting stock alerts page: {e}")
+            return False, str(e)
+
+    @classmethod
+    def get_stock_alerts_version(cls):
+        """取得警告清單版本（尚未有任何警告時為 0）"""
+        try:
+            meta = cls._get(FirestoreService.STOCK_ALERT_META_COLLECTION, FirestoreService.STOCK_ALERT_VERSION_DOC) or {}
+            return True, int(meta.get('version', 0))
+        except Exception as e:
+            logger.error(f"Error getting stock alerts version: {e}")
+            return False, str(e)
+
+    @classmethod
+    def acknowledge_stock_alert(cls, alert_id, acknowledged_by="admin"):
+        """確認庫存警告"""
+        try:
+            with cls._transaction():
+                data = cls._get('stockAlerts', alert_id)
+                if data is None:
+                    raise DocumentNotFound(f"No document to update: stockAlerts/{alert_id}")
+                cls._put('stockAlerts', alert_id, _apply_fields(data, {
+                    'status': 'acknowledged',
+                    'acknowledgedAt': datetime.now(TW_TZ),
+                    'acknowledgedBy': acknowledged_by
+                }))
+                cls._bump_stock_alert_version()
+            logger.info(f"Stock alert acknowledged: {alert_id}")
+            return True, "警告已確認"
+        except Exception as e:
+            logger.error(f"Error acknowledging stock alert: {e}")
+            return False, str(e)
+
+    @classmethod
+    def check_and_create_stock_alerts(cls, product_id):
+        """檢查並創建庫存警告"""
+        try:
+            product = cls._get('products', product_id)
+            if product is None:
+                return False, "商品不存在"
+
+            stock = product.get('stock', 0)
+            min_stock_alert = product.get('minStockAlert', 10)
+            max_stock_alert = product.get('maxStockAlert', 1000)
+
+            # 檢查超低庫存 (低於最低值的 30%)
+            critical_level = min_stock_alert * 0.3
+            if stock < critical_level:
+                cls.add_stock_alert(product_id, 'critical', critical_level)
+            if stock <= min_stock_alert:
+                cls.add_stock_alert(product_id, 'low', min_stock_alert)
+            if stock > max_stock_alert:
+                cls.add_stock_alert(product_id, 'high', max_stock_alert)
+
+            return True, "警告檢查完成"
+        except Exception as e:
+            logger.error(f"Error checking stock alerts: {e}")
+            return False, str(e)
+
+    # ===== LINE 推播 outbox =====
+
+    @classmethod
+    def add_line_outbox(cls, message_id, user_id, text):
+        """寫入待送出的 LINE 推播訊息（送出成功後刪除）"""
+        try:
+            now = datetime.now(TW_TZ)
+            cls._put('lineOutbox', message_id, {
+                'messageId': message_id,
+                'userId': user_id,
+                'text': text,
+                'status': 'pending',
+                'attempts': 0,
+                'lastError': '',
+                'createdAt': now,
+                'updatedAt': now
+            })
+            return True, message_id
+        except Exception as e:
+            logger.error(f"Error adding LINE outbox message: {e}")
+            return False, str(e)
+
+    @classmethod
+    def update_line_outbox(cls, message_id, **kwargs):
+        """更新 outbox 訊息狀態"""
+        try:
+            cls._update('lineOutbox', message_id, {**kwargs, 'updatedAt': datetime.now(TW_TZ)})
+            return True, "訊息已更新"
+        except Exception as e:
+            logger.error(f"Error updating LINE outbox message {message_id}: {e}")
+            return False, str(e)
+
+    @classmethod
+    def delete_line_outbox(cls, message_id):
+        """刪除已送出的 outbox 訊息"""
+        try:
+            cls._delete('lineOutbox', message_id)
+            return True, "訊息已刪除"
+        except Exception as e:
+            logger.error(f"Error deleting LINE outbox message {message_id}: {e}")
+            return False, str(e)
+
+    @classmethod
+    def claim_stale_line_outbox(cls, lease_seconds, limit=500):
+        """認領逾時未送出的 outbox 訊息（updatedAt 超過 lease_seconds 未更新的 pending 訊息）"""
+        try:
+            now = datetime.now(TW_TZ)
+            with cls._transaction():
+                docs = cls._select('lineOutbox', [
+                    ('status', '==', 'pending'), ('updatedAt', '<=', now - timedelta(seconds=lease_seconds))
+                ], order_by=[('updatedAt', False)], limit=limit)
+                for doc_id, data in docs:
+                    data['updatedAt'] = now
+                    cls._put('lineOutbox', doc_id, data)
+            return True, [data for _, data in docs]
+        except Exception as e:
+            logger.error(f"Error claiming stale LINE outbox messages: {e}")
+            return False, str(e)
+
+    # ===== 會員 LINE ID 驗證令牌 =====
+
+    @classmethod
+    def add_verification_token(cls, token, user_id, expires_at):
+        """儲存 LINE ID 綁定驗證令牌"""
+        try:
+            cls._put('verificationTokens', token, {
+                'userId': user_id,
+                'createdAt': datetime.now(TW_TZ),
+                'expiresAt': expires_at
+            })
+            return True, token
+        except Exception as e:
+            logger.error(f"Error adding verification token: {e}")
+            return False, str(e)
+
+    @classmethod
+    def get_verification_token(cls, token):
+        """取得驗證令牌；不存在時回傳 (True, None)"""
+        try:
+            return True, cls._get('verificationTokens', token)
+        except Exception as e:
+            logger.error(f"Error getting verification token: {e}")
+            return False, str(e)
+
+    @classmethod
+    def delete_verification_token(cls, token):
+        """刪除已使用或已過期的驗證令牌"""
+        try:
+            cls._delete('verificationTokens', token)
+            return True, "令牌已刪除"
+        except Exception as e:
+            logger.error(f"Error deleting verification token: {e}")
+            return False, str(e)
+
+    # ===== 資料維護 =====
+
+    @classmethod
+    def clear_collection(cls, collection):
+        """刪除集合內所有文件
+
+        Returns:
+            (True, 刪除筆數) 或 (False, 錯誤訊息)
+        """
+        try:
+            _, deleted = cls._execute(f'DELETE FROM "{cls._table(collection)}"')
+            return True, deleted
+        except Exception as e:
+            logger.error(f"Error clearing collection {collection}: {e}")
+            return False, str(e)
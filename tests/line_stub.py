@@ -0,0 +1,79 @@
+"""
+本機 LINE Messaging API stub
+
+只實作 POST /v2/bot/message/push，記錄收到的請求並可指定回應狀態碼，
+供背景派送器測試或本機開發時使用（不會真的發送 LINE 訊息）。
+
+單獨執行：
+  python -m tests.line_stub 8081
+  LINE_API_HOST=http://127.0.0.1:8081 python app.py
+"""
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class LINEStubServer:
+    """在背景執行緒中執行的 LINE API stub"""
+
+    def __init__(self, port=0):
+        self.requests = []
+        self.responses = []  # 依序回應的狀態碼，用完後一律回 200
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._make_handler())
+        self._thread = None
+
+    @property
+    def host(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length) or b'{}')
+                with stub._lock:
+                    stub.requests.append({
+                        'path': self.path,
+                        'headers': dict(self.headers),
+                        'body': body
+                    })
+                    status = stub.responses.pop(0) if stub.responses else 200
+
+                if status == 200:
+                    sent = [{'id': str(len(stub.requests)), 'quoteToken': 'stub'}]
+                    payload = json.dumps({'sentMessages': sent}).encode()
+                else:
+                    payload = json.dumps({'message': 'stub error'}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8081
+    server = LINEStubServer(port)
+    print(f"LINE API stub listening on {server.host}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -3,6 +3,7 @@
 """
 import unittest
 import json
+from contextlib import contextmanager
 from unittest.mock import patch, MagicMock
 import sys
 import os
@@ -11,6 +12,20 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.environ['FLASK_ENV'] = 'testing'
 
 from app import app
+from services.database_adapter import DatabaseAdapter, DatabaseCache
+from services.sqlite_service import SQLiteService
+
+
+@contextmanager
+def sqlite_backend():
+    """以記憶體 SQLite 後端執行管理 API（含商品 p1，庫存 10）"""
+    SQLiteService.init(':memory:')
+    SQLiteService.load('products', 'p1', {'productId': 'p1', 'name': '土雞蛋', 'price': 250, 'stock': 10,
+                                          'status': 'active', 'actualQuantity': 1})
+    DatabaseCache.clear()
+    with patch.object(DatabaseAdapter, 'get_service', return_value=SQLiteService):
+        yield SQLiteService
+    DatabaseCache.clear()
 
 
 class TestAdminRoutesBase(unittest.TestCase):
@@ -44,6 +59,10 @@ class TestAdminAuth(TestAdminRoutesBase):
         response = self.client.get('/api/admin/members')
         self.assertEqual(response.status_code, 401)
 
+    def test_export_orders_unauthorized(self):
+        response = self.client.get('/api/admin/orders/export')
+        self.assertEqual(response.status_code, 401)
+
     def test_add_delivery_unauthorized(self):
         response = self.client.post('/api/admin/order/add_delivery', json={})
         self.assertEqual(response.status_code, 401)
@@ -52,6 +71,10 @@ class TestAdminAuth(TestAdminRoutesBase):
         response = self.client.get('/api/admin/reports/delivery-records')
         self.assertEqual(response.status_code, 401)
 
+    def test_dashboard_stats_unauthorized(self):
+        response = self.client.get('/api/admin/stats')
+        self.assertEqual(response.status_code, 401)
+
 
 # ===== 取得所有訂單 =====
 
@@ -85,6 +108,64 @@ class TestGetAllOrders(TestAdminRoutesBase):
         self.assertEqual(response.status_code, 500)
 
 
+    @patch('services.database_adapter.DatabaseAdapter.get_orders_page')
+    def test_paginated_mode(self, mock_page):
+        self.login()
+        mock_page.return_value = (True, {
+            'orders': [{'orderId': 'ORD002', 'customer': {}}],
+            'nextCursor': '2026-03-02T00:00:00|ORD002',
+            'hasMore': True
+        })
+        response = self.client.get('/api/admin/orders?limit=1&status=已確認')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['status'], 'success')
+        self.assertTrue(data['hasMore'])
+        self.assertEqual(data['orders'][0]['orderId'], 'ORD002')
+        kwargs = mock_page.call_args[1]
+        self.assertEqual(kwargs['limit'], 1)
+        self.assertEqual(kwargs['status'], '已確認')
+
+    @patch('services.database_adapter.DatabaseAdapter.get_orders_page')
+    def test_paginated_limit_is_capped(self, mock_page):
+        self.login()
+        mock_page.return_value = (True, {'orders': [], 'nextCursor': None, 'hasMore': False})
+        self.client.get('/api/admin/orders?limit=100000')
+        self.assertEqual(mock_page.call_args[1]['limit'], 500)
+
+    def test_paginated_invalid_limit_returns_400(self):
+        self.login()
+        response = self.client.get('/api/admin/orders?limit=abc')
+        self.assertEqual(response.status_code, 400)
+
+    def test_paginated_invalid_date_returns_400(self):
+        self.login()
+        response = self.client.get('/api/admin/orders?dateFrom=20260301')
+        self.assertEqual(response.status_code, 400)
+
+
+# ===== 取得單一訂單 =====
+
+class TestGetOrder(TestAdminRoutesBase):
+
+    @patch('services.database_adapter.DatabaseAdapter.get_order_with_member')
+    def test_success(self, mock_get):
+        self.login()
+        mock_get.return_value = (True, {'orderId': 'ORD001', 'customer': {'name': '王小明'}})
+        response = self.client.get('/api/admin/order/ORD001')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['order']['customer']['name'], '王小明')
+        mock_get.assert_called_once_with('ORD001')
+
+    @patch('services.database_adapter.DatabaseAdapter.get_order_with_member')
+    def test_not_found(self, mock_get):
+        self.login()
+        mock_get.return_value = (False, '訂單不存在')
+        response = self.client.get('/api/admin/order/ORD999')
+        self.assertEqual(response.status_code, 404)
+
+
 # ===== 更新訂單狀態 =====
 
 class TestUpdateOrderStatus(TestAdminRoutesBase):
@@ -93,7 +174,7 @@ class TestUpdateOrderStatus(TestAdminRoutesBase):
     @patch('services.database_adapter.DatabaseAdapter.update_order_status')
     def test_success_with_line_notification(self, mock_update, mock_line):
         self.login()
-        mock_update.return_value = True
+        mock_update.return_value = (True, '訂單狀態已更新')
         response = self.client.post('/api/admin/order/update_status', json={
             'orderId': 'ORD001', 'status': '已確認', 'userId': 'U123'
         })
@@ -105,7 +186,7 @@ class TestUpdateOrderStatus(TestAdminRoutesBase):
     @patch('services.database_adapter.DatabaseAdapter.update_order_status')
     def test_success_without_user_id_skips_line(self, mock_update, mock_line):
         self.login()
-        mock_update.return_value = True
+        mock_update.return_value = (True, '訂單狀態已更新')
         response = self.client.post('/api/admin/order/update_status', json={
             'orderId': 'ORD001', 'status': '已確認'
         })
@@ -125,12 +206,34 @@ class TestUpdateOrderStatus(TestAdminRoutesBase):
     @patch('services.database_adapter.DatabaseAdapter.update_order_status')
     def test_order_not_found(self, mock_update):
         self.login()
-        mock_update.return_value = False
+        mock_update.return_value = (False, '訂單不存在')
         response = self.client.post('/api/admin/order/update_status', json={
             'orderId': 'ORD999', 'status': '已確認'
         })
         self.assertEqual(response.status_code, 404)
 
+    @patch('services.line_service.LINEService.send_status_update')
+    def test_reopen_without_stock_rejected(self, mock_line):
+        """庫存不足無法恢復已取消的訂單：回 400 與原因，而非訂單不存在"""
+        self.login()
+        with sqlite_backend() as service:
+            service.place_order('ORD1', 'U1', '土雞蛋 x3', 750, '處理中', '未付款', 'transfer',
+                                [{'productId': 'p1', 'qty': 3}])
+            service.update_order_status('ORD1', '已取消')
+            service.update_products_stock([{'productId': 'p1', 'qtyChange': -9}], '盤點')
+            response = self.client.post('/api/admin/order/update_status', json={
+                'orderId': 'ORD1', 'status': '處理中', 'userId': 'U1'
+            })
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('庫存不足', json.loads(response.data)['msg'])
+            self.assertEqual(service.get_order_by_id('ORD1')[1]['status'], '已取消')
+
+            response = self.client.post('/api/admin/order/update_status', json={
+                'orderId': 'ORD404', 'status': '處理中'
+            })
+            self.assertEqual(response.status_code, 404)
+        mock_line.assert_not_called()
+
 
 # ===== 更新付款狀態 =====
 
@@ -139,7 +242,7 @@ class TestUpdatePaymentStatus(TestAdminRoutesBase):
     @patch('services.database_adapter.DatabaseAdapter.update_order_payment_status')
     def test_success(self, mock_update):
         self.login()
-        mock_update.return_value = True
+        mock_update.return_value = (True, '付款狀態已更新')
         response = self.client.post('/api/admin/order/update_payment', json={
             'orderId': 'ORD001', 'paymentStatus': '已付款'
         })
@@ -159,12 +262,31 @@ class TestUpdatePaymentStatus(TestAdminRoutesBase):
     @patch('services.database_adapter.DatabaseAdapter.update_order_payment_status')
     def test_order_not_found(self, mock_update):
         self.login()
-        mock_update.return_value = False
+        mock_update.return_value = (False, '訂單不存在')
         response = self.client.post('/api/admin/order/update_payment', json={
             'orderId': 'ORD999', 'paymentStatus': '已付款'
         })
         self.assertEqual(response.status_code, 404)
 
+    def test_cancelled_order_cannot_be_paid(self):
+        """已取消的訂單標記為已付款：回 400 與原因，而非訂單不存在"""
+        self.login()
+        with sqlite_backend() as service:
+            service.place_order('ORD1', 'U1', '土雞蛋 x1', 250, '處理中', '未付款', 'transfer',
+                                [{'productId': 'p1', 'qty': 1}])
+            service.update_order_status('ORD1', '已取消')
+            response = self.client.post('/api/admin/order/update_payment', json={
+                'orderId': 'ORD1', 'paymentStatus': '已付款'
+            })
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('不可標記為已付款', json.loads(response.data)['msg'])
+            self.assertEqual(service.get_order_by_id('ORD1')[1]['paymentStatus'], '未付款')
+
+            response = self.client.post('/api/admin/order/update_payment', json={
+                'orderId': 'ORD404', 'paymentStatus': '已付款'
+            })
+            self.assertEqual(response.status_code, 404)
+
 
 # ===== 新增出貨紀錄 =====
 
@@ -210,6 +332,47 @@ class TestAddDeliveryLog(TestAdminRoutesBase):
         self.assertEqual(response.status_code, 400)
 
 
+class TestBulkDelivery(TestAdminRoutesBase):
+
+    @patch('services.line_service.LINEService.send_delivery_notification')
+    @patch('services.database_adapter.DatabaseAdapter.add_delivery_logs')
+    def test_returns_per_order_results(self, mock_add, mock_line):
+        self.login()
+        mock_add.return_value = (True, [
+            {'orderId': 'ORD001', 'success': True, 'userId': 'U001', 'qty': 5,
+             'status': '部分配送', 'total_delivered': 5, 'total_ordered': 10, 'delivery_date': '2026-03-18'},
+            {'orderId': 'ORD999', 'success': False, 'msg': '訂單不存在'}
+        ])
+        response = self.client.post('/api/admin/order/bulk_delivery', json={'deliveries': [
+            {'orderId': 'ORD001', 'qty': 5, 'address': '新竹市', 'delivery_date': '2026-03-18'},
+            {'orderId': 'ORD999', 'qty': 2},
+            {'orderId': 'ORD002', 'qty': 0}
+        ]})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['succeeded'], 1)
+        self.assertEqual(data['failed'], 2)
+        self.assertEqual([r['orderId'] for r in data['results']], ['ORD001', 'ORD999', 'ORD002'])
+        self.assertNotIn('userId', data['results'][0])
+        # 無效項目不送進資料庫
+        self.assertEqual(len(mock_add.call_args[0][0]), 2)
+        mock_line.assert_called_once_with('U001', 'ORD001', '2026-03-18', 5, 5)
+
+    def test_missing_list_rejected(self):
+        self.login()
+        response = self.client.post('/api/admin/order/bulk_delivery', json={})
+        self.assertEqual(response.status_code, 400)
+
+    @patch('services.database_adapter.DatabaseAdapter.add_delivery_logs')
+    def test_too_many_rejected(self, mock_add):
+        self.login()
+        mock_add.return_value = (False, '單次最多登錄 400 筆出貨')
+        response = self.client.post('/api/admin/order/bulk_delivery', json={
+            'deliveries': [{'orderId': 'ORD001', 'qty': 1}]
+        })
+        self.assertEqual(response.status_code, 400)
+
+
 # ===== 修正出貨紀錄 =====
 
 class TestCorrectDeliveryLog(TestAdminRoutesBase):
@@ -256,19 +419,63 @@ class TestCorrectDeliveryLog(TestAdminRoutesBase):
         self.assertEqual(response.status_code, 400)
 
 
+# ===== 管理者新增會員 =====
+
+class TestCreateMember(TestAdminRoutesBase):
+
+    @patch('services.database_adapter.DatabaseAdapter.get_all_members')
+    @patch('services.database_adapter.DatabaseAdapter.add_member_with_unique_phone')
+    def test_success_without_full_member_scan(self, mock_add, mock_all):
+        self.login()
+        mock_add.return_value = (True, 'ADMIN_1')
+        response = self.client.post('/api/admin/member/create', json={
+            'name': '王小明', 'phone': '0912345678', 'address': '新竹市'
+        })
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertTrue(data['userId'].startswith('ADMIN_'))
+        mock_all.assert_not_called()
+
+    @patch('services.database_adapter.DatabaseAdapter.add_member_with_unique_phone')
+    def test_duplicate_phone_rejected(self, mock_add):
+        self.login()
+        mock_add.return_value = (False, None)
+        response = self.client.post('/api/admin/member/create', json={
+            'name': '王小明', 'phone': '0912345678', 'address': '新竹市'
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('0912345678', json.loads(response.data)['msg'])
+
+    @patch('services.database_adapter.DatabaseAdapter.add_member_with_unique_phone')
+    def test_database_error_returns_500(self, mock_add):
+        self.login()
+        mock_add.return_value = (False, 'DB error')
+        response = self.client.post('/api/admin/member/create', json={
+            'name': '王小明', 'phone': '0912345678', 'address': '新竹市'
+        })
+        self.assertEqual(response.status_code, 500)
+
+    def test_missing_fields_rejected(self):
+        self.login()
+        response = self.client.post('/api/admin/member/create', json={'name': '王小明'})
+        self.assertEqual(response.status_code, 400)
+
+
 # ===== 店家為會員建立訂單 =====
 
 class TestCreateOrderForMember(TestAdminRoutesBase):
 
+    @patch('services.database_adapter.DatabaseAdapter.get_applicable_discounts_batch', return_value=(True, {}))
+    @patch('services.order_id_service.OrderIdService.next_order_id', return_value='ORD0000000000100')
     @patch('services.line_service.LINEService.send_push_message')
-    @patch('services.database_adapter.DatabaseAdapter.add_order')
+    @patch('services.database_adapter.DatabaseAdapter.place_order')
     @patch('services.database_adapter.DatabaseAdapter.get_product')
     @patch('services.database_adapter.DatabaseAdapter.get_member_by_id')
-    def test_success(self, mock_member, mock_product, mock_add, mock_line):
+    def test_success(self, mock_member, mock_product, mock_add, mock_line, mock_order_id, mock_discounts):
         self.login()
         mock_member.return_value = (True, {'name': '王小明', 'phone': '0912345678'})
         mock_product.return_value = (True, {'price': 100, 'status': 'active', 'actualQuantity': 1})
-        mock_add.return_value = True
+        mock_add.return_value = (True, {})
         response = self.client.post('/api/admin/order/create-for-member', json={
             'userId': 'U123', 'productId': 'prod_001',
             'itemName': '土雞蛋', 'qty': 5
@@ -276,8 +483,29 @@ class TestCreateOrderForMember(TestAdminRoutesBase):
         self.assertEqual(response.status_code, 200)
         data = json.loads(response.data)
         self.assertEqual(data['status'], 'success')
-        self.assertIn('orderId', data)
+        self.assertEqual(data['orderId'], 'ORD0000000000100')
         self.assertIn('王小明', data['msg'])
+        self.assertEqual(mock_add.call_args[1]['amount'], 500)
+
+    @patch('services.database_adapter.DatabaseAdapter.get_applicable_discounts_batch', return_value=(True, {}))
+    @patch('services.order_id_service.OrderIdService.next_order_id',
+           side_effect=['ORD0000000000100', 'ORD0000000000101'])
+    @patch('services.line_service.LINEService.send_push_message')
+    @patch('services.database_adapter.DatabaseAdapter.place_order')
+    @patch('services.database_adapter.DatabaseAdapter.get_product')
+    @patch('services.database_adapter.DatabaseAdapter.get_member_by_id')
+    def test_duplicate_order_id_retried(self, mock_member, mock_product, mock_add, mock_line, mock_order_id, mock_discounts):
+        self.login()
+        mock_member.return_value = (True, {'name': '王小明', 'phone': '0912345678'})
+        mock_product.return_value = (True, {'price': 100, 'status': 'active', 'actualQuantity': 1})
+        mock_add.side_effect = [(False, '訂單編號重複'), (True, {})]
+        response = self.client.post('/api/admin/order/create-for-member', json={
+            'userId': 'U123', 'productId': 'prod_001',
+            'itemName': '土雞蛋', 'qty': 5
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['orderId'], 'ORD0000000000101')
+        self.assertEqual(mock_add.call_count, 2)
 
     def test_missing_params(self):
         self.login()
@@ -324,6 +552,45 @@ class TestCreateOrderForMember(TestAdminRoutesBase):
         self.assertIn('下架', json.loads(response.data)['msg'])
 
 
+# ===== 計價 =====
+
+class TestPricingRoutes(TestAdminRoutesBase):
+
+    def setUp(self):
+        self.login()
+        patcher = patch('services.database_adapter.DatabaseAdapter.get_product',
+                        side_effect=lambda pid: (True, {'productId': pid, 'price': 250,
+                                                        'bulkPricing': [{'minQty': 10, 'price': 240}]})
+                        if pid == 'p1' else (False, '商品不存在'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch('services.database_adapter.DatabaseAdapter.get_applicable_discounts_batch',
+                        return_value=(True, {'p1': [{'id': 'd1', 'discountType': 'fixed', 'discountValue': 20}]}))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_quote_batch(self):
+        response = self.client.post('/api/admin/pricing/quote', json={
+            'lines': [{'productId': 'p1', 'qty': 2}, {'productId': 'p1', 'qty': 10}]
+        })
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual([q['amount'] for q in data['quotes']], [460, 2200])
+        self.assertEqual(data['totalAmount'], 2660)
+
+    def test_quote_unknown_product(self):
+        response = self.client.post('/api/admin/pricing/quote', json={'lines': [{'productId': 'p9', 'qty': 1}]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_price_preview(self):
+        response = self.client.get('/api/admin/product/p1/price-preview?maxQty=5000')
+        self.assertEqual(response.status_code, 200)
+        prices = json.loads(response.data)['prices']
+        self.assertEqual(len(prices), 1000)
+        self.assertEqual(prices[8], {'qty': 9, 'tierPrice': 250, 'unitPrice': 230, 'discountId': 'd1', 'amount': 2070})
+        self.assertEqual(prices[9]['unitPrice'], 220)
+
+
 # ===== 會員管理 =====
 
 class TestMemberManagement(TestAdminRoutesBase):
@@ -399,38 +666,43 @@ class TestMemberManagement(TestAdminRoutesBase):
 
 # ===== 出貨報表 =====
 
+class TestDashboardStats(TestAdminRoutesBase):
+
+    @patch('services.database_adapter.DatabaseAdapter.get_order_stats')
+    def test_success(self, mock_stats):
+        self.login()
+        mock_stats.return_value = (True, {'totalOrders': 2, 'outstandingTrays': 5})
+        response = self.client.get('/api/admin/stats?days=7&months=1000')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['stats']['outstandingTrays'], 5)
+        mock_stats.assert_called_once_with(7, 36)
+
+    def test_invalid_days_returns_400(self):
+        self.login()
+        self.assertEqual(self.client.get('/api/admin/stats?days=abc').status_code, 400)
+        self.assertEqual(self.client.get('/api/admin/stats?days=0').status_code, 400)
+
+
 class TestDeliveryReport(TestAdminRoutesBase):
 
-    @patch('services.database_adapter.DatabaseAdapter.get_all_orders_with_members')
+    @patch('services.database_adapter.DatabaseAdapter.get_delivery_records_by_date')
     def test_success_with_matching_records(self, mock_get):
         self.login()
-        mock_get.return_value = [{
+        mock_get.return_value = (True, [{
             'orderId': 'ORD001',
-            'customer': {'name': '王小明', 'phone': '0912345678'},
-            'deliveryLogs': [
-                {'delivery_date': '2026-03-18', 'qty': 5, 'address': '新竹市'}
-            ]
-        }]
+            'delivery_qty': 5,
+            'delivery_address': '新竹市',
+            'customer_name': '王小明',
+            'customer_phone': '0912345678'
+        }])
         response = self.client.get('/api/admin/reports/delivery-records?delivery_date=2026-03-18')
         self.assertEqual(response.status_code, 200)
         data = json.loads(response.data)
         self.assertEqual(data['status'], 'success')
         self.assertEqual(data['total_records'], 1)
         self.assertEqual(data['records'][0]['customer_name'], '王小明')
-
-    @patch('services.database_adapter.DatabaseAdapter.get_all_orders_with_members')
-    def test_corrected_qty_used_when_present(self, mock_get):
-        self.login()
-        mock_get.return_value = [{
-            'orderId': 'ORD001',
-            'customer': {'name': '王小明', 'phone': '0912345678'},
-            'deliveryLogs': [
-                {'delivery_date': '2026-03-18', 'qty': 5, 'corrected_qty': 3, 'address': '新竹市'}
-            ]
-        }]
-        response = self.client.get('/api/admin/reports/delivery-records?delivery_date=2026-03-18')
-        data = json.loads(response.data)
-        self.assertEqual(data['records'][0]['delivery_qty'], 3)
+        mock_get.assert_called_once_with('2026-03-18')
 
     def test_missing_date_returns_400(self):
         self.login()
@@ -442,17 +714,68 @@ class TestDeliveryReport(TestAdminRoutesBase):
         response = self.client.get('/api/admin/reports/delivery-records?delivery_date=20260318')
         self.assertEqual(response.status_code, 400)
 
-    @patch('services.database_adapter.DatabaseAdapter.get_all_orders_with_members')
+    @patch('services.database_adapter.DatabaseAdapter.get_delivery_records_by_date')
     def test_no_matching_date_returns_empty(self, mock_get):
         self.login()
-        mock_get.return_value = [{
-            'orderId': 'ORD001', 'customer': {},
-            'deliveryLogs': [{'delivery_date': '2026-01-01', 'qty': 5, 'address': '新竹市'}]
-        }]
+        mock_get.return_value = (True, [])
         response = self.client.get('/api/admin/reports/delivery-records?delivery_date=2026-03-18')
         data = json.loads(response.data)
         self.assertEqual(data['total_records'], 0)
 
+    @patch('services.database_adapter.DatabaseAdapter.get_delivery_records_by_date')
+    def test_query_failure_returns_500(self, mock_get):
+        self.login()
+        mock_get.return_value = (False, '查詢失敗')
+        response = self.client.get('/api/admin/reports/delivery-records?delivery_date=2026-03-18')
+        self.assertEqual(response.status_code, 500)
+
+
+# ===== 匯出 =====
+
+class TestExport(TestAdminRoutesBase):
+
+    @patch('services.database_adapter.DatabaseAdapter.iter_members')
+    def test_export_members_streams_csv(self, mock_iter):
+        self.login()
+        mock_iter.return_value = iter([
+            {'userId': 'U1', 'name': '王小明', 'phone': '0912345678', 'status': '啟用',
+             'createdAt': '2026-01-01 00:00:00', 'updatedAt': '2026-01-02 00:00:00'}
+        ])
+        response = self.client.get('/api/admin/members/export')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(lines[0], 'userId,name,phone,address,address2,birthDate,status,createdAt,updatedAt')
+        self.assertTrue(lines[1].startswith('U1,王小明,0912345678'))
+        self.assertIn('attachment; filename=members.csv', response.headers['Content-Disposition'])
+
+    @patch('services.database_adapter.DatabaseAdapter.iter_orders_with_members')
+    def test_export_orders_flattens_delivery_logs(self, mock_iter):
+        self.login()
+        mock_iter.return_value = iter([
+            {'orderId': 'ORD001', 'userId': 'U1', 'customer': {'name': '王小明'},
+             'expectedTotal': 10, 'totalDelivered': 7,
+             'deliveryLogs': [
+                 {'logId': 'a1', 'delivery_date': '2026-03-18', 'qty': 5, 'address': '新竹市'},
+                 {'logId': 'a2', 'delivery_date': '2026-03-19', 'qty': 4, 'corrected_qty': 2,
+                  'is_corrected': True, 'address': '竹北市'}
+             ]},
+            {'orderId': 'ORD002', 'userId': 'U2', 'customer': {}, 'deliveryLogs': [], 'items': '土雞蛋 x3'}
+        ])
+        response = self.client.get('/api/admin/orders/export')
+        self.assertEqual(response.status_code, 200)
+        import csv
+        from io import StringIO
+        rows = list(csv.DictReader(StringIO(response.get_data(as_text=True))))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['deliveryQty'], '5')
+        self.assertEqual(rows[1]['deliveryQty'], '2')
+        self.assertEqual(rows[1]['isCorrected'], 'Y')
+        self.assertEqual(rows[1]['customerName'], '王小明')
+        self.assertEqual(rows[2]['orderId'], 'ORD002')
+        self.assertEqual(rows[2]['deliveryDate'], '')
+        self.assertEqual(rows[2]['expectedTotal'], '3')
+
 
 # ===== 審計日誌 =====
 
@@ -51,6 +51,39 @@ class TestFlaskApp(unittest.TestCase):
         self.assertEqual(response.status_code, 404)
 
 
+class TestHealthChecks(unittest.TestCase):
+    """存活與就緒檢查"""
+
+    @classmethod
+    def setUpClass(cls):
+        with patch('services.firestore_service.FirestoreService.init'):
+            from app import app
+            cls.client = app.test_client()
+
+    def test_healthz_does_not_touch_database(self):
+        with patch('services.database_adapter.DatabaseAdapter.get_service') as mock_get_service:
+            response = self.client.get('/healthz')
+        self.assertEqual(response.status_code, 200)
+        mock_get_service.assert_not_called()
+
+    @patch('services.database_adapter.DatabaseAdapter._select_backend')
+    def test_readyz_ready(self, mock_select):
+        mock_select.return_value.is_initialized.return_value = True
+        response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['database']['status'], 'ready')
+
+    @patch('services.database_adapter.DatabaseAdapter.warm_up')
+    @patch('services.database_adapter.DatabaseAdapter._select_backend')
+    def test_readyz_not_ready_starts_warm_up(self, mock_select, mock_warm_up):
+        mock_select.return_value.is_initialized.return_value = False
+        with patch.dict('services.database_adapter.DatabaseAdapter._init_state', {'status': 'idle'}):
+            response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.get_json()['status'], 'not_ready')
+        mock_warm_up.assert_called_once()
+
+
 class TestAuthRoutes(unittest.TestCase):
     """認證路由測試"""
     
@@ -117,7 +150,7 @@ class TestMemberAPI(unittest.TestCase):
     @patch('services.firestore_service.FirestoreService.add_member')
     def test_add_member(self, mock_add):
         """測試新增成員"""
-        mock_add.return_value = True
+        mock_add.return_value = (True, {})
         
         response = self.app.post('/api/register', json={
             'userId': 'U123',
@@ -127,14 +160,38 @@ class TestMemberAPI(unittest.TestCase):
         }, content_type='application/json')
         self.assertIn(response.status_code, [200, 201])
 
-    @patch('services.database_adapter.DatabaseAdapter.add_order')
+    @patch('services.database_adapter.DatabaseAdapter.get_applicable_discounts_batch', return_value=(True, {}))
+    @patch('services.order_id_service.OrderIdService.next_order_id',
+           side_effect=['ORD0000000000100', 'ORD0000000000101'])
+    @patch('services.database_adapter.DatabaseAdapter.place_order')
     @patch('services.database_adapter.DatabaseAdapter.get_product')
     @patch('services.line_service.LINEService.send_push_message')
-    def test_order_notification(self, mock_line, mock_get_product, mock_add_order):
+    def test_order_retries_duplicate_order_id(self, mock_line, mock_get_product, mock_place, mock_order_id, mock_discounts):
+        """訂單編號重複時換新編號重試"""
+        mock_get_product.return_value = (True, {'price': 100, 'status': 'active', 'actualQuantity': 1})
+        mock_place.side_effect = [(False, '訂單編號重複'), (True, {})]
+
+        response = self.app.post('/api/order', json={
+            'userId': 'U123',
+            'productId': 'prod_test123',
+            'itemName': '土雞蛋',
+            'qty': 5,
+            'paymentMethod': 'transfer'
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['orderId'], 'ORD0000000000101')
+        self.assertEqual(mock_place.call_args[1]['order_id'], 'ORD0000000000101')
+
+    @patch('services.database_adapter.DatabaseAdapter.get_applicable_discounts_batch', return_value=(True, {}))
+    @patch('services.order_id_service.OrderIdService.next_order_id', return_value='ORD0000000000100')
+    @patch('services.database_adapter.DatabaseAdapter.place_order')
+    @patch('services.database_adapter.DatabaseAdapter.get_product')
+    @patch('services.line_service.LINEService.send_push_message')
+    def test_order_notification(self, mock_line, mock_get_product, mock_add_order, mock_order_id, mock_discounts):
         """測試訂單通知"""
         mock_line.return_value = True
         mock_get_product.return_value = (True, {'price': 100, 'status': 'active', 'actualQuantity': 1})
-        mock_add_order.return_value = True
+        mock_add_order.return_value = (True, {})
 
         response = self.app.post('/api/order', json={
             'userId': 'U123',
@@ -189,7 +246,7 @@ class TestMemberAPI(unittest.TestCase):
     @patch('services.line_service.LINEService.send_push_message')
     def test_register_member(self, mock_line, mock_add):
         """測試註冊會員"""
-        mock_add.return_value = True
+        mock_add.return_value = (True, {})
         
         response = self.client.post('/api/register',
             json={
@@ -219,13 +276,15 @@ class TestOrderAPI(unittest.TestCase):
             cls.app = app
             cls.client = app.test_client()
     
-    @patch('services.database_adapter.DatabaseAdapter.add_order')
+    @patch('services.database_adapter.DatabaseAdapter.get_applicable_discounts_batch', return_value=(True, {}))
+    @patch('services.order_id_service.OrderIdService.next_order_id', return_value='ORD0000000000100')
+    @patch('services.database_adapter.DatabaseAdapter.place_order')
     @patch('services.database_adapter.DatabaseAdapter.get_product')
     @patch('services.line_service.LINEService.send_order_confirmation')
-    def test_create_order_transfer(self, mock_line, mock_get_product, mock_add):
+    def test_create_order_transfer(self, mock_line, mock_get_product, mock_add, mock_order_id, mock_discounts):
         """測試建立轉帳訂單"""
         mock_get_product.return_value = (True, {'price': 100, 'status': 'active', 'actualQuantity': 1})
-        mock_add.return_value = True
+        mock_add.return_value = (True, {})
 
         response = self.client.post('/api/order',
             json={
@@ -242,6 +301,134 @@ class TestOrderAPI(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         data = json.loads(response.data)
         self.assertEqual(data['status'], 'success')
+        self.assertEqual(mock_add.call_args[1]['order_id'], 'ORD0000000000100')
+        self.assertEqual(mock_add.call_args[1]['amount'], 500)
+        line_item = mock_add.call_args[1]['line_items'][0]
+        self.assertEqual((line_item['name'], line_item['qty'], line_item['amount']), ('土雞蛋', 5, 500))
+
+    @patch('services.database_adapter.DatabaseAdapter.get_applicable_discounts_batch')
+    @patch('services.order_id_service.OrderIdService.next_order_id', return_value='ORD0000000000101')
+    @patch('services.database_adapter.DatabaseAdapter.place_order')
+    @patch('services.database_adapter.DatabaseAdapter.get_product')
+    @patch('services.line_service.LINEService.send_order_confirmation')
+    def test_create_order_applies_tiers_and_discounts(self, mock_line, mock_get_product, mock_add, mock_order_id,
+                                                       mock_discounts):
+        """測試建立訂單 - 金額套用分級定價與折扣"""
+        mock_get_product.return_value = (True, {
+            'price': 250, 'status': 'active', 'actualQuantity': 1, 'categoryId': 'c1',
+            'bulkPricing': [{'minQty': 10, 'price': 240}]
+        })
+        mock_discounts.return_value = (True, {'prod_test123': [
+            {'id': 'd1', 'discountType': 'percentage', 'discountValue': 10}
+        ]})
+        mock_add.return_value = (True, {})
+
+        response = self.client.post('/api/order', json={
+            'userId': 'U123', 'productId': 'prod_test123', 'itemName': '土雞蛋',
+            'qty': '10', 'paymentMethod': 'transfer'
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_add.call_args[1]['amount'], 2160)
+        mock_discounts.assert_called_once_with([('prod_test123', 'c1')], member_level=None)
+
+    @patch('services.database_adapter.DatabaseAdapter.get_applicable_discounts_batch')
+    @patch('services.order_id_service.OrderIdService.next_order_id', return_value='ORD0000000000104')
+    @patch('services.database_adapter.DatabaseAdapter.place_order', return_value=(True, {}))
+    @patch('services.database_adapter.DatabaseAdapter.get_product')
+    @patch('services.line_service.LINEService.send_order_confirmation')
+    def test_quote_matches_charged_amount(self, mock_line, mock_get_product, mock_add, mock_order_id, mock_discounts):
+        """測試訂購頁報價 - 顯示金額與下單收取金額一致"""
+        mock_get_product.return_value = (True, {
+            'name': '土雞蛋', 'price': 250, 'status': 'active', 'actualQuantity': 1, 'categoryId': 'c1',
+            'bulkPricing': [{'minQty': 10, 'price': 240}, {'minQty': 30, 'price': 230}]
+        })
+        for discounts in ({}, {'prod_test123': [{'id': 'd1', 'name': '春季優惠', 'discountType': 'fixed',
+                                                 'discountValue': 15}]}):
+            mock_discounts.return_value = (True, discounts)
+            for qty in (1, 9, 12, 30):
+                response = self.client.post('/api/quote', json={'cart': [{'productId': 'prod_test123', 'qty': qty}]})
+                self.assertEqual(response.status_code, 200)
+                displayed = json.loads(response.data)['totalAmount']
+
+                self.client.post('/api/order', json={
+                    'userId': 'U123', 'productId': 'prod_test123', 'itemName': '土雞蛋',
+                    'qty': str(qty), 'paymentMethod': 'transfer'
+                })
+                self.assertEqual(displayed, mock_add.call_args[1]['amount'], (qty, discounts))
+
+                self.client.post('/api/order', json={
+                    'userId': 'U123', 'paymentMethod': 'transfer', 'cart': [{'productId': 'prod_test123', 'qty': qty}]
+                })
+                self.assertEqual(displayed, mock_add.call_args[1]['amount'], (qty, discounts))
+
+        # 12 盤套用分級定價：240 × 12，而非售價 250 × 12
+        mock_discounts.return_value = (True, {})
+        response = self.client.post('/api/quote', json={'cart': [{'productId': 'prod_test123', 'qty': 12}]})
+        quote = json.loads(response.data)
+        self.assertEqual(quote['totalAmount'], 2880)
+        self.assertEqual((quote['quotes'][0]['listPrice'], quote['quotes'][0]['unitPrice']), (250, 240))
+
+    @patch('services.database_adapter.DatabaseAdapter.get_applicable_discounts_batch', return_value=(True, {}))
+    @patch('services.database_adapter.DatabaseAdapter.get_product',
+           return_value=(True, {'name': '禮盒', 'price': 300, 'status': 'inactive'}))
+    def test_quote_rejects_invalid_cart(self, mock_get_product, mock_discounts):
+        """測試訂購頁報價 - 下架商品與驗證錯誤"""
+        response = self.client.post('/api/quote', json={'cart': [{'productId': 'p2', 'qty': 1}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('下架', json.loads(response.data)['msg'])
+
+        response = self.client.post('/api/quote', json={'cart': []})
+        self.assertEqual(response.status_code, 400)
+
+    @patch('services.database_adapter.DatabaseAdapter.get_applicable_discounts_batch', return_value=(True, {}))
+    @patch('services.order_id_service.OrderIdService.next_order_id', return_value='ORD0000000000102')
+    @patch('services.database_adapter.DatabaseAdapter.place_order')
+    @patch('services.database_adapter.DatabaseAdapter.get_product')
+    @patch('services.line_service.LINEService.send_order_confirmation')
+    def test_create_cart_order(self, mock_line, mock_get_product, mock_add_cart, mock_order_id, mock_discounts):
+        """測試建立多商品訂單 - 單一交易寫入、只發送一則確認訊息"""
+        products = {
+            'p1': {'name': '土雞蛋', 'price': 100, 'status': 'active', 'actualQuantity': 2},
+            'p2': {'name': '禮盒', 'price': 300, 'status': 'active'}
+        }
+        mock_get_product.side_effect = lambda product_id: (True, products[product_id])
+        mock_add_cart.return_value = (True, {})
+
+        response = self.client.post('/api/order', json={
+            'userId': 'U123', 'paymentMethod': 'transfer',
+            'cart': [{'productId': 'p1', 'qty': 2}, {'productId': 'p2', 'qty': 1}, {'productId': 'p1', 'qty': 1}]
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['amount'], 600)
+        kwargs = mock_add_cart.call_args[1]
+        self.assertEqual(kwargs['item_str'], '土雞蛋 x3, 禮盒 x1')
+        self.assertEqual([(i['productId'], i['qty'], i['actualQuantity']) for i in kwargs['line_items']],
+                         [('p1', 3, 2), ('p2', 1, 1)])
+        mock_line.assert_called_once_with('U123', 'ORD0000000000102', '土雞蛋 x3, 禮盒 x1', 600, '未付款')
+
+    @patch('services.database_adapter.DatabaseAdapter.get_applicable_discounts_batch', return_value=(True, {}))
+    @patch('services.order_id_service.OrderIdService.next_order_id', return_value='ORD0000000000103')
+    @patch('services.database_adapter.DatabaseAdapter.place_order', return_value=(False, '庫存不足：禮盒，目前庫存：0'))
+    @patch('services.database_adapter.DatabaseAdapter.get_product',
+           return_value=(True, {'name': '禮盒', 'price': 300, 'status': 'active'}))
+    @patch('services.line_service.LINEService.send_order_confirmation')
+    def test_create_cart_order_rejected(self, mock_line, mock_get_product, mock_add_cart, mock_order_id,
+                                        mock_discounts):
+        """測試建立多商品訂單 - 庫存不足與驗證錯誤"""
+        response = self.client.post('/api/order', json={
+            'userId': 'U123', 'paymentMethod': 'transfer', 'cart': [{'productId': 'p2', 'qty': 1}]
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('庫存不足', json.loads(response.data)['msg'])
+        mock_line.assert_not_called()
+
+        response = self.client.post('/api/order', json={
+            'userId': 'U123', 'paymentMethod': 'transfer', 'cart': [{'productId': 'p2', 'qty': 0}]
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(mock_add_cart.call_count, 1)
     
     def test_create_order_invalid_item(self):
         """測試建立訂單 - 無效商品"""
@@ -261,5 +448,208 @@ class TestOrderAPI(unittest.TestCase):
         self.assertEqual(data['status'], 'error')
 
 
+
+class TestApplicableDiscountsAPI(unittest.TestCase):
+    """批次查詢適用折扣"""
+
+    @classmethod
+    def setUpClass(cls):
+        with patch('services.firestore_service.FirestoreService.init'):
+            from app import app
+            cls.client = app.test_client()
+
+    def setUp(self):
+        with self.client.session_transaction() as sess:
+            sess['logged_in'] = True
+
+    def tearDown(self):
+        with self.client.session_transaction() as sess:
+            sess.clear()
+
+    @patch('services.database_adapter.DatabaseAdapter.get_applicable_discounts_batch')
+    @patch('services.database_adapter.DatabaseAdapter.get_all_products')
+    def test_resolves_categories_from_products(self, mock_products, mock_batch):
+        mock_products.return_value = (True, [{'productId': 'p1', 'categoryId': 'c1'}])
+        mock_batch.return_value = (True, {'p1': [{'id': 'd1'}], 'p2': []})
+
+        response = self.client.post('/api/admin/discounts/applicable',
+                                    json={'productIds': ['p1', 'p2'], 'memberLevel': 'gold'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['data']['p1'], [{'id': 'd1'}])
+        mock_batch.assert_called_once_with([('p1', 'c1'), ('p2', None)], member_level='gold')
+
+    def test_requires_product_ids(self):
+        response = self.client.post('/api/admin/discounts/applicable', json={})
+        self.assertEqual(response.status_code, 400)
+
+    @patch('services.database_adapter.DatabaseAdapter.get_applicable_discounts_batch')
+    def test_requires_admin_login(self, mock_batch):
+        with self.client.session_transaction() as sess:
+            sess.clear()
+        response = self.client.post('/api/admin/discounts/applicable', json={'productIds': ['p1']})
+        self.assertEqual(response.status_code, 401)
+        mock_batch.assert_not_called()
+
+
+class TestStockAdminAPI(unittest.TestCase):
+    """庫存寫入 API 需管理員登入"""
+
+    @classmethod
+    def setUpClass(cls):
+        with patch('services.firestore_service.FirestoreService.init'):
+            from app import app
+            cls.client = app.test_client()
+
+    def login(self):
+        with self.client.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['admin_name'] = 'test_admin'
+
+    def tearDown(self):
+        with self.client.session_transaction() as sess:
+            sess.clear()
+
+    @patch('services.database_adapter.DatabaseAdapter.update_products_stock')
+    def test_bulk_stock_requires_login(self, mock_update):
+        response = self.client.post('/api/admin/products/stock/bulk',
+                                    json={'changes': [{'productId': 'p1', 'qtyChange': 99}], 'reason': '盤點'})
+        self.assertEqual(response.status_code, 401)
+        mock_update.assert_not_called()
+
+    @patch('services.database_adapter.DatabaseAdapter.update_products_stock')
+    def test_bulk_stock_as_admin(self, mock_update):
+        mock_update.return_value = (True, {'p1': {'oldStock': 1, 'newStock': 100}})
+        self.login()
+        response = self.client.post('/api/admin/products/stock/bulk',
+                                    json={'changes': [{'productId': 'p1', 'qtyChange': 99}], 'reason': '盤點'})
+        self.assertEqual(response.status_code, 200)
+        mock_update.assert_called_once_with(changes=[{'productId': 'p1', 'qtyChange': 99}],
+                                            reason='盤點', operator='test_admin')
+
+    @patch('services.database_adapter.DatabaseAdapter.set_stock_shards')
+    def test_stock_shards_requires_login(self, mock_shards):
+        response = self.client.post('/api/admin/product/p1/stock-shards', json={'shards': 8})
+        self.assertEqual(response.status_code, 401)
+        mock_shards.assert_not_called()
+
+        mock_shards.return_value = (True, {'shards': 8})
+        self.login()
+        response = self.client.post('/api/admin/product/p1/stock-shards', json={'shards': 8})
+        self.assertEqual(response.status_code, 200)
+        mock_shards.assert_called_once_with('p1', 8)
+
+
+class TestStockAlertsAPI(unittest.TestCase):
+    """庫存警告 API：分頁與 ETag"""
+
+    @classmethod
+    def setUpClass(cls):
+        with patch('services.firestore_service.FirestoreService.init'):
+            from app import app
+            cls.client = app.test_client()
+
+    @patch('services.database_adapter.DatabaseAdapter.get_stock_alerts')
+    @patch('services.database_adapter.DatabaseAdapter.get_stock_alerts_version', return_value=(True, 3))
+    def test_unchanged_list_returns_304_without_query(self, mock_version, mock_get_alerts):
+        mock_get_alerts.return_value = (True, [{'id': 'A1', 'alertType': 'low'}])
+
+        response = self.client.get('/api/admin/stock-alerts')
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        self.assertEqual(response.get_json()['data'][0]['id'], 'A1')
+
+        response = self.client.get('/api/admin/stock-alerts', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(mock_get_alerts.call_count, 1)
+
+        # 不同篩選條件或版本變更時 ETag 不同
+        response = self.client.get('/api/admin/stock-alerts?type=low', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        mock_version.return_value = (True, 4)
+        response = self.client.get('/api/admin/stock-alerts', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    @patch('services.database_adapter.DatabaseAdapter.get_stock_alerts_page')
+    @patch('services.database_adapter.DatabaseAdapter.get_stock_alerts_version', return_value=(True, 0))
+    def test_page_mode(self, mock_version, mock_page):
+        mock_page.return_value = (True, {'alerts': [], 'nextCursor': None, 'hasMore': False})
+        response = self.client.get('/api/admin/stock-alerts?status=&limit=1000&startAfter=c1')
+        self.assertEqual(response.status_code, 200)
+        mock_page.assert_called_once_with(status=None, alert_type=None, limit=200, start_after='c1')
+
+        response = self.client.get('/api/admin/stock-alerts?limit=abc')
+        self.assertEqual(response.status_code, 400)
+
+
+class TestRetryPaymentAPI(unittest.TestCase):
+    """重新付款 API 測試"""
+
+    @classmethod
+    def setUpClass(cls):
+        """測試類初始化"""
+        with patch('services.firestore_service.FirestoreService.init'):
+            from app import app
+            cls.app = app
+            cls.client = app.test_client()
+
+    @patch('services.database_adapter.DatabaseAdapter.get_all_orders_with_members')
+    @patch('services.database_adapter.DatabaseAdapter.get_order_by_id')
+    def test_retry_payment_uses_direct_lookup(self, mock_get_order, mock_get_all):
+        """測試重新付款以單筆讀取取得訂單"""
+        mock_get_order.return_value = (True, {
+            'orderId': 'ORD12345678', 'paymentStatus': '待付款',
+            'amount': 500, 'items': '土雞蛋 x2'
+        })
+
+        response = self.client.post('/api/retry_payment', json={'orderId': 'ORD12345678', 'retryCount': 1})
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['status'], 'ecpay_init')
+        self.assertEqual(data['ecpayParams']['MerchantTradeNo'], 'ORD12345678R1')
+        mock_get_order.assert_called_once_with('ORD12345678')
+        mock_get_all.assert_not_called()
+
+    @patch('services.database_adapter.DatabaseAdapter.get_order_by_id')
+    def test_retry_payment_order_not_found(self, mock_get_order):
+        """測試重新付款 - 訂單不存在"""
+        mock_get_order.return_value = (False, '訂單不存在')
+        response = self.client.post('/api/retry_payment', json={'orderId': 'ORD00000000'})
+        self.assertEqual(response.status_code, 404)
+
+    @patch('services.database_adapter.DatabaseAdapter.get_order_by_id')
+    def test_retry_payment_rejects_cancelled_order(self, mock_get_order):
+        """測試重新付款 - 已取消的訂單（預留庫存已釋放）不可付款"""
+        mock_get_order.return_value = (True, {
+            'orderId': 'ORD12345678', 'status': '已取消', 'paymentStatus': '待付款', 'amount': 500, 'items': '土雞蛋 x2'
+        })
+        response = self.client.post('/api/retry_payment', json={'orderId': 'ORD12345678', 'retryCount': 1})
+        self.assertEqual(response.status_code, 400)
+
+    @patch('services.line_service.LINEService.send_payment_success')
+    @patch('services.database_adapter.DatabaseAdapter.update_order_payment_status')
+    @patch('services.database_adapter.DatabaseAdapter.get_order_by_id')
+    def test_ecpay_callback_ignores_cancelled_order(self, mock_get_order, mock_update, mock_line):
+        """測試綠界回調 - 已取消的訂單不標記為已付款"""
+        from config import Config
+        from ecpay_sdk import ECPaySDK
+        mock_get_order.return_value = (True, {'orderId': 'ORD12345678', 'userId': 'U1', 'status': '已取消'})
+        form = {'MerchantTradeNo': 'ORD12345678R1', 'RtnCode': '1', 'RtnMsg': 'paid'}
+        form['CheckMacValue'] = ECPaySDK(Config.ECPAY_MERCHANT_ID, Config.ECPAY_HASH_KEY, Config.ECPAY_HASH_IV,
+                                         Config.ECPAY_ACTION_URL).generate_check_mac_value(form)
+
+        response = self.client.post('/api/ecpay/callback', data=form)
+
+        self.assertEqual(response.get_data(as_text=True), '1|OK')
+        mock_get_order.assert_called_once_with('ORD12345678')
+        mock_update.assert_not_called()
+        mock_line.assert_not_called()
+
+    def test_retry_payment_rejects_three_digit_retry_count(self):
+        """測試重新付款 - 重試次數超過 2 位數會超出綠界 20 字元限制"""
+        response = self.client.post('/api/retry_payment', json={'orderId': 'ORD0000000000100', 'retryCount': 100})
+        self.assertEqual(response.status_code, 400)
+
 if __name__ == '__main__':
     unittest.main()
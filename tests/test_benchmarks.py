@@ -0,0 +1,107 @@
+"""
+單元測試 - 壓力測試工具 (benchmarks/)：記憶體內 Firestore 替身與路由壓力測試
+"""
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists, NotFound
+
+from benchmarks.fake_firestore import FakeFirestoreClient
+from benchmarks.bench_routes import run_benchmark, compare_results, percentile
+from services.firestore_service import FirestoreService
+
+
+class TestFakeFirestore(unittest.TestCase):
+    """記憶體內 Firestore 替身的行為需與 Firestore 一致"""
+
+    def setUp(self):
+        self.db = FakeFirestoreClient()
+        for i, (user, created) in enumerate([('u1', 3), ('u2', 1), ('u1', 2), ('u1', None)]):
+            data = {'orderId': f"o{i}", 'userId': user, 'tags': ['a'] if i % 2 else []}
+            if created is not None:
+                data['createdAt'] = created
+            self.db.load('orders', f"o{i}", data)
+
+    def test_query_filters_orders_and_excludes_missing_fields(self):
+        docs = self.db.collection('orders').where('userId', '==', 'u1') \
+            .order_by('createdAt', direction=firestore.Query.DESCENDING).stream()
+        self.assertEqual([d.id for d in docs], ['o0', 'o2'])
+
+    def test_start_after_snapshot_and_dict_cursor(self):
+        query = self.db.collection('orders').order_by('__name__').limit(2)
+        first = list(query.stream())
+        second = list(query.start_after(first[-1]).stream())
+        self.assertEqual([d.id for d in first + second], ['o0', 'o1', 'o2', 'o3'])
+
+        docs = self.db.collection('orders').order_by('createdAt').start_after({'createdAt': 1}).stream()
+        self.assertEqual([d.id for d in docs], ['o2', 'o0'])
+
+    def test_create_update_and_transforms(self):
+        ref = self.db.collection('orders').document('o0')
+        with self.assertRaises(AlreadyExists):
+            ref.create({'orderId': 'o0'})
+        with self.assertRaises(NotFound):
+            self.db.collection('orders').document('missing').update({'x': 1})
+
+        ref.update({'count': firestore.Increment(2), 'tags': firestore.ArrayUnion(['b']), 'meta.flag': True})
+        data = ref.get().to_dict()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['tags'], ['b'])
+        self.assertEqual(data['meta'], {'flag': True})
+
+    def test_batch_is_atomic(self):
+        batch = self.db.batch()
+        batch.set(self.db.collection('orders').document('o9'), {'orderId': 'o9'})
+        batch.create(self.db.collection('orders').document('o0'), {'orderId': 'o0'})
+        with self.assertRaises(AlreadyExists):
+            batch.commit()
+        self.assertFalse(self.db.collection('orders').document('o9').get().exists)
+
+    def test_transactional_and_read_counting(self):
+        @firestore.transactional
+        def bump(transaction, ref):
+            value = ref.get(transaction=transaction).to_dict().get('n', 0)
+            transaction.update(ref, {'n': value + 1})
+
+        ref = self.db.collection('orders').document('o1')
+        bump(self.db.transaction(), ref)
+        self.assertEqual(ref.get().to_dict()['n'], 1)
+
+        self.db.stats.begin_request()
+        list(self.db.collection('orders').where('userId', '==', 'nobody').stream())
+        self.db.get_all([self.db.collection('orders').document('o0'), ref])
+        self.assertEqual(self.db.stats.end_request(), {'reads': 3, 'writes': 0, 'rpcs': 2})
+
+
+class TestBenchRoutes(unittest.TestCase):
+    """以極小資料量執行所有壓力測試情境"""
+
+    def test_all_scenarios_run_without_errors(self):
+        original_db = FirestoreService._db
+        result = run_benchmark(members=10, orders=60, products=3, stock_logs=20, days=10,
+                               requests=4, concurrency=2, warmup=0, log=lambda message: None)
+
+        self.assertIs(FirestoreService._db, original_db)
+        self.assertEqual(result['meta']['dataset']['orders'], 60)
+        for name, scenario in result['scenarios'].items():
+            self.assertEqual(scenario['errors'], 0, name)
+            self.assertEqual(scenario['requests'], 4)
+            self.assertIn('readsPerRequest', scenario)
+        self.assertEqual(result['scenarios']['admin_order_detail']['readsPerRequest'], 2)
+
+        rows = compare_results(result, result)
+        self.assertTrue(all(row['p50'] in (0.0, None) for row in rows))
+
+    def test_percentile_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 50), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
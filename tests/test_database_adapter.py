@@ -0,0 +1,253 @@
+"""
+單元測試 - 資料庫適配器快取層 (services/database_adapter.py)
+"""
+import unittest
+import sys
+import os
+import threading
+import time
+from unittest.mock import patch, MagicMock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.database_adapter import DatabaseAdapter, DatabaseCache
+
+
+class CacheTestBase(unittest.TestCase):
+
+    def setUp(self):
+        DatabaseCache.clear()
+        self.service = MagicMock()
+        patcher = patch.object(DatabaseAdapter, 'get_service', return_value=self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(DatabaseCache.clear)
+
+
+class TestListCache(CacheTestBase):
+
+    def test_second_call_is_cache_hit(self):
+        self.service.get_all_products.return_value = (True, [{'productId': 'p1'}])
+        DatabaseAdapter.get_all_products()
+        success, products = DatabaseAdapter.get_all_products()
+        self.assertTrue(success)
+        self.assertEqual(products, [{'productId': 'p1'}])
+        self.service.get_all_products.assert_called_once()
+        stats = DatabaseAdapter.get_cache_stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_failed_result_not_cached(self):
+        self.service.get_all_categories.return_value = (False, 'DB error')
+        DatabaseAdapter.get_all_categories()
+        DatabaseAdapter.get_all_categories()
+        self.assertEqual(self.service.get_all_categories.call_count, 2)
+
+    def test_cached_value_is_isolated_from_caller_mutation(self):
+        self.service.get_all_discounts.return_value = (True, [{'id': 'd1'}])
+        _, first = DatabaseAdapter.get_all_discounts()
+        first.append({'id': 'mutated'})
+        _, second = DatabaseAdapter.get_all_discounts()
+        self.assertEqual(second, [{'id': 'd1'}])
+
+    def test_add_category_invalidates_list(self):
+        self.service.get_all_categories.return_value = (True, [])
+        self.service.add_category.return_value = (True, 'c1')
+        DatabaseAdapter.get_all_categories()
+        DatabaseAdapter.add_category('蛋類')
+        DatabaseAdapter.get_all_categories()
+        self.assertEqual(self.service.get_all_categories.call_count, 2)
+
+    def test_invalidate_during_load_discards_stale_result(self):
+        loaded = []
+
+        def load_categories():
+            # 讀取途中另一請求寫入並失效快取
+            if not loaded:
+                DatabaseCache.invalidate('categories')
+            loaded.append(True)
+            return True, [{'id': f'c{len(loaded)}'}]
+
+        self.service.get_all_categories.side_effect = load_categories
+        _, first = DatabaseAdapter.get_all_categories()
+        _, second = DatabaseAdapter.get_all_categories()
+        _, third = DatabaseAdapter.get_all_categories()
+        self.assertEqual(first, [{'id': 'c1'}])
+        self.assertEqual(second, [{'id': 'c2'}])
+        self.assertEqual(third, [{'id': 'c2'}])
+        self.assertEqual(self.service.get_all_categories.call_count, 2)
+
+    @patch('services.database_adapter.Config')
+    def test_disabled_cache_always_loads(self, mock_config):
+        mock_config.DB_CACHE_ENABLED = False
+        self.service.get_all_products.return_value = (True, [])
+        DatabaseAdapter.get_all_products()
+        DatabaseAdapter.get_all_products()
+        self.assertEqual(self.service.get_all_products.call_count, 2)
+
+
+class TestDocumentCache(CacheTestBase):
+
+    def test_get_product_cached_per_id(self):
+        self.service.get_product.side_effect = lambda pid: (True, {'productId': pid})
+        DatabaseAdapter.get_product('p1')
+        DatabaseAdapter.get_product('p1')
+        DatabaseAdapter.get_product('p2')
+        self.assertEqual(self.service.get_product.call_count, 2)
+
+    def test_update_product_invalidates_document_and_list(self):
+        self.service.get_product.return_value = (True, {'productId': 'p1', 'price': 250})
+        self.service.get_all_products.return_value = (True, [])
+        self.service.update_product.return_value = (True, '商品已更新')
+        DatabaseAdapter.get_product('p1')
+        DatabaseAdapter.get_all_products()
+        DatabaseAdapter.update_product('p1', price=240)
+        DatabaseAdapter.get_product('p1')
+        DatabaseAdapter.get_all_products()
+        self.assertEqual(self.service.get_product.call_count, 2)
+        self.assertEqual(self.service.get_all_products.call_count, 2)
+
+    def test_stock_update_invalidates_product(self):
+        self.service.get_product.return_value = (True, {'productId': 'p1', 'stock': 10})
+        self.service.update_product_stock.return_value = (True, {})
+        DatabaseAdapter.get_product('p1')
+        DatabaseAdapter.update_product_stock('p1', -2, '出貨', 'admin')
+        DatabaseAdapter.get_product('p1')
+        self.assertEqual(self.service.get_product.call_count, 2)
+
+    def test_missing_document_not_cached(self):
+        self.service.get_product.return_value = (False, '商品不存在')
+        DatabaseAdapter.get_product('p404')
+        DatabaseAdapter.get_product('p404')
+        self.assertEqual(self.service.get_product.call_count, 2)
+
+    def test_invalidate_during_document_load_across_threads(self):
+        started, release = threading.Event(), threading.Event()
+        versions = iter([{'price': 100}, {'price': 120}])
+
+        def load_product(product_id):
+            data = next(versions)
+            if data['price'] == 100:
+                started.set()
+                release.wait(5)
+            return True, data
+
+        self.service.get_product.side_effect = load_product
+        self.service.update_product.return_value = True
+        reader = threading.Thread(target=DatabaseAdapter.get_product, args=('p1',))
+        reader.start()
+        started.wait(5)
+        DatabaseAdapter.update_product('p1', price=120)
+        release.set()
+        reader.join(5)
+
+        _, product = DatabaseAdapter.get_product('p1')
+        self.assertEqual(product, {'price': 120})
+
+
+class TestDiscountIndex(CacheTestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.service.get_active_discounts.return_value = (True, [
+            {'id': 'd1', 'targetType': 'product', 'targetId': 'p1', 'discountValue': 10},
+            {'id': 'd2', 'targetType': 'category', 'targetId': 'c1', 'discountValue': 5,
+             'startDate': '2026-03-01', 'endDate': '2026-03-31'},
+            {'id': 'd3', 'targetType': 'member_level', 'targetId': 'gold', 'discountValue': 3},
+            {'id': 'd4', 'targetType': 'product', 'targetId': 'p2', 'startDate': 'not-a-date'},
+        ])
+
+    def test_batch_lookup_loads_once(self):
+        success, result = DatabaseAdapter.get_applicable_discounts_batch(
+            [('p1', 'c1'), ('p2', 'c1'), ('p3', None)], member_level='gold')
+        self.assertTrue(success)
+        self.assertEqual([d['id'] for d in result['p1']], ['d1', 'd3'])
+        self.assertEqual([d['id'] for d in result['p2']], ['d3'])
+        DatabaseAdapter.get_applicable_discounts('p1', 'c1')
+        self.service.get_active_discounts.assert_called_once()
+        self.service.get_applicable_discounts.assert_not_called()
+
+    def test_date_only_end_includes_whole_day(self):
+        from services.database_adapter import DiscountIndex
+        from services.firestore_service import TW_TZ
+        from datetime import datetime
+        loader = self.service.get_active_discounts
+        for day, expected in (((2026, 3, 31, 23, 59), ['d2']), ((2026, 4, 1, 0, 0), []), ((2026, 2, 28, 23, 0), [])):
+            _, discounts = DiscountIndex.lookup(loader, 'p9', 'c1', now=TW_TZ.localize(datetime(*day)))
+            self.assertEqual([d['id'] for d in discounts], expected)
+
+    def test_discount_write_reloads_index(self):
+        self.service.update_discount.return_value = (True, '折扣已更新')
+        DatabaseAdapter.get_applicable_discounts('p1')
+        DatabaseAdapter.update_discount('d1', discountValue=20)
+        DatabaseAdapter.get_applicable_discounts('p1')
+        self.assertEqual(self.service.get_active_discounts.call_count, 2)
+
+    def test_returned_discounts_are_copies(self):
+        _, discounts = DatabaseAdapter.get_applicable_discounts('p1')
+        discounts[0]['discountValue'] = 99
+        _, discounts = DatabaseAdapter.get_applicable_discounts('p1')
+        self.assertEqual(discounts[0]['discountValue'], 10)
+
+    def test_load_failure(self):
+        self.service.get_active_discounts.return_value = (False, 'DB error')
+        success, _ = DatabaseAdapter.get_applicable_discounts('p1')
+        self.assertFalse(success)
+
+
+class TestBackendSelection(unittest.TestCase):
+
+    @patch('services.database_adapter.Config')
+    def test_selects_backend_from_config(self, mock_config):
+        mock_config.DATABASE_BACKEND = 'sqlite'
+        self.assertIs(DatabaseAdapter._select_backend(), DatabaseAdapter.BACKENDS['sqlite'])
+        mock_config.DATABASE_BACKEND = 'firestore'
+        self.assertIs(DatabaseAdapter._select_backend(), DatabaseAdapter.BACKENDS['firestore'])
+
+    @patch('services.database_adapter.Config')
+    def test_unknown_backend_raises(self, mock_config):
+        mock_config.DATABASE_BACKEND = 'mysql'
+        with self.assertRaises(ValueError):
+            DatabaseAdapter.get_service()
+
+
+class TestLazyInit(unittest.TestCase):
+
+    def setUp(self):
+        self.service = MagicMock()
+        self.service.is_initialized.return_value = False
+        patcher = patch.object(DatabaseAdapter, '_select_backend', return_value=self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        saved_state = dict(DatabaseAdapter._init_state)
+        self.addCleanup(DatabaseAdapter._init_state.update, saved_state)
+
+    def test_initializes_once_across_threads(self):
+        def init():
+            time.sleep(0.05)
+            self.service.is_initialized.return_value = True
+        self.service.init.side_effect = init
+
+        threads = [threading.Thread(target=DatabaseAdapter.get_service) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.service.init.assert_called_once()
+        self.assertEqual(DatabaseAdapter.readiness()['status'], 'ready')
+
+    def test_failed_init_reported_and_retried(self):
+        self.service.init.side_effect = RuntimeError('bad credentials')
+        DatabaseAdapter.warm_up(background=False)
+        state = DatabaseAdapter.readiness()
+        self.assertEqual(state['status'], 'error')
+        self.assertEqual(state['error'], 'bad credentials')
+
+        self.service.init.side_effect = None
+        DatabaseAdapter.get_service()
+        self.assertEqual(self.service.init.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+單元測試 - 資料庫用量統計 (services/db_instrumentation.py)
+"""
+import unittest
+import sys
+import os
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['FLASK_ENV'] = 'testing'
+
+from benchmarks.fake_firestore import FakeFirestoreClient
+from services import db_instrumentation
+from services.firestore_service import FirestoreService
+
+
+class InstrumentedTestBase(unittest.TestCase):
+    """以記憶體內 Firestore 替身比對代理統計與替身自身的統計"""
+
+    def setUp(self):
+        self.fake = FakeFirestoreClient()
+        for i in range(3):
+            self.fake.load('members', f"U{i}", {'userId': f"U{i}", 'name': f"會員{i}", 'phone': f"09{i}"})
+        self.fake.load('orders', 'ORD1', {'orderId': 'ORD1', 'userId': 'U1', 'status': '處理中',
+                                          'actualQuantity': 1, 'orderQty': 2, 'deliveryLogs': []})
+        self.original_db = FirestoreService._db
+        FirestoreService._db = db_instrumentation.instrument(self.fake)
+        self.addCleanup(setattr, FirestoreService, '_db', self.original_db)
+        self.addCleanup(db_instrumentation.end_request)
+
+    def measure(self, func, *args, **kwargs):
+        db_instrumentation.begin_request()
+        self.fake.stats.begin_request()
+        result = func(*args, **kwargs)
+        return result, db_instrumentation.end_request(), self.fake.stats.end_request()
+
+
+class TestInstrumentedClient(InstrumentedTestBase):
+
+    def test_query_reads_match_backend(self):
+        members, usage, expected = self.measure(FirestoreService.get_all_members)
+        self.assertEqual(len(members), 3)
+        self.assertEqual((usage['reads'], usage['rpcs']), (expected['reads'], expected['rpcs']))
+
+    def test_empty_query_counts_one_read(self):
+        _, usage, _ = self.measure(FirestoreService.get_member_by_phone, '0999')
+        self.assertEqual(usage['reads'], 1)
+
+    def test_batch_and_transaction_writes_counted_at_commit(self):
+        (success, _), usage, expected = self.measure(FirestoreService.add_delivery_log, 'ORD1', 1)
+        self.assertTrue(success)
+        self.assertEqual(usage['writes'], expected['writes'])
+        self.assertEqual(usage['reads'], expected['reads'])
+
+        (success, _), usage, expected = self.measure(
+            FirestoreService.add_member_with_unique_phone, 'U9', '新會員', '0988', '新竹市')
+        self.assertTrue(success)
+        self.assertEqual(usage['writes'], expected['writes'])
+
+    def test_no_usage_outside_request(self):
+        FirestoreService.get_all_members()
+        self.assertIsNone(db_instrumentation.current_usage())
+
+
+class TestRequestReporting(InstrumentedTestBase):
+
+    def setUp(self):
+        super().setUp()
+        with patch('services.firestore_service.FirestoreService.init'):
+            from app import app
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['user_name'] = 'test_admin'
+
+    def test_server_timing_header(self):
+        response = self.client.get('/api/admin/members')
+        self.assertEqual(response.status_code, 200)
+        header = response.headers['Server-Timing']
+        self.assertIn('db;dur=', header)
+        self.assertIn('db-reads;desc="3"', header)
+        self.assertIn('db-rpcs;desc="1"', header)
+
+    @patch('app.Config.DB_SLOW_REQUEST_MS', 0)
+    def test_slow_request_logged_as_warning(self):
+        with self.assertLogs('services.db_instrumentation', level='WARNING') as logs:
+            self.client.get('/api/admin/members')
+        self.assertIn('"event": "db_usage"', logs.output[0])
+        self.assertIn('"path": "/api/admin/members"', logs.output[0])
+        self.assertIn('"reads": 3', logs.output[0])
+
+    @patch('app.Config.DB_INSTRUMENTATION_ENABLED', False)
+    def test_disabled(self):
+        response = self.client.get('/api/admin/members')
+        self.assertNotIn('Server-Timing', response.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
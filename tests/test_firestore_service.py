@@ -4,12 +4,14 @@
 import unittest
 import sys
 import os
+import time
 from unittest.mock import patch, MagicMock
 from datetime import datetime
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from services.firestore_service import FirestoreService
+from google.cloud import firestore
+from services.firestore_service import FirestoreService, FirestoreClientPool, _ChannelLimiter, TW_TZ
 
 
 def make_mock_db():
@@ -19,6 +21,15 @@ def make_mock_db():
     return db
 
 
+def _setup_order_doc(db, order_data):
+    """設定 orders/{id}.get() 回傳的文件（order_data 為 None 表示不存在）"""
+    doc = MagicMock()
+    doc.exists = order_data is not None
+    doc.to_dict.return_value = order_data
+    db.collection.return_value.document.return_value.get.return_value = doc
+    return doc
+
+
 class TestAddMember(unittest.TestCase):
 
     def test_success(self):
@@ -74,6 +85,59 @@ class TestCheckMemberExists(unittest.TestCase):
         self.assertIsNone(result)
 
 
+class TestMemberPhoneLookup(unittest.TestCase):
+
+    def test_get_member_by_phone_uses_indexed_query(self):
+        db = make_mock_db()
+        mock_doc = MagicMock()
+        mock_doc.to_dict.return_value = {'userId': 'U123', 'phone': '0912345678'}
+        query = db.collection.return_value.where.return_value.limit.return_value
+        query.stream.return_value = [mock_doc]
+        success, member = FirestoreService.get_member_by_phone('0912345678')
+        self.assertTrue(success)
+        self.assertEqual(member['userId'], 'U123')
+        db.collection.return_value.where.assert_called_once_with('phone', '==', '0912345678')
+        db.collection.return_value.where.return_value.limit.assert_called_once_with(1)
+
+    def test_get_member_by_phone_not_found(self):
+        db = make_mock_db()
+        db.collection.return_value.where.return_value.limit.return_value.stream.return_value = []
+        self.assertEqual(FirestoreService.get_member_by_phone('0912345678'), (True, None))
+
+    def _setup_existing(self, db, reserved=False, member=False):
+        reservation = MagicMock()
+        reservation.exists = reserved
+        db.collection.return_value.document.return_value.get.return_value = reservation
+        query = db.collection.return_value.where.return_value.limit.return_value
+        query.stream.return_value = [MagicMock()] if member else []
+
+    def test_add_with_unique_phone_writes_member_and_reservation(self):
+        db = make_mock_db()
+        self._setup_existing(db)
+        transaction = db.transaction.return_value
+        success, user_id = FirestoreService.add_member_with_unique_phone('ADMIN_1', '王小明', '0912345678', '新竹市')
+        self.assertTrue(success)
+        self.assertEqual(user_id, 'ADMIN_1')
+        self.assertEqual(transaction.create.call_args[0][1]['phone'], '0912345678')
+        self.assertEqual(transaction.set.call_args[0][1]['userId'], 'ADMIN_1')
+        db.collection.return_value.document.return_value.set.assert_not_called()
+
+    def test_add_with_reserved_phone_returns_conflict(self):
+        db = make_mock_db()
+        self._setup_existing(db, reserved=True)
+        success, error = FirestoreService.add_member_with_unique_phone('ADMIN_1', '王小明', '0912345678', '新竹市')
+        self.assertFalse(success)
+        self.assertIsNone(error)
+        db.transaction.return_value.create.assert_not_called()
+
+    def test_add_with_existing_member_phone_returns_conflict(self):
+        db = make_mock_db()
+        self._setup_existing(db, member=True)
+        success, error = FirestoreService.add_member_with_unique_phone('ADMIN_1', '王小明', '0912345678', '新竹市')
+        self.assertFalse(success)
+        self.assertIsNone(error)
+
+
 class TestUpdateMember(unittest.TestCase):
 
     def test_success(self):
@@ -134,6 +198,51 @@ class TestGetAllMembers(unittest.TestCase):
         self.assertEqual(result, [])
 
 
+class TestStreamingExport(unittest.TestCase):
+
+    def _doc(self, data, doc_id=None):
+        doc = MagicMock()
+        doc.id = doc_id
+        doc.exists = True
+        doc.to_dict.return_value = data
+        return doc
+
+    def test_iter_members_pages_by_document_id(self):
+        db = make_mock_db()
+        query = db.collection.return_value.order_by.return_value.limit.return_value
+        first_page = [self._doc({'userId': 'U1'}), self._doc({'userId': 'U2'})]
+        query.stream.return_value = first_page
+        query.start_after.return_value.stream.return_value = [self._doc({'userId': 'U3'})]
+
+        members = list(FirestoreService.iter_members(page_size=2))
+
+        self.assertEqual([m['userId'] for m in members], ['U1', 'U2', 'U3'])
+        self.assertEqual(members[0]['status'], '啟用')
+        db.collection.return_value.order_by.assert_called_once_with('__name__')
+        query.start_after.assert_called_once_with(first_page[-1])
+
+    def test_iter_members_is_lazy(self):
+        db = make_mock_db()
+        FirestoreService.iter_members()
+        db.collection.assert_not_called()
+
+    def test_iter_orders_joins_members_per_page(self):
+        db = make_mock_db()
+        query = db.collection.return_value.order_by.return_value.limit.return_value
+        query.stream.return_value = [
+            self._doc({'orderId': 'ORD001', 'userId': 'U1', 'date': '2026-03-18 10:00:00'}),
+            self._doc({'orderId': 'ORD002', 'userId': 'U1', 'date': '2026-03-18 11:00:00'})
+        ]
+        db.get_all.return_value = [self._doc({'name': '王小明'}, doc_id='U1')]
+
+        orders = list(FirestoreService.iter_orders_with_members(page_size=10))
+
+        self.assertEqual(len(orders), 2)
+        self.assertEqual(orders[1]['customer']['name'], '王小明')
+        db.get_all.assert_called_once()
+        query.start_after.assert_not_called()
+
+
 class TestGetMemberById(unittest.TestCase):
 
     def test_found_returns_true_and_data(self):
@@ -207,7 +316,7 @@ class TestAddOrder(unittest.TestCase):
             '待確認', '未付款', 'transfer'
         )
         self.assertTrue(result)
-        db.collection.assert_called_with('orders')
+        db.collection.assert_any_call('orders')
 
     def test_with_optional_fields(self):
         make_mock_db()
@@ -226,6 +335,147 @@ class TestAddOrder(unittest.TestCase):
         )
         self.assertFalse(result)
 
+    def test_existing_order_id_is_not_overwritten(self):
+        from google.api_core.exceptions import AlreadyExists
+        db = make_mock_db()
+        batch = db.batch.return_value
+        batch.commit.side_effect = AlreadyExists('exists')
+        result = FirestoreService.add_order(
+            'ORD001', 'U123', '土雞蛋 x5', 500, '待確認', '未付款', 'transfer'
+        )
+        self.assertFalse(result)
+        batch.create.assert_called_once()
+        db.collection.return_value.document.return_value.set.assert_not_called()
+
+
+class TestOrderIdWorkerLease(unittest.TestCase):
+
+    def _slot(self, slot_id, data=None):
+        doc = MagicMock()
+        doc.id = slot_id
+        doc.exists = data is not None
+        doc.to_dict.return_value = data
+        return doc
+
+    def test_acquire_takes_expired_slot(self):
+        db = make_mock_db()
+        now = time.time()
+        db.get_all.return_value = [self._slot(f"{i:02d}", {'token': 'other', 'leaseUntil': now + 600}) for i in range(3)]
+        db.get_all.return_value[1] = self._slot('01', {'token': 'other', 'leaseUntil': now - 1})
+        success, (worker_id, lease_until) = FirestoreService.acquire_order_id_worker('mine', 600, max_workers=3)
+        self.assertTrue(success)
+        self.assertEqual(worker_id, 1)
+        self.assertGreater(lease_until, now)
+        self.assertEqual(db.transaction.return_value.set.call_args[0][1]['token'], 'mine')
+
+    def test_acquire_prefers_own_slot(self):
+        db = make_mock_db()
+        db.get_all.return_value = [self._slot('00'), self._slot('01', {'token': 'mine', 'leaseUntil': time.time() + 100})]
+        success, (worker_id, _) = FirestoreService.acquire_order_id_worker('mine', 600, max_workers=2)
+        self.assertTrue(success)
+        self.assertEqual(worker_id, 1)
+
+    def test_acquire_fails_when_all_slots_leased(self):
+        db = make_mock_db()
+        db.get_all.return_value = [self._slot('00', {'token': 'other', 'leaseUntil': time.time() + 600})]
+        success, msg = FirestoreService.acquire_order_id_worker('mine', 600, max_workers=1)
+        self.assertFalse(success)
+
+    def test_renew_rejects_foreign_token(self):
+        db = make_mock_db()
+        db.collection.return_value.document.return_value.get.return_value = self._slot('05', {'token': 'other'})
+        success, _ = FirestoreService.renew_order_id_worker(5, 'mine', 600)
+        self.assertFalse(success)
+        db.transaction.return_value.update.assert_not_called()
+
+
+class TestAddOrderCounters(unittest.TestCase):
+
+    def test_sets_delivery_counters(self):
+        db = make_mock_db()
+        FirestoreService.add_order(
+            'ORD001', 'U123', '土雞蛋 x5', 500, '待確認', '未付款', 'transfer',
+            actual_quantity=6, order_qty=5
+        )
+        data = db.batch.return_value.create.call_args[0][1]
+        self.assertEqual(data['expectedTotal'], 30)
+        self.assertEqual(data['totalDelivered'], 0)
+
+
+class TestGetUserOrdersCounters(unittest.TestCase):
+
+    def _setup_orders(self, db, orders):
+        docs = []
+        for data in orders:
+            doc = MagicMock()
+            doc.to_dict.return_value = data
+            docs.append(doc)
+        query = db.collection.return_value.where.return_value.where.return_value \
+            .order_by.return_value.order_by.return_value.select.return_value
+        query.stream.return_value = docs
+        return query
+
+    def test_remaining_qty_uses_stored_counters(self):
+        db = make_mock_db()
+        self._setup_orders(db, [{
+            'orderId': 'ORD001', 'date': '2026-03-18 10:00:00',
+            'expectedTotal': 10, 'totalDelivered': 4
+        }])
+        orders = FirestoreService.get_user_orders('U123')
+        self.assertEqual(orders[0]['remainingQty'], 6)
+        # 計數欄位存在時不需再讀取 deliveryLogs
+        db.get_all.assert_not_called()
+
+    def test_remaining_qty_legacy_order_falls_back_to_logs(self):
+        db = make_mock_db()
+        self._setup_orders(db, [{
+            'orderId': 'ORD001', 'date': '2026-03-18 10:00:00',
+            'orderQty': 5, 'actualQuantity': 2
+        }])
+        logs_doc = MagicMock(id='ORD001', exists=True)
+        logs_doc.to_dict.return_value = {'deliveryLogs': [{'qty': 3}, {'qty': 5, 'corrected_qty': 4}]}
+        db.get_all.return_value = [logs_doc]
+        orders = FirestoreService.get_user_orders('U123')
+        self.assertEqual(orders[0]['remainingQty'], 3)
+        self.assertEqual(db.get_all.call_args[1]['field_paths'], ['deliveryLogs'])
+        self.assertNotIn('deliveryLogs', orders[0])
+
+
+class TestGetUserOrdersPage(unittest.TestCase):
+    """會員訂單分頁：排除已刪除、新到舊、只回傳顯示欄位"""
+
+    def setUp(self):
+        from benchmarks.fake_firestore import FakeFirestoreClient
+        self.original_db = FirestoreService._db
+        FirestoreService._db = self.fake = FakeFirestoreClient()
+        self.addCleanup(setattr, FirestoreService, '_db', self.original_db)
+        base = datetime(2026, 1, 1, tzinfo=TW_TZ)
+        for i in range(5):
+            self.fake.load('orders', f"ORD{i}", {
+                'orderId': f"ORD{i}", 'userId': 'U1', 'status': '已刪除' if i == 3 else '處理中',
+                'items': '土雞蛋 x1', 'amount': 100, 'expectedTotal': 2, 'totalDelivered': 1,
+                'deliveryLogs': [{'qty': 1}], 'createdAt': base.replace(day=i + 1)
+            })
+        self.fake.load('orders', 'OTHER', {'orderId': 'OTHER', 'userId': 'U2', 'status': '處理中',
+                                           'createdAt': base})
+
+    def test_pages_newest_first_without_deleted(self):
+        success, page = FirestoreService.get_user_orders_page('U1', limit=2)
+        self.assertTrue(success)
+        self.assertEqual([o['orderId'] for o in page['orders']], ['ORD4', 'ORD2'])
+        self.assertTrue(page['hasMore'])
+        self.assertNotIn('deliveryLogs', page['orders'][0])
+        self.assertEqual(page['orders'][0]['remainingQty'], 1)
+
+        success, page = FirestoreService.get_user_orders_page('U1', limit=2, start_after=page['nextCursor'])
+        self.assertEqual([o['orderId'] for o in page['orders']], ['ORD1', 'ORD0'])
+        self.assertFalse(page['hasMore'])
+        self.assertIsNone(page['nextCursor'])
+
+    def test_invalid_cursor(self):
+        success, _ = FirestoreService.get_user_orders_page('U1', start_after='bad')
+        self.assertFalse(success)
+
 
 class TestGetAllOrdersWithMembers(unittest.TestCase):
 
@@ -285,6 +535,129 @@ class TestGetAllOrdersWithMembers(unittest.TestCase):
         self.assertEqual(result, [])
 
 
+class TestGetOrderById(unittest.TestCase):
+
+    def _order_doc(self, exists=True, data=None):
+        doc = MagicMock()
+        doc.exists = exists
+        doc.to_dict.return_value = data or {}
+        return doc
+
+    def test_found_returns_order(self):
+        db = make_mock_db()
+        db.collection.return_value.document.return_value.get.return_value = self._order_doc(
+            data={'orderId': 'ORD001', 'userId': 'U123', 'date': '2026-03-18 10:00:00'}
+        )
+        success, order = FirestoreService.get_order_by_id('ORD001')
+        self.assertTrue(success)
+        self.assertEqual(order['orderId'], 'ORD001')
+        db.collection.return_value.document.assert_called_with('ORD001')
+        db.collection.return_value.stream.assert_not_called()
+
+    def test_not_found(self):
+        db = make_mock_db()
+        db.collection.return_value.document.return_value.get.return_value = self._order_doc(exists=False)
+        success, msg = FirestoreService.get_order_by_id('ORD999')
+        self.assertFalse(success)
+        self.assertEqual(msg, '訂單不存在')
+
+    def test_with_member_reads_single_member(self):
+        db = make_mock_db()
+        order_doc = self._order_doc(data={'orderId': 'ORD001', 'userId': 'U123', 'date': '2026-03-18 10:00:00'})
+        member_doc = self._order_doc(data={'userId': 'U123', 'name': '王小明'})
+        db.collection.return_value.document.return_value.get.side_effect = [order_doc, member_doc]
+        success, order = FirestoreService.get_order_with_member('ORD001')
+        self.assertTrue(success)
+        self.assertEqual(order['customer']['name'], '王小明')
+        self.assertEqual(db.collection.return_value.document.return_value.get.call_count, 2)
+
+    def test_with_member_missing_member_gets_empty_customer(self):
+        db = make_mock_db()
+        order_doc = self._order_doc(data={'orderId': 'ORD001', 'userId': 'U123', 'date': '2026-03-18 10:00:00'})
+        db.collection.return_value.document.return_value.get.side_effect = [order_doc, self._order_doc(exists=False)]
+        success, order = FirestoreService.get_order_with_member('ORD001')
+        self.assertTrue(success)
+        self.assertEqual(order['customer'], {})
+
+
+class TestGetOrdersPage(unittest.TestCase):
+
+    def _setup_query(self, db, order_dicts, members=None):
+        query = MagicMock()
+        for method in ('where', 'order_by', 'start_after', 'limit'):
+            getattr(query, method).return_value = query
+        order_docs = []
+        for data in order_dicts:
+            doc = MagicMock()
+            doc.to_dict.return_value = dict(data)
+            order_docs.append(doc)
+        query.stream.return_value = order_docs
+        db.collection.return_value = query
+
+        member_docs = []
+        for uid, data in (members or {}).items():
+            doc = MagicMock()
+            doc.id = uid
+            doc.exists = True
+            doc.to_dict.return_value = data
+            member_docs.append(doc)
+        db.get_all.return_value = member_docs
+        return query
+
+    def test_returns_page_with_customers_from_batched_get(self):
+        db = make_mock_db()
+        self._setup_query(db, [
+            {'orderId': 'ORD002', 'userId': 'U1', 'createdAt': datetime(2026, 3, 2), 'date': '2026-03-02 10:00:00'},
+            {'orderId': 'ORD001', 'userId': 'U1', 'createdAt': datetime(2026, 3, 1), 'date': '2026-03-01 10:00:00'},
+        ], members={'U1': {'name': '王小明'}})
+        success, result = FirestoreService.get_orders_page(limit=5)
+        self.assertTrue(success)
+        self.assertEqual(len(result['orders']), 2)
+        self.assertFalse(result['hasMore'])
+        self.assertIsNone(result['nextCursor'])
+        self.assertEqual(result['orders'][0]['customer']['name'], '王小明')
+        # 只讀取本頁會員，且同一會員只讀一次
+        refs = db.get_all.call_args[0][0]
+        self.assertEqual(len(refs), 1)
+
+    def test_has_more_returns_cursor_of_last_order(self):
+        db = make_mock_db()
+        query = self._setup_query(db, [
+            {'orderId': 'ORD003', 'userId': 'U1', 'createdAt': datetime(2026, 3, 3)},
+            {'orderId': 'ORD002', 'userId': 'U1', 'createdAt': datetime(2026, 3, 2)},
+            {'orderId': 'ORD001', 'userId': 'U1', 'createdAt': datetime(2026, 3, 1)},
+        ])
+        success, result = FirestoreService.get_orders_page(limit=2)
+        self.assertTrue(success)
+        self.assertTrue(result['hasMore'])
+        self.assertEqual([o['orderId'] for o in result['orders']], ['ORD003', 'ORD002'])
+        self.assertEqual(result['nextCursor'], '2026-03-02T00:00:00|ORD002')
+        query.limit.assert_called_with(3)
+
+    def test_cursor_and_filters_pushed_into_query(self):
+        db = make_mock_db()
+        query = self._setup_query(db, [])
+        success, result = FirestoreService.get_orders_page(
+            limit=10, start_after='2026-03-02T00:00:00|ORD002',
+            status='已確認', payment_status='未付款',
+            date_from='2026-03-01', date_to='2026-03-31'
+        )
+        self.assertTrue(success)
+        self.assertEqual(result['orders'], [])
+        fields = [c[0][0] for c in query.where.call_args_list]
+        self.assertEqual(fields, ['status', 'paymentStatus', 'createdAt', 'createdAt'])
+        query.start_after.assert_called_once_with({
+            'createdAt': datetime(2026, 3, 2), 'orderId': 'ORD002'
+        })
+        db.get_all.assert_not_called()
+
+    def test_invalid_cursor_returns_false(self):
+        db = make_mock_db()
+        self._setup_query(db, [])
+        success, msg = FirestoreService.get_orders_page(start_after='garbage')
+        self.assertFalse(success)
+
+
 class TestAddDeliveryLog(unittest.TestCase):
 
     def _setup_order(self, db, order_data):
@@ -344,6 +717,139 @@ class TestAddDeliveryLog(unittest.TestCase):
         self.assertEqual(result['delivery_date'], '2026-03-20')
 
 
+class TestAddDeliveryLogs(unittest.TestCase):
+
+    def _order_doc(self, order_id, order_data, exists=True):
+        doc = MagicMock()
+        doc.id = order_id
+        doc.exists = exists
+        doc.to_dict.return_value = order_data
+        return doc
+
+    def test_reads_orders_in_one_call_and_merges_same_order(self):
+        db = make_mock_db()
+        db.get_all.return_value = [
+            self._order_doc('ORD001', {'userId': 'U001', 'deliveryLogs': [], 'expectedTotal': 10, 'totalDelivered': 0}),
+            self._order_doc('ORD999', {}, exists=False)
+        ]
+        success, results = FirestoreService.add_delivery_logs([
+            {'orderId': 'ORD001', 'qty': 4, 'address': '新竹市', 'delivery_date': '2026-03-18'},
+            {'orderId': 'ORD999', 'qty': 2},
+            {'orderId': 'ORD001', 'qty': 6, 'address': '竹北市', 'delivery_date': '2026-03-18'}
+        ])
+        self.assertTrue(success)
+        db.get_all.assert_called_once()
+        self.assertEqual(results[0]['status'], '部分配送')
+        self.assertEqual(results[0]['total_delivered'], 4)
+        self.assertEqual(results[2]['status'], '已完成')
+        self.assertEqual(results[2]['total_delivered'], 10)
+        self.assertEqual(results[2]['userId'], 'U001')
+        self.assertFalse(results[1]['success'])
+
+        batch = db.transaction.return_value
+        # 同一訂單只更新一次，累加兩筆出貨
+        batch.update.assert_called_once()
+        update = batch.update.call_args[0][1]
+        self.assertEqual(update['totalDelivered'].value, 10)
+        self.assertEqual(len(update['deliveryLogs'].values), 2)
+        # 2 筆出貨索引 + 1 筆統計計數
+        self.assertEqual(batch.set.call_count, 3)
+        batch._commit.assert_called_once()
+
+    def test_splits_writes_at_batch_limit(self):
+        db = make_mock_db()
+        deliveries = [{'orderId': f'ORD{i:03d}', 'qty': 1} for i in range(300)]
+        db.get_all.return_value = [
+            self._order_doc(d['orderId'], {'deliveryLogs': [], 'expectedTotal': 5, 'totalDelivered': 0})
+            for d in deliveries
+        ]
+        success, results = FirestoreService.add_delivery_logs(deliveries)
+        self.assertTrue(success)
+        # 每張訂單 2 筆寫入，600 筆需分成兩批
+        self.assertEqual(db.transaction.return_value._commit.call_count, 2)
+        self.assertTrue(all(r['success'] for r in results))
+
+    def test_failed_commit_marks_chunk_failed(self):
+        db = make_mock_db()
+        db.get_all.return_value = [
+            self._order_doc('ORD001', {'deliveryLogs': [], 'expectedTotal': 5, 'totalDelivered': 0})
+        ]
+        db.transaction.return_value._commit.side_effect = Exception('deadline exceeded')
+        success, results = FirestoreService.add_delivery_logs([{'orderId': 'ORD001', 'qty': 1}])
+        self.assertTrue(success)
+        self.assertFalse(results[0]['success'])
+        self.assertIn('deadline', results[0]['msg'])
+
+    def test_rejects_too_many(self):
+        make_mock_db()
+        deliveries = [{'orderId': 'ORD001', 'qty': 1}] * (FirestoreService.MAX_BULK_DELIVERIES + 1)
+        success, msg = FirestoreService.add_delivery_logs(deliveries)
+        self.assertFalse(success)
+
+
+class TestDeliveryCounters(unittest.TestCase):
+
+    def _setup_order(self, db, order_data):
+        mock_doc = MagicMock()
+        mock_doc.exists = True
+        mock_doc.to_dict.return_value = order_data
+        db.collection.return_value.document.return_value.get.return_value = mock_doc
+
+    def _update_data(self, db):
+        return db.transaction.return_value.update.call_args[0][1]
+
+    def test_add_uses_increment_and_array_union(self):
+        db = make_mock_db()
+        self._setup_order(db, {
+            'deliveryLogs': [{'qty': 3}],
+            'expectedTotal': 10, 'totalDelivered': 3
+        })
+        success, result = FirestoreService.add_delivery_log('ORD001', 4, '新竹市', '2026-03-18')
+        self.assertTrue(success)
+        self.assertEqual(result['total_delivered'], 7)
+        self.assertEqual(result['total_ordered'], 10)
+        data = self._update_data(db)
+        self.assertIsInstance(data['totalDelivered'], firestore.Increment)
+        self.assertEqual(data['totalDelivered'].value, 4)
+        self.assertIsInstance(data['deliveryLogs'], firestore.ArrayUnion)
+        self.assertNotIn('expectedTotal', data)
+
+    def test_add_on_legacy_order_backfills_counters(self):
+        db = make_mock_db()
+        self._setup_order(db, {
+            'deliveryLogs': [{'qty': 3}],
+            'orderQty': 5, 'actualQuantity': 2
+        })
+        success, result = FirestoreService.add_delivery_log('ORD001', 4)
+        self.assertTrue(success)
+        data = self._update_data(db)
+        self.assertEqual(data['totalDelivered'], 7)
+        self.assertEqual(data['expectedTotal'], 10)
+
+    def test_correct_increments_by_difference(self):
+        db = make_mock_db()
+        self._setup_order(db, {
+            'deliveryLogs': [{'stamp': '2026-03-18 10:00:00', 'qty': 5, 'address': '新竹市'}],
+            'expectedTotal': 5, 'totalDelivered': 5
+        })
+        success, result = FirestoreService.correct_delivery_log('ORD001', 0, 3, '竹北市')
+        self.assertTrue(success)
+        self.assertEqual(result['total_delivered'], 3)
+        self.assertEqual(result['status'], '部分配送')
+        self.assertEqual(self._update_data(db)['totalDelivered'].value, -2)
+
+    def test_correct_on_legacy_order_sets_total(self):
+        db = make_mock_db()
+        self._setup_order(db, {
+            'deliveryLogs': [{'qty': 5}, {'qty': 2}],
+            'items': '土雞蛋 x10'
+        })
+        success, result = FirestoreService.correct_delivery_log('ORD001', 0, 3)
+        self.assertTrue(success)
+        self.assertEqual(result['total_delivered'], 5)
+        self.assertEqual(self._update_data(db)['totalDelivered'], 5)
+
+
 class TestCorrectDeliveryLog(unittest.TestCase):
 
     def _setup_order(self, db, delivery_logs):
@@ -391,39 +897,121 @@ class TestCorrectDeliveryLog(unittest.TestCase):
         success, result = FirestoreService.correct_delivery_log('ORD001', 0, 3, '竹北市')
         self.assertTrue(success)
         # 確認 corrected_qty 被記錄
-        update_call = db.collection.return_value.document.return_value.update.call_args
-        updated_logs = update_call[0][0]['deliveryLogs']
+        update_call = db.transaction.return_value.update.call_args
+        updated_logs = update_call[0][1]['deliveryLogs']
         self.assertTrue(updated_logs[0]['is_corrected'])
         self.assertEqual(updated_logs[0]['corrected_qty'], 3)
 
 
+class TestDeliveryIndex(unittest.TestCase):
+
+    def _setup_order(self, db, order_data):
+        mock_doc = MagicMock()
+        mock_doc.exists = True
+        mock_doc.to_dict.return_value = order_data
+        db.collection.return_value.document.return_value.get.return_value = mock_doc
+
+    def test_add_writes_index_entry_in_same_batch(self):
+        db = make_mock_db()
+        self._setup_order(db, {
+            'userId': 'U001', 'deliveryLogs': [],
+            'expectedTotal': 10, 'totalDelivered': 0
+        })
+        success, _ = FirestoreService.add_delivery_log('ORD001', 4, '新竹市', '2026-03-18')
+        self.assertTrue(success)
+        batch = db.transaction.return_value
+        entry = batch.set.call_args_list[0][0][1]
+        self.assertEqual(entry['orderId'], 'ORD001')
+        self.assertEqual(entry['userId'], 'U001')
+        self.assertEqual(entry['delivery_date'], '2026-03-18')
+        self.assertEqual(entry['qty'], 4)
+        self.assertTrue(entry['logId'])
+        batch._commit.assert_called_once()
+
+    def test_correct_rewrites_index_entry(self):
+        db = make_mock_db()
+        self._setup_order(db, {
+            'userId': 'U001',
+            'deliveryLogs': [{'logId': 'abc123', 'delivery_date': '2026-03-18', 'qty': 5, 'address': '新竹市'}],
+            'expectedTotal': 10, 'totalDelivered': 5
+        })
+        success, _ = FirestoreService.correct_delivery_log('ORD001', 0, 3, '竹北市', '2026-03-20')
+        self.assertTrue(success)
+        db.collection.return_value.document.assert_any_call('abc123')
+        entry = db.transaction.return_value.set.call_args_list[0][0][1]
+        self.assertEqual(entry['qty'], 3)
+        self.assertEqual(entry['delivery_date'], '2026-03-20')
+        self.assertEqual(entry['address'], '竹北市')
+
+    def test_get_records_by_date_joins_members(self):
+        db = make_mock_db()
+        entry_doc = MagicMock()
+        entry_doc.to_dict.return_value = {
+            'orderId': 'ORD001', 'userId': 'U001', 'qty': 5, 'address': '新竹市'
+        }
+        query = db.collection.return_value.where.return_value.order_by.return_value
+        query.stream.return_value = [entry_doc]
+        member_doc = MagicMock()
+        member_doc.exists = True
+        member_doc.id = 'U001'
+        member_doc.to_dict.return_value = {'name': '王小明', 'phone': '0912345678'}
+        db.get_all.return_value = [member_doc]
+
+        success, records = FirestoreService.get_delivery_records_by_date('2026-03-18')
+        self.assertTrue(success)
+        db.collection.return_value.where.assert_called_once_with('delivery_date', '==', '2026-03-18')
+        self.assertEqual(records, [{
+            'orderId': 'ORD001',
+            'delivery_qty': 5,
+            'delivery_address': '新竹市',
+            'customer_name': '王小明',
+            'customer_phone': '0912345678'
+        }])
+
+    def test_get_records_by_date_empty_skips_member_read(self):
+        db = make_mock_db()
+        db.collection.return_value.where.return_value.order_by.return_value.stream.return_value = []
+        success, records = FirestoreService.get_delivery_records_by_date('2026-03-18')
+        self.assertTrue(success)
+        self.assertEqual(records, [])
+        db.get_all.assert_not_called()
+
+
 class TestUpdateOrderStatus(unittest.TestCase):
 
     def test_success(self):
         db = make_mock_db()
-        result = FirestoreService.update_order_status('ORD001', '已完成')
-        self.assertTrue(result)
-        db.collection.assert_called_with('orders')
+        _setup_order_doc(db, {'status': '處理中', 'amount': 500, 'paymentStatus': '已付款'})
+        success, _ = FirestoreService.update_order_status('ORD001', '已完成')
+        self.assertTrue(success)
+        db.collection.assert_any_call('orders')
+        self.assertEqual(db.transaction.return_value.update.call_args[0][1]['status'], '已完成')
+
+    def test_missing_order_returns_false(self):
+        db = make_mock_db()
+        _setup_order_doc(db, None)
+        self.assertEqual(FirestoreService.update_order_status('ORD404', '已完成'),
+                         (False, FirestoreService.ORDER_NOT_FOUND_MSG))
+        db.transaction.return_value.update.assert_not_called()
 
     def test_db_exception_returns_false(self):
         db = make_mock_db()
         db.collection.side_effect = Exception('DB error')
-        result = FirestoreService.update_order_status('ORD001', '已完成')
-        self.assertFalse(result)
+        self.assertEqual(FirestoreService.update_order_status('ORD001', '已完成'), (False, 'DB error'))
 
 
 class TestUpdateOrderPaymentStatus(unittest.TestCase):
 
     def test_success(self):
         db = make_mock_db()
-        result = FirestoreService.update_order_payment_status('ORD001', '已付款')
-        self.assertTrue(result)
+        _setup_order_doc(db, {'status': '處理中', 'amount': 500, 'paymentStatus': '未付款'})
+        success, _ = FirestoreService.update_order_payment_status('ORD001', '已付款')
+        self.assertTrue(success)
 
     def test_db_exception_returns_false(self):
         db = make_mock_db()
         db.collection.side_effect = Exception('DB error')
-        result = FirestoreService.update_order_payment_status('ORD001', '已付款')
-        self.assertFalse(result)
+        self.assertEqual(FirestoreService.update_order_payment_status('ORD001', '已付款'), (False, 'DB error'))
 
 
 class TestAddAuditLog(unittest.TestCase):
@@ -483,5 +1071,537 @@ class TestUpdateProductStock(unittest.TestCase):
         self.assertEqual(msg, '商品不存在')
 
 
+    def test_stock_and_log_written_in_same_transaction(self):
+        db = make_mock_db()
+        mock_doc = MagicMock()
+        mock_doc.exists = True
+        mock_doc.to_dict.return_value = {'name': '土雞蛋', 'stock': 10}
+        db.collection.return_value.document.return_value.get.return_value = mock_doc
+        transaction = db.transaction.return_value
+        success, _ = FirestoreService.update_product_stock('prod_001', -4, '出貨')
+        self.assertTrue(success)
+        # 庫存與異動紀錄皆經由交易寫入，不直接呼叫 update/add
+        self.assertEqual(transaction.update.call_args[0][1]['stock'], 6)
+        self.assertEqual(transaction.set.call_args[0][1]['newStock'], 6)
+        db.collection.return_value.document.return_value.update.assert_not_called()
+        db.collection.return_value.add.assert_not_called()
+        mock_doc_get = db.collection.return_value.document.return_value.get
+        self.assertIs(mock_doc_get.call_args[1]['transaction'], transaction)
+
+
+class TestUpdateProductsStock(unittest.TestCase):
+
+    def _setup_products(self, db, products):
+        docs = []
+        for pid, data in products.items():
+            doc = MagicMock()
+            doc.id = pid
+            doc.exists = True
+            doc.to_dict.return_value = data
+            docs.append(doc)
+        db.get_all.return_value = docs
+
+    def test_bulk_success_merges_duplicates(self):
+        db = make_mock_db()
+        self._setup_products(db, {
+            'p1': {'name': '土雞蛋', 'stock': 10},
+            'p2': {'name': '鴨蛋', 'stock': 5}
+        })
+        success, result = FirestoreService.update_products_stock([
+            {'productId': 'p1', 'qtyChange': 3},
+            {'productId': 'p2', 'qtyChange': -5},
+            {'productId': 'p1', 'qtyChange': 2}
+        ], '盤點')
+        self.assertTrue(success)
+        self.assertEqual(result['p1'], {'oldStock': 10, 'newStock': 15})
+        self.assertEqual(result['p2'], {'oldStock': 5, 'newStock': 0})
+        transaction = db.transaction.return_value
+        self.assertEqual(transaction.update.call_count, 2)
+        self.assertEqual(transaction.set.call_count, 2)
+
+    def test_bulk_rejects_all_when_one_goes_negative(self):
+        db = make_mock_db()
+        self._setup_products(db, {
+            'p1': {'name': '土雞蛋', 'stock': 10},
+            'p2': {'name': '鴨蛋', 'stock': 1}
+        })
+        success, msg = FirestoreService.update_products_stock([
+            {'productId': 'p1', 'qtyChange': -3},
+            {'productId': 'p2', 'qtyChange': -2}
+        ], '出貨')
+        self.assertFalse(success)
+        self.assertIn('庫存不足', msg)
+        db.transaction.return_value.update.assert_not_called()
+
+    def test_bulk_missing_product(self):
+        db = make_mock_db()
+        self._setup_products(db, {'p1': {'name': '土雞蛋', 'stock': 10}})
+        success, msg = FirestoreService.update_products_stock([
+            {'productId': 'p1', 'qtyChange': 1},
+            {'productId': 'p404', 'qtyChange': 1}
+        ], '進貨')
+        self.assertFalse(success)
+        self.assertIn('p404', msg)
+
+    def test_bulk_empty_changes(self):
+        make_mock_db()
+        success, msg = FirestoreService.update_products_stock([], '進貨')
+        self.assertFalse(success)
+
+
+class TestPlaceOrder(unittest.TestCase):
+    """下單：檢查商品、預留庫存與訂單在同一交易，取消時釋放"""
+
+    def setUp(self):
+        from benchmarks.fake_firestore import FakeFirestoreClient
+        self.original_db = FirestoreService._db
+        FirestoreService._db = self.fake = FakeFirestoreClient()
+        self.addCleanup(setattr, FirestoreService, '_db', self.original_db)
+        self.fake.load('products', 'p1', {'name': '土雞蛋', 'stock': 20, 'status': 'active'})
+        self.fake.load('products', 'p2', {'name': '禮盒', 'stock': 5, 'status': 'active'})
+        self.fake.load('products', 'p3', {'name': '鴨蛋', 'stock': 50, 'status': 'inactive'})
+
+    def _stock(self, product_id):
+        return self.fake.collection('products').document(product_id).get().to_dict()['stock']
+
+    def _order(self, order_id):
+        return self.fake.collection('orders').document(order_id).get().to_dict()
+
+    def _add(self, order_id, line_items):
+        return FirestoreService.place_order(order_id, 'U1', '土雞蛋 x2, 禮盒 x1', 700, '處理中', '未付款',
+                                            'transfer', line_items, operator='U1')
+
+    def test_order_and_stock_committed_together(self):
+        success, order = self._add('ORD1', [
+            {'productId': 'p1', 'name': '土雞蛋', 'qty': 2, 'actualQuantity': 3, 'amount': 500},
+            {'productId': 'p2', 'name': '禮盒', 'qty': 1, 'actualQuantity': 1, 'amount': 200}
+        ])
+        self.assertTrue(success)
+        self.assertEqual(order['expectedTotal'], 7)
+        stored = self.fake.collection('orders').document('ORD1').get().to_dict()
+        self.assertEqual([item['productId'] for item in stored['lineItems']], ['p1', 'p2'])
+        self.assertEqual((self._stock('p1'), self._stock('p2')), (14, 4))
+        logs = [doc.to_dict() for doc in self.fake.collection('stockLogs').stream()]
+        self.assertEqual(sorted((log['productId'], log['quantity']) for log in logs), [('p1', 6), ('p2', 1)])
+        self.assertEqual(logs[0]['reason'], '訂單 ORD1')
+        success, stats = FirestoreService.get_order_stats(days=1, months=1)
+        self.assertEqual((stats['totalOrders'], stats['expectedTrays']), (1, 7))
+
+    def test_nothing_written_when_one_line_fails(self):
+        for line_items, message in [
+            ([{'productId': 'p1', 'qty': 2}, {'productId': 'p2', 'qty': 6}], '庫存不足'),
+            ([{'productId': 'p1', 'qty': 2}, {'productId': 'p3', 'qty': 1}], '已下架'),
+            ([{'productId': 'p1', 'qty': 2}, {'productId': 'p404', 'qty': 1}], 'p404'),
+        ]:
+            success, msg = self._add('ORD2', line_items)
+            self.assertFalse(success)
+            self.assertIn(message, msg)
+        self.assertEqual((self._stock('p1'), self._stock('p2')), (20, 5))
+        self.assertFalse(self.fake.collection('orders').document('ORD2').get().exists)
+        self.assertEqual(list(self.fake.collection('stockLogs').stream()), [])
+
+    def test_duplicate_order_id_keeps_stock(self):
+        self.assertTrue(self._add('ORD3', [{'productId': 'p1', 'qty': 1}])[0])
+        success, msg = self._add('ORD3', [{'productId': 'p1', 'qty': 1}])
+        self.assertFalse(success)
+        self.assertEqual(self._stock('p1'), 19)
+
+
+    def test_cancel_releases_reserved_stock_once(self):
+        self.assertTrue(self._add('ORD4', [{'productId': 'p1', 'qty': 3, 'actualQuantity': 2}])[0])
+        self.assertEqual(self._stock('p1'), 14)
+        self.assertTrue(FirestoreService.update_order_status('ORD4', '已取消')[0])
+        self.assertEqual(self._stock('p1'), 20)
+        self.assertFalse(self.fake.collection('orders').document('ORD4').get().to_dict()['stockReserved'])
+        FirestoreService.update_order_status('ORD4', '已刪除')
+        self.assertEqual(self._stock('p1'), 20)
+
+    def test_reopen_re_reserves_stock(self):
+        self.assertTrue(self._add('ORD6', [{'productId': 'p2', 'qty': 4}])[0])
+        self.assertTrue(FirestoreService.update_order_status('ORD6', '已取消')[0])
+        self.assertEqual(self._stock('p2'), 5)
+        self.assertTrue(self._add('ORD7', [{'productId': 'p2', 'qty': 3}])[0])
+
+        # 庫存不足時不可恢復，狀態與庫存都不變
+        success, msg = FirestoreService.update_order_status('ORD6', '處理中')
+        self.assertFalse(success)
+        self.assertIn('庫存不足', msg)
+        self.assertEqual(self._order('ORD6')['status'], '已取消')
+        self.assertEqual(self._stock('p2'), 2)
+
+        FirestoreService.update_order_status('ORD7', '已取消')
+        self.assertTrue(FirestoreService.update_order_status('ORD6', '處理中')[0])
+        self.assertEqual(self._stock('p2'), 1)
+        self.assertTrue(self._order('ORD6')['stockReserved'])
+
+    def test_failed_release_aborts_status_change(self):
+        self.assertTrue(self._add('ORD8', [{'productId': 'p1', 'qty': 2}])[0])
+        self.fake.collection('products').document('p1').delete()
+        self.assertFalse(FirestoreService.update_order_status('ORD8', '已取消')[0])
+        order = self._order('ORD8')
+        self.assertEqual((order['status'], order['stockReserved']), ('處理中', True))
+
+    def test_cancelled_order_cannot_be_paid(self):
+        self.assertTrue(self._add('ORD9', [{'productId': 'p1', 'qty': 1}])[0])
+        FirestoreService.update_order_status('ORD9', '已取消')
+        self.assertEqual(FirestoreService.update_order_payment_status('ORD9', '已付款'),
+                         (False, "訂單已已取消，不可標記為已付款"))
+        self.assertEqual(self._order('ORD9')['paymentStatus'], '未付款')
+        self.assertTrue(FirestoreService.update_order_payment_status('ORD9', '待付款')[0])
+
+    def test_delivered_order_keeps_stock_on_cancel(self):
+        self.assertTrue(self._add('ORD5', [{'productId': 'p1', 'qty': 4}])[0])
+        FirestoreService.add_delivery_log('ORD5', 1)
+        FirestoreService.update_order_status('ORD5', '已取消')
+        self.assertEqual(self._stock('p1'), 16)
+
+
+class TestStockShards(unittest.TestCase):
+    """庫存分片：下單只讀寫隨機分片，總庫存為各分片加總"""
+
+    def setUp(self):
+        from benchmarks.fake_firestore import FakeFirestoreClient
+        self.original_db = FirestoreService._db
+        FirestoreService._db = self.fake = FakeFirestoreClient()
+        self.addCleanup(setattr, FirestoreService, '_db', self.original_db)
+        self.fake.load('products', 'p1', {'productId': 'p1', 'name': '限量禮盒', 'stock': 150,
+                                          'status': 'active', 'minStockAlert': 10})
+
+    def _shards(self):
+        docs = self.fake.collection(FirestoreService.STOCK_SHARD_COLLECTION).stream()
+        return sorted(doc.to_dict()['stock'] for doc in docs)
+
+    def _place(self, order_id, qty):
+        return FirestoreService.place_order(order_id, 'U1', f"限量禮盒 x{qty}", 100 * qty, '處理中', '未付款',
+                                            'transfer', [{'productId': 'p1', 'qty': qty}])
+
+    def test_reshard_keeps_total(self):
+        self.assertEqual(FirestoreService.set_stock_shards('p1', 4)[1]['stock'], 150)
+        self.assertEqual(self._shards(), [37, 37, 38, 38])
+        self.assertEqual(FirestoreService.get_product('p1')[1]['stock'], 150)
+        self.assertFalse(FirestoreService.set_stock_shards('p1', 999)[0])
+        self.assertFalse(FirestoreService.set_stock_shards('p404', 2)[0])
+
+        FirestoreService.update_product_stock('p1', -100, '盤點')
+        self.assertEqual(FirestoreService.get_product('p1')[1]['stock'], 50)
+        success, result = FirestoreService.update_product_stock('p1', 5, '進貨')
+        self.assertEqual(result['newStock'], 55)
+
+        FirestoreService.set_stock_shards('p1', 0)
+        self.assertEqual(self._shards(), [])
+        self.assertEqual(FirestoreService.get_product('p1')[1]['stock'], 55)
+
+    def test_reservation_spans_shards_and_rejects_oversell(self):
+        FirestoreService.set_stock_shards('p1', 3)
+        reads = self.fake.stats.reads
+        self.assertTrue(self._place('ORD0', 10)[0])
+        # 商品文件 + 一個分片
+        self.assertEqual(self.fake.stats.reads - reads, 2)
+        self.assertTrue(self._place('ORD1', 50)[0])
+        self.assertEqual(sum(self._shards()), 90)
+        success, msg = self._place('ORD2', 91)
+        self.assertFalse(success)
+        self.assertIn('庫存不足', msg)
+        self.assertEqual(sum(self._shards()), 90)
+
+        FirestoreService.update_order_status('ORD1', '已取消')
+        self.assertEqual(sum(self._shards()), 140)
+        self.assertEqual(FirestoreService.get_low_stock_products()[1], [])
+
+    def test_concurrent_orders_never_oversell(self):
+        from concurrent.futures import ThreadPoolExecutor
+        FirestoreService.set_stock_shards('p1', 10)
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            results = list(pool.map(lambda i: self._place(f"ORD{i:03d}", 1)[0], range(200)))
+        self.assertEqual(results.count(True), 150)
+        self.assertEqual(self._shards(), [0] * 10)
+        self.assertEqual(FirestoreService.get_product('p1')[1]['stock'], 0)
+
+
+class TestApplicableDiscounts(unittest.TestCase):
+    """適用折扣：單一查詢取得商品、分類與會員等級折扣"""
+
+    def setUp(self):
+        from benchmarks.fake_firestore import FakeFirestoreClient
+        self.original_db = FirestoreService._db
+        FirestoreService._db = self.fake = FakeFirestoreClient()
+        self.addCleanup(setattr, FirestoreService, '_db', self.original_db)
+        for doc_id, target_type, target_id, status, end in [
+            ('d1', 'product', 'p1', 'active', None), ('d2', 'category', 'c1', 'active', '2099-12-31'),
+            ('d3', 'category', 'p1', 'active', None), ('d4', 'product', 'p1', 'deleted', None),
+            ('d5', 'product', 'p1', 'active', '2020-01-01'),
+        ]:
+            self.fake.load('discounts', doc_id, {'targetType': target_type, 'targetId': target_id,
+                                                  'status': status, 'startDate': '2020-01-01' if end else None,
+                                                  'endDate': end})
+
+    def test_single_query_filters_target_type_and_window(self):
+        rpcs = self.fake.stats.rpcs
+        success, discounts = FirestoreService.get_applicable_discounts('p1', 'c1')
+        self.assertTrue(success)
+        self.assertEqual(sorted(d['id'] for d in discounts), ['d1', 'd2'])
+        self.assertEqual(self.fake.stats.rpcs - rpcs, 1)
+
+    def test_active_discounts(self):
+        success, discounts = FirestoreService.get_active_discounts()
+        self.assertEqual(sorted(d['id'] for d in discounts), ['d1', 'd2', 'd3', 'd5'])
+
+
+class TestStockAlerts(unittest.TestCase):
+    """庫存警告：查詢端篩選、分頁與清單版本"""
+
+    def setUp(self):
+        from benchmarks.fake_firestore import FakeFirestoreClient
+        self.original_db = FirestoreService._db
+        FirestoreService._db = self.fake = FakeFirestoreClient()
+        self.addCleanup(setattr, FirestoreService, '_db', self.original_db)
+        base = datetime(2026, 1, 1, tzinfo=TW_TZ)
+        for i, (alert_type, status) in enumerate([('low', 'active'), ('critical', 'active'), ('low', 'acknowledged'),
+                                                  ('low', 'active'), ('high', 'active')]):
+            self.fake.load('stockAlerts', f"A{i}", {'productId': f"p{i}", 'alertType': alert_type,
+                                                    'status': status, 'createdAt': base.replace(day=i + 1)})
+
+    def test_filters_and_pages_newest_first(self):
+        success, alerts = FirestoreService.get_stock_alerts('active', 'low')
+        self.assertTrue(success)
+        self.assertEqual([a['id'] for a in alerts], ['A3', 'A0'])
+
+        success, page = FirestoreService.get_stock_alerts_page('active', limit=2)
+        self.assertEqual([a['id'] for a in page['alerts']], ['A4', 'A3'])
+        self.assertTrue(page['hasMore'])
+        _, page = FirestoreService.get_stock_alerts_page('active', limit=2, start_after=page['nextCursor'])
+        self.assertEqual([a['id'] for a in page['alerts']], ['A1', 'A0'])
+        self.assertFalse(page['hasMore'])
+
+    def test_query_reads_only_matching_alerts(self):
+        before = self.fake.stats.reads
+        FirestoreService.get_stock_alerts_page('active', 'critical', limit=10)
+        self.assertEqual(self.fake.stats.reads - before, 1)
+
+    def test_writes_bump_version(self):
+        self.assertEqual(FirestoreService.get_stock_alerts_version(), (True, 0))
+        self.assertTrue(FirestoreService.add_stock_alert('p9', 'low', 10)[0])
+        self.assertTrue(FirestoreService.acknowledge_stock_alert('A0')[0])
+        self.assertEqual(FirestoreService.get_stock_alerts_version(), (True, 2))
+
+        success, _ = FirestoreService.acknowledge_stock_alert('missing')
+        self.assertFalse(success)
+        self.assertEqual(FirestoreService.get_stock_alerts_version(), (True, 2))
+
+
+class TestLineOutbox(unittest.TestCase):
+    """LINE 推播 outbox 補送認領"""
+
+    def setUp(self):
+        from benchmarks.fake_firestore import FakeFirestoreClient
+        self.original_db = FirestoreService._db
+        FirestoreService._db = self.fake = FakeFirestoreClient()
+        self.addCleanup(setattr, FirestoreService, '_db', self.original_db)
+
+    def test_claims_only_stale_messages_once(self):
+        FirestoreService.add_line_outbox('fresh', 'U1', 'Hello')
+        self.fake.load('lineOutbox', 'stale', {'messageId': 'stale', 'userId': 'U1', 'text': 'Hello',
+                                               'status': 'pending', 'attempts': 1,
+                                               'updatedAt': datetime(2026, 1, 1, tzinfo=TW_TZ)})
+
+        success, messages = FirestoreService.claim_stale_line_outbox(300)
+        self.assertTrue(success)
+        self.assertEqual([m['messageId'] for m in messages], ['stale'])
+        self.assertEqual(FirestoreService.claim_stale_line_outbox(300), (True, []))
+
+
+class TestFirestoreClientPool(unittest.TestCase):
+    """Firestore 連線池"""
+
+    def test_picks_least_busy_channel(self):
+        from benchmarks.fake_firestore import FakeFirestoreClient
+        base = FakeFirestoreClient()
+        base.load('members', 'U1', {'name': '會員'})
+        views = [base.channel(5) for _ in range(3)]
+        pool = FirestoreClientPool(views, limiters=views)
+        views[0].in_flight = views[2].in_flight = 4
+        self.assertIs(pool._pick(), views[1])
+        # 各 channel 共用同一份資料
+        self.assertEqual(pool.collection('members').document('U1').get().to_dict()['name'], '會員')
+        self.assertEqual(pool.stats()[0], {'inFlight': 4, 'maxConcurrent': 5})
+
+    def test_limiter_times_out_when_channel_full(self):
+        from google.api_core.exceptions import DeadlineExceeded
+        limiter = _ChannelLimiter(1)
+        details = MagicMock(timeout=0.01)
+        limiter._acquire(None)
+        with self.assertRaises(DeadlineExceeded):
+            limiter.intercept_unary_unary(lambda d, r: 'ok', details, None)
+        limiter._release()
+        self.assertEqual(limiter.intercept_unary_unary(lambda d, r: 'ok', details, None), 'ok')
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_channel_options_and_rpc_defaults(self):
+        from google.auth.credentials import AnonymousCredentials
+        import grpc
+        with patch('google.cloud.firestore_v1.services.firestore.transports.grpc.'
+                   'FirestoreGrpcTransport.create_channel') as mock_create:
+            # 不連線：以未使用的本機 channel 取代
+            mock_create.return_value = grpc.insecure_channel('localhost:1')
+            pool = FirestoreClientPool.create('demo', AnonymousCredentials(), channels=2,
+                                              max_concurrent_rpcs=7, rpc_timeout=3, stream_timeout=60,
+                                              keepalive_ms=15000)
+            client = pool._clients[0]
+            client._firestore_api
+        self.assertEqual(len(pool.stats()), 2)
+        self.assertIn(('grpc.keepalive_time_ms', 15000), mock_create.call_args[1]['options'])
+        transport = client._firestore_api.transport
+        self.assertEqual(transport._wrapped_methods[transport.get_document]._timeout, 3)
+        self.assertEqual(transport._wrapped_methods[transport.run_query]._timeout, 60)
+        self.assertEqual(transport._wrapped_methods[transport.commit]._timeout, 3)
+        pool.close()
+
+    def test_real_client_still_has_overridden_internals(self):
+        """_PooledClient 依賴的 firestore.Client 內部屬性在目前安裝的版本中仍存在"""
+        import inspect
+        from google.auth.credentials import AnonymousCredentials
+        from services.firestore_service import _PooledClient
+        self.assertIsInstance(inspect.getattr_static(firestore.Client, '_firestore_api'), property)
+        client = firestore.Client(project='demo', credentials=AnonymousCredentials())
+        for name in _PooledClient.REQUIRED_CLIENT_ATTRIBUTES:
+            self.assertTrue(hasattr(client, name), name)
+        self.assertIsNone(client._firestore_api_internal)
+        # GAPIC transport 以 _wrapped_methods 保存各 RPC 的預設 deadline 與重試
+        self.assertIsInstance(client._firestore_api.transport._wrapped_methods, dict)
+        client.close()
+
+    def test_emulator_channel_is_limited(self):
+        from google.auth.credentials import AnonymousCredentials
+        from services.firestore_service import _PooledClient
+        limiter = _ChannelLimiter(3)
+        with patch.dict(os.environ, {'FIRESTORE_EMULATOR_HOST': 'localhost:1'}), \
+                patch('services.firestore_service.grpc.intercept_channel',
+                      side_effect=lambda channel, interceptor: channel) as mock_intercept:
+            client = _PooledClient(project='demo', credentials=AnonymousCredentials(), limiter=limiter)
+            api = client._firestore_api
+        self.assertIs(client._firestore_api, api)
+        self.assertIn(limiter, [c[0][1] for c in mock_intercept.call_args_list])
+        client.close()
+
+
+class TestOrderLineItems(unittest.TestCase):
+    """訂單品項：新訂單存 lineItems，舊訂單以批次回填"""
+
+    def setUp(self):
+        from benchmarks.fake_firestore import FakeFirestoreClient
+        self.original_db = FirestoreService._db
+        FirestoreService._db = self.fake = FakeFirestoreClient()
+        self.addCleanup(setattr, FirestoreService, '_db', self.original_db)
+
+    def _order(self, order_id):
+        return self.fake.collection('orders').document(order_id).get().to_dict()
+
+    def test_new_order_has_line_items(self):
+        FirestoreService.add_order('ORD1', 'U1', '土雞蛋 x2 (x9)', 500, '處理中', '未付款', 'transfer',
+                                   product_id='p1', actual_quantity=3, order_qty=2)
+        order = self._order('ORD1')
+        self.assertEqual(order['lineItems'], [{'productId': 'p1', 'qty': 2, 'actualQuantity': 3}])
+        self.assertEqual(order['expectedTotal'], 6)
+
+    def test_backfill_legacy_orders(self):
+        self.fake.load('products', 'p1', {'name': '土雞蛋', 'actualQuantity': 2})
+        self.fake.load('orders', 'ORD1', {'orderId': 'ORD1', 'items': '土雞蛋 x3 (放x9號)', 'amount': 750})
+        self.fake.load('orders', 'ORD2', {'orderId': 'ORD2', 'items': '鴨蛋 x4', 'productId': 'p9',
+                                          'orderQty': 4, 'expectedTotal': 4})
+        self.fake.load('orders', 'ORD3', {'orderId': 'ORD3', 'items': '土雞蛋 x1',
+                                          'lineItems': [{'productId': 'p1', 'qty': 1}]})
+
+        with patch.object(FirestoreService, 'BATCH_WRITE_LIMIT', 1):
+            success, result = FirestoreService.backfill_order_line_items(page_size=2)
+        self.assertTrue(success)
+        self.assertEqual(result, {'total': 3, 'updated': 2, 'skipped': 1})
+
+        order = self._order('ORD1')
+        self.assertEqual(order['lineItems'], [{'productId': 'p1', 'name': '土雞蛋', 'qty': 3,
+                                               'actualQuantity': 2, 'amount': 750}])
+        self.assertEqual((order['orderQty'], order['actualQuantity'], order['expectedTotal']), (3, 2, 6))
+        order = self._order('ORD2')
+        self.assertEqual((order['lineItems'][0]['name'], order['expectedTotal']), ('鴨蛋', 4))
+        self.assertEqual(self._order('ORD3')['lineItems'], [{'productId': 'p1', 'qty': 1}])
+
+        # 再次執行不會重複寫入
+        self.assertEqual(FirestoreService.backfill_order_line_items()[1]['updated'], 0)
+
+
+class TestOrderStats(unittest.TestCase):
+    """儀表板統計計數：與由全部訂單重新計算的結果一致"""
+
+    def setUp(self):
+        from benchmarks.fake_firestore import FakeFirestoreClient
+        self.original_db = FirestoreService._db
+        FirestoreService._db = FakeFirestoreClient()
+        self.addCleanup(setattr, FirestoreService, '_db', self.original_db)
+
+    def _stats(self):
+        success, stats = FirestoreService.get_order_stats(days=3, months=2)
+        self.assertTrue(success)
+        return stats
+
+    def test_counters_follow_order_writes(self):
+        self.assertTrue(FirestoreService.add_order('ORD1', 'U1', '土雞蛋 x2', 500, '處理中', '未付款', 'transfer',
+                                                   actual_quantity=3, order_qty=2))
+        self.assertTrue(FirestoreService.add_order('ORD2', 'U2', '土雞蛋 x1', 300, '處理中', '已付款', 'credit'))
+        self.assertTrue(FirestoreService.add_order('ORD3', 'U3', '土雞蛋 x1', 200, '處理中', '待付款', 'transfer'))
+        # 重複的訂單編號不應改變計數
+        self.assertFalse(FirestoreService.add_order('ORD1', 'U9', '土雞蛋 x9', 900, '處理中', '未付款', 'transfer'))
+
+        FirestoreService.add_delivery_log('ORD1', 4)
+        FirestoreService.add_delivery_logs([{'orderId': 'ORD2', 'qty': 1}])
+        FirestoreService.correct_delivery_log('ORD1', 0, 2)
+        FirestoreService.update_order_payment_status('ORD1', '已付款')
+        FirestoreService.update_order_status('ORD3', '已刪除')
+        self.assertFalse(FirestoreService.update_order_status('ORD404', '已完成')[0])
+
+        stats = self._stats()
+        today = datetime.now(TW_TZ).strftime('%Y-%m-%d')
+        self.assertEqual(stats['totalOrders'], 3)
+        self.assertEqual(stats['ordersByStatus'], {'已刪除': 1, '已完成': 1, '部分配送': 1})
+        self.assertEqual((stats['unpaidOrders'], stats['unpaidAmount']), (0, 0))
+        self.assertEqual(stats['revenue'], 800)
+        self.assertEqual(stats['revenueByDay'][today], 800)
+        self.assertEqual(stats['revenueByMonth'][today[:7]], 800)
+        self.assertEqual(len(stats['revenueByDay']), 3)
+        self.assertEqual((stats['expectedTrays'], stats['deliveredTrays'], stats['outstandingTrays']), (7, 3, 4))
+
+        success, count = FirestoreService.rebuild_order_stats(page_size=2)
+        self.assertEqual((success, count), (True, 3))
+        self.assertEqual(self._stats(), stats)
+
+    def test_concurrent_deliveries_keep_totals_and_status(self):
+        from concurrent.futures import ThreadPoolExecutor
+        self.assertTrue(FirestoreService.add_order('ORD1', 'U1', '土雞蛋 x10', 1000, '處理中', '已付款', 'credit',
+                                                   actual_quantity=1, order_qty=10))
+
+        def deliver(i):
+            if i % 2:
+                return FirestoreService.add_delivery_log('ORD1', 1)
+            return FirestoreService.add_delivery_logs([{'orderId': 'ORD1', 'qty': 1}])
+
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            outcomes = list(pool.map(deliver, range(10)))
+        self.assertTrue(all(success for success, _ in outcomes))
+
+        order = FirestoreService._db.collection('orders').document('ORD1').get().to_dict()
+        self.assertEqual(order['totalDelivered'], 10)
+        self.assertEqual(len(order['deliveryLogs']), 10)
+        self.assertEqual(order['status'], '已完成')
+
+        stats = self._stats()
+        self.assertEqual(stats['ordersByStatus'], {'已完成': 1})
+        self.assertEqual((stats['expectedTrays'], stats['deliveredTrays']), (10, 10))
+        FirestoreService.rebuild_order_stats()
+        self.assertEqual(self._stats(), stats)
+
+    def test_empty(self):
+        stats = self._stats()
+        self.assertEqual(stats['totalOrders'], 0)
+        self.assertEqual(stats['outstandingTrays'], 0)
+        self.assertEqual(list(stats['revenueByDay'].values()), [0, 0, 0])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,151 @@
+"""
+單元測試 - LINE 推播背景派送器（使用本機 LINE API stub）
+"""
+import unittest
+import sys
+import os
+import time
+from unittest.mock import patch, MagicMock
+
+# 添加專案根目錄到 Python 路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.line_service import LINEService, LINEDispatcher
+from tests.line_stub import LINEStubServer
+
+
+class TestLINEDispatcher(unittest.TestCase):
+    """LINE 推播背景派送測試"""
+
+    def setUp(self):
+        self.user_id = "U1234567890abcdef1234567890abcdef"
+        self.stub = LINEStubServer().start()
+
+        config_patcher = patch('services.line_service.Config')
+        self.config = config_patcher.start()
+        self.config.LINE_CHANNEL_ACCESS_TOKEN = "test_token"
+        self.config.LINE_API_HOST = self.stub.host
+        self.config.LINE_DISPATCH_QUEUE_SIZE = 10
+        self.config.LINE_DISPATCH_WORKERS = 2
+        self.config.LINE_DISPATCH_MAX_ATTEMPTS = 3
+        self.config.LINE_DISPATCH_BACKOFF = 0.01
+        self.config.LINE_OUTBOX_LEASE_SECONDS = 300
+        self.addCleanup(config_patcher.stop)
+
+        adapter_patcher = patch('services.line_service.DatabaseAdapter')
+        self.adapter = adapter_patcher.start()
+        self.adapter.add_line_outbox.return_value = (True, 'id')
+        self.adapter.claim_stale_line_outbox.return_value = (True, [])
+        self.addCleanup(adapter_patcher.stop)
+
+        self.dispatcher = LINEDispatcher()
+        self.addCleanup(self.stub.stop)
+        self.addCleanup(self.dispatcher.stop)
+
+    def _wait_for(self, condition, timeout=5):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if condition():
+                return True
+            time.sleep(0.01)
+        return False
+
+    def test_enqueue_delivers_through_pooled_client(self):
+        """訊息經由佇列送到 LINE API，成功後刪除 outbox"""
+        self.dispatcher.start(recover=False)
+        self.assertTrue(self.dispatcher.enqueue(self.user_id, "Hello"))
+        self.dispatcher.join()
+
+        self.assertEqual(len(self.stub.requests), 1)
+        request = self.stub.requests[0]
+        self.assertEqual(request['path'], '/v2/bot/message/push')
+        self.assertEqual(request['body']['to'], self.user_id)
+        self.assertEqual(request['body']['messages'][0]['text'], "Hello")
+
+        message_id = self.adapter.add_line_outbox.call_args[0][0]
+        self.assertEqual(request['headers'].get('X-Line-Retry-Key'), message_id)
+        self.adapter.delete_line_outbox.assert_called_once_with(message_id)
+        self.assertEqual(self.dispatcher.stats()['sent'], 1)
+
+    def test_server_error_is_retried_with_same_retry_key(self):
+        """5xx 以退避重試，重送沿用相同的 retry key"""
+        self.stub.responses = [500, 500]
+        self.dispatcher.start(recover=False)
+        self.dispatcher.enqueue(self.user_id, "Hello")
+
+        self.assertTrue(self._wait_for(lambda: self.adapter.delete_line_outbox.called))
+        self.assertEqual(len(self.stub.requests), 3)
+        keys = {r['headers'].get('X-Line-Retry-Key') for r in self.stub.requests}
+        self.assertEqual(len(keys), 1)
+        self.assertEqual(self.dispatcher.stats()['retried'], 2)
+
+    def test_client_error_marks_outbox_failed(self):
+        """400 不重試，outbox 標記為 failed"""
+        self.stub.responses = [400]
+        self.dispatcher.start(recover=False)
+        self.dispatcher.enqueue(self.user_id, "Hello")
+        self.dispatcher.join()
+
+        self.assertEqual(len(self.stub.requests), 1)
+        self.adapter.delete_line_outbox.assert_not_called()
+        kwargs = self.adapter.update_line_outbox.call_args[1]
+        self.assertEqual(kwargs['status'], 'failed')
+        self.assertEqual(kwargs['attempts'], 1)
+
+    def test_duplicate_retry_key_counts_as_sent(self):
+        """409（retry key 已被接受）視為已送出"""
+        self.stub.responses = [409]
+        self.dispatcher.start(recover=False)
+        self.dispatcher.enqueue(self.user_id, "Hello")
+        self.dispatcher.join()
+
+        self.adapter.delete_line_outbox.assert_called_once()
+        self.assertEqual(self.dispatcher.stats()['sent'], 1)
+
+    def test_recover_outbox_resends_pending_messages(self):
+        """啟動時補送 outbox 中租約已過期的訊息"""
+        self.adapter.claim_stale_line_outbox.return_value = (True, [
+            {'messageId': '123e4567-e89b-12d3-a456-426614174000', 'userId': self.user_id,
+             'text': "Pending", 'attempts': 1}
+        ])
+        self.dispatcher.start(recover=False)
+        self.assertEqual(self.dispatcher.recover_outbox(), 1)
+        self.dispatcher.join()
+
+        self.assertEqual(self.stub.requests[0]['body']['messages'][0]['text'], "Pending")
+        self.adapter.delete_line_outbox.assert_called_once_with('123e4567-e89b-12d3-a456-426614174000')
+        self.adapter.claim_stale_line_outbox.assert_called_once_with(300)
+
+    def test_recover_outbox_once_per_process(self):
+        """同一進程重新啟動派送器時不再重複補送 outbox"""
+        self.dispatcher.start()
+        self.assertTrue(self._wait_for(lambda: self.adapter.claim_stale_line_outbox.called))
+        self.dispatcher.stop()
+        self.dispatcher.start()
+        time.sleep(0.05)
+
+        self.adapter.claim_stale_line_outbox.assert_called_once()
+
+    def test_full_queue_keeps_message_in_outbox(self):
+        """佇列已滿時不阻塞請求，訊息保留在 outbox"""
+        self.dispatcher.start(workers=1, queue_size=1, recover=False)
+        with patch.object(self.dispatcher, '_queue') as mock_queue:
+            import queue
+            mock_queue.put_nowait.side_effect = queue.Full
+            self.assertTrue(self.dispatcher.enqueue(self.user_id, "Hello"))
+        self.assertEqual(self.dispatcher.stats()['dropped'], 1)
+
+    def test_send_push_message_only_enqueues_when_running(self):
+        """派送器啟動後，send_push_message 只排入佇列"""
+        with patch('services.line_service.line_dispatcher') as mock_dispatcher, \
+             patch('services.line_service.ApiClient') as mock_api_client:
+            mock_dispatcher.running = True
+            mock_dispatcher.enqueue.return_value = True
+
+            self.assertTrue(LINEService.send_push_message(self.user_id, "Hello"))
+            mock_dispatcher.enqueue.assert_called_once_with(self.user_id, "Hello")
+            mock_api_client.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
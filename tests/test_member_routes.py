@@ -83,5 +83,35 @@ class TestMemberDataValidation(unittest.TestCase):
         self.assertIsNotNone(result)
 
 
+
+class TestHistoryRoute(unittest.TestCase):
+    """訂購紀錄路由測試"""
+
+    @classmethod
+    def setUpClass(cls):
+        with patch('services.firestore_service.FirestoreService.init'):
+            from app import app
+            cls.client = app.test_client()
+
+    @patch('services.database_adapter.DatabaseAdapter.get_user_orders')
+    def test_legacy_mode_returns_list(self, mock_get):
+        mock_get.return_value = [{'orderId': 'ORD1'}]
+        response = self.client.post('/api/history', json={'userId': 'U1'})
+        self.assertEqual(json.loads(response.data), [{'orderId': 'ORD1'}])
+
+    @patch('services.database_adapter.DatabaseAdapter.get_user_orders_page')
+    def test_paginated_mode(self, mock_page):
+        mock_page.return_value = (True, {'orders': [{'orderId': 'ORD1'}], 'nextCursor': 'c', 'hasMore': True})
+        response = self.client.post('/api/history', json={'userId': 'U1', 'limit': 500, 'startAfter': 'abc'})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['nextCursor'], 'c')
+        mock_page.assert_called_once_with('U1', 100, 'abc')
+
+    def test_invalid_limit_returns_400(self):
+        response = self.client.post('/api/history', json={'userId': 'U1', 'limit': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
 if __name__ == '__main__':
     unittest.main()
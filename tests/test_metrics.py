@@ -0,0 +1,105 @@
+"""
+單元測試 - 監控指標 (services/metrics.py) 與 /metrics 端點
+"""
+import unittest
+import json
+import os
+import sys
+import tempfile
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['FLASK_ENV'] = 'testing'
+
+from services.metrics import MetricsRegistry, metrics
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        self.registry.counter('jobs_total', '工作數')
+        self.registry.gauge('busy', '忙碌中')
+        self.registry.histogram('latency_seconds', '延遲', buckets=(0.1, 1.0))
+
+    def test_render_counter_and_histogram(self):
+        self.registry.inc('jobs_total', result='ok')
+        self.registry.inc('jobs_total', 2, result='ok')
+        for value in (0.05, 0.5, 3):
+            self.registry.observe('latency_seconds', value, route='a')
+
+        text = self.registry.render()
+        self.assertIn('# TYPE jobs_total counter', text)
+        self.assertIn('jobs_total{result="ok"} 3', text)
+        self.assertIn('latency_seconds_bucket{route="a",le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{route="a",le="1"} 2', text)
+        self.assertIn('latency_seconds_bucket{route="a",le="+Inf"} 3', text)
+        self.assertIn('latency_seconds_sum{route="a"} 3.55', text)
+        self.assertIn('latency_seconds_count{route="a"} 3', text)
+
+    def test_label_values_escaped(self):
+        self.registry.inc('jobs_total', result='a"b\\c')
+        self.assertIn('jobs_total{result="a\\"b\\\\c"} 1', self.registry.render())
+
+    def test_multiprocess_merge(self):
+        self.registry.inc('jobs_total', result='ok')
+        self.registry.inc('busy', 1)
+        with tempfile.TemporaryDirectory() as directory:
+            # 已結束的 worker：保留計數器，忽略 gauge
+            with open(os.path.join(directory, 'metrics_999999999.json'), 'w') as f:
+                json.dump({'pid': 999999999, 'values': [
+                    ['jobs_total', [['result', 'ok']], 4],
+                    ['busy', [], 7],
+                    ['latency_seconds', [['route', 'a']], {'buckets': [1, 0], 'sum': 0.05, 'count': 1}]
+                ]}, f)
+            # 自己寫入的檔案不重複計算
+            self.registry.flush(directory)
+
+            merged = self.registry.collect(directory)
+        self.assertEqual(merged[('jobs_total', (('result', 'ok'),))], 5)
+        self.assertEqual(merged[('busy', ())], 1)
+        self.assertEqual(merged[('latency_seconds', (('route', 'a'),))]['count'], 1)
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        with patch('services.firestore_service.FirestoreService.init'):
+            from app import app
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_requires_login_or_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        with patch('app.Config.METRICS_TOKEN', 'scrape-token'):
+            wrong = self.client.get('/metrics', headers={'Authorization': 'Bearer nope'})
+            right = self.client.get('/metrics', headers={'Authorization': 'Bearer scrape-token'})
+        self.assertEqual(wrong.status_code, 401)
+        self.assertEqual(right.status_code, 200)
+        self.assertTrue(right.content_type.startswith('text/plain'))
+
+    def test_records_route_latency_and_status(self):
+        self.client.get('/api/admin/orders')
+        with self.client.session_transaction() as sess:
+            sess['logged_in'] = True
+        text = self.client.get('/metrics').get_data(as_text=True)
+
+        self.assertIn('http_requests_total{blueprint="admin",endpoint="admin.get_all_orders",'
+                      'method="GET",status="401"} 1', text)
+        self.assertIn('http_request_duration_seconds_count{blueprint="admin",'
+                      'endpoint="admin.get_all_orders",method="GET"} 1', text)
+        # /metrics 本身仍在處理中
+        self.assertIn('http_requests_in_flight 1', text)
+
+    def test_ecpay_callback_outcome(self):
+        self.client.post('/api/ecpay/callback', data={'RtnCode': '1'})
+        with self.client.session_transaction() as sess:
+            sess['logged_in'] = True
+        text = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('ecpay_callbacks_total{result="missing_checksum"} 1', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+"""
+單元測試 - 訂單編號產生器 (services/order_id_service.py)
+"""
+import unittest
+import sys
+import os
+import threading
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.order_id_service import (
+    OrderIdService, OrderIdUnavailable, ORDER_ID_LENGTH, PLACE_ORDER_MAX_ATTEMPTS
+)
+from routes.ecpay import RETRY_TRADE_NO_PATTERN
+
+
+class TestOrderIdService(unittest.TestCase):
+
+    def setUp(self):
+        OrderIdService._reset()
+        self.addCleanup(OrderIdService._reset)
+
+    def test_format_fits_ecpay_limit_with_retry_suffix(self):
+        OrderIdService.configure(7)
+        order_id = OrderIdService.next_order_id()
+        self.assertEqual(len(order_id), ORDER_ID_LENGTH)
+        self.assertTrue(order_id.startswith('ORD'))
+        self.assertEqual(order_id[12:14], '07')
+        self.assertLessEqual(len(f"{order_id}R99"), 20)
+
+    def test_retry_trade_no_round_trip(self):
+        OrderIdService.configure(0)
+        order_id = OrderIdService.next_order_id()
+        self.assertEqual(RETRY_TRADE_NO_PATTERN.match(f"{order_id}R12").group(1), order_id)
+        self.assertEqual(RETRY_TRADE_NO_PATTERN.match('ORD12345678R1').group(1), 'ORD12345678')
+        self.assertIsNone(RETRY_TRADE_NO_PATTERN.match(order_id))
+
+    def test_monotonic_within_same_second(self):
+        OrderIdService.configure(1)
+        with patch('services.order_id_service.time.time', return_value=1800000000.5):
+            ids = [OrderIdService.next_order_id() for _ in range(1500)]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), 1500)
+
+    def test_unique_across_threads(self):
+        OrderIdService.configure(2)
+        ids = []
+        lock = threading.Lock()
+
+        def worker():
+            local = [OrderIdService.next_order_id() for _ in range(500)]
+            with lock:
+                ids.extend(local)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(set(ids)), 4000)
+
+    def _patch_timer(self):
+        patcher = patch('services.order_id_service.threading.Timer')
+        timer = patcher.start()
+        self.addCleanup(patcher.stop)
+        return timer
+
+    @patch('services.order_id_service.DatabaseAdapter')
+    def test_acquires_lease_once_and_renews_in_background(self, mock_adapter):
+        timer = self._patch_timer()
+        with patch('services.order_id_service.time.time', return_value=1000.0):
+            mock_adapter.acquire_order_id_worker.return_value = (True, (42, 1600.0))
+            first = OrderIdService.next_order_id()
+            OrderIdService.next_order_id()
+        self.assertEqual(first[12:14], '42')
+        mock_adapter.acquire_order_id_worker.assert_called_once()
+        # 租約剩餘一半時由背景計時器續約
+        self.assertEqual(timer.call_args[0][0], 300)
+
+        # 續約時間已過，但請求路徑不等待續約
+        with patch('services.order_id_service.time.time', return_value=1301.0):
+            OrderIdService.next_order_id()
+        mock_adapter.renew_order_id_worker.assert_not_called()
+
+        with patch('services.order_id_service.time.time', return_value=1301.0):
+            mock_adapter.renew_order_id_worker.return_value = (True, 1901.0)
+            OrderIdService._renew_in_background()
+        token = mock_adapter.acquire_order_id_worker.call_args[0][0]
+        mock_adapter.renew_order_id_worker.assert_called_once_with(42, token, 600)
+        with patch('services.order_id_service.time.time', return_value=1800.0):
+            self.assertEqual(OrderIdService.next_order_id()[12:14], '42')
+        mock_adapter.acquire_order_id_worker.assert_called_once()
+
+    @patch('services.order_id_service.DatabaseAdapter')
+    def test_lost_lease_acquires_new_worker(self, mock_adapter):
+        self._patch_timer()
+        with patch('services.order_id_service.time.time', return_value=1000.0):
+            mock_adapter.acquire_order_id_worker.return_value = (True, (3, 1600.0))
+            OrderIdService.next_order_id()
+        with patch('services.order_id_service.time.time', return_value=1400.0):
+            mock_adapter.renew_order_id_worker.return_value = (False, '租約已失效')
+            mock_adapter.acquire_order_id_worker.return_value = (True, (9, 2000.0))
+            OrderIdService._renew_in_background()
+            order_id = OrderIdService.next_order_id()
+        self.assertEqual(order_id[12:14], '09')
+
+    @patch('services.order_id_service.DatabaseAdapter')
+    def test_failed_renewal_keeps_worker_until_safety_margin(self, mock_adapter):
+        self._patch_timer()
+        with patch('services.order_id_service.time.time', return_value=1000.0):
+            mock_adapter.acquire_order_id_worker.return_value = (True, (5, 1600.0))
+            OrderIdService.next_order_id()
+        mock_adapter.renew_order_id_worker.return_value = (False, 'DB error')
+        mock_adapter.acquire_order_id_worker.return_value = (False, 'DB error')
+        with patch('services.order_id_service.time.time', return_value=1300.0):
+            OrderIdService._renew_in_background()
+            self.assertEqual(OrderIdService.next_order_id()[12:14], '05')
+        # 租約到期前 30 秒起不再使用，也不會改用隨機編號
+        with patch('services.order_id_service.time.time', return_value=1575.0):
+            with self.assertRaises(OrderIdUnavailable):
+                OrderIdService.next_order_id()
+
+    @patch('services.order_id_service.DatabaseAdapter')
+    def test_lease_failure_raises_instead_of_random_worker(self, mock_adapter):
+        timer = self._patch_timer()
+        mock_adapter.acquire_order_id_worker.return_value = (False, 'DB error')
+        with self.assertRaises(OrderIdUnavailable):
+            OrderIdService.next_order_id()
+        self.assertIsNone(OrderIdService._worker_id)
+        # 背景計時器稍後重試申請
+        self.assertEqual(timer.call_args[0][0], 30)
+
+
+class TestPlaceOrder(unittest.TestCase):
+
+    def setUp(self):
+        OrderIdService.configure(4)
+        self.addCleanup(OrderIdService._reset)
+
+    @patch('services.order_id_service.DatabaseAdapter')
+    def test_retries_with_new_id_on_duplicate(self, mock_adapter):
+        mock_adapter.DUPLICATE_ORDER_ID_MSG = '訂單編號重複'
+        mock_adapter.place_order.side_effect = [(False, '訂單編號重複'), (True, {'orderId': 'x'})]
+        success, result, order_id = OrderIdService.place_order(user_id='U1', amount=100)
+        self.assertTrue(success)
+        first_id = mock_adapter.place_order.call_args_list[0][1]['order_id']
+        self.assertEqual(mock_adapter.place_order.call_args_list[1][1]['order_id'], order_id)
+        self.assertNotEqual(first_id, order_id)
+        self.assertEqual(mock_adapter.place_order.call_args[1]['user_id'], 'U1')
+
+    @patch('services.order_id_service.DatabaseAdapter')
+    def test_other_failures_are_not_retried(self, mock_adapter):
+        mock_adapter.DUPLICATE_ORDER_ID_MSG = '訂單編號重複'
+        mock_adapter.place_order.return_value = (False, '庫存不足')
+        success, result, _ = OrderIdService.place_order(user_id='U1')
+        self.assertEqual((success, result), (False, '庫存不足'))
+        mock_adapter.place_order.assert_called_once()
+
+    @patch('services.order_id_service.DatabaseAdapter')
+    def test_gives_up_after_max_attempts(self, mock_adapter):
+        mock_adapter.DUPLICATE_ORDER_ID_MSG = '訂單編號重複'
+        mock_adapter.place_order.return_value = (False, '訂單編號重複')
+        success, result, _ = OrderIdService.place_order(user_id='U1')
+        self.assertFalse(success)
+        self.assertEqual(mock_adapter.place_order.call_count, PLACE_ORDER_MAX_ATTEMPTS)
+
+    def test_unavailable_worker_returns_error(self):
+        OrderIdService._reset()
+        with patch.object(OrderIdService, '_ensure_worker', side_effect=OrderIdUnavailable('no lease')):
+            success, msg, order_id = OrderIdService.place_order(user_id='U1')
+        self.assertFalse(success)
+        self.assertIsNone(order_id)
+
+if __name__ == '__main__':
+    unittest.main()
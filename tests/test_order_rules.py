@@ -0,0 +1,159 @@
+"""
+單元測試 - 訂單業務規則 (services/order_rules.py)
+"""
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from firebase_admin import firestore
+from services import order_rules
+
+
+class TestOrderQuantities(unittest.TestCase):
+
+    def test_parse_legacy_items_ignores_remarks(self):
+        self.assertEqual(order_rules.parse_legacy_items('土雞蛋 x5 (請放x3號信箱)'), ('土雞蛋', 5))
+        self.assertEqual(order_rules.parse_legacy_items('土雞蛋 x12'), ('土雞蛋', 12))
+        self.assertEqual(order_rules.parse_legacy_items('土雞蛋 (x3)'), ('土雞蛋', 1))
+        self.assertEqual(order_rules.expected_total({'items': '土雞蛋 x2 (x9)'}), 2)
+        self.assertEqual(order_rules.expected_total(
+            {'lineItems': [{'qty': 2, 'actualQuantity': 3}, {'qty': 1}], 'items': '土雞蛋 x9'}), 7)
+
+    def test_total_delivered_falls_back_to_logs(self):
+        logs = [{'qty': 5, 'corrected_qty': 3}, {'qty': 2}]
+        self.assertEqual(order_rules.total_delivered({'deliveryLogs': logs}), 5)
+        self.assertEqual(order_rules.total_delivered({'deliveryLogs': logs, 'totalDelivered': 9}), 9)
+
+    def test_finish_user_order_remaining_qty(self):
+        order = order_rules.finish_user_order({
+            'date': '2026-03-01 10:00:00', 'expectedTotal': 10, 'deliveryLogs': [{'qty': 4}]
+        })
+        self.assertEqual(order['remainingQty'], 6)
+        self.assertNotIn('deliveryLogs', order)
+
+
+class TestDeliveryRules(unittest.TestCase):
+
+    def test_index_entry_uses_corrected_qty(self):
+        entry = order_rules.delivery_index_entry('ORD001', 'U001', {
+            'logId': 'abc123', 'delivery_date': '2026-03-18',
+            'qty': 5, 'corrected_qty': 3, 'address': '新竹市'
+        })
+        self.assertEqual(entry['qty'], 3)
+
+    def test_delivery_update_results_per_entry(self):
+        order = {'expectedTotal': 10, 'totalDelivered': 4}
+        update, logs, results = order_rules.delivery_update(order, [(3, 'A', '2026-03-01'), (3, 'B', '')])
+        self.assertEqual([r['status'] for r in results], [order_rules.DELIVERY_PARTIAL_STATUS,
+                                                         order_rules.DELIVERY_COMPLETED_STATUS])
+        self.assertEqual([r['total_delivered'] for r in results], [7, 10])
+        self.assertEqual(len({log['logId'] for log in logs}), 2)
+        self.assertIsInstance(update['totalDelivered'], firestore.Increment)
+        self.assertEqual(update['status'], order_rules.DELIVERY_COMPLETED_STATUS)
+
+    def test_legacy_order_gets_counters(self):
+        order = {'items': '土雞蛋 x4', 'deliveryLogs': [{'qty': 1}]}
+        update, _, results = order_rules.delivery_update(order, [(1, '', '')])
+        self.assertEqual(update['totalDelivered'], 2)
+        self.assertEqual(update['expectedTotal'], 4)
+        self.assertEqual(results[0]['status'], order_rules.DELIVERY_PARTIAL_STATUS)
+
+    def test_correction_adjusts_by_difference(self):
+        order = {'expectedTotal': 6, 'totalDelivered': 6, 'deliveryLogs': [{'qty': 6, 'address': 'A'}]}
+        update, log, result = order_rules.delivery_correction('ORD1', order, 0, 4, 'B', '')
+        self.assertEqual(result['total_delivered'], 4)
+        self.assertEqual(result['status'], order_rules.DELIVERY_PARTIAL_STATUS)
+        self.assertEqual(log['logId'], 'ORD1-0')
+        self.assertIsNone(order_rules.delivery_correction('ORD1', order, 3, 4, 'B', ''))
+
+    def test_correct_to_zero_then_again(self):
+        order = {'expectedTotal': 6, 'totalDelivered': 6, 'deliveryLogs': [{'qty': 6, 'address': 'A'}]}
+        update, log, result = order_rules.delivery_correction('ORD1', order, 0, 0, 'A', '')
+        self.assertEqual(update['totalDelivered'].value, -6)
+        self.assertEqual(result['total_delivered'], 0)
+        self.assertEqual(order_rules.delivered_qty(log), 0)
+        self.assertEqual(order_rules.delivery_index_entry('ORD1', 'U1', log)['qty'], 0)
+
+        # 再次修正以 0 為修正前數量
+        order = {**order, 'totalDelivered': 0, 'deliveryLogs': [log]}
+        update, log, result = order_rules.delivery_correction('ORD1', order, 0, 2, 'A', '')
+        self.assertEqual(update['totalDelivered'].value, 2)
+        self.assertEqual((result['old_qty'], result['total_delivered']), (0, 2))
+        self.assertEqual(log['original_qty'], 6)
+        self.assertEqual(order_rules.total_delivered({'deliveryLogs': [{'qty': 6, 'corrected_qty': 0}]}), 0)
+
+
+class TestStatusRules(unittest.TestCase):
+
+    def setUp(self):
+        self.order = {'orderId': 'ORD1', 'stockReserved': True, 'totalDelivered': 0,
+                      'lineItems': [{'productId': 'p1', 'qty': 2, 'actualQuantity': 3}, {'productId': 'p1', 'qty': 1}]}
+
+    def test_cancel_releases_and_restore_reserves(self):
+        changes, _, reserve, reserved_after = order_rules.status_stock_changes(self.order, '已取消')
+        self.assertEqual(changes, {'p1': 7})
+        self.assertFalse(reserve or reserved_after)
+        self.order['stockReserved'] = False
+        changes, _, reserve, reserved_after = order_rules.status_stock_changes(self.order, '處理中')
+        self.assertEqual(changes, {'p1': -7})
+        self.assertTrue(reserve and reserved_after)
+
+    def test_delivered_order_keeps_reservation(self):
+        self.order['totalDelivered'] = 1
+        self.assertIsNone(order_rules.status_stock_changes(self.order, '已取消'))
+        self.assertIsNone(order_rules.status_stock_changes({'orderId': 'ORD2'}, '已取消'))
+
+    def test_cancelled_order_cannot_be_paid(self):
+        self.assertIsNone(order_rules.payment_status_error(self.order, '已付款'))
+        self.assertIn('不可標記為已付款', order_rules.payment_status_error({'status': '已取消'}, '已付款'))
+        self.assertIsNone(order_rules.payment_status_error({'status': '已取消'}, '未付款'))
+
+    def test_stock_messages(self):
+        product = {'name': '土雞蛋', 'status': 'inactive'}
+        self.assertEqual(order_rules.stock_product_error('p1', None, True), "商品不存在")
+        self.assertEqual(order_rules.stock_product_error('p1', None, False), "商品不存在：p1")
+        self.assertIsNone(order_rules.stock_product_error('p1', product, True))
+        self.assertEqual(order_rules.stock_product_error('p1', product, True, reserve=True), "該商品已下架：土雞蛋")
+        self.assertEqual(order_rules.insufficient_stock_message('p1', product, 2, False), "庫存不足：土雞蛋，目前庫存：2")
+
+
+class TestOrderStats(unittest.TestCase):
+
+    def test_delta_moves_between_statuses(self):
+        order = {'status': '處理中', 'amount': 500, 'date': '2026-03-01 10:00:00',
+                 'paymentStatus': '未付款', 'expectedTotal': 2, 'totalDelivered': 0}
+        delta = order_rules.order_stats_delta(order, {**order, 'status': order_rules.DELETED_ORDER_STATUS})
+        self.assertEqual(delta['ordersByStatus.處理中'], -1)
+        self.assertEqual(delta['ordersByStatus.已刪除'], 1)
+        self.assertEqual(delta['revenue'], -500)
+        self.assertNotIn('totalOrders', delta)
+
+    def test_cancel_and_reopen_move_amounts_and_trays(self):
+        order = {'status': '部分配送', 'amount': 750, 'date': '2026-03-02 09:00:00',
+                 'paymentStatus': '未付款', 'expectedTotal': 3, 'totalDelivered': 1}
+        cancelled = {**order, 'status': '已取消'}
+        delta = order_rules.order_stats_delta(order, cancelled)
+        self.assertEqual(delta, {
+            'ordersByStatus.部分配送': -1, 'ordersByStatus.已取消': 1,
+            'revenue': -750, 'revenueByDay.2026-03-02': -750, 'revenueByMonth.2026-03': -750,
+            'unpaidOrders': -1, 'unpaidAmount': -750, 'expectedTrays': -3, 'deliveredTrays': -1
+        })
+
+        reopened = order_rules.order_stats_delta(cancelled, {**cancelled, 'status': '處理中'})
+        self.assertEqual(reopened['revenue'], 750)
+        self.assertEqual(reopened['unpaidAmount'], 750)
+        self.assertEqual(reopened['expectedTrays'], 3)
+        self.assertEqual(reopened['ordersByStatus.已取消'], -1)
+
+        totals = order_rules.nest_order_stats(order_rules.order_stats_contribution(cancelled))
+        summary = order_rules.summarize_order_stats(totals)
+        self.assertEqual((summary['revenue'], summary['unpaidAmount'], summary['outstandingTrays']), (0, 0, 0))
+
+    def test_nest_order_stats(self):
+        self.assertEqual(order_rules.nest_order_stats({'a.b': 1, 'a.c': 2, 'd': 3}), {'a': {'b': 1, 'c': 2}, 'd': 3})
+
+
+if __name__ == '__main__':
+    unittest.main()
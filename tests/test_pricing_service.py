@@ -0,0 +1,75 @@
+"""
+單元測試 - 計價引擎 (services/pricing_service.py)
+"""
+import unittest
+import sys
+import os
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.pricing_service import PriceQuote, PriceTiers, PricingError, compile_tiers, product_tiers
+
+
+class TestPriceTiers(unittest.TestCase):
+
+    def test_bisect_lookup(self):
+        tiers = compile_tiers(250, ((10, 240), (20, 230)))
+        self.assertEqual([tiers.unit_price(q) for q in (1, 9, 10, 19, 20, 500)], [250, 250, 240, 240, 230, 230])
+
+    def test_unit_prices_matches_lookup(self):
+        tiers = PriceTiers(300, ((1, 280), (5, 260), (50, 200)))
+        prices = tiers.unit_prices(100)
+        self.assertEqual(prices, [tiers.unit_price(q) for q in range(1, 101)])
+
+    def test_product_tiers_fall_back_to_config(self):
+        self.assertEqual(product_tiers({'name': '土雞蛋1盤', 'price': 250}).unit_price(15), 240)
+        self.assertEqual(product_tiers({'name': '雞蛋禮盒', 'price': 180}).unit_price(15), 180)
+        tiers = product_tiers({'name': '土雞蛋1盤', 'price': 250, 'bulkPricing': [{'minQty': 5, 'price': 200}]})
+        self.assertEqual(tiers.unit_price(15), 200)
+
+
+class TestPriceQuote(unittest.TestCase):
+
+    def setUp(self):
+        self.quote = PriceQuote(
+            {'p1': {'price': 100}, 'p2': {'price': 50, 'bulkPricing': [{'minQty': 10, 'price': 45}]}},
+            {'p1': [{'id': 'd1', 'discountType': 'percentage', 'discountValue': 15},
+                    {'id': 'd2', 'discountType': 'fixed', 'discountValue': 10}],
+             'p2': [{'id': 'd3', 'discountType': 'fixed', 'discountValue': 999}]}
+        )
+
+    def test_best_discount_is_applied(self):
+        result = self.quote.quote('p1', 3)
+        self.assertEqual(result['discountId'], 'd1')
+        self.assertEqual(result['amount'], 255)
+        self.assertEqual(result['discountAmount'], 45)
+
+    def test_discount_never_below_zero(self):
+        self.assertEqual(self.quote.quote('p2', 10)['amount'], 0)
+
+    def test_quote_many_and_errors(self):
+        quotes, total = PriceQuote({'p1': {'price': 10.5}}, {}).quote_many([('p1', 1), ('p1', 3)])
+        self.assertEqual([q['amount'] for q in quotes], [11, 32])
+        self.assertEqual(total, 43)
+        with self.assertRaises(PricingError):
+            self.quote.quote('p9', 1)
+        with self.assertRaises(PricingError):
+            self.quote.quote('p1', 0)
+
+    def test_preview(self):
+        rows = PriceQuote({'p2': {'price': 50, 'bulkPricing': [{'minQty': 10, 'price': 45}]}}, {}).preview('p2', 12)
+        self.assertEqual([r['unitPrice'] for r in rows], [50] * 9 + [45] * 3)
+        self.assertEqual(rows[-1]['amount'], 540)
+
+    @patch('services.database_adapter.DatabaseAdapter.get_applicable_discounts_batch', return_value=(False, 'DB error'))
+    @patch('services.database_adapter.DatabaseAdapter.get_product', return_value=(True, {'price': 100, 'categoryId': ''}))
+    def test_load_prices_without_discounts_when_index_fails(self, mock_product, mock_discounts):
+        quote = PriceQuote.load(['p1', 'p1'])
+        self.assertEqual(quote.quote('p1', 2)['amount'], 200)
+        mock_product.assert_called_once_with('p1')
+        mock_discounts.assert_called_once_with([('p1', None)], member_level=None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,258 @@
+"""
+單元測試 - SQLite 資料庫服務 (services/sqlite_service.py)
+"""
+import unittest
+import sys
+import os
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytz
+
+from services.sqlite_service import SQLiteService
+
+TW_TZ = pytz.timezone('Asia/Taipei')
+
+
+class SQLiteTestBase(unittest.TestCase):
+
+    def setUp(self):
+        SQLiteService.init(':memory:')
+
+
+class TestMembers(SQLiteTestBase):
+
+    def test_add_and_get_member(self):
+        self.assertTrue(SQLiteService.add_member('U1', '王小明', '0912345678', '新竹市'))
+        member = SQLiteService.check_member_exists('U1')
+        self.assertEqual(member['phone'], '0912345678')
+
+        success, found = SQLiteService.get_member_by_phone('0912345678')
+        self.assertTrue(success)
+        self.assertEqual(found['userId'], 'U1')
+        self.assertIsInstance(found['createdAt'], datetime)
+
+    def test_unique_phone_rejects_duplicate(self):
+        self.assertEqual(SQLiteService.add_member_with_unique_phone('U1', 'A', '0911', 'x'), (True, 'U1'))
+        self.assertEqual(SQLiteService.add_member_with_unique_phone('U2', 'B', '0911', 'y'), (False, None))
+        self.assertIsNone(SQLiteService.check_member_exists('U2'))
+
+    def test_update_missing_member_fails(self):
+        self.assertFalse(SQLiteService.update_member('U404', 'A', '0911', 'x'))
+
+
+class TestOrders(SQLiteTestBase):
+
+    def setUp(self):
+        super().setUp()
+        SQLiteService.add_member('U1', '王小明', '0912345678', '新竹市')
+        base = TW_TZ.localize(datetime(2026, 1, 1, 12))
+        for i in range(5):
+            SQLiteService.load('orders', f"ORD{i}", {
+                'orderId': f"ORD{i}", 'userId': 'U1' if i % 2 == 0 else 'U2',
+                'status': '處理中', 'paymentStatus': '未付款',
+                'actualQuantity': 1, 'orderQty': 2, 'expectedTotal': 2, 'totalDelivered': 0,
+                'deliveryLogs': [], 'createdAt': base + timedelta(days=i)
+            })
+
+    def test_add_order_is_create_only(self):
+        self.assertTrue(SQLiteService.add_order('ORDX', 'U1', '雞蛋 x1', 100, '處理中', '未付款', 'transfer'))
+        self.assertFalse(SQLiteService.add_order('ORDX', 'U1', '雞蛋 x2', 200, '處理中', '未付款', 'transfer'))
+        success, order = SQLiteService.get_order_by_id('ORDX')
+        self.assertEqual(order['amount'], 100)
+
+    def test_user_orders_use_index(self):
+        orders = SQLiteService.get_user_orders('U1')
+        self.assertEqual(sorted(o['orderId'] for o in orders), ['ORD0', 'ORD2', 'ORD4'])
+        self.assertEqual(orders[0]['remainingQty'], 2)
+
+        plan = ' '.join(SQLiteService.explain_query('orders', [('userId', '==', 'U1')]))
+        self.assertIn('idx_orders_userId', plan)
+
+    def test_user_orders_page(self):
+        SQLiteService.update_order_status('ORD2', '已刪除')
+        success, page = SQLiteService.get_user_orders_page('U1', limit=1)
+        self.assertTrue(success)
+        self.assertEqual([o['orderId'] for o in page['orders']], ['ORD4'])
+        self.assertNotIn('deliveryLogs', page['orders'][0])
+        success, page = SQLiteService.get_user_orders_page('U1', limit=1, start_after=page['nextCursor'])
+        self.assertEqual([o['orderId'] for o in page['orders']], ['ORD0'])
+        self.assertFalse(page['hasMore'])
+
+    def test_orders_page_cursor_and_date_filter(self):
+        success, page = SQLiteService.get_orders_page(limit=2)
+        self.assertTrue(success)
+        self.assertEqual([o['orderId'] for o in page['orders']], ['ORD4', 'ORD3'])
+        self.assertTrue(page['hasMore'])
+        self.assertEqual(page['orders'][0]['customer']['name'], '王小明')
+
+        _, page = SQLiteService.get_orders_page(limit=2, start_after=page['nextCursor'])
+        self.assertEqual([o['orderId'] for o in page['orders']], ['ORD2', 'ORD1'])
+
+        _, page = SQLiteService.get_orders_page(limit=10, date_from='2026-01-02', date_to='2026-01-03')
+        self.assertEqual([o['orderId'] for o in page['orders']], ['ORD2', 'ORD1'])
+        self.assertFalse(page['hasMore'])
+
+        plan = ' '.join(SQLiteService.explain_query('orders', order_by=[('createdAt', True), ('orderId', True)]))
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_delivery_flow(self):
+        success, result = SQLiteService.add_delivery_log('ORD0', 1, '新竹市', '2026-02-01')
+        self.assertTrue(success)
+        success, results = SQLiteService.add_delivery_logs([
+            {'orderId': 'ORD0', 'qty': 1, 'delivery_date': '2026-02-01'},
+            {'orderId': 'ORD404', 'qty': 1, 'delivery_date': '2026-02-01'}
+        ])
+        self.assertTrue(success)
+        self.assertTrue(results[0]['success'])
+        self.assertFalse(results[1]['success'])
+
+        _, order = SQLiteService.get_order_by_id('ORD0')
+        self.assertEqual(order['totalDelivered'], 2)
+        self.assertEqual(order['status'], '已完成')
+
+        success, records = SQLiteService.get_delivery_records_by_date('2026-02-01')
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]['customer_phone'], '0912345678')
+
+        success, _ = SQLiteService.correct_delivery_log('ORD0', 0, 3)
+        self.assertTrue(success)
+        _, order = SQLiteService.get_order_by_id('ORD0')
+        self.assertEqual(order['totalDelivered'], 4)
+        _, records = SQLiteService.get_delivery_records_by_date('2026-02-01')
+        self.assertEqual(sum(r['delivery_qty'] for r in records), 4)
+
+
+    def test_order_stats(self):
+        SQLiteService.update_order_payment_status('ORD0', '已付款')
+        SQLiteService.update_order_status('ORD4', '已刪除')
+        SQLiteService.add_delivery_log('ORD1', 2)
+        success, stats = SQLiteService.get_order_stats()
+        self.assertTrue(success)
+        self.assertEqual(stats['totalOrders'], 5)
+        self.assertEqual(stats['ordersByStatus'], {'處理中': 3, '已完成': 1, '已刪除': 1})
+        self.assertEqual(stats['unpaidOrders'], 3)
+        self.assertEqual((stats['expectedTrays'], stats['outstandingTrays']), (8, 6))
+
+class TestProductsAndStock(SQLiteTestBase):
+
+    def setUp(self):
+        super().setUp()
+        for product_id, stock in (('p1', 5), ('p2', 50)):
+            SQLiteService.load('products', product_id, {'productId': product_id, 'name': product_id,
+                                                        'stock': stock, 'status': 'active'})
+
+    def test_bulk_stock_update_is_all_or_nothing(self):
+        success, msg = SQLiteService.update_products_stock(
+            [{'productId': 'p1', 'qtyChange': 10}, {'productId': 'p2', 'qtyChange': -60}], '出貨')
+        self.assertFalse(success)
+        self.assertIn('庫存不足', msg)
+        self.assertEqual(SQLiteService.get_product('p1')[1]['stock'], 5)
+
+        success, result = SQLiteService.update_products_stock(
+            [{'productId': 'p1', 'qtyChange': 10}, {'productId': 'p2', 'qtyChange': -5}], '出貨')
+        self.assertTrue(success)
+        self.assertEqual(result['p2'], {'oldStock': 50, 'newStock': 45})
+        _, logs = SQLiteService.get_stock_logs()
+        self.assertEqual(len(logs), 2)
+
+    def test_cart_order_is_all_or_nothing(self):
+        args = ('U1', 'p1 x1, p2 x4', 500, '處理中', '未付款', 'transfer')
+        success, msg = SQLiteService.place_order(
+            'ORDC1', *args, [{'productId': 'p1', 'qty': 6}, {'productId': 'p2', 'qty': 4}])
+        self.assertFalse(success)
+        self.assertIn('庫存不足', msg)
+        self.assertEqual(SQLiteService.get_order_by_id('ORDC1')[0], False)
+        self.assertEqual(SQLiteService.get_product('p2')[1]['stock'], 50)
+
+        success, order = SQLiteService.place_order(
+            'ORDC1', *args, [{'productId': 'p1', 'qty': 1}, {'productId': 'p2', 'qty': 4, 'actualQuantity': 2}])
+        self.assertTrue(success)
+        self.assertEqual(order['expectedTotal'], 9)
+        self.assertEqual(SQLiteService.get_product('p2')[1]['stock'], 42)
+        self.assertEqual(len(SQLiteService.get_order_by_id('ORDC1')[1]['lineItems']), 2)
+        _, logs = SQLiteService.get_stock_logs()
+        self.assertEqual(len(logs), 2)
+
+    def test_cancel_releases_reserved_stock(self):
+        self.assertTrue(SQLiteService.place_order('ORDR1', 'U1', 'p2 x3', 300, '處理中', '未付款', 'transfer',
+                                                  [{'productId': 'p2', 'qty': 3, 'actualQuantity': 2}])[0])
+        self.assertEqual(SQLiteService.get_product('p2')[1]['stock'], 44)
+        self.assertTrue(SQLiteService.update_order_status('ORDR1', '已取消')[0])
+        self.assertTrue(SQLiteService.update_order_status('ORDR1', '已刪除')[0])
+        self.assertEqual(SQLiteService.get_product('p2')[1]['stock'], 50)
+        self.assertEqual(SQLiteService.update_order_status('ORD404', '已取消'),
+                         (False, SQLiteService.ORDER_NOT_FOUND_MSG))
+        self.assertFalse(SQLiteService.set_stock_shards('p2', 4)[0])
+        self.assertFalse(SQLiteService.update_order_payment_status('ORDR1', '已付款')[0])
+
+        # 恢復訂單重新預留；庫存不足時狀態不變
+        SQLiteService.update_products_stock([{'productId': 'p2', 'qtyChange': -45}], '盤點')
+        success, msg = SQLiteService.update_order_status('ORDR1', '處理中')
+        self.assertFalse(success)
+        self.assertIn('庫存不足', msg)
+        self.assertEqual(SQLiteService.get_order_by_id('ORDR1')[1]['status'], '已刪除')
+        SQLiteService.update_products_stock([{'productId': 'p2', 'qtyChange': 10}], '進貨')
+        self.assertTrue(SQLiteService.update_order_status('ORDR1', '處理中')[0])
+        self.assertEqual(SQLiteService.get_product('p2')[1]['stock'], 9)
+
+    def test_low_stock_and_soft_delete(self):
+        _, low = SQLiteService.get_low_stock_products()
+        self.assertEqual([p['productId'] for p in low], ['p1'])
+        SQLiteService.delete_product('p1')
+        _, products = SQLiteService.get_all_products()
+        self.assertEqual([p['productId'] for p in products], ['p2'])
+
+    def test_clear_collection(self):
+        self.assertEqual(SQLiteService.clear_collection('products'), (True, 2))
+        self.assertEqual(SQLiteService.get_all_products(), (True, []))
+
+    def test_stock_alerts_page_and_version(self):
+        base = datetime(2026, 1, 1, tzinfo=TW_TZ)
+        for i, alert_type in enumerate(['low', 'critical', 'low']):
+            SQLiteService.load('stockAlerts', f"A{i}", {'productId': 'p1', 'alertType': alert_type,
+                                                        'status': 'active', 'createdAt': base.replace(day=i + 1)})
+        success, page = SQLiteService.get_stock_alerts_page('active', 'low', limit=1)
+        self.assertTrue(success)
+        self.assertEqual([a['id'] for a in page['alerts']], ['A2'])
+        _, page = SQLiteService.get_stock_alerts_page('active', 'low', limit=1, start_after=page['nextCursor'])
+        self.assertEqual([a['id'] for a in page['alerts']], ['A0'])
+        self.assertFalse(page['hasMore'])
+
+        self.assertEqual(SQLiteService.get_stock_alerts_version(), (True, 0))
+        SQLiteService.acknowledge_stock_alert('A2')
+        self.assertFalse(SQLiteService.acknowledge_stock_alert('missing')[0])
+        self.assertEqual(SQLiteService.get_stock_alerts_version(), (True, 1))
+        _, alerts = SQLiteService.get_stock_alerts(None, 'low')
+        self.assertEqual([a['status'] for a in alerts], ['acknowledged', 'active'])
+
+
+class TestVerificationTokens(SQLiteTestBase):
+
+    def test_token_round_trip(self):
+        expiry = datetime.now(TW_TZ) + timedelta(minutes=5)
+        SQLiteService.add_verification_token('tok', 'U1', expiry)
+        success, data = SQLiteService.get_verification_token('tok')
+        self.assertTrue(success)
+        self.assertEqual(data['expiresAt'], expiry)
+        SQLiteService.delete_verification_token('tok')
+        self.assertEqual(SQLiteService.get_verification_token('tok'), (True, None))
+
+
+class TestLineOutbox(SQLiteTestBase):
+
+    def test_claims_only_stale_messages_once(self):
+        SQLiteService.add_line_outbox('fresh', 'U1', 'Hello')
+        SQLiteService.add_line_outbox('stale', 'U1', 'Hello')
+        SQLiteService._put('lineOutbox', 'stale', dict(SQLiteService._get('lineOutbox', 'stale'),
+                                                        updatedAt=datetime.now(TW_TZ) - timedelta(minutes=10)))
+
+        success, messages = SQLiteService.claim_stale_line_outbox(300)
+        self.assertTrue(success)
+        self.assertEqual([m['messageId'] for m in messages], ['stale'])
+        self.assertEqual(SQLiteService.claim_stale_line_outbox(300), (True, []))
+
+
+if __name__ == '__main__':
+    unittest.main()
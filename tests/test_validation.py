@@ -107,6 +107,17 @@ class TestFormValidator(unittest.TestCase):
         self.assertIsNotNone(result)
         self.assertTrue(any('數量' in err for err in result))
     
+    def test_validate_cart_order_form(self):
+        """測試購物車訂單表單"""
+        data = {'cart': [{'productId': 'p1', 'qty': '2'}, {'productId': 'p2', 'qty': 1}], 'paymentMethod': 'ecpay'}
+        self.assertIsNone(FormValidator.validate_cart_order_form(data))
+        
+        result = FormValidator.validate_cart_order_form({'cart': [], 'paymentMethod': 'transfer'})
+        self.assertTrue(any('購物車' in err for err in result))
+        result = FormValidator.validate_cart_order_form(
+            {'cart': [{'productId': 'p1', 'qty': 'x'}, {'qty': 1}], 'paymentMethod': 'transfer'})
+        self.assertEqual(len(result), 2)
+    
     def test_validate_order_form_invalid_payment_method(self):
         """測試無效付款方式"""
         data = {
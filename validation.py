@@ -82,6 +82,46 @@ class FormValidator:
         
         return errors if errors else None
     
+    @staticmethod
+    def validate_cart(cart):
+        """驗證購物車品項（[{"productId", "qty"}]），回傳錯誤訊息列表"""
+        errors = []
+        if not isinstance(cart, list) or not cart:
+            errors.append("購物車不能為空")
+        elif len(cart) > 50:
+            errors.append("單筆訂單最多 50 項商品")
+        else:
+            for index, line in enumerate(cart, start=1):
+                if not isinstance(line, dict) or not str(line.get('productId') or '').strip():
+                    errors.append(f"第 {index} 項商品 ID 不能為空")
+                    continue
+                try:
+                    qty = int(line.get('qty', 1))
+                    if qty < 1:
+                        errors.append(f"第 {index} 項數量必須大於 0")
+                    elif qty > 1000:
+                        errors.append(f"第 {index} 項訂購數量不能超過 1000")
+                except (ValueError, TypeError):
+                    errors.append(f"第 {index} 項數量格式不正確")
+        return errors
+    
+    @staticmethod
+    def validate_cart_order_form(data):
+        """驗證購物車訂單表單（cart: [{"productId", "qty"}]）"""
+        errors = FormValidator.validate_cart(data.get('cart'))
+        
+        # 驗證付款方式
+        payment_method = data.get('paymentMethod', '').strip()
+        if payment_method not in ['transfer', 'ecpay']:
+            errors.append("付款方式不正確")
+        
+        # 驗證備註 (選填)
+        remarks = data.get('remarks', '').strip()
+        if remarks and len(remarks) > 500:
+            errors.append("備註長度不能超過 500 個字元")
+        
+        return errors if errors else None
+    
     @staticmethod
     def validate_login_password(password):
         """驗證登入密碼"""